@@ -0,0 +1,450 @@
+"""
+Broker de messages asynchrone, pour le code qui tourne dans une boucle
+asyncio (ASGI, consumers Channels).
+
+Même registre de canaux que MessageBroker, mais sans jamais bloquer la
+boucle: publish() est une coroutine, et un seul abonnement Redis par broker
+est lu par une tâche qui attend les messages (pas de sondage comme
+run_in_thread). Deux façons de recevoir:
+
+    await broker.subscribe('tasks/new', on_task)   # callback, synchrone ou coroutine
+
+    async with broker.subscription('tasks/status/#') as subscription:
+        async for channel, data in subscription:
+            ...
+
+Plusieurs abonnés au même canal partagent l'abonnement Redis: le canal est
+désabonné quand le dernier abonné se retire.
+"""
+
+import asyncio
+import inspect
+import logging
+import math
+from typing import Any, Callable, Iterable, List, Optional
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from redis.utils import str_if_bytes
+
+from .broker import BaseMessageBroker
+from .coalesce import is_terminal
+from .envelope import decode_message
+from .topics import is_wildcard, to_redis_pattern, topic_matches
+
+logger = logging.getLogger(__name__)
+
+# Délai avant de relire l'abonnement après une erreur Redis
+RECONNECT_DELAY = 1.0
+
+
+class Subscription:
+    """
+    Abonnement itérable: produit les (canal, données) reçus sur un canal ou
+    un filtre avec jokers. Les messages attendent dans une file bornée; si le
+    lecteur ne suit pas, les plus anciens sont abandonnés.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, broker, channel, maxsize=1000):
+        self.broker = broker
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def __call__(self, channel, data):
+        """Appelé par le broker pour chaque message reçu"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Abonnement {self.channel}: {self.dropped} messages abandonnés (lecteur trop lent)")
+        self.queue.put_nowait((channel, data))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        item = await self.queue.get()
+        if item is self._CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    async def get(self, timeout=None):
+        """
+        Attend le prochain message.
+
+        Returns:
+            tuple: (canal, données), ou None si le délai expire ou si l'abonnement est fermé
+        """
+        try:
+            return await asyncio.wait_for(self.__anext__(), timeout)
+        except (asyncio.TimeoutError, StopAsyncIteration):
+            return None
+
+    async def close(self):
+        """Se retire du canal; l'itération se termine après les messages déjà reçus"""
+        if self.closed:
+            return
+        self.closed = True
+        await self.broker.unsubscribe(self.channel, self)
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(self._CLOSED)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class AsyncMessageBroker(BaseMessageBroker):
+    """
+    Broker pub/sub via redis.asyncio.
+    Les coroutines doivent être appelées depuis la boucle qui lit les messages.
+    """
+
+    def __init__(self, host=None, port=None, db=None):
+        """
+        Prépare le client Redis (la connexion est ouverte au premier appel) et
+        configure les canaux par défaut.
+
+        Args:
+            host: Hôte Redis (défaut: settings.REDIS_HOST ou localhost)
+            port: Port Redis (défaut: settings.REDIS_PORT ou 6379)
+            db: Base de données Redis (défaut: settings.REDIS_DB ou 0)
+        """
+        super().__init__(host, port, db)
+
+        # Connexion Redis
+        self.redis_client = aioredis.Redis(
+            host=self.redis_host,
+            port=self.redis_port,
+            db=self.redis_db,
+            client_name=self.session_id,
+            decode_responses=True  # Décode automatiquement les réponses en UTF-8
+        )
+        # Réponses non décodées: les messages peuvent être binaires (codec msgpack)
+        self.binary_client = aioredis.Redis(
+            host=self.redis_host,
+            port=self.redis_port,
+            db=self.redis_db,
+            client_name=self.session_id
+        )
+        self.pubsub = self.binary_client.pubsub()
+
+        # (subscribe|psubscribe, nom Redis) -> [(canal ou filtre, callback)]
+        self._handlers: dict[tuple, list] = {}
+        self._listener = None
+        # Signalé quand le premier abonnement Redis est demandé
+        self._has_subscriptions = asyncio.Event()
+        # Tâche d'envoi des messages retenus par la fusion (démarrée au premier message retenu)
+        self._coalesce_task = None
+        self._coalesce_lock = asyncio.Lock()
+
+        logger.info("AsyncMessageBroker initialisé avec succès")
+
+    @staticmethod
+    def _redis_key(channel: str):
+        """Commande et nom Redis d'un canal (motif pour un filtre avec jokers)"""
+        if is_wildcard(channel):
+            # Redis ne connaît pas les jokers MQTT: s'abonner au motif équivalent
+            return 'psubscribe', to_redis_pattern(channel)
+        return 'subscribe', channel
+
+    async def delete_channel(self, channel_name: str) -> bool:
+        """
+        Supprime un canal existant et ferme ses abonnements.
+
+        Args:
+            channel_name: Nom du canal à supprimer
+
+        Returns:
+            bool: True si supprimé, False si n'existe pas
+        """
+        if channel_name not in self._channels:
+            logger.warning(f"Canal {channel_name} n'existe pas")
+            return False
+
+        # Désabonne tout le monde
+        for topic_filter, callback in list(self._handlers.get(self._redis_key(channel_name), [])):
+            if topic_filter != channel_name:
+                continue
+            if isinstance(callback, Subscription):
+                await callback.close()
+            else:
+                await self.unsubscribe(channel_name, callback)
+
+        self._discard_channel(channel_name)
+        return True
+
+    async def subscribe(self, channel: str, callback: Callable[[str, Any], Any]):
+        """
+        S'abonne à un canal avec une fonction de callback.
+
+        Args:
+            channel: Nom du canal ou filtre avec jokers (+ et #)
+            callback: Fonction ou coroutine appelée avec (canal, données) à
+                chaque message; les coroutines sont attendues une par une, dans
+                l'ordre des messages
+
+        Example:
+            async def on_task(channel, data):
+                await process(data)
+
+            await broker.subscribe('tasks/new', on_task)
+        """
+        self._ensure_channel(channel)
+
+        key = self._redis_key(channel)
+        handlers = self._handlers.setdefault(key, [])
+        handlers.append((channel, callback))
+        if len(handlers) == 1:
+            # Premier abonné local: abonnement Redis
+            kind, name = key
+            await getattr(self.pubsub, kind)(name)
+            self._has_subscriptions.set()
+        self.get_channel(channel).subscribers += 1
+        self.start_listening()
+
+        logger.info(f"Abonné au canal: {channel}")
+
+    def subscription(self, channel: str, maxsize: int = 1000):
+        """
+        Abonnement itérable à un canal, à utiliser avec async with.
+
+        Args:
+            channel: Nom du canal ou filtre avec jokers
+            maxsize: Messages en attente avant abandon des plus anciens (défaut: 1000)
+        """
+        subscription = Subscription(self, channel, maxsize)
+        return _SubscriptionContext(self, subscription)
+
+    async def unsubscribe(self, channel: str, callback: Callable[[str, Any], Any]) -> bool:
+        """
+        Retire un callback (ou un abonnement itérable) d'un canal.
+
+        Returns:
+            bool: True si retiré, False s'il n'était pas abonné
+        """
+        key = self._redis_key(channel)
+        handlers = self._handlers.get(key, [])
+        try:
+            handlers.remove((channel, callback))
+        except ValueError:
+            return False
+
+        if not handlers:
+            # Dernier abonné local: désabonnement Redis
+            del self._handlers[key]
+            kind, name = key
+            await getattr(self.pubsub, 'punsubscribe' if kind == 'psubscribe' else 'unsubscribe')(name)
+        registered = self.get_channel(channel)
+        if registered is not None and registered.subscribers > 0:
+            registered.subscribers -= 1
+
+        logger.info(f"Désabonné du canal: {channel}")
+        return True
+
+    async def publish(self, channel: str, message: Any, headers: Optional[dict] = None) -> bool:
+        """
+        Publie un message sur un canal.
+
+        Args:
+            channel: Nom du canal
+            message: Message à publier (sera converti en JSON)
+            headers: En-tête d'enveloppe (ex: {'token': ...}); si fourni, le
+                message est enveloppé et son corps traverse le proxy sans être décodé
+
+        Returns:
+            bool: True si publié (ou retenu par la fusion du canal), False si erreur
+        """
+        try:
+            # Créer le canal s'il n'existe pas et qu'aucun filtre ne le couvre
+            self._ensure_channel(channel)
+            key = self._coalesce_key(channel, message)
+            if key is not None:
+                if not is_terminal(message):
+                    # Publié à la fin de la fenêtre, sauf s'il est remplacé d'ici là
+                    self.coalescer.offer(key, (channel, message, headers), self.get_channel(channel).coalesce_window)
+                    if self._coalesce_task is None or self._coalesce_task.done():
+                        self._coalesce_task = asyncio.get_running_loop().create_task(self._run_coalesce_flusher())
+                    return True
+                # Après un envoi en cours: le message terminal reste le dernier de sa clé
+                async with self._coalesce_lock:
+                    self.coalescer.discard(key)
+            json_message = self._encode_for_publish(channel, message, headers)
+
+            # Publier le message (et l'ajouter au stream d'un canal durable)
+            if self.get_channel(channel).durable:
+                pipe = self.redis_client.pipeline(transaction=False)
+                self._queue_publish(pipe, channel, json_message)
+                await pipe.execute()
+            else:
+                await self.redis_client.publish(channel, json_message)
+            logger.debug(f"Message publié sur {channel}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Erreur lors de la publication sur {channel}: {e}")
+            return False
+
+    async def publish_many(self, messages: Iterable[tuple], chunk_size: Optional[int] = None) -> List[Optional[int]]:
+        """
+        Publie plusieurs messages en un aller-retour Redis par paquet.
+
+        Args:
+            messages: Itérable de (canal, message) ou (canal, message, en-tête)
+            chunk_size: Messages par aller-retour (défaut: settings.REDIS_PUBLISH_CHUNK_SIZE ou 100)
+
+        Returns:
+            list: Nombre de récepteurs de chaque message, dans l'ordre; None
+                pour un message non publié
+        """
+        messages = list(messages)
+        results = [None] * len(messages)
+        for chunk in self._publish_chunks(messages, chunk_size):
+            pipe = self.redis_client.pipeline(transaction=False)
+            queued = [self._queue_publish(pipe, channel, json_message) for _, channel, json_message in chunk]
+            try:
+                replies = await pipe.execute(raise_on_error=False)
+            except Exception as e:
+                # Connexion perdue: tout le paquet est en échec
+                logger.error(f"Erreur lors de la publication d'un paquet de {len(chunk)} messages: {e}")
+                continue
+            self._chunk_results(results, chunk, queued, replies)
+        logger.debug(f"{len(messages)} messages publiés par lots")
+        return results
+
+    async def _run_coalesce_flusher(self):
+        """Tâche d'envoi: publie par lots les messages dont la fenêtre est écoulée"""
+        while True:
+            await asyncio.sleep(self.coalescer.next_due())
+            try:
+                await self._flush_coalesced()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'envoi des messages fusionnés: {e}")
+
+    async def _flush_coalesced(self, now: Optional[float] = None) -> int:
+        """Publie les messages retenus échus à l'instant now (défaut: maintenant)"""
+        async with self._coalesce_lock:
+            due = self.coalescer.pop_due(now)
+            if due:
+                await self.publish_many(due)
+        return len(due)
+
+    def start_listening(self):
+        """
+        Démarre la tâche de lecture des messages dans la boucle courante.
+        Appelé automatiquement par subscribe().
+        """
+        if self._listener is not None and not self._listener.done():
+            return
+        logger.info("Démarrage de l'écoute des messages")
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop_listening(self):
+        """Arrête l'écoute des messages et ferme les connexions Redis."""
+        logger.info("Arrêt de l'écoute des messages")
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._coalesce_task is not None:
+            # Pas d'annulation au milieu d'un envoi: les messages retirés seraient perdus
+            async with self._coalesce_lock:
+                self._coalesce_task.cancel()
+                try:
+                    await self._coalesce_task
+                except asyncio.CancelledError:
+                    pass
+            # Les messages encore retenus partent sans attendre leur fenêtre
+            self._coalesce_task = None
+            await self._flush_coalesced(math.inf)
+            logger.info(f"Fusion des messages: {self.coalescer.stats()}")
+        for handlers in list(self._handlers.values()):
+            for _, callback in handlers:
+                if isinstance(callback, Subscription) and not callback.closed:
+                    callback.closed = True
+                    callback.queue.put_nowait(Subscription._CLOSED)
+        self._handlers.clear()
+        await self.pubsub.aclose()
+        await self.redis_client.aclose()
+        await self.binary_client.aclose()
+
+    async def _listen(self):
+        """Lit l'abonnement Redis et distribue les messages aux abonnés"""
+        while True:
+            if not self.pubsub.subscribed:
+                # Rien à lire: attendre un abonnement plutôt que de sonder
+                self._has_subscriptions.clear()
+                await self._has_subscriptions.wait()
+                continue
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            except (RedisError, OSError) as e:
+                # Le client se reconnecte et se réabonne à la prochaine lecture
+                logger.error(f"Erreur de lecture des messages: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            if message is not None:
+                await self._dispatch(message)
+
+    async def _dispatch(self, message):
+        """Appelle les abonnés d'un message, dans l'ordre d'abonnement"""
+        channel = str_if_bytes(message['channel'])
+        if message['type'] == 'message':
+            key = ('subscribe', channel)
+        elif message['type'] == 'pmessage':
+            key = ('psubscribe', str_if_bytes(message['pattern']))
+        else:
+            return
+        handlers = self._handlers.get(key)
+        if not handlers:
+            return
+
+        data = decode_message(message['data'])
+        for topic_filter, callback in list(handlers):
+            # Le motif Redis est plus large que le filtre ('+' devient '*')
+            if message['type'] == 'pmessage' and not topic_matches(topic_filter, channel):
+                continue
+            try:
+                result = callback(channel, data)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Erreur dans le callback de {topic_filter}: {e}")
+
+
+class _SubscriptionContext:
+    """
+    Résultat de broker.subscription(): s'abonne à l'entrée du bloc async with
+    et se désabonne à la sortie. Peut aussi être attendu directement
+    (subscription = await broker.subscription(...)), la fermeture est alors
+    à la charge de l'appelant.
+    """
+
+    def __init__(self, broker, subscription):
+        self.broker = broker
+        self.subscription = subscription
+
+    async def _open(self):
+        await self.broker.subscribe(self.subscription.channel, self.subscription)
+        return self.subscription
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self):
+        return await self._open()
+
+    async def __aexit__(self, *exc_info):
+        await self.subscription.close()
@@ -0,0 +1,473 @@
+"""
+Moteur asyncio du proxy Redis.
+Sert toutes les connexions client depuis une seule boucle d'événements
+avec des lectures/écritures non bloquantes, au lieu d'un thread par client.
+Les règles d'autorisation sont celles de RedisProxy.
+"""
+
+import asyncio
+import logging
+import socket
+import time
+import traceback
+import redis.asyncio as aioredis
+
+from . import audit, handoff
+from .outbound import DROP_OLDEST
+from .proxy import RedisProxy, RedisCommand
+from .resp import RespProtocolError, encode_error
+from .upstream import AsyncUpstreamConnection, AsyncUpstreamPool
+
+logger = logging.getLogger('RedisProxy')
+
+
+class AsyncRedisProxy(RedisProxy):
+    """
+    Proxy Redis basé sur asyncio.
+    Réutilise prepare_publish/prepare_subscribe de RedisProxy et ne
+    remplace que la couche de transport.
+    """
+
+    def __init__(self, redis_host='localhost', redis_port=6379, proxy_port=6380, pool_size=4,
+                 outbound_policy=DROP_OLDEST, outbound_queue_size=1000,
+                 reuse_port=False, session_store=None, worker_id=None, audit_log=None, handoff_path=None,
+                 backlog=4096):
+        """
+        Initialise le proxy Redis asyncio.
+
+        Args:
+            redis_host: Hôte Redis (défaut: localhost)
+            redis_port: Port Redis (défaut: 6379)
+            proxy_port: Port sur lequel le proxy écoute (défaut: 6380)
+            pool_size: Nombre de connexions partagées vers Redis (défaut: 4)
+            outbound_policy: Politique pour les clients lents: drop_oldest, coalesce ou disconnect
+            outbound_queue_size: Nombre maximal de messages en attente par client (défaut: 1000)
+            reuse_port: Partager le port d'écoute avec d'autres workers (SO_REUSEPORT)
+            session_store: Stockage des sessions (défaut: LocalSessionStore, propre au processus)
+            worker_id: Numéro du worker quand plusieurs processus servent le même port
+            audit_log: Journal d'audit du trafic (défaut: selon settings.REDIS_PROXY_AUDIT_LOG)
+            handoff_path: Socket Unix de reprise à chaud (défaut: pas de reprise)
+            backlog: Taille de la file d'attente des connexions entrantes
+        """
+        super().__init__(
+            redis_host=redis_host,
+            redis_port=redis_port,
+            proxy_port=proxy_port,
+            pool_size=pool_size,
+            outbound_policy=outbound_policy,
+            outbound_queue_size=outbound_queue_size,
+            reuse_port=reuse_port,
+            session_store=session_store,
+            worker_id=worker_id,
+            audit_log=audit_log,
+            handoff_path=handoff_path
+        )
+        self.backlog = backlog
+        self.loop = None
+        self.server = None
+        self.pubsub_task = None
+        self.subscriptions_confirmed = None  # Événement remplacé à chaque confirmation de Redis
+
+    def start(self):
+        """Démarre le proxy et bloque jusqu'à son arrêt"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logger.info("Arrêt du proxy...")
+        finally:
+            self.stop()
+
+    async def serve(self):
+        """Démarre le serveur et la tâche d'écoute des messages publiés"""
+        self.loop = asyncio.get_running_loop()
+        self.subscriptions_confirmed = asyncio.Event()
+        self.upstream_pool = AsyncUpstreamPool(self.redis_host, self.redis_port, size=self.pool_size)
+        takeover = self._take_over()
+        if takeover is not None:
+            # Socket d'écoute de l'ancien processus: sa file de connexions en attente est conservée
+            takeover.ack()
+            self.server = await asyncio.start_server(
+                self.handle_connection,
+                sock=takeover.listener,
+                backlog=self.backlog
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle_connection,
+                host='0.0.0.0',
+                port=self.proxy_port,
+                backlog=self.backlog,
+                reuse_address=True,
+                reuse_port=self.reuse_port or None
+            )
+        self.running = True
+        logger.info(f"Proxy Redis (asyncio) démarré sur le port {self.proxy_port}{self._worker_label()}")
+
+        self.pubsub_task = asyncio.create_task(self._listen_for_published_messages_async())
+        # Envoi des messages retenus par la fusion
+        self.coalesce_slot = self.upstream_pool.assign_slot()
+        coalesce_task = asyncio.create_task(self._run_coalesce_flusher_async())
+        self.policy_reloader.start(self.channel_policies.fingerprint)
+        self.reaper.start()
+
+        if takeover is not None:
+            for client_socket, state, blob in takeover.clients:
+                asyncio.create_task(self._adopt_connection(client_socket, state, blob))
+            logger.info(f"{len(takeover.clients)} connexions reprises de l'ancien processus")
+        if self.handoff_path:
+            self.handoff_server = handoff.HandoffServer(self.handoff_path, self._hand_off)
+            self.handoff_server.start()
+
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            # server.close() après une reprise à chaud: arrêt normal
+            if not self.handed_off:
+                raise
+        finally:
+            self.pubsub_task.cancel()
+            coalesce_task.cancel()
+
+    async def _run_coalesce_flusher_async(self):
+        """Tâche d'envoi: transmet les PUBLISH retenus dont la fenêtre est écoulée"""
+        while True:
+            await asyncio.sleep(self.coalescer.next_due())
+            for upstream_command in self.coalescer.pop_due():
+                try:
+                    await self.upstream_pool.submit(upstream_command, self.coalesce_slot)
+                except OSError as e:
+                    logger.error(f"Envoi d'un message fusionné impossible: {e}")
+
+    def _close_sockets(self):
+        """Ferme le serveur et les connexions client (sauf celles cédées au nouveau processus)"""
+        if self.server:
+            self.server.close()
+        for client_info in list(self.client_connections.values()):
+            try:
+                client_info['writer'].close()
+            except Exception:
+                pass
+
+    async def _adopt_connection(self, client_socket, state, blob):
+        """Sert une connexion reprise à l'ancien processus"""
+        reader, writer = await asyncio.open_connection(sock=client_socket)
+        await self.handle_connection(reader, writer, session=(state, blob))
+
+    async def handle_connection(self, reader, writer, session=None):
+        """
+        Gère une connexion client.
+
+        Args:
+            session: (état, octets en attente) d'une connexion reprise à l'ancien processus
+        """
+        client_address = writer.get_extra_info('peername')
+        client_id = f"{client_address[0]}:{client_address[1]}"
+        logger.debug(f"Nouvelle connexion: {client_id}")
+        self.audit_log.record(audit.CONNECT, client_id, detail='handoff' if session else None)
+
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._set_keepalive(sock)
+
+        client_info = self._new_client_info(
+            writer=writer,
+            outbound_ready=asyncio.Event(),
+            outbound_drained=asyncio.Event(),
+            pool_slot=self.upstream_pool.assign_slot()
+        )
+        self.client_connections[client_id] = client_info
+        if session is not None:
+            self._adopt_session(client_id, client_info, *session)
+        if self.handing_off:
+            # Acceptée pendant une reprise: cédée avec les autres sans être lue
+            writer.transport.pause_reading()
+        self._start_writer(client_id, client_info)
+
+        redis_conn = None  # Connexion dédiée, ouverte seulement si nécessaire
+        parser = client_info['parser']
+        try:
+            while self.running:
+                # Recevoir des données du client; 'reading' indique qu'aucune commande n'est en cours
+                client_info['reading'] = True
+                data = await reader.read(65536)
+                client_info['reading'] = False
+                client_info['last_activity'] = time.monotonic()
+                if not data:
+                    logger.debug(f"Pas de donnees recues")
+                    break
+
+                # Une lecture peut contenir zéro, une ou plusieurs commandes complètes
+                try:
+                    parser.feed(data)
+                except RespProtocolError as e:
+                    await self._send_replies(client_info, [encode_error(f"ERR Protocol error: {e}")])
+                    break
+
+                # Les commandes du pool sont envoyées à la suite (pipelining),
+                # puis les réponses sont renvoyées au client dans l'ordre
+                replies = []
+                close = False
+                for parts, raw_data in parser:
+                    if not parts:
+                        continue  # Ligne inline vide, ignorée par Redis
+
+                    # Analyser la commande Redis
+                    command = RedisCommand(raw_data, parts)
+                    logger.debug(f"Commande reçue: {command}")
+
+                    session_id = self.session_to_restore(client_info, command)
+                    if session_id:
+                        # Lecture Redis bloquante: hors de la boucle
+                        session = await self.loop.run_in_executor(None, self.session_store.load, session_id)
+                        self.restore_session(client_info, session)
+                    action, payload = self.process_command(client_id, command, raw_data)
+                    if command.command_type in ('SUBSCRIBE', 'PSUBSCRIBE'):
+                        # Confirmé au client une fois Redis abonné: rien n'est perdu entre les deux
+                        await self._wait_upstream_subscriptions(client_id, client_info, command)
+                    if action == 'delay':
+                        # Client au-delà de sa limite: seule sa coroutine attend
+                        delay, payload = payload
+                        await asyncio.sleep(delay)
+                        action = 'dedicated' if client_info.get('dedicated') else 'forward'
+                    if action == 'forward':
+                        replies.append(await self.upstream_pool.submit(payload, client_info['pool_slot']))
+                    elif action == 'dedicated':
+                        if redis_conn is None:
+                            redis_conn = await AsyncUpstreamConnection.open(self.redis_host, self.redis_port)
+                        replies.append(await redis_conn.request(payload))
+                    else:
+                        replies.append(payload)
+                        if action == 'close':
+                            close = True
+                            break
+
+                # Les réponses passent par la file d'envoi, dans l'ordre avec les messages pub/sub
+                await self._send_replies(
+                    client_info,
+                    [reply if isinstance(reply, bytes) else await reply for reply in replies]
+                )
+                if close:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.debug(f"Connexion interrompue pour {client_id}: {e}")
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"Erreur pour le client {client_id}: {e}")
+
+        finally:
+            # Nettoyage
+            if redis_conn is not None:
+                redis_conn.close()
+
+            # Laisser l'écrivain envoyer les dernières réponses (ex: +OK de QUIT)
+            client_info['closing'] = True
+            client_info['outbound_ready'].set()
+            try:
+                await asyncio.wait_for(client_info['writer_task'], timeout=1.0)
+            except (asyncio.TimeoutError, ConnectionError):
+                client_info['writer_task'].cancel()
+            writer.close()
+
+            # Supprimer la connexion et ses abonnements
+            self._remove_client(client_id)
+
+            logger.debug(f"Client déconnecté: {client_id}")
+
+    async def _wait_upstream_subscriptions(self, client_id, client_info, command):
+        """Attend que Redis ait confirmé les abonnements qui couvrent un SUBSCRIBE client"""
+        keys = self.upstream_keys(client_info, command)
+        deadline = self.loop.time() + self.subscribe_timeout
+        while self.upstream_subscriptions.unconfirmed(keys):
+            remaining = deadline - self.loop.time()
+            try:
+                await asyncio.wait_for(self.subscriptions_confirmed.wait(), max(remaining, 0))
+            except asyncio.TimeoutError:
+                logger.warning(f"Abonnement Redis non confirmé pour {client_id}: {keys}")
+                return
+
+    def _on_upstream_message(self, message):
+        super()._on_upstream_message(message)
+        if message['type'] in ('subscribe', 'psubscribe'):
+            # Réveille les SUBSCRIBE en attente; les suivants attendront le nouvel événement
+            self.subscriptions_confirmed.set()
+            self.subscriptions_confirmed = asyncio.Event()
+
+    async def _listen_for_published_messages_async(self):
+        """Abonné partagé: écoute les messages publiés sur Redis et les transmet aux clients abonnés"""
+        # Messages reçus en bytes: ils sont retransmis sans décodage ni réencodage
+        redis_client = aioredis.Redis(host=self.redis_host, port=self.redis_port, decode_responses=False)
+        pubsub = redis_client.pubsub()
+        try:
+            while self.running:
+                # Appliquer les changements d'abonnement depuis le dernier tour, une commande par type
+                for kind, channels in self._drain_pending_subscriptions().items():
+                    await getattr(pubsub, kind)(*channels)
+
+                if not pubsub.subscribed:
+                    # Aucun client abonné: pas de connexion à lire
+                    await asyncio.sleep(0.05)
+                    continue
+
+                message = await pubsub.get_message(timeout=0.05)
+                if message is not None:
+                    self._on_upstream_message(message)
+
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Erreur dans la tâche d'écoute des messages publiés: {e}")
+            traceback.print_exc()
+        finally:
+            await pubsub.aclose()
+            await redis_client.aclose()
+
+    def _install_policies(self, table):
+        """
+        Remplace la table des politiques depuis le thread de rechargement;
+        les files d'envoi ne sont touchées que depuis la boucle.
+        """
+        self.channel_policies = table
+        if self.loop is not None and self.running:
+            self.loop.call_soon_threadsafe(self._revoke_unauthorized_subscriptions)
+
+    def _start_writer(self, client_id, client_info):
+        """L'écrivain vide la file d'envoi: l'abonné partagé n'attend jamais un client lent"""
+        client_info['writer_task'] = asyncio.create_task(
+            self._write_loop(client_info['writer'], client_id, client_info)
+        )
+
+    def _hand_off(self, connection):
+        """Cède les sockets au nouveau processus (thread de HandoffServer), depuis la boucle"""
+        if self.loop is None or not self.running:
+            return False
+        return asyncio.run_coroutine_threadsafe(self._hand_off_async(connection), self.loop).result()
+
+    async def _hand_off_async(self, connection):
+        """
+        Suspend les lectures, attend la fin des commandes en cours et des
+        écritures, puis transmet les sockets. La transmission et l'attente de
+        la confirmation bloquent la boucle: rien n'est lu ni accepté entre
+        l'instantané des connexions et la sortie du processus.
+        """
+        deadline = self.loop.time() + self.handoff_drain_timeout
+        self.handing_off = True
+        self.reaper.paused = True
+        for client_info in list(self.client_connections.values()):
+            client_info['writer'].transport.pause_reading()
+
+        # Une lecture en attente sur un transport suspendu: plus de commande en cours
+        while self.loop.time() < deadline and not all(
+            client_info.get('reading') or client_info['dedicated']
+            for client_info in list(self.client_connections.values())
+        ):
+            await asyncio.sleep(0.01)
+        candidates = [
+            (client_id, client_info) for client_id, client_info in list(self.client_connections.items())
+            if client_info.get('reading') and not client_info['dedicated']
+        ]
+
+        # Les écrivains vident les files d'envoi puis s'arrêtent
+        for _, client_info in candidates:
+            client_info['closing'] = True
+            client_info['outbound_ready'].set()
+        if candidates:
+            await asyncio.wait(
+                [client_info['writer_task'] for _, client_info in candidates],
+                timeout=max(0.0, deadline - self.loop.time())
+            )
+        clients = [
+            (client_id, client_info) for client_id, client_info in candidates
+            if client_info['writer_task'].done()
+        ]
+
+        try:
+            self._send_handoff(connection, self.server.sockets[0].fileno(), clients)
+        except (OSError, ValueError, handoff.HandoffError) as e:
+            logger.error(f"Reprise abandonnée, le proxy continue: {e}")
+            for client_id, client_info in candidates:
+                client_info['closing'] = False
+                if client_info['writer_task'].done():
+                    self._start_writer(client_id, client_info)
+            self.handing_off = False
+            self.reaper.paused = False
+            for client_info in list(self.client_connections.values()):
+                client_info['writer'].transport.resume_reading()
+            return False
+
+        self._finish_handoff(clients)
+        self.handed_off = True
+        # Ne ferme que le descripteur de ce processus: la connexion reste ouverte dans le nouveau
+        for _, client_info in clients:
+            client_info['writer'].transport.close()
+        # Fin de serve_forever(): start() appelle stop(), qui ferme les connexions non cédées
+        self.server.close()
+        return True
+
+    def _client_fileno(self, client_info):
+        return client_info['writer'].get_extra_info('socket').fileno()
+
+    def _send_to_client(self, client_info, data, key=None):
+        """Dépose un message pub/sub dans la file d'envoi du client, sans bloquer"""
+        if not client_info['outbound'].put_message(data, key):
+            self._disconnect_slow_client(client_info)
+            return
+        client_info['outbound_ready'].set()
+
+    async def _send_replies(self, client_info, replies):
+        """
+        Dépose les réponses aux commandes du client dans sa file d'envoi et
+        attend l'écrivain si trop de réponses restent à envoyer.
+        """
+        outbound = client_info['outbound']
+        for reply in replies:
+            outbound.put_reply(reply)
+        client_info['outbound_ready'].set()
+        if outbound.reply_bytes > self.outbound_max_bytes:
+            client_info['outbound_drained'].clear()
+            await client_info['outbound_drained'].wait()
+
+    async def _write_loop(self, writer, client_id, client_info):
+        """Écrivain d'un client: envoie le contenu de sa file d'envoi"""
+        ready = client_info['outbound_ready']
+        outbound = client_info['outbound']
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                batch = outbound.drain()
+                if batch:
+                    # Écriture vectorisée par le transport (sendmsg à partir de Python 3.12)
+                    client_info['write_started'] = time.monotonic()
+                    writer.writelines(batch)
+                    await writer.drain()
+                    client_info['write_started'] = None
+                client_info['outbound_drained'].set()
+                if client_info['closing'] and not outbound:
+                    break
+        except ConnectionError as e:
+            logger.debug(f"Envoi impossible vers {client_id}: {e}")
+            self._disconnect_slow_client(client_info)
+
+    def _disconnect_slow_client(self, client_info):
+        """Coupe une connexion dont la file déborde (politique disconnect) ou en erreur"""
+        if client_info['outbound'].overflowed:
+            logger.warning("File d'envoi pleine: déconnexion d'un client trop lent")
+            client_info['close_reason'] = 'outbound_overflow'
+        self._close_connection(client_info)
+
+    def _reap_client(self, client_id, client_info, reason):
+        """Ferme une connexion inactive ou bloquée depuis le thread du ConnectionReaper"""
+        client_info['close_reason'] = reason
+        if self.loop is not None and self.running:
+            self.loop.call_soon_threadsafe(self._close_connection, client_info)
+
+    def _close_connection(self, client_info):
+        """Coupe une connexion; sa coroutine fait le nettoyage (connexion Redis dédiée, abonnements)"""
+        client_info['closing'] = True
+        client_info['outbound_ready'].set()
+        client_info['outbound_drained'].set()
+        # Fait échouer la lecture en cours du client, qui fera le nettoyage
+        client_info['writer'].transport.abort()
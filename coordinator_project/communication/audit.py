@@ -0,0 +1,369 @@
+"""
+Journal d'audit du trafic du proxy Redis.
+
+Les threads clients, l'abonné partagé et la boucle asyncio ne font qu'ajouter
+un tuple dans un tampon circulaire (deque bornée: append est atomique, sans
+verrou explicite). Un thread dédié vide le tampon par lots, met en forme les
+enregistrements (JSON lines), masque les corps de messages et écrit dans des
+fichiers tournants lus par la commande replay_audit_log.
+
+Quand le tampon est plein, les enregistrements les plus anciens sont perdus
+plutôt que de ralentir le proxy; les numéros de séquence permettent de compter
+ces pertes.
+
+Format d'une ligne:
+    {"seq": 12, "ts": 1700000000.123, "event": "publish", "client": "10.0.0.5:40122",
+     "channel": "tasks/result/42", "size": 512, "outcome": "ok", "user": "...",
+     "role": "volunteer", "body": {...}}
+Le champ "detail" complète certains événements: commande Redis (command),
+nombre de destinataires (deliver), commande et canaux refusés (subscribe).
+"""
+
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from .envelope import is_envelope, split_envelope
+from .topics import TopicTrie
+
+logger = logging.getLogger('RedisProxy')
+
+# Événements enregistrés
+CONNECT = 'connect'
+DISCONNECT = 'disconnect'
+PUBLISH = 'publish'
+SUBSCRIBE = 'subscribe'
+UNSUBSCRIBE = 'unsubscribe'
+DELIVER = 'deliver'
+COMMAND = 'command'
+
+# Conservation des corps de messages
+BODY_NONE = 'none'          # taille seulement
+BODY_REDACTED = 'redacted'  # corps JSON avec les champs sensibles masqués
+BODY_FULL = 'full'          # corps complet, sans le token (pour replay_audit_log)
+BODY_MODES = (BODY_NONE, BODY_REDACTED, BODY_FULL)
+
+# Champs masqués en mode redacted (le token est retiré dans tous les modes)
+REDACTED_KEYS = frozenset({'password', 'token', 'secret', 'access_token', 'refresh_token', 'authorization'})
+REDACTED = '********'
+
+
+def redact(value):
+    """Masque récursivement les champs sensibles d'une valeur JSON"""
+    if isinstance(value, dict):
+        return {key: REDACTED if key.lower() in REDACTED_KEYS else redact(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+class NullAuditLog:
+    """Journal d'audit désactivé"""
+
+    enabled = False
+
+    def record(self, event, client_id=None, channel=None, size=0, outcome=None,
+               body=None, user_id=None, role=None, detail=None):
+        pass
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class AuditLog:
+    """
+    Journal d'audit asynchrone écrit par lots dans des fichiers tournants.
+    """
+
+    enabled = True
+
+    def __init__(self, path, sample_rates=None, body_mode=BODY_NONE, max_body_bytes=64 * 1024,
+                 capacity=65536, flush_interval=0.5, max_bytes=64 * 1024 * 1024, backup_count=5,
+                 worker_id=None):
+        """
+        Args:
+            path: Fichier du journal (les fichiers tournés sont path.1, path.2...)
+            sample_rates: dict filtre de canal -> proportion enregistrée (0 à 1),
+                ex: {'coord/heartbeat/#': 0.01}; le filtre le plus précis s'applique
+            body_mode: Conservation des corps: none, redacted ou full (défaut: none)
+            max_body_bytes: Taille maximale d'un corps conservé (défaut: 64 Ko)
+            capacity: Nombre d'enregistrements en attente d'écriture (défaut: 65536)
+            flush_interval: Délai entre deux écritures, en secondes (défaut: 0.5)
+            max_bytes: Taille d'un fichier avant rotation (défaut: 64 Mo)
+            backup_count: Nombre de fichiers tournés conservés (défaut: 5)
+            worker_id: Numéro du worker, ajouté au nom du fichier
+        """
+        if body_mode not in BODY_MODES:
+            raise ValueError(f"Mode de conservation des corps inconnu: {body_mode}")
+        if worker_id is not None:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.worker{worker_id}{ext}"
+        self.path = path
+        self.body_mode = body_mode
+        self.max_body_bytes = max_body_bytes
+        self.flush_interval = flush_interval
+
+        # Taux d'échantillonnage par filtre, mémorisés par canal
+        self._sample_rules = TopicTrie()
+        for topic_filter, rate in (sample_rates or {}).items():
+            self._sample_rules.add(topic_filter, rate)
+        self._rates = {}
+
+        self._buffer = deque(maxlen=capacity)
+        # Réveil anticipé du thread d'écriture quand le tampon est à moitié plein
+        self._wake_threshold = capacity // 2
+        self._sequence = itertools.count()
+        self._writer = RotatingWriter(path, max_bytes=max_bytes, backup_count=backup_count)
+
+        # Métriques: written et last_seq ne sont modifiés que par le thread d'écriture
+        self.written = 0
+        self.last_seq = -1
+        self.sampled_out = 0  # Approximatif: incrémenté sans verrou par les appelants
+
+        self._wake = threading.Event()
+        self._closing = False
+        self._flusher_thread = threading.Thread(target=self._flush_loop, name='audit-flusher')
+        self._flusher_thread.daemon = True
+        self._flusher_thread.start()
+
+    @classmethod
+    def from_settings(cls, path=None, body_mode=None, worker_id=None):
+        """
+        Construit le journal à partir des settings REDIS_PROXY_AUDIT_*.
+        Retourne un NullAuditLog si aucun fichier n'est configuré.
+        """
+        from django.conf import settings
+
+        path = path or getattr(settings, 'REDIS_PROXY_AUDIT_LOG', None)
+        if not path:
+            return NullAuditLog()
+        return cls(
+            path,
+            sample_rates=getattr(settings, 'REDIS_PROXY_AUDIT_SAMPLE_RATES', None),
+            body_mode=body_mode or getattr(settings, 'REDIS_PROXY_AUDIT_BODY', BODY_NONE),
+            max_bytes=getattr(settings, 'REDIS_PROXY_AUDIT_MAX_BYTES', 64 * 1024 * 1024),
+            backup_count=getattr(settings, 'REDIS_PROXY_AUDIT_BACKUP_COUNT', 5),
+            worker_id=worker_id
+        )
+
+    def _sample_rate(self, channel):
+        rate = self._rates.get(channel)
+        if rate is None:
+            matches = self._sample_rules.match_items(channel)
+            if matches:
+                # Le filtre le plus long est le plus précis
+                _, rates = max(matches, key=lambda item: len(item[0]))
+                rate = min(rates)
+            else:
+                rate = 1.0
+            if len(self._rates) >= 10000:
+                self._rates = {}
+            self._rates[channel] = rate
+        return rate
+
+    def record(self, event, client_id=None, channel=None, size=0, outcome=None,
+               body=None, user_id=None, role=None, detail=None):
+        """
+        Enregistre un événement. Seul coût sur le chemin des messages: le
+        tirage d'échantillonnage et l'ajout d'un tuple dans le tampon; le
+        corps n'est ni copié ni décodé ici.
+
+        Args:
+            event: Type d'événement (publish, subscribe, deliver...)
+            client_id: Connexion concernée
+            channel: Canal (ou liste de canaux pour subscribe)
+            size: Taille du message en octets
+            outcome: Résultat (None pour ok, sinon réponse d'erreur RESP ou motif)
+            body: Corps du message (bytes), conservé selon body_mode
+            detail: Informations propres à l'événement (valeur JSON)
+        """
+        if channel is not None and channel.__class__ is str:
+            rate = self._sample_rate(channel)
+            if rate < 1.0 and random.random() >= rate:
+                self.sampled_out += 1
+                return
+        if self.body_mode == BODY_NONE:
+            body = None
+        buffer = self._buffer
+        buffer.append((next(self._sequence), time.time(), event, client_id, channel,
+                       size, outcome, body, user_id, role, detail))
+        if len(buffer) >= self._wake_threshold:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Écrit les enregistrements en attente (appelé par le thread d'écriture)"""
+        buffer = self._buffer
+        lines = []
+        while True:
+            try:
+                record = buffer.popleft()
+            except IndexError:
+                break
+            if record[0] > self.last_seq:
+                self.last_seq = record[0]
+            lines.append(self._format(record))
+        if not lines:
+            return 0
+        try:
+            self._writer.write(''.join(lines))
+        except OSError as e:
+            logger.error(f"Écriture du journal d'audit impossible: {e}")
+            return 0
+        self.written += len(lines)
+        return len(lines)
+
+    def _format(self, record):
+        seq, ts, event, client_id, channel, size, outcome, body, user_id, role, detail = record
+        entry = {'seq': seq, 'ts': round(ts, 6), 'event': event}
+        if client_id is not None:
+            entry['client'] = client_id
+        if channel is not None:
+            entry['channel'] = channel
+        if size:
+            entry['size'] = size
+        entry['outcome'] = self._format_outcome(outcome)
+        if user_id:
+            entry['user'] = user_id
+        if role:
+            entry['role'] = role
+        if detail is not None:
+            entry['detail'] = detail
+        if body is not None:
+            entry.update(self._format_body(body))
+        return json.dumps(entry, separators=(',', ':'), default=str) + '\n'
+
+    @staticmethod
+    def _format_outcome(outcome):
+        if outcome is None:
+            return 'ok'
+        if isinstance(outcome, bytes):
+            # Réponse d'erreur RESP: "-ERR NOAUTH Permission denied\r\n" -> "ERR NOAUTH Permission denied"
+            return outcome.decode('utf-8', 'replace').lstrip('-').strip()
+        return outcome
+
+    def _format_body(self, body):
+        """Corps conservé, masqué selon body_mode (exécuté hors du chemin des messages)"""
+        if len(body) > self.max_body_bytes:
+            return {'body_truncated': True}
+        header = None
+        try:
+            if is_envelope(body):
+                header, view = split_envelope(bytes(body))
+                value = json.loads(bytes(view))
+            else:
+                value = json.loads(body)
+        except ValueError:
+            return {'body_raw': bytes(body).decode('utf-8', 'replace')}
+        if header is not None:
+            header.pop('token', None)
+        if isinstance(value, dict):
+            value.pop('token', None)
+        if self.body_mode == BODY_REDACTED:
+            value = redact(value)
+            header = redact(header) if header is not None else None
+        result = {'body': value}
+        if header is not None:
+            result['envelope'] = header
+        return result
+
+    def stats(self):
+        """Métriques du journal"""
+        return {
+            'path': self.path,
+            'pending': len(self._buffer),
+            'written': self.written,
+            # Séquences émises mais jamais écrites (tampon plein)
+            'lost': max(0, self.last_seq + 1 - self.written - len(self._buffer)),
+            'sampled_out': self.sampled_out,
+        }
+
+    def close(self):
+        """Écrit les derniers enregistrements et ferme le fichier"""
+        if self._closing:
+            return
+        self._closing = True
+        self._wake.set()
+        self._flusher_thread.join(timeout=5.0)
+        self._writer.close()
+
+
+class RotatingWriter:
+    """Fichier en ajout avec rotation par taille (path, path.1, path.2...)"""
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        self._size = self._file.tell()
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        if self._size and self.max_bytes and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, 'wb')
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+
+def audit_files(path):
+    """Fichiers d'un journal, du plus ancien au plus récent"""
+    rotated = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated.append(f"{path}.{index}")
+        index += 1
+    files = list(reversed(rotated))
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_audit_records(path):
+    """
+    Lit les enregistrements d'un journal (fichiers tournés compris), dans l'ordre.
+
+    Yields:
+        dict: Un enregistrement par ligne valide
+    """
+    for filename in audit_files(path):
+        with open(filename, 'rb') as audit_file:
+            for line in audit_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Dernière ligne tronquée par un arrêt brutal
+                    continue
@@ -0,0 +1,98 @@
+"""
+Benchmarks du module de communication.
+Chaque scénario est un module de ce paquet exposant add_arguments(parser)
+et run(options, stdout), exécuté via la commande benchmark_communication.
+"""
+
+import contextlib
+import resource
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+
+# Scénarios disponibles: nom de la sous-commande -> module
+SCENARIOS = {
+    'proxy_engines': 'communication.benchmarks.proxy_engines',
+    'resp_parser': 'communication.benchmarks.resp_parser',
+    'subscription_fanout': 'communication.benchmarks.subscription_fanout',
+    'slow_consumers': 'communication.benchmarks.slow_consumers',
+    'fanout_frames': 'communication.benchmarks.fanout_frames',
+    'proxy_workers': 'communication.benchmarks.proxy_workers',
+    'publish_payloads': 'communication.benchmarks.publish_payloads',
+    'durable_channels': 'communication.benchmarks.durable_channels',
+    'local_dispatch': 'communication.benchmarks.local_dispatch',
+    'wire_codecs': 'communication.benchmarks.wire_codecs',
+}
+
+
+def percentile(values, pct):
+    """Retourne le percentile pct (0-100) d'une liste de valeurs"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def format_table(headers, rows):
+    """Formate des résultats sous forme de tableau texte"""
+    widths = [len(str(h)) for h in headers]
+    for row in rows:
+        for i, cell in enumerate(row):
+            widths[i] = max(widths[i], len(str(cell)))
+    lines = ['  '.join(str(h).ljust(widths[i]) for i, h in enumerate(headers))]
+    lines.append('  '.join('-' * w for w in widths))
+    for row in rows:
+        lines.append('  '.join(str(cell).ljust(widths[i]) for i, cell in enumerate(row)))
+    return '\n'.join(lines)
+
+
+def raise_nofile_limit(wanted):
+    """Augmente la limite de descripteurs ouverts (hérité par les sous-processus)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def wait_for_port(host, port, timeout=10.0):
+    """Attend qu'un port TCP accepte des connexions"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+@contextlib.contextmanager
+def proxy_process(redis_host, redis_port, proxy_port, *extra_args):
+    """
+    Lance start_redis_proxy dans un sous-processus le temps du benchmark,
+    pour que le client simulé ne partage pas le GIL avec le proxy.
+    """
+    process = subprocess.Popen(
+        [sys.executable, 'manage.py', 'start_redis_proxy',
+         '--redis-host', redis_host,
+         '--redis-port', str(redis_port),
+         '--proxy-port', str(proxy_port),
+         *extra_args],
+        cwd=settings.BASE_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_for_port('127.0.0.1', proxy_port):
+            raise RuntimeError(f"Le proxy n'a pas démarré sur le port {proxy_port}")
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,182 @@
+"""
+Débit et mémoire Redis des canaux durables (streams) face au pub/sub.
+
+Publie le même lot de messages avec MessageBroker.publish_many sur deux canaux:
+    pubsub:  canal ordinaire, un abonné compte les messages reçus
+    durable: canal durable (XADD + PUBLISH), un StreamConsumer lit et
+             acquitte les messages au sein d'un groupe
+et mesure le débit de publication, le débit de réception, la mémoire Redis
+consommée (used_memory) et la taille du stream (MEMORY USAGE). Les clés du
+benchmark sont supprimées à la fin.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import redis
+
+from . import format_table
+from ..broker import MessageBroker
+from ..streams import StreamConsumer, stream_key
+
+PUBSUB_CHANNEL = 'bench/pubsub'
+DURABLE_CHANNEL = 'bench/durable'
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--messages',
+        type=int,
+        default=20000,
+        help='Messages publiés par mode (défaut: 20000)'
+    )
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=512,
+        help='Taille approximative des messages en octets (défaut: 512)'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=100,
+        help='Messages par aller-retour de publish_many (défaut: 100)'
+    )
+    parser.add_argument(
+        '--maxlen',
+        type=int,
+        default=0,
+        help='MAXLEN du stream durable, 0 pour tout conserver pendant la mesure (défaut: 0)'
+    )
+
+
+def _messages(count, size):
+    payload = {'task_id': '', 'status': 'COMPLETED', 'output': ''}
+    payload['output'] = 'x' * max(0, size - len(json.dumps(payload)))
+    return [dict(payload, task_id=str(index)) for index in range(count)]
+
+
+def _used_memory(client):
+    try:
+        return client.info('memory')['used_memory']
+    except (redis.RedisError, KeyError):
+        return None
+
+
+def _format_bytes(value):
+    return 'n/d' if value is None else f"{value / 1e6:,.2f} Mo"
+
+
+def _receive_pubsub(client, expected, ready, done):
+    """Abonné pub/sub: compte les messages jusqu'à expected"""
+    pubsub = client.pubsub()
+    pubsub.subscribe(PUBSUB_CHANNEL)
+    pubsub.get_message(timeout=1.0)  # Confirmation d'abonnement
+    ready.set()
+    received = 0
+    deadline = time.monotonic() + 120
+    while received < expected and time.monotonic() < deadline:
+        message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+        if message is not None:
+            received += 1
+    done['received'] = received
+    done['finished'] = time.perf_counter()
+    pubsub.close()
+
+
+def _bench_pubsub(broker, messages, chunk_size):
+    ready = threading.Event()
+    done = {}
+    thread = threading.Thread(
+        target=_receive_pubsub, args=(broker.redis_client, len(messages), ready, done)
+    )
+    thread.start()
+    ready.wait(5)
+
+    before = _used_memory(broker.redis_client)
+    started = time.perf_counter()
+    broker.publish_many(((PUBSUB_CHANNEL, message) for message in messages), chunk_size)
+    published = time.perf_counter()
+    after = _used_memory(broker.redis_client)
+    thread.join()
+
+    return {
+        'publish': published - started,
+        'receive': done['finished'] - started,
+        'received': done['received'],
+        'memory': None if before is None or after is None else after - before,
+        'stream': None,
+    }
+
+
+def _bench_durable(broker, messages, chunk_size):
+    client = broker.redis_client
+    key = stream_key(DURABLE_CHANNEL)
+    client.delete(key)
+    consumer = StreamConsumer(client, DURABLE_CHANNEL, 'bench', 'bench-1', count=500, block=100)
+    consumer.ensure_group('$')
+
+    before = _used_memory(client)
+    started = time.perf_counter()
+    broker.publish_many(((DURABLE_CHANNEL, message) for message in messages), chunk_size)
+    published = time.perf_counter()
+    after = _used_memory(client)
+    try:
+        stream_size = client.memory_usage(key, samples=0)
+    except redis.RedisError:
+        stream_size = None
+
+    # Lecture après coup: le stream a conservé les messages publiés sans lecteur
+    received = 0
+    read_started = time.perf_counter()
+    deadline = time.monotonic() + 120
+    while received < len(messages) and time.monotonic() < deadline:
+        entries = consumer.read()
+        consumer.ack(*[entry_id for entry_id, _, _ in entries])
+        received += len(entries)
+    finished = time.perf_counter()
+    client.delete(key)
+
+    return {
+        'publish': published - started,
+        'receive': finished - read_started,
+        'received': received,
+        'memory': None if before is None or after is None else after - before,
+        'stream': stream_size,
+    }
+
+
+def run(options, stdout):
+    logging.getLogger('communication').setLevel(logging.WARNING)
+
+    broker = MessageBroker(host=options['redis_host'], port=options['redis_port'], persistent=False)
+    broker.create_channel(PUBSUB_CHANNEL, 'Benchmark pub/sub')
+    broker.create_channel(DURABLE_CHANNEL, 'Benchmark durable', durable=True)
+    durable = broker.get_channel(DURABLE_CHANNEL)
+    # 0: pas de coupe pendant la mesure, la mémoire reflète tout le lot
+    durable.maxlen = options['maxlen'] or None
+    durable.retention = None
+
+    messages = _messages(options['messages'], options['size'])
+    count = len(messages)
+    rows = []
+    for mode, bench in (('pubsub', _bench_pubsub), ('durable', _bench_durable)):
+        result = bench(broker, messages, options['chunk_size'])
+        rows.append([
+            mode,
+            count,
+            f"{count / result['publish']:,.0f}",
+            result['received'],
+            f"{result['received'] / result['receive']:,.0f}",
+            _format_bytes(result['memory']),
+            _format_bytes(result['stream']),
+            'n/d' if result['stream'] is None else f"{result['stream'] / count:,.0f}",
+        ])
+    broker.redis_client.close()
+
+    stdout.write(format_table(
+        ['mode', 'messages', 'publiés/s', 'reçus', 'reçus/s', 'mémoire Redis', 'stream', 'octets/message'],
+        rows
+    ))
@@ -0,0 +1,166 @@
+"""
+Débit et appels système de la diffusion d'un gros message à de nombreux abonnés.
+
+Un message de résultat (64 Ko par défaut) est diffusé à --subscribers clients
+simulés par des paires de sockets, branchés sur un proxy à threads dans le
+processus du benchmark. Compare la trame encodée une fois et envoyée en
+écriture vectorisée (sendmsg) à l'ancien chemin: trame reconstruite avec des
+f-strings et un envoi par trame. Ne nécessite pas Redis.
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+
+from . import format_table
+from ..proxy import RedisProxy, RedisCommand
+from ..outbound import send_buffers
+from ..resp import encode_command
+from ..upstream import UpstreamPool
+
+CHANNEL = 'tasks/result/42'
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--subscribers',
+        type=int,
+        default=100,
+        help="Nombre d'abonnés au canal (défaut: 100)"
+    )
+    parser.add_argument(
+        '--payload-size',
+        type=int,
+        default=64 * 1024,
+        help='Taille du message de résultat en octets (défaut: 65536)'
+    )
+    parser.add_argument(
+        '--messages',
+        type=int,
+        default=200,
+        help='Nombre de messages diffusés (défaut: 200)'
+    )
+
+
+class _VectoredProxy(RedisProxy):
+    """Chemin actuel, avec comptage des appels d'envoi"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_calls = 0
+        self.calls_lock = threading.Lock()
+
+    def _send_batch(self, client_socket, batch):
+        calls = send_buffers(client_socket, batch)
+        with self.calls_lock:
+            self.send_calls += calls
+
+
+class _LegacyProxy(_VectoredProxy):
+    """Ancien chemin: trame reconstruite par f-strings et un envoi par trame"""
+
+    def _format_pubsub_message(self, channel, data):
+        channel_bytes = channel.encode('utf-8')
+        data_bytes = data.encode('utf-8') if isinstance(data, str) else data
+        data = data.decode('utf-8') if isinstance(data, bytes) else data
+        return (
+            f"*3\r\n$7\r\nmessage\r\n${len(channel_bytes)}\r\n{channel}\r\n"
+            f"${len(data_bytes)}\r\n{data}\r\n"
+        ).encode('utf-8')
+
+    def _send_batch(self, client_socket, batch):
+        calls = 0
+        for frame in batch:
+            view = memoryview(frame)
+            while view:
+                sent = client_socket.send(view)
+                view = view[sent:]
+                calls += 1
+        with self.calls_lock:
+            self.send_calls += calls
+
+
+def _reader(sock, expected, done):
+    """Abonné simulé: lit le nombre d'octets attendu"""
+    received = 0
+    try:
+        while received < expected:
+            chunk = sock.recv(1024 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+    except OSError:
+        pass
+    finally:
+        done.set()
+
+
+def _run_case(options, proxy_class):
+    messages = options['messages']
+    proxy = proxy_class(
+        redis_host=options['redis_host'],
+        redis_port=options['redis_port'],
+        outbound_queue_size=messages
+    )
+    proxy.running = True
+    # Pool jamais utilisé: les connexions vers Redis ne sont ouvertes qu'à la demande
+    proxy.upstream_pool = UpstreamPool(proxy.redis_host, proxy.redis_port, size=1)
+
+    # Message de résultat en bytes, tel que reçu de Redis par l'abonné partagé
+    data = json.dumps({'task_id': '42', 'results': 'x' * options['payload_size']}).encode('utf-8')
+    frame_size = len(proxy._format_pubsub_message(CHANNEL, data))
+
+    peers = []
+    readers = []
+    for i in range(options['subscribers']):
+        proxy_side, client_side = socket.socketpair()
+        client_id = f"bench:{i}"
+        proxy._register_client(proxy_side, client_id)
+        # tasks/result/# est réservé aux volunteers authentifiés
+        proxy.client_connections[client_id].update(authenticated=True, role='volunteer')
+        confirmation = proxy.prepare_subscribe(client_id, RedisCommand(encode_command('SUBSCRIBE', CHANNEL)))
+        proxy._send_replies(proxy.client_connections[client_id], [confirmation])
+        peers.append(client_side)
+
+        done = threading.Event()
+        thread = threading.Thread(target=_reader, args=(client_side, len(confirmation) + messages * frame_size, done))
+        thread.daemon = True
+        thread.start()
+        readers.append(done)
+    proxy._drain_pending_subscriptions()
+
+    proxy.send_calls = 0
+    started = time.perf_counter()
+    for _ in range(messages):
+        proxy.dispatch_published_message(CHANNEL, data)
+    for done in readers:
+        done.wait(60)
+    elapsed = time.perf_counter() - started
+
+    send_calls = proxy.send_calls
+    proxy.stop()
+    for peer in peers:
+        peer.close()
+
+    deliveries = messages * options['subscribers']
+    return [
+        'f-strings + envoi par trame' if proxy_class is _LegacyProxy else 'encodage unique + sendmsg',
+        f"{deliveries * frame_size / elapsed / 1024 / 1024:,.0f}",
+        f"{deliveries / elapsed:,.0f}",
+        f"{send_calls / deliveries:.2f}",
+    ]
+
+
+def run(options, stdout):
+    logger = logging.getLogger('RedisProxy')
+    previous_level = logger.level
+    logger.setLevel(logging.ERROR)
+
+    try:
+        rows = [_run_case(options, proxy_class) for proxy_class in (_LegacyProxy, _VectoredProxy)]
+    finally:
+        logger.setLevel(previous_level)
+
+    stdout.write(format_table(['chemin', 'Mo/s', 'messages livrés/s', 'appels système/message'], rows))
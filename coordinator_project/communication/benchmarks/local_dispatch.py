@@ -0,0 +1,76 @@
+"""
+Latence d'une publication vers un abonné du même MessageBroker.
+
+Mesure le délai entre publish() et l'appel du callback abonné au canal, dans
+un seul processus, avec et sans livraison locale (local_dispatch):
+    redis:  le message fait l'aller-retour par Redis puis par le thread
+            d'écoute de redis-py (run_in_thread)
+    local:  le message est remis au callback par le répartiteur en mémoire
+            du broker (il est tout de même publié sur Redis)
+"""
+
+import logging
+import threading
+import time
+
+from . import format_table, percentile
+from ..broker import MessageBroker
+
+CHANNEL = 'bench/local'
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--messages',
+        type=int,
+        default=2000,
+        help='Requêtes mesurées par mode (défaut: 2000)'
+    )
+
+
+def _measure(broker, count):
+    received = threading.Event()
+    delivered = []
+    latencies = []
+
+    def on_message(channel, data):
+        delivered.append(time.perf_counter())
+        received.set()
+
+    broker.subscribe(CHANNEL, on_message)
+    time.sleep(0.2)  # Confirmation d'abonnement par Redis
+    try:
+        for index in range(count):
+            received.clear()
+            delivered.clear()
+            started = time.perf_counter()
+            broker.publish(CHANNEL, {'request_id': index})
+            if not received.wait(5.0):
+                raise RuntimeError(f"Message {index} non reçu sur {CHANNEL}")
+            latencies.append((delivered[0] - started) * 1e6)
+    finally:
+        broker.stop_listening()
+    return latencies
+
+
+def run(options, stdout):
+    logging.getLogger('communication').setLevel(logging.WARNING)
+
+    rows = []
+    for mode in ('redis', 'local'):
+        broker = MessageBroker(host=options['redis_host'], port=options['redis_port'], persistent=False)
+        broker.create_channel(CHANNEL, 'Benchmark livraison locale', local_dispatch=mode == 'local')
+        broker.start_listening()
+        latencies = _measure(broker, options['messages'])
+        rows.append([
+            mode,
+            len(latencies),
+            f"{sum(latencies) / len(latencies):,.1f}",
+            f"{percentile(latencies, 50):,.1f}",
+            f"{percentile(latencies, 99):,.1f}",
+        ])
+
+    stdout.write(format_table(
+        ['mode', 'messages', 'moyenne (µs)', 'p50 (µs)', 'p99 (µs)'],
+        rows
+    ))
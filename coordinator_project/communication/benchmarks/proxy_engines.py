@@ -0,0 +1,136 @@
+"""
+Compare les moteurs threaded et asyncio du proxy Redis.
+
+Pour chaque moteur et chaque nombre de clients simulés, mesure le débit
+d'établissement des connexions (connexions/s) et la latence p99 d'un
+PUBLISH transmis à Redis à travers le proxy. Nécessite un Redis joignable.
+"""
+
+import asyncio
+import json
+import time
+
+from . import format_table, percentile, proxy_process, raise_nofile_limit
+
+PUBLISH_CHANNEL = 'coord/emergency'  # Canal ouvert: pas de token nécessaire
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--clients',
+        default='1000,5000,20000',
+        help='Nombres de clients simulés, séparés par des virgules (défaut: 1000,5000,20000)'
+    )
+    parser.add_argument(
+        '--engines',
+        default='threaded,asyncio',
+        help='Moteurs à comparer (défaut: threaded,asyncio)'
+    )
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=5,
+        help='Nombre de PUBLISH par client pour la mesure de latence (défaut: 5)'
+    )
+    parser.add_argument(
+        '--proxy-port',
+        type=int,
+        default=16380,
+        help='Port utilisé par le proxy pendant le benchmark (défaut: 16380)'
+    )
+    parser.add_argument(
+        '--connect-concurrency',
+        type=int,
+        default=512,
+        help='Connexions ouvertes en parallèle pendant la montée en charge (défaut: 512)'
+    )
+
+
+def _publish_frame(client_index):
+    """Construit une commande PUBLISH RESP pour un client"""
+    payload = json.dumps({'client': client_index, 'type': 'benchmark'}).encode('utf-8')
+    channel = PUBLISH_CHANNEL.encode('utf-8')
+    return (
+        b'*3\r\n$7\r\nPUBLISH\r\n$' + str(len(channel)).encode() + b'\r\n' + channel +
+        b'\r\n$' + str(len(payload)).encode() + b'\r\n' + payload + b'\r\n'
+    )
+
+
+async def _connect_all(port, count, concurrency):
+    """Ouvre count connexions vers le proxy et retourne (connexions, durée)"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect():
+        async with semaphore:
+            try:
+                return await asyncio.open_connection('127.0.0.1', port)
+            except OSError:
+                return None
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(connect() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    return [conn for conn in results if conn is not None], elapsed
+
+
+async def _measure_latency(connections, rounds):
+    """Envoie rounds PUBLISH par client et retourne les latences en ms"""
+    latencies = []
+
+    async def client(index, reader, writer):
+        frame = _publish_frame(index)
+        for _ in range(rounds):
+            started = time.perf_counter()
+            writer.write(frame)
+            await writer.drain()
+            reply = await reader.readline()
+            if not reply:
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(
+        *(client(i, reader, writer) for i, (reader, writer) in enumerate(connections)),
+        return_exceptions=True
+    )
+    return latencies
+
+
+async def _run_scenario(port, count, rounds, concurrency):
+    connections, connect_time = await _connect_all(port, count, concurrency)
+    latencies = await _measure_latency(connections, rounds)
+    for _, writer in connections:
+        writer.close()
+    return len(connections), connect_time, latencies
+
+
+def run(options, stdout):
+    client_counts = [int(value) for value in options['clients'].split(',')]
+    engines = options['engines'].split(',')
+
+    limit = raise_nofile_limit(max(client_counts) * 2 + 1024)
+    stdout.write(f"Limite de descripteurs: {limit}")
+
+    rows = []
+    for engine in engines:
+        for count in client_counts:
+            with proxy_process(options['redis_host'], options['redis_port'],
+                               options['proxy_port'], '--engine', engine):
+                connected, connect_time, latencies = asyncio.run(
+                    _run_scenario(options['proxy_port'], count, options['rounds'],
+                                  options['connect_concurrency'])
+                )
+            rows.append([
+                engine,
+                count,
+                connected,
+                f"{connected / connect_time:.0f}" if connect_time else '-',
+                f"{percentile(latencies, 50):.2f}",
+                f"{percentile(latencies, 99):.2f}",
+                len(latencies)
+            ])
+            stdout.write(f"{engine} / {count} clients terminé")
+
+    stdout.write(format_table(
+        ['moteur', 'clients', 'connectés', 'connexions/s', 'p50 (ms)', 'p99 (ms)', 'publish'],
+        rows
+    ))
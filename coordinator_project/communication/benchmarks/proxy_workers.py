@@ -0,0 +1,156 @@
+"""
+Débit du proxy Redis selon le nombre de workers (--workers, SO_REUSEPORT).
+
+Pour chaque nombre de workers, lance le proxy puis plusieurs processus de
+charge qui envoient des commandes en pipeline sur de nombreuses connexions,
+et mesure le débit total (requêtes/s) et l'accélération par rapport à un
+seul worker. La commande 'publish' (par défaut) passe par l'autorisation et
+le pool vers Redis, qui doit être joignable; la commande 'local' (CLIENT
+SETNAME) est traitée par le proxy sans Redis et ne mesure que l'analyse et
+la réponse. Le gain attendu est borné par le nombre de cœurs de la machine.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+
+from . import format_table, proxy_process, raise_nofile_limit
+from ..resp import encode_command
+
+PUBLISH_CHANNEL = 'coord/emergency'  # Canal ouvert: pas de token nécessaire
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--workers',
+        default='1,2,4',
+        help='Nombres de workers du proxy, séparés par des virgules (défaut: 1,2,4)'
+    )
+    parser.add_argument(
+        '--engine',
+        choices=['threaded', 'asyncio'],
+        default='asyncio',
+        help='Moteur du proxy (défaut: asyncio)'
+    )
+    parser.add_argument(
+        '--command',
+        choices=['local', 'publish'],
+        default='publish',
+        help="Commande envoyée: 'publish' ou 'local' (CLIENT SETNAME, sans Redis) (défaut: publish)"
+    )
+    parser.add_argument(
+        '--load-processes',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Nombre de processus générant la charge (défaut: nombre de cœurs)'
+    )
+    parser.add_argument(
+        '--connections',
+        type=int,
+        default=64,
+        help='Connexions ouvertes par processus de charge (défaut: 64)'
+    )
+    parser.add_argument(
+        '--pipeline',
+        type=int,
+        default=16,
+        help='Commandes envoyées par lot sur chaque connexion (défaut: 16)'
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=5.0,
+        help='Durée de chaque mesure en secondes (défaut: 5)'
+    )
+    parser.add_argument(
+        '--proxy-port',
+        type=int,
+        default=16381,
+        help='Port utilisé par le proxy pendant le benchmark (défaut: 16381)'
+    )
+
+
+def _frame(command):
+    if command == 'publish':
+        return encode_command('PUBLISH', PUBLISH_CHANNEL, '{"type": "benchmark"}')
+    return encode_command('CLIENT', 'SETNAME', 'benchmark')
+
+
+async def _load(port, command, connections, pipeline, duration):
+    """Envoie des lots de commandes jusqu'à la fin de la mesure; retourne le nombre de réponses"""
+    batch = _frame(command) * pipeline
+    deadline = time.monotonic() + duration
+    completed = 0
+
+    async def client():
+        nonlocal completed
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            return
+        try:
+            while time.monotonic() < deadline:
+                writer.write(batch)
+                await writer.drain()
+                # Les réponses (+OK ou :n) tiennent chacune sur une ligne
+                for _ in range(pipeline):
+                    if not await reader.readline():
+                        return
+                completed += pipeline
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client() for _ in range(connections)), return_exceptions=True)
+    return completed
+
+
+def _load_process(port, command, connections, pipeline, duration, results):
+    results.put(asyncio.run(_load(port, command, connections, pipeline, duration)))
+
+
+def _measure(options):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_load_process,
+            args=(options['proxy_port'], options['command'], options['connections'],
+                  options['pipeline'], options['duration'], results)
+        )
+        for _ in range(options['load_processes'])
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    completed = sum(results.get() for _ in processes)
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return completed, elapsed
+
+
+def run(options, stdout):
+    raise_nofile_limit(options['load_processes'] * options['connections'] * 2 + 1024)
+    stdout.write(f"Cœurs disponibles: {os.cpu_count()}")
+
+    rows = []
+    baseline = None
+    for workers in [int(value) for value in options['workers'].split(',')]:
+        with proxy_process(options['redis_host'], options['redis_port'], options['proxy_port'],
+                           '--engine', options['engine'], '--workers', str(workers)):
+            # Laisser tous les workers ouvrir leur socket d'écoute
+            time.sleep(0.5)
+            completed, elapsed = _measure(options)
+        throughput = completed / elapsed if elapsed else 0.0
+        if baseline is None:
+            baseline = throughput
+        rows.append([
+            workers,
+            completed,
+            f"{throughput:,.0f}",
+            f"{throughput / baseline:.2f}x" if baseline else '-',
+        ])
+        stdout.write(f"{workers} worker(s) terminé")
+
+    stdout.write(format_table(['workers', 'requêtes', 'requêtes/s', 'accélération'], rows))
@@ -0,0 +1,106 @@
+"""
+Débit du traitement des PUBLISH par le proxy selon la taille des messages.
+
+Pour chaque taille de message, mesure dans le processus du benchmark le
+traitement d'un PUBLISH authentifié (analyse RESP, autorisation,
+transformateurs, trame transmise à Redis) en trois modes:
+    json:     objet JSON décodé puis réencodé pour y ajouter les métadonnées
+    envelope: message enveloppé, seul l'en-tête est décodé
+    inspect:  message enveloppé sur un canal dont le corps est inspecté
+Aucun socket n'est ouvert. Ne nécessite pas Redis.
+"""
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from django.conf import settings
+
+from . import format_table
+from ..envelope import encode_envelope
+from ..proxy import RedisProxy, RedisCommand
+from ..resp import RespParser, encode_command
+
+CHANNEL = 'tasks/result/42'
+INSPECTED_CHANNEL = 'auth/register'
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--sizes',
+        default='200,4096,65536,1048576',
+        help='Tailles des messages en octets, séparées par des virgules (défaut: 200,4096,65536,1048576)'
+    )
+    parser.add_argument(
+        '--modes',
+        default='json,envelope,inspect',
+        help='Modes à comparer (défaut: json,envelope,inspect)'
+    )
+    parser.add_argument(
+        '--bytes-per-case',
+        type=int,
+        default=64 * 1024 * 1024,
+        help='Volume publié par mesure, qui fixe le nombre de messages (défaut: 64 Mo)'
+    )
+
+
+def _frame(mode, size, token):
+    """Construit la commande PUBLISH d'un message de résultat d'environ size octets"""
+    result = {'task_id': '42', 'status': 'COMPLETED', 'output': ''}
+    result['output'] = 'x' * max(0, size - len(json.dumps(result)))
+    if mode == 'json':
+        result['token'] = token
+        return encode_command('PUBLISH', CHANNEL, json.dumps(result))
+    if mode == 'inspect':
+        return encode_command('PUBLISH', INSPECTED_CHANNEL, encode_envelope({}, json.dumps(result)))
+    return encode_command('PUBLISH', CHANNEL, encode_envelope({'token': token}, json.dumps(result)))
+
+
+def _measure(proxy, frame, count):
+    parser = RespParser()
+    started = time.perf_counter()
+    for _ in range(count):
+        parser.feed(frame)
+        parts, raw = parser.gets()
+        handled, upstream_command, error = proxy.prepare_publish('bench:1', RedisCommand(raw, parts))
+        if error:
+            raise RuntimeError(error)
+    return time.perf_counter() - started
+
+
+def run(options, stdout):
+    logger = logging.getLogger('RedisProxy')
+    previous_level = logger.level
+    logger.setLevel(logging.WARNING)
+
+    token = jwt.encode(
+        {'user_id': 'bench', 'role': 'volunteer', 'exp': datetime.utcnow() + timedelta(hours=1)},
+        settings.SECRET_KEY, algorithm='HS256'
+    )
+    proxy = RedisProxy(redis_host=options['redis_host'], redis_port=options['redis_port'])
+    proxy.client_connections['bench:1'] = proxy._new_client_info()
+
+    rows = []
+    try:
+        for size in [int(value) for value in options['sizes'].split(',')]:
+            count = max(20, options['bytes_per_case'] // size)
+            for mode in options['modes'].split(','):
+                frame = _frame(mode, size, token)
+                elapsed = _measure(proxy, frame, count)
+                rows.append([
+                    size,
+                    mode,
+                    count,
+                    f"{count / elapsed:,.0f}",
+                    f"{count * len(frame) / elapsed / 1e6:,.1f}",
+                    f"{elapsed / count * 1e6:,.1f}",
+                ])
+    finally:
+        logger.setLevel(previous_level)
+
+    stdout.write(format_table(
+        ['taille (octets)', 'mode', 'messages', 'messages/s', 'Mo/s', 'µs/message'],
+        rows
+    ))
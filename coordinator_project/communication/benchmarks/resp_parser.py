@@ -0,0 +1,105 @@
+"""
+Micro-benchmark du parseur RESP incrémental (commandes analysées par seconde).
+
+Un corpus de commandes (PUBLISH de tailles variées, SUBSCRIBE, SET binaires,
+commandes inline) est injecté par morceaux de tailles différentes, pour
+mesurer le coût du pipelining et des trames fragmentées. Les cas de
+fragmentation et de données invalides sont vérifiés par les tests
+(communication/tests.py). Ne nécessite pas Redis.
+"""
+
+import json
+import os
+import random
+import time
+
+from . import format_table
+from ..resp import RespParser, encode_command
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--commands',
+        type=int,
+        default=20000,
+        help='Nombre de commandes dans le corpus (défaut: 20000)'
+    )
+    parser.add_argument(
+        '--payload-sizes',
+        default='200,4096,65536',
+        help='Tailles des messages PUBLISH en octets (défaut: 200,4096,65536)'
+    )
+    parser.add_argument(
+        '--chunk-sizes',
+        default='1,512,4096,65536,0',
+        help='Tailles des lectures simulées, 0 = corpus entier (défaut: 1,512,4096,65536,0)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Graine du générateur aléatoire (défaut: 0)'
+    )
+
+
+def build_corpus(count, payload_size, rng):
+    """Construit un flux de commandes pipelinées"""
+    frames = []
+    body = json.dumps({'results': 'é' * (payload_size // 2)}).encode('utf-8')[:payload_size]
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            frames.append(encode_command('PUBLISH', f'tasks/result/{i}', body))
+        elif kind == 1:
+            frames.append(encode_command('SUBSCRIBE', 'tasks/assign', f'tasks/status/{i}'))
+        elif kind == 2:
+            frames.append(encode_command('SET', f'key:{i}', os.urandom(rng.randint(0, 64))))
+        else:
+            frames.append(b'PING\r\n')
+    return b''.join(frames), count
+
+
+def parse_all(corpus, chunk_size):
+    """Analyse le corpus lu par morceaux de chunk_size octets"""
+    parser = RespParser()
+    commands = []
+    if chunk_size <= 0:
+        chunk_size = len(corpus)
+    view = memoryview(corpus)
+    for offset in range(0, len(corpus), chunk_size):
+        parser.feed(view[offset:offset + chunk_size])
+        commands.extend(parser)
+    return commands, parser.buffered()
+
+
+def run(options, stdout):
+    rng = random.Random(options['seed'])
+    chunk_sizes = [int(value) for value in options['chunk_sizes'].split(',')]
+
+    rows = []
+    for payload_size in [int(value) for value in options['payload_sizes'].split(',')]:
+        corpus, count = build_corpus(options['commands'], payload_size, rng)
+        reference, _ = parse_all(corpus, 0)
+        if len(reference) != count:
+            stdout.write(f"Erreur: {len(reference)} commandes analysées sur {count}")
+            return
+
+        for chunk_size in chunk_sizes:
+            if chunk_size == 1 and len(corpus) > 4 * 1024 * 1024:
+                continue  # Trop lent pour être utile
+            started = time.perf_counter()
+            commands, leftover = parse_all(corpus, chunk_size)
+            elapsed = time.perf_counter() - started
+            rows.append([
+                payload_size,
+                chunk_size or 'entier',
+                len(commands),
+                f"{len(commands) / elapsed:,.0f}",
+                f"{len(corpus) / elapsed / 1024 / 1024:,.1f}",
+                'ok' if commands == reference and not leftover else 'ÉCHEC'
+            ])
+
+    stdout.write(format_table(
+        ['payload (o)', 'lecture (o)', 'commandes', 'commandes/s', 'Mo/s', 'résultat'],
+        rows
+    ))
@@ -0,0 +1,186 @@
+"""
+Latence de diffusion du proxy en présence de clients qui ne lisent plus.
+
+Des clients simulés par des paires de sockets sont branchés sur un proxy à
+threads dans le processus du benchmark: les clients rapides lisent leurs
+messages, les clients lents jamais. Pour chaque nombre de clients lents et
+chaque politique de débordement, mesure la durée d'une diffusion par
+l'abonné partagé et la latence de réception des clients rapides, qui doivent
+rester stables. Ne nécessite pas Redis.
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+
+from . import format_table, percentile
+from ..outbound import POLICIES
+from ..proxy import RedisProxy, RedisCommand
+from ..resp import RespParser, encode_array, encode_command
+from ..upstream import UpstreamPool
+
+CHANNEL = 'coord/emergency'
+END_OF_RUN = b'{"end": true}'
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--fast-clients',
+        type=int,
+        default=20,
+        help='Nombre de clients qui lisent leurs messages (défaut: 20)'
+    )
+    parser.add_argument(
+        '--slow-clients',
+        default='0,10,50',
+        help='Nombres de clients qui ne lisent jamais, séparés par des virgules (défaut: 0,10,50)'
+    )
+    parser.add_argument(
+        '--policies',
+        default=','.join(POLICIES),
+        help='Politiques de débordement à comparer (défaut: toutes)'
+    )
+    parser.add_argument(
+        '--messages',
+        type=int,
+        default=2000,
+        help='Nombre de messages diffusés par mesure (défaut: 2000)'
+    )
+    parser.add_argument(
+        '--rate',
+        type=int,
+        default=500,
+        help='Messages publiés par seconde (défaut: 500)'
+    )
+    parser.add_argument(
+        '--payload-size',
+        type=int,
+        default=1024,
+        help='Taille des messages en octets (défaut: 1024)'
+    )
+
+
+def _reader(sock, latencies, done):
+    """Client rapide: lit les messages et mesure leur latence de réception"""
+    parser = RespParser()
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            now = time.perf_counter()
+            for value, _ in parser:
+                if value[2] == END_OF_RUN:
+                    return
+                latencies.append(now - json.loads(value[2])['sent_at'])
+    except OSError:
+        pass
+    finally:
+        done.set()
+
+
+def _run_case(options, policy, slow_count):
+    proxy = RedisProxy(
+        redis_host=options['redis_host'],
+        redis_port=options['redis_port'],
+        outbound_policy=policy,
+        outbound_queue_size=100
+    )
+    proxy.running = True
+    # Pool jamais utilisé: les connexions vers Redis ne sont ouvertes qu'à la demande
+    proxy.upstream_pool = UpstreamPool(proxy.redis_host, proxy.redis_port, size=1)
+
+    peers = []
+    readers = []
+    latencies = []
+    for i in range(options['fast_clients'] + slow_count):
+        proxy_side, client_side = socket.socketpair()
+        # Tampons réduits pour que les clients lents saturent rapidement
+        for sock in (proxy_side, client_side):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        client_id = f"bench:{i}"
+        proxy._register_client(proxy_side, client_id)
+        confirmation = proxy.prepare_subscribe(client_id, RedisCommand(encode_command('SUBSCRIBE', CHANNEL)))
+        proxy._send_replies(proxy.client_connections[client_id], [confirmation])
+        peers.append(client_side)
+
+        # Lire la confirmation d'abonnement
+        parser = RespParser()
+        while not parser.has_frames():
+            parser.feed(client_side.recv(4096))
+
+        if i < options['fast_clients']:
+            done = threading.Event()
+            thread = threading.Thread(
+                target=_reader,
+                args=(client_side, latencies, done)
+            )
+            thread.daemon = True
+            thread.start()
+            readers.append(done)
+    proxy._drain_pending_subscriptions()
+
+    padding = 'x' * options['payload_size']
+    interval = 1.0 / options['rate']
+    fanout = []
+    next_send = time.perf_counter()
+    for _ in range(options['messages']):
+        data = json.dumps({'sent_at': time.perf_counter(), 'padding': padding})
+        started = time.perf_counter()
+        proxy.dispatch_published_message(CHANNEL, data)
+        fanout.append(time.perf_counter() - started)
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    # Marqueur de fin envoyé comme une réponse: jamais abandonné par la file
+    for i in range(options['fast_clients']):
+        client_info = proxy.client_connections.get(f"bench:{i}")
+        if client_info is not None:
+            proxy._send_replies(client_info, [encode_array('message', CHANNEL, END_OF_RUN)])
+
+    deadline = time.monotonic() + 30
+    for done in readers:
+        done.wait(max(0.0, deadline - time.monotonic()))
+
+    total = proxy.outbound_stats()['total']
+    proxy.stop()
+    for peer in peers:
+        peer.close()
+
+    return [
+        policy,
+        slow_count,
+        f"{percentile(fanout, 50) * 1e6:,.0f}",
+        f"{percentile(fanout, 99) * 1e6:,.0f}",
+        f"{percentile(latencies, 50) * 1e3:,.2f}",
+        f"{percentile(latencies, 99) * 1e3:,.2f}",
+        f"{len(latencies)}/{options['messages'] * options['fast_clients']}",
+        total['dropped'],
+        total['coalesced'],
+    ]
+
+
+def run(options, stdout):
+    logger = logging.getLogger('RedisProxy')
+    previous_level = logger.level
+    logger.setLevel(logging.ERROR)
+
+    rows = []
+    try:
+        for policy in options['policies'].split(','):
+            for slow_count in [int(value) for value in options['slow_clients'].split(',')]:
+                rows.append(_run_case(options, policy, slow_count))
+    finally:
+        logger.setLevel(previous_level)
+
+    stdout.write(format_table(
+        ['politique', 'lents', 'diffusion p50 (µs)', 'diffusion p99 (µs)',
+         'réception p50 (ms)', 'réception p99 (ms)', 'reçus (rapides)', 'abandonnés', 'fusionnés'],
+        rows
+    ))
@@ -0,0 +1,115 @@
+"""
+Coût de diffusion d'un message publié selon le nombre de clients connectés.
+
+Simule dans le processus du benchmark un proxy avec --clients connexions
+réparties sur des canaux de --subscribers abonnés chacun, puis compare la
+diffusion par l'index des abonnements au parcours de toutes les connexions
+(comportement précédent). Aucun socket n'est ouvert: l'envoi aux clients est
+remplacé par un compteur. Ne nécessite pas Redis.
+"""
+
+import logging
+import time
+
+from . import format_table
+from ..proxy import RedisProxy, RedisCommand
+from ..resp import encode_command
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--clients',
+        default='1000,10000',
+        help='Nombres de clients connectés, séparés par des virgules (défaut: 1000,10000)'
+    )
+    parser.add_argument(
+        '--subscribers',
+        type=int,
+        default=10,
+        help='Nombre d\'abonnés par canal (défaut: 10)'
+    )
+    parser.add_argument(
+        '--messages',
+        type=int,
+        default=20000,
+        help='Nombre de messages diffusés par mesure (défaut: 20000)'
+    )
+
+
+class _CountingProxy(RedisProxy):
+    """Proxy dont les envois aux clients sont seulement comptés"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deliveries = 0
+
+    def _send_to_client(self, client_info, data, key=None):
+        self.deliveries += 1
+
+
+def _scan_dispatch(proxy, channel, data):
+    """Diffusion par parcours de toutes les connexions (ancien comportement)"""
+    resp_message = proxy._format_pubsub_message(channel, data)
+    for client_id, client_info in list(proxy.client_connections.items()):
+        if channel in client_info.get('subscribed_channels', set()):
+            proxy._send_to_client(client_info, resp_message)
+
+
+def _build_proxy(options, clients):
+    """Connecte les clients simulés et les abonne par le chemin SUBSCRIBE normal"""
+    proxy = _CountingProxy(redis_host=options['redis_host'], redis_port=options['redis_port'])
+    channels = [f"tasks/status/{i}" for i in range(max(1, clients // options['subscribers']))]
+    for i in range(clients):
+        client_id = f"10.0.{i // 250}.{i % 250}:{40000 + i}"
+        client_info = proxy._new_client_info()
+        client_info.update(authenticated=True, role='coordinator')
+        proxy.client_connections[client_id] = client_info
+        channel = channels[i % len(channels)]
+        proxy.prepare_subscribe(client_id, RedisCommand(encode_command('SUBSCRIBE', channel)))
+    return proxy, channels
+
+
+def _measure(proxy, dispatch, channels, messages):
+    data = '{"task_id": "42", "status": "RUNNING"}'
+    proxy.deliveries = 0
+    started = time.perf_counter()
+    for i in range(messages):
+        dispatch(channels[i % len(channels)], data)
+    elapsed = time.perf_counter() - started
+    return elapsed, proxy.deliveries
+
+
+def run(options, stdout):
+    # Les logs par message fausseraient la mesure
+    logger = logging.getLogger('RedisProxy')
+    previous_level = logger.level
+    logger.setLevel(logging.WARNING)
+
+    rows = []
+    try:
+        for clients in [int(value) for value in options['clients'].split(',')]:
+            proxy, channels = _build_proxy(options, clients)
+            # Ne pas s'abonner auprès de Redis: l'abonné partagé n'est pas démarré
+            proxy._drain_pending_subscriptions()
+
+            strategies = [
+                ('parcours', lambda channel, data: _scan_dispatch(proxy, channel, data)),
+                ('index', proxy.dispatch_published_message),
+            ]
+            for name, dispatch in strategies:
+                elapsed, deliveries = _measure(proxy, dispatch, channels, options['messages'])
+                rows.append([
+                    clients,
+                    len(channels),
+                    name,
+                    f"{options['messages'] / elapsed:,.0f}",
+                    f"{elapsed / options['messages'] * 1e6:,.1f}",
+                    deliveries // options['messages']
+                ])
+    finally:
+        logger.setLevel(previous_level)
+
+    stdout.write(format_table(
+        ['clients', 'canaux', 'diffusion', 'messages/s', 'µs/message', 'envois/message'],
+        rows
+    ))
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark des codecs de messages (json, orjson, msgpack).
+
+Pour chaque classe de messages.py, un message représentatif est encodé comme
+le publie le broker (enveloppe et en-tête compris pour un format binaire) puis
+décodé comme le reçoit un abonné (decode_message). Mesure le temps moyen
+d'encodage et de décodage et la taille du message publié. Les résultats de
+tâche portent un corps de --result-size octets. Ne nécessite pas Redis.
+"""
+
+import time
+
+from . import format_table
+from .. import messages
+from ..broker import BaseMessageBroker
+from ..codecs import available_codecs
+from ..envelope import decode_message
+
+TOKEN = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.' + 'x' * 180
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=20000,
+        help='Encodages et décodages par message et par codec (défaut: 20000)'
+    )
+    parser.add_argument(
+        '--result-size',
+        type=int,
+        default=4096,
+        help='Taille de la sortie portée par TaskResultMessage en octets (défaut: 4096)'
+    )
+    parser.add_argument(
+        '--codecs',
+        default=None,
+        help='Codecs comparés, séparés par des virgules (défaut: tous les codecs disponibles)'
+    )
+
+
+def sample_messages(result_size):
+    """Un message représentatif de chaque classe de messages.py"""
+    client_info = {'user_agent': 'coordinator-client/1.0', 'platform': 'linux'}
+    return [
+        messages.ManagerRegistrationMessage('alice', 'alice@example.org', 's3cret-password',
+                                            '10.0.0.12', client_info),
+        messages.ManagerRegistrationResponseMessage('success', 'Manager enregistré', 'a1b2c3',
+                                                    'alice', 'alice@example.org'),
+        messages.ManagerLoginMessage('alice', 's3cret-password', '10.0.0.12', client_info),
+        messages.ManagerLoginResponseMessage('success', 'Connexion réussie', TOKEN, TOKEN,
+                                             'a1b2c3', 'alice'),
+        messages.VolunteerRegistrationMessage('worker-01', 'AMD EPYC 7543', 32, 131072, 512000,
+                                              'Ubuntu 22.04', True, 'NVIDIA A100', 40960,
+                                              '10.0.1.7', 8000, {'max_tasks': 4, 'night_only': False}),
+        messages.VolunteerRegistrationResponseMessage('success', 'Volunteer enregistré', 'v-42',
+                                                      'worker-01'),
+        messages.VolunteerLoginMessage('v-42', 'worker-01', '10.0.1.7'),
+        messages.VolunteerLoginResponseMessage('success', 'Connexion réussie', TOKEN, TOKEN,
+                                               'v-42', 'worker-01'),
+        messages.TaskMessage('wf-7', 'task-311', 'render-frame', 'blender -b scene.blend -f 311',
+                             {'cpu': 4, 'ram': 8192, 'gpu': True}, ['task-309', 'task-310'], TOKEN),
+        messages.TaskStatusMessage('wf-7', 'task-311', 'RUNNING', 0.42, 'Image 311 en cours', TOKEN),
+        messages.TaskResultMessage('wf-7', 'task-311', 'success',
+                                   {'output': 'x' * result_size, 'exit_code': 0, 'frames': [311]},
+                                   None, 12.5, TOKEN),
+    ]
+
+
+def _time(function, argument, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function(argument)
+    return (time.perf_counter() - started) / iterations
+
+
+def run(options, stdout):
+    codecs = options['codecs'].split(',') if options['codecs'] else available_codecs()
+    iterations = options['iterations']
+
+    rows = []
+    for message in sample_messages(options['result_size']):
+        data = message.to_dict()
+        for codec in codecs:
+            def encode(data, codec=codec):
+                return BaseMessageBroker._encode_message(data, None, codec)
+
+            payload = encode(data)
+            decoded = decode_message(payload)
+            # Le token voyage dans l'en-tête d'un message binaire, pas dans le corps
+            assert {k: v for k, v in decoded.items() if k != 'token'} == \
+                {k: v for k, v in data.items() if k != 'token'}, f"{codec}: message altéré"
+            rows.append([
+                type(message).__name__,
+                codec,
+                len(payload),
+                f"{_time(encode, data, iterations) * 1e6:.2f}",
+                f"{_time(decode_message, payload, iterations) * 1e6:.2f}",
+            ])
+
+    stdout.write(format_table(['message', 'codec', 'octets', 'encodage µs', 'décodage µs'], rows))
@@ -3,13 +3,25 @@ Broker de messages utilisant Redis pour la communication pub/sub.
 Gère les canaux de communication entre les managers et les volunteers.
 """
 
-from typing import List, Optional, Callable, Any
+from concurrent.futures import Future
+from typing import List, Optional, Callable, Any, Iterable
 import redis
-import json
-from dataclasses import dataclass
+import math
+import queue
+import threading
+import uuid
+from dataclasses import asdict, dataclass
 from datetime import datetime
 import logging
 from django.conf import settings
+from redis.utils import str_if_bytes
+from .coalesce import Coalescer, coalesce_key, is_terminal
+from .codecs import CODEC_HEADER, JSON, get_codec
+from .envelope import ORIGIN_KEY, decode_message, decode_with_origin, encode_envelope, without_token
+from .registry import BROKER_FIELDS, ChannelStore
+from .rpc import PendingRequests, reply_channel_for
+from .streams import StreamConsumer, add_to_stream
+from .topics import TopicTrie, is_wildcard, to_redis_pattern, topic_matches
 
 logger = logging.getLogger(__name__)
 
@@ -23,24 +35,232 @@ class Channel:
         description: Description du canal
         created_at: Date de création
         active: Si le canal est actif
-        subscribers: Nombre d'abonnés actifs
+        subscribers: Nombre d'abonnés actifs (tout le cluster pour un canal
+            concret d'un broker persistant, abonnements locaux sinon)
+        durable: Si les messages sont aussi conservés dans un stream Redis
+        local_dispatch: Si les abonnés du même broker reçoivent les messages
+            directement en mémoire, sans aller-retour par Redis
+        maxlen: Entrées conservées dans le stream (approximatif, None: sans limite)
+        retention: Âge maximal des entrées du stream en secondes (None: sans limite)
+        codec: Codec des messages publiés (voir codecs.py)
+        coalesce_window: Fenêtre de fusion en secondes: seul le dernier message
+            par clé y est publié (0: pas de fusion, voir coalesce.py)
+        coalesce_key: Champ des messages qui distingue les clés de fusion
+            (None: une seule clé par canal)
     """
     name: str
     description: str
     created_at: datetime
     active: bool = True
     subscribers: int = 0
+    durable: bool = False
+    local_dispatch: bool = False
+    maxlen: Optional[int] = None
+    retention: Optional[float] = None
+    codec: str = JSON
+    coalesce_window: float = 0.0
+    coalesce_key: Optional[str] = None
 
 
-class MessageBroker:
+def resolve_endpoint(host=None, port=None, db=None):
     """
-    Broker central pour la communication pub/sub via Redis.
-    Gère les canaux de communication et le routage des messages.
+    Complète les paramètres de connexion avec les settings: ceux du proxy
+    Redis si USE_REDIS_PROXY, ceux de Redis sinon.
+    
+    Returns:
+        tuple: (hôte, port, base)
+    """
+    if getattr(settings, 'USE_REDIS_PROXY', False):
+        # Utiliser le proxy Redis
+        return (
+            host or getattr(settings, 'REDIS_PROXY_HOST', 'localhost'),
+            port or getattr(settings, 'REDIS_PROXY_PORT', 6380),
+            db or getattr(settings, 'REDIS_PROXY_DB', 0),
+        )
+    # Utiliser Redis directement
+    return (
+        host or getattr(settings, 'REDIS_HOST', 'localhost'),
+        port or getattr(settings, 'REDIS_PORT', 6379),
+        db or getattr(settings, 'REDIS_DB', 0),
+    )
+
+
+class SharedConnectionPool(redis.ConnectionPool):
+    """
+    Pool de connexions partagé par tous les clients d'un processus vers un
+    même serveur. Au-delà de max_idle connexions libres, une connexion
+    rendue au pool est fermée: après un pic, le processus revient à quelques
+    connexions ouvertes au lieu de garder toutes celles du pic.
+    """
+    
+    def __init__(self, max_idle=4, **kwargs):
+        super().__init__(**kwargs)
+        self.max_idle = max_idle
+    
+    def release(self, connection):
+        super().release(connection)
+        with self._lock:
+            if len(self._available_connections) <= self.max_idle:
+                return
+            try:
+                self._available_connections.remove(connection)
+            except ValueError:
+                return  # Connexion d'un autre processus, déjà fermée
+            self._created_connections -= 1
+        connection.disconnect()
+
+
+class ConfirmedPubSub(redis.client.PubSub):
+    """
+    PubSub qui retient les abonnements confirmés par le serveur, pour attendre
+    qu'un abonnement soit effectif avant de publier ce qui attend sa réponse.
+    Le thread d'écoute lit les confirmations sans les transmettre: elles
+    sont relevées ici, au passage.
+    """
+    
+    SUBSCRIBE_MESSAGE_TYPES = ('subscribe', 'psubscribe')
+    
+    def __init__(self, *args, **kwargs):
+        self._confirmed = set()  # (type, canal ou motif) confirmés
+        self._confirmation = threading.Condition()
+        super().__init__(*args, **kwargs)
+    
+    def handle_message(self, response, ignore_subscribe_messages=False):
+        if isinstance(response, list) and str_if_bytes(response[0]) in self.SUBSCRIBE_MESSAGE_TYPES:
+            with self._confirmation:
+                self._confirmed.add((str_if_bytes(response[0]), str_if_bytes(response[1])))
+                self._confirmation.notify_all()
+        return super().handle_message(response, ignore_subscribe_messages)
+    
+    def reset(self):
+        with self._confirmation:
+            self._confirmed.clear()
+        super().reset()
+    
+    def wait_confirmed(self, kind, channel, timeout):
+        """
+        Attend la confirmation d'un abonnement (kind: 'subscribe' ou 'psubscribe').
+        
+        Returns:
+            bool: False si le délai a expiré avant
+        """
+        with self._confirmation:
+            return self._confirmation.wait_for(lambda: (kind, channel) in self._confirmed, timeout)
+
+
+class LocalDispatcher:
+    """
+    Livre les messages publiés aux callbacks locaux d'un broker, dans un
+    thread dédié (comme les messages reçus de Redis) et dans l'ordre de
+    publication. Le thread démarre au premier message.
+    """
+    
+    def __init__(self, name='broker-local-dispatch'):
+        self.name = name
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.delivered = 0
+    
+    def submit(self, callbacks, channel, data):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name)
+                    self._thread.daemon = True
+                    self._thread.start()
+        self._queue.put((callbacks, channel, data))
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            callbacks, channel, data = item
+            for callback in callbacks:
+                try:
+                    callback(channel, data)
+                except Exception as e:
+                    logger.error(f"Erreur dans un callback local de {channel}: {e}")
+            self.delivered += 1
+    
+    def stop(self):
+        """Arrête le thread après les messages déjà soumis"""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread = None
+
+
+# (hôte, port, base) -> broker partagé du processus; (hôte, port, base, décodage, nom) -> pool
+_pools: dict = {}
+_brokers: dict = {}
+_registry_lock = threading.RLock()  # get_broker() appelle get_connection_pool()
+
+
+def get_connection_pool(host=None, port=None, db=None, decode_responses=True,
+                        client_name=None) -> SharedConnectionPool:
+    """
+    Pool de connexions du processus pour un serveur, créé au premier appel.
+    Aucune connexion n'est ouverte avant la première commande.
+    
+    Args:
+        decode_responses: Décoder les réponses en UTF-8; False pour lire des
+            messages binaires (codec msgpack)
+        client_name: Nom des connexions (CLIENT SETNAME): identifiant de
+            session d'un broker derrière le proxy, qui a alors son propre pool
+    """
+    endpoint = resolve_endpoint(host, port, db)
+    key = endpoint + (decode_responses, client_name)
+    with _registry_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SharedConnectionPool(
+                host=endpoint[0],
+                port=endpoint[1],
+                db=endpoint[2],
+                decode_responses=decode_responses,
+                client_name=client_name,
+                max_connections=getattr(settings, 'REDIS_POOL_MAX_CONNECTIONS', 64),
+                max_idle=getattr(settings, 'REDIS_POOL_MAX_IDLE', 4),
+                socket_connect_timeout=getattr(settings, 'REDIS_POOL_CONNECT_TIMEOUT', 5),
+                socket_keepalive=True,
+                # Vérifie par PING une connexion restée inutilisée (coupure silencieuse)
+                health_check_interval=getattr(settings, 'REDIS_POOL_HEALTH_CHECK_INTERVAL', 30),
+            )
+        return pool
+
+
+def get_broker(host=None, port=None, db=None) -> 'MessageBroker':
+    """
+    Broker partagé du processus pour un serveur, créé au premier appel:
+    les canaux par défaut ne sont initialisés qu'une fois et tous les
+    appelants utilisent le même pool de connexions.
+    
+    Example:
+        get_broker().publish('tasks/new', {...})
+    """
+    endpoint = resolve_endpoint(host, port, db)
+    broker = _brokers.get(endpoint)
+    if broker is not None:
+        return broker
+    with _registry_lock:
+        broker = _brokers.get(endpoint)
+        if broker is None:
+            broker = _brokers[endpoint] = MessageBroker(*endpoint)
+        return broker
+
+
+class BaseMessageBroker:
+    """
+    Partie commune des brokers synchrone et asynchrone: paramètres de
+    connexion, registre des canaux et encodage des messages. Aucune
+    entrée-sortie: les sous-classes fournissent le client Redis.
     """
     
     def __init__(self, host=None, port=None, db=None):
         """
-        Initialise la connexion Redis et configure les canaux par défaut.
+        Résout les paramètres de connexion et configure les canaux par défaut.
         
         Args:
             host: Hôte Redis (défaut: settings.REDIS_HOST ou localhost)
@@ -48,37 +268,41 @@ class MessageBroker:
             db: Base de données Redis (défaut: settings.REDIS_DB ou 0)
         """
         # Utiliser les paramètres fournis ou les valeurs par défaut des settings
-        self.use_proxy = getattr(settings, 'USE_REDIS_PROXY', False)
-        
+        self.redis_host, self.redis_port, self.redis_db = resolve_endpoint(host, port, db)
+        # Un broker construit avec l'adresse de Redis (consommateurs...) contourne le proxy
+        self.use_proxy = getattr(settings, 'USE_REDIS_PROXY', False) and (self.redis_host, self.redis_port) == (
+            getattr(settings, 'REDIS_PROXY_HOST', 'localhost'),
+            getattr(settings, 'REDIS_PROXY_PORT', 6380),
+        )
+        # Derrière le proxy, toutes les connexions du broker (commandes, pub/sub) portent le
+        # même nom de session: l'authentification d'un PUBLISH vaut pour les abonnements
+        self.session_id = uuid.uuid4().hex if self.use_proxy else None
         if self.use_proxy:
-            # Utiliser le proxy Redis
-            self.redis_host = host or getattr(settings, 'REDIS_PROXY_HOST', 'localhost')
-            self.redis_port = port or getattr(settings, 'REDIS_PROXY_PORT', 6380)
-            self.redis_db = db or getattr(settings, 'REDIS_PROXY_DB', 0)
-            logger.info(f"MessageBroker utilise le proxy Redis: {self.redis_host}:{self.redis_port}")
+            logger.info(f"{type(self).__name__} utilise le proxy Redis: {self.redis_host}:{self.redis_port}")
         else:
-            # Utiliser Redis directement
-            self.redis_host = host or getattr(settings, 'REDIS_HOST', 'localhost')
-            self.redis_port = port or getattr(settings, 'REDIS_PORT', 6379)
-            self.redis_db = db or getattr(settings, 'REDIS_DB', 0)
-            logger.info(f"MessageBroker utilise Redis directement: {self.redis_host}:{self.redis_port}")
+            logger.info(f"{type(self).__name__} utilise Redis directement: {self.redis_host}:{self.redis_port}")
         
-        # Connexion Redis
-        self.redis_client = redis.Redis(
-            host=self.redis_host, 
-            port=self.redis_port, 
-            db=self.redis_db,
-            decode_responses=True  # Décode automatiquement les réponses en UTF-8
-        )
-        self.pubsub = self.redis_client.pubsub()
+        # Messages envoyés par aller-retour dans publish_many()
+        self.publish_chunk_size = getattr(settings, 'REDIS_PUBLISH_CHUNK_SIZE', 100)
+        # Codec des canaux sans codec propre, et codecs par canal ou filtre
+        self.default_codec = getattr(settings, 'REDIS_DEFAULT_CODEC', JSON)
+        self.channel_codecs = getattr(settings, 'REDIS_CHANNEL_CODECS', {})
+        # Canaux de progression dont seul le dernier message par clé est publié
+        self.coalesce_channels = getattr(settings, 'REDIS_COALESCE_CHANNELS', {
+            'tasks/status/#': {'window': 0.25, 'key': 'task_id'},
+        })
+        self.coalescer = Coalescer()
+        # Rétention par défaut des canaux durables
+        self.stream_maxlen = getattr(settings, 'REDIS_STREAM_MAXLEN', 100000)
+        self.stream_retention = getattr(settings, 'REDIS_STREAM_RETENTION', 7 * 24 * 3600)
         
         # Stockage des canaux
         self._channels: dict[str, Channel] = {}
+        # Même trie que le proxy: résout 'tasks/status/42' vers 'tasks/status/#'
+        self._channel_trie = TopicTrie()
         
         # Initialise les canaux par défaut
         self._initialize_default_channels()
-        
-        logger.info("MessageBroker initialisé avec succès")
     
     def _initialize_default_channels(self):
         """Configure les canaux par défaut du système."""
@@ -111,18 +335,41 @@ class MessageBroker:
             ("manager/requests", "Requêtes spéciales des managers")
         ]
         
+        # Canaux dont les messages ne doivent pas être perdus pendant un redémarrage
+        durable_channels = getattr(settings, 'REDIS_DURABLE_CHANNELS', ['tasks/assign', 'tasks/result/#'])
+        # Réponses souvent attendues dans le même processus que leur publieur
+        local_channels = getattr(settings, 'REDIS_LOCAL_DISPATCH_CHANNELS', [
+            'auth/register_response', 'auth/login_response',
+            'volunteer/register_response', 'manager/status',
+        ])
+        
         for channel_name, description in default_channels:
-            self.create_channel(channel_name, description)
+            coalesce = self.coalesce_channels.get(channel_name, {})
+            self.create_channel(channel_name, description, durable=channel_name in durable_channels,
+                                local_dispatch=channel_name in local_channels,
+                                codec=self.channel_codecs.get(channel_name),
+                                coalesce_window=coalesce.get('window', 0.0),
+                                coalesce_key=coalesce.get('key'))
             
         logger.info(f"Canaux par défaut initialisés: {len(default_channels)} canaux")
 
-    def create_channel(self, channel_name: str, description: str) -> bool:
+    def create_channel(self, channel_name: str, description: str, durable: bool = False,
+                       maxlen: Optional[int] = None, retention: Optional[float] = None,
+                       local_dispatch: bool = False, codec: Optional[str] = None,
+                       coalesce_window: float = 0.0, coalesce_key: Optional[str] = None) -> bool:
         """
         Crée un nouveau canal de communication.
         
         Args:
             channel_name: Nom du canal (ex: 'tasks/new')
             description: Description du canal
+            durable: Conserver aussi les messages dans un stream Redis
+            maxlen: Entrées conservées (défaut: settings.REDIS_STREAM_MAXLEN ou 100000)
+            retention: Âge maximal des entrées en secondes (défaut: settings.REDIS_STREAM_RETENTION ou 7 jours)
+            local_dispatch: Livrer directement aux abonnés du même broker
+            codec: Codec des messages publiés (défaut: settings.REDIS_DEFAULT_CODEC ou json)
+            coalesce_window: Fenêtre de fusion des messages en secondes (0: pas de fusion)
+            coalesce_key: Champ des messages qui distingue les clés de fusion (ex: 'task_id')
             
         Returns:
             bool: True si créé, False si existe déjà
@@ -134,35 +381,114 @@ class MessageBroker:
         channel = Channel(
             name=channel_name,
             description=description,
-            created_at=datetime.utcnow()
+            created_at=datetime.utcnow(),
+            local_dispatch=local_dispatch,
+            codec=self._usable_codec(codec or self.default_codec),
+            coalesce_window=coalesce_window,
+            coalesce_key=coalesce_key
         )
+        if durable:
+            self._make_durable(channel, maxlen, retention)
         self._channels[channel_name] = channel
+        self._channel_trie.add(channel_name)
+        self._persist_channel(channel)
         
         logger.info(f"Canal créé: {channel_name}")
         return True
 
-    def delete_channel(self, channel_name: str) -> bool:
+    def set_durable(self, channel_name: str, durable: bool = True,
+                    maxlen: Optional[int] = None, retention: Optional[float] = None) -> bool:
         """
-        Supprime un canal existant.
+        Active ou désactive le mode durable d'un canal du registre. Le stream
+        existant n'est pas supprimé en désactivant.
+        
+        Returns:
+            bool: True si modifié, False si le canal n'existe pas
+        """
+        channel = self._channels.get(channel_name)
+        if channel is None:
+            logger.warning(f"Canal {channel_name} n'existe pas")
+            return False
+        if durable:
+            self._make_durable(channel, maxlen, retention)
+        else:
+            channel.durable = False
+        self._persist_channel(channel)
+        logger.info(f"Canal {channel_name} {'durable' if durable else 'non durable'}")
+        return True
+
+    def set_local_dispatch(self, channel_name: str, enabled: bool = True) -> bool:
+        """
+        Active ou désactive la livraison en mémoire aux abonnés du même broker
+        pour un canal du registre (ou un filtre: tous les canaux qu'il couvre).
+        
+        Returns:
+            bool: True si modifié, False si le canal n'existe pas
+        """
+        channel = self._channels.get(channel_name)
+        if channel is None:
+            logger.warning(f"Canal {channel_name} n'existe pas")
+            return False
+        channel.local_dispatch = enabled
+        self._persist_channel(channel)
+        return True
+
+    def set_codec(self, channel_name: str, codec: str) -> bool:
+        """
+        Change le codec des messages publiés sur un canal du registre (ou un
+        filtre: tous les canaux qu'il couvre). Les récepteurs n'ont rien à
+        changer: chaque message porte son format.
+        
+        Returns:
+            bool: True si modifié, False si le canal n'existe pas
+        """
+        channel = self._channels.get(channel_name)
+        if channel is None:
+            logger.warning(f"Canal {channel_name} n'existe pas")
+            return False
+        channel.codec = self._usable_codec(codec)
+        self._persist_channel(channel)
+        logger.info(f"Canal {channel_name}: codec {channel.codec}")
+        return True
+
+    def set_coalescing(self, channel_name: str, window: float, key: Optional[str] = None) -> bool:
+        """
+        Active (window > 0) ou désactive la fusion des messages d'un canal du
+        registre (ou d'un filtre: tous les canaux qu'il couvre). Les messages
+        déjà retenus sont publiés à la fin de leur fenêtre.
         
         Args:
-            channel_name: Nom du canal à supprimer
+            channel_name: Nom du canal
+            window: Fenêtre en secondes pendant laquelle seul le dernier message par clé est publié
+            key: Champ des messages qui distingue les clés (ex: 'task_id'; None: une clé par canal)
             
         Returns:
-            bool: True si supprimé, False si n'existe pas
+            bool: True si modifié, False si le canal n'existe pas
         """
-        if channel_name not in self._channels:
+        channel = self._channels.get(channel_name)
+        if channel is None:
             logger.warning(f"Canal {channel_name} n'existe pas")
             return False
-            
-        # Désabonne tout le monde
-        pattern = f"{channel_name}*"
-        self.pubsub.punsubscribe(pattern)
-        
-        del self._channels[channel_name]
-        logger.info(f"Canal supprimé: {channel_name}")
+        channel.coalesce_window = window
+        channel.coalesce_key = key
+        self._persist_channel(channel)
+        logger.info(f"Canal {channel_name}: fusion sur {window}s par {key or 'canal'}")
         return True
 
+    @staticmethod
+    def _usable_codec(name: str) -> str:
+        """Nom du codec, ou json si le codec est inconnu ou son module absent"""
+        try:
+            return get_codec(name).name
+        except ValueError as e:
+            logger.warning(f"{e}, publication en JSON")
+            return JSON
+
+    def _make_durable(self, channel: Channel, maxlen: Optional[int], retention: Optional[float]):
+        channel.durable = True
+        channel.maxlen = maxlen or self.stream_maxlen
+        channel.retention = retention or self.stream_retention
+
     def list_channels(self) -> List[Channel]:
         """Liste tous les canaux disponibles."""
         return list(self._channels.values())
@@ -170,6 +496,8 @@ class MessageBroker:
     def get_channel(self, channel_name: str) -> Optional[Channel]:
         """
         Obtient les informations d'un canal.
+        Un canal concret sans définition propre est résolu vers le filtre
+        le plus précis qui le couvre (ex: 'tasks/status/42' -> 'tasks/status/#').
         
         Args:
             channel_name: Nom du canal
@@ -177,7 +505,304 @@ class MessageBroker:
         Returns:
             Channel ou None si pas trouvé
         """
-        return self._channels.get(channel_name)
+        channel = self._channels.get(channel_name)
+        if channel is not None:
+            return channel
+        
+        matches = [topic_filter for topic_filter, _ in self._channel_trie.match_items(channel_name)]
+        if not matches:
+            return None
+        # Le filtre le plus long est le plus précis
+        return self._channels.get(max(matches, key=len))
+
+    def _discard_channel(self, channel_name: str):
+        """Retire un canal du registre (sans toucher aux abonnements Redis)."""
+        del self._channels[channel_name]
+        self._channel_trie.discard(channel_name)
+        self._forget_channel(channel_name)
+        logger.info(f"Canal supprimé: {channel_name}")
+
+    def _persist_channel(self, channel: Channel):
+        """Enregistre un canal créé ou modifié (les sous-classes persistantes l'écrivent en base)"""
+
+    def _forget_channel(self, channel_name: str):
+        """Enregistre la suppression d'un canal (voir _persist_channel)"""
+
+    def _apply_stored_channel(self, data: dict):
+        """
+        Met le registre à jour depuis un document de la base, relu au
+        démarrage ou après une invalidation. Seuls les champs du broker
+        définis dans le document remplacent ceux du registre.
+        """
+        name = data['name']
+        channel = self._channels.get(name)
+        if not data.get('active', True):
+            if channel is not None:
+                del self._channels[name]
+                self._replace_channel_trie()
+                logger.info(f"Canal supprimé par un autre broker: {name}")
+            return
+        
+        created = channel is None
+        if created:
+            channel = Channel(
+                name=name,
+                description=data.get('description') or '',
+                created_at=data.get('created_at') or datetime.utcnow()
+            )
+        elif data.get('description'):
+            channel.description = data['description']
+        for field in BROKER_FIELDS:
+            if data.get(field) is not None:
+                setattr(channel, field, data[field])
+        channel.codec = self._usable_codec(channel.codec)
+        if channel.durable:
+            self._make_durable(channel, channel.maxlen, channel.retention)
+        if created:
+            self._channels[name] = channel
+            self._replace_channel_trie()
+
+    def _replace_channel_trie(self):
+        """
+        Reconstruit le trie des canaux et remplace la référence: les threads
+        qui publient pendant la mise à jour lisent l'ancien trie, intact.
+        """
+        trie = TopicTrie()
+        for name in list(self._channels):
+            trie.add(name)
+        self._channel_trie = trie
+
+    def _coalesce_key(self, channel: str, message: Any):
+        """
+        Clé de fusion d'un message d'un canal en mode fusion, ou None si le
+        message est publié tel quel (canal sans fusion, message déjà encodé,
+        publication par le proxy qui fusionne lui-même).
+        """
+        if self.use_proxy:
+            # Le proxy applique la même fusion à tous les publieurs: une seule fenêtre
+            return None
+        registered = self.get_channel(channel)
+        if not registered.coalesce_window or not isinstance(message, dict):
+            return None
+        return coalesce_key(channel, message, registered.coalesce_key)
+
+    def _ensure_channel(self, channel_name: str) -> Channel:
+        """Crée le canal s'il n'existe pas et qu'aucun filtre ne le couvre."""
+        if self.get_channel(channel_name) is None:
+            self.create_channel(channel_name, f"Canal créé automatiquement: {channel_name}")
+        return self.get_channel(channel_name)
+
+    @staticmethod
+    def _encode_message(message: Any, headers: Optional[dict] = None, codec: str = JSON):
+        """
+        Sérialise un message pour Redis.
+        
+        Args:
+            message: Message à publier (sérialisé par le codec sauf s'il est
+                déjà une chaîne JSON)
+            headers: En-tête d'enveloppe (ex: {'token': ...}); si fourni, le
+                message est enveloppé et son corps traverse le proxy sans être décodé
+            codec: Nom du codec; un format binaire est toujours enveloppé, avec
+                son nom et le token du message dans l'en-tête
+            
+        Returns:
+            str ou bytes: Message prêt à être publié
+        """
+        if isinstance(message, str):
+            return message if headers is None else encode_envelope(headers, message)
+        
+        codec = get_codec(codec)
+        if codec.binary:
+            headers = dict(headers or {}, **{CODEC_HEADER: codec.wire})
+            if isinstance(message, dict) and 'token' in message:
+                # Le proxy authentifie la publication par l'en-tête, sans décoder le corps
+                message = dict(message)
+                token = message.pop('token')
+                headers.setdefault('token', token)
+        encoded = codec.encode(message)
+        
+        if headers is not None:
+            encoded = encode_envelope(headers, encoded)
+        return encoded
+
+    def _encode_for_publish(self, channel: str, message: Any, headers: Optional[dict] = None):
+        """Encode un message à publier (les sous-classes y ajoutent la livraison locale)"""
+        return self._encode_message(message, headers, self.get_channel(channel).codec)
+
+    def _queue_publish(self, pipe, channel: str, json_message: str) -> int:
+        """
+        Met en file dans un pipeline la publication d'un message: XADD sur le
+        stream si le canal (ou le filtre qui le couvre) est durable, puis PUBLISH.
+        
+        Returns:
+            int: Nombre de commandes ajoutées (la réponse du PUBLISH est la dernière)
+        """
+        registered = self.get_channel(channel)
+        queued = 0
+        if registered is not None and registered.durable:
+            # Le token ne doit pas être conservé: le proxy le retire de l'entrée
+            # qu'il transmet, sans proxy le broker le retire lui-même
+            stream_message = json_message if self.use_proxy else without_token(json_message)
+            queued = add_to_stream(pipe, registered.name, channel, stream_message,
+                                   registered.maxlen, registered.retention)
+        pipe.publish(channel, json_message)
+        return queued + 1
+
+    def _publish_chunks(self, messages: Iterable[tuple], chunk_size: Optional[int] = None):
+        """
+        Encode les messages de publish_many() et les regroupe par paquets.
+        Un message impossible à encoder est journalisé et exclu des paquets.
+        
+        Args:
+            messages: (canal, message) ou (canal, message, en-tête)
+            chunk_size: Messages par paquet (défaut: self.publish_chunk_size)
+            
+        Yields:
+            list: (position du message, canal, message encodé)
+        """
+        chunk_size = chunk_size or self.publish_chunk_size
+        chunk = []
+        for index, item in enumerate(messages):
+            channel, message = item[0], item[1]
+            headers = item[2] if len(item) > 2 else None
+            try:
+                self._ensure_channel(channel)
+                chunk.append((index, channel, self._encode_for_publish(channel, message, headers)))
+            except Exception as e:
+                logger.error(f"Erreur lors de l'encodage du message pour {channel}: {e}")
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _chunk_results(results: list, chunk: list, queued: list, replies: list):
+        """
+        Range les réponses d'un paquet: la réponse du PUBLISH de chaque message,
+        ou None si l'une de ses commandes a échoué.
+        """
+        position = 0
+        for (index, channel, _), count in zip(chunk, queued):
+            own = replies[position:position + count]
+            position += count
+            reply = next((reply for reply in own if isinstance(reply, Exception)), own[-1])
+            if isinstance(reply, Exception):
+                logger.error(f"Erreur lors de la publication sur {channel}: {reply}")
+                reply = None
+            results[index] = reply
+
+
+class MessageBroker(BaseMessageBroker):
+    """
+    Broker central pour la communication pub/sub via Redis.
+    Gère les canaux de communication et le routage des messages.
+    """
+    
+    # Synchronisation du registre avec la base (None: registre propre à l'instance)
+    channel_store = None
+    
+    def __init__(self, host=None, port=None, db=None, persistent=None):
+        """
+        Initialise la connexion Redis et configure les canaux par défaut.
+        
+        Args:
+            host: Hôte Redis (défaut: settings.REDIS_HOST ou localhost)
+            port: Port Redis (défaut: settings.REDIS_PORT ou 6379)
+            db: Base de données Redis (défaut: settings.REDIS_DB ou 0)
+            persistent: Partager le registre des canaux via la base et Redis
+                (défaut: settings.REDIS_CHANNEL_REGISTRY_PERSISTENT ou True)
+        """
+        super().__init__(host, port, db)
+        
+        # Client Redis sur le pool partagé du processus (connexion ouverte à la première commande)
+        self.redis_client = redis.Redis(
+            connection_pool=get_connection_pool(self.redis_host, self.redis_port, self.redis_db,
+                                                client_name=self.session_id)
+        )
+        # Réponses non décodées: les messages peuvent être binaires (codec msgpack)
+        self.binary_client = redis.Redis(
+            connection_pool=get_connection_pool(self.redis_host, self.redis_port, self.redis_db,
+                                                decode_responses=False, client_name=self.session_id)
+        )
+        self.pubsub = ConfirmedPubSub(self.binary_client.connection_pool)
+        self._listener_thread = None
+        
+        # Livraison en mémoire aux callbacks de ce broker (canaux local_dispatch)
+        self.origin = uuid.uuid4().hex
+        self._local_callbacks = TopicTrie()
+        self.local_dispatcher = LocalDispatcher()
+        
+        # Requêtes en attente de réponse et canaux de réponse déjà écoutés
+        self.request_timeout = getattr(settings, 'REDIS_REQUEST_TIMEOUT', 10.0)
+        self.pending_requests = PendingRequests()
+        self._reply_channels = set()
+        self._reply_lock = threading.Lock()
+        
+        # Thread d'envoi des messages retenus par la fusion (démarré au premier message retenu)
+        self._coalesce_thread = None
+        self._coalesce_lock = threading.Lock()
+        self._coalesce_stop = threading.Event()
+        
+        # Registre partagé: les canaux par défaut viennent des settings, les
+        # documents de la base les complètent dès le chargement en arrière-plan
+        if persistent is None:
+            persistent = getattr(settings, 'REDIS_CHANNEL_REGISTRY_PERSISTENT', True)
+        if persistent:
+            self.channel_store = ChannelStore(
+                self.redis_client,
+                self.origin,
+                on_change=self._apply_stored_channel,
+                channel_names=self._concrete_channel_names,
+                on_counts=self._apply_subscriber_counts,
+                numsub_interval=getattr(settings, 'REDIS_NUMSUB_INTERVAL', 10.0),
+                numsub_batch=getattr(settings, 'REDIS_NUMSUB_BATCH', 100),
+            )
+            self.channel_store.start()
+        
+        logger.info("MessageBroker initialisé avec succès")
+
+    def _persist_channel(self, channel: Channel):
+        if self.channel_store is not None:
+            self.channel_store.save(asdict(channel))
+
+    def _forget_channel(self, channel_name: str):
+        if self.channel_store is not None:
+            self.channel_store.delete(channel_name)
+
+    def _concrete_channel_names(self) -> List[str]:
+        """Canaux du registre dont PUBSUB NUMSUB compte les abonnés (pas les filtres)"""
+        return [name for name in list(self._channels) if not is_wildcard(name)]
+
+    def _apply_subscriber_counts(self, counts: dict):
+        for name, count in counts.items():
+            channel = self._channels.get(name)
+            if channel is not None:
+                channel.subscribers = count
+
+    def delete_channel(self, channel_name: str) -> bool:
+        """
+        Supprime un canal existant.
+        
+        Args:
+            channel_name: Nom du canal à supprimer
+            
+        Returns:
+            bool: True si supprimé, False si n'existe pas
+        """
+        if channel_name not in self._channels:
+            logger.warning(f"Canal {channel_name} n'existe pas")
+            return False
+            
+        # Désabonne tout le monde
+        pattern = f"{channel_name}*"
+        self.pubsub.punsubscribe(pattern)
+        for callback in self._local_callbacks.values(channel_name):
+            self._local_callbacks.discard(channel_name, callback)
+        
+        self._discard_channel(channel_name)
+        return True
 
     def subscribe(self, channel: str, callback: Callable[[str, Any], None]):
         """
@@ -193,53 +818,242 @@ class MessageBroker:
             
             broker.subscribe('tasks/new', on_task)
         """
-        if channel not in self._channels:
-            self.create_channel(channel, f"Canal créé automatiquement: {channel}")
+        self._ensure_channel(channel)
+        
+        wildcard = is_wildcard(channel)
             
         def message_handler(message):
             try:
                 if message['type'] == 'message':
-                    data = json.loads(message['data'])
-                    callback(channel, data)
+                    data, origin = decode_with_origin(message['data'])
+                    if origin != self.origin:
+                        callback(channel, data)
+                elif message['type'] == 'pmessage':
+                    # Filtre avec jokers: le callback reçoit le canal concret
+                    concrete = str_if_bytes(message['channel'])
+                    if not topic_matches(channel, concrete):
+                        return
+                    data, origin = decode_with_origin(message['data'])
+                    if origin != self.origin:
+                        callback(concrete, data)
                     
             except Exception as e:
                 logger.error(f"Erreur dans message_handler: {e}")
-                
-        self.pubsub.subscribe(**{channel: message_handler})
-        self._channels[channel].subscribers += 1
+        
+        if wildcard:
+            # Redis ne connaît pas les jokers MQTT: s'abonner au motif équivalent
+            self.pubsub.psubscribe(**{to_redis_pattern(channel): message_handler})
+        else:
+            self.pubsub.subscribe(**{channel: message_handler})
+        self._local_callbacks.add(channel, callback)
+        self.get_channel(channel).subscribers += 1
         
         logger.info(f"Abonné au canal: {channel}")
         
-    def publish(self, channel: str, message: Any) -> bool:
+    def publish(self, channel: str, message: Any, headers: Optional[dict] = None) -> bool:
         """
         Publie un message sur un canal.
         
         Args:
             channel: Nom du canal
-            message: Message à publier (sera converti en JSON)
+            message: Message à publier (sérialisé par le codec du canal)
+            headers: En-tête d'enveloppe (ex: {'token': ...}); si fourni, le
+                message est enveloppé et son corps traverse le proxy sans être décodé
             
         Returns:
-            bool: True si publié, False si erreur
+            bool: True si publié (ou retenu par la fusion du canal), False si erreur
         """
         try:
-            # Créer le canal s'il n'existe pas
-            if channel not in self._channels:
-                self.create_channel(channel, f"Canal créé automatiquement: {channel}")
+            # Créer le canal s'il n'existe pas et qu'aucun filtre ne le couvre
+            self._ensure_channel(channel)
+            key = self._coalesce_key(channel, message)
+            if key is not None:
+                if not is_terminal(message):
+                    # Publié à la fin de la fenêtre, sauf s'il est remplacé d'ici là
+                    self.coalescer.offer(key, (channel, message, headers), self.get_channel(channel).coalesce_window)
+                    self._start_coalesce_flusher()
+                    return True
+                # Après un envoi en cours: le message terminal reste le dernier de sa clé
+                with self._coalesce_lock:
+                    self.coalescer.discard(key)
+            json_message = self._encode_for_publish(channel, message, headers)
                 
-            # Convertir le message en JSON
-            if isinstance(message, str):
-                json_message = message
+            # Publier le message (et l'ajouter au stream d'un canal durable)
+            if self.get_channel(channel).durable:
+                pipe = self.redis_client.pipeline(transaction=False)
+                self._queue_publish(pipe, channel, json_message)
+                pipe.execute()
             else:
-                json_message = json.dumps(message)
-                
-            # Publier le message
-            self.redis_client.publish(channel, json_message)
+                self.redis_client.publish(channel, json_message)
             logger.debug(f"Message publié sur {channel}")
             return True
             
         except Exception as e:
             logger.error(f"Erreur lors de la publication sur {channel}: {e}")
             return False
+
+    def _encode_for_publish(self, channel: str, message: Any, headers: Optional[dict] = None):
+        """
+        Encode un message et, si le canal est en livraison locale, le remet
+        tout de suite aux callbacks de ce broker qui le couvrent. Le message
+        publié sur Redis (pour les abonnés des autres processus) est marqué
+        de l'origine, pour que ce broker ne le livre pas une seconde fois;
+        decode_message retire la marque à la réception.
+        Les callbacks locaux reçoivent le message tel qu'encodé, sans les
+        métadonnées que le proxy ajoute (_sender_id, _timestamp...).
+        """
+        callbacks = None
+        if self.get_channel(channel).local_dispatch:
+            callbacks = self._local_callbacks.match(channel)
+        if callbacks:
+            if headers is not None:
+                headers = dict(headers, **{ORIGIN_KEY: self.origin})
+            elif isinstance(message, dict):
+                message = dict(message, **{ORIGIN_KEY: self.origin})
+            else:
+                callbacks = None  # Message déjà encodé: pas de marque possible, livré par Redis
+        json_message = self._encode_message(message, headers, self.get_channel(channel).codec)
+        if callbacks:
+            # Décodé comme par un abonné Redis: le publieur peut modifier son objet ensuite
+            self.local_dispatcher.submit(callbacks, channel, decode_message(json_message))
+        return json_message
+
+    def _start_coalesce_flusher(self):
+        if self._coalesce_thread is not None:
+            return
+        with self._coalesce_lock:
+            if self._coalesce_thread is None:
+                self._coalesce_stop.clear()
+                self._coalesce_thread = threading.Thread(target=self._run_coalesce_flusher,
+                                                         name='broker-coalesce-flush')
+                self._coalesce_thread.daemon = True
+                self._coalesce_thread.start()
+
+    def _run_coalesce_flusher(self):
+        """Thread d'envoi: publie par lots les messages dont la fenêtre est écoulée"""
+        while not self._coalesce_stop.wait(self.coalescer.next_due()):
+            try:
+                self._flush_coalesced()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'envoi des messages fusionnés: {e}")
+
+    def _flush_coalesced(self, now: Optional[float] = None) -> int:
+        """Publie les messages retenus échus à l'instant now (défaut: maintenant)"""
+        with self._coalesce_lock:
+            due = self.coalescer.pop_due(now)
+            if due:
+                self.publish_many(due)
+        return len(due)
+
+    def publish_many(self, messages: Iterable[tuple], chunk_size: Optional[int] = None) -> List[Optional[int]]:
+        """
+        Publie plusieurs messages en un aller-retour Redis par paquet
+        (pipeline sans transaction: chaque message reste indépendant). Les
+        messages d'un lot ne sont pas fusionnés.
+        
+        Args:
+            messages: Itérable de (canal, message) ou (canal, message, en-tête)
+            chunk_size: Messages par aller-retour (défaut: settings.REDIS_PUBLISH_CHUNK_SIZE ou 100)
+            
+        Returns:
+            list: Nombre de récepteurs de chaque message, dans l'ordre; None
+                pour un message non publié
+            
+        Example:
+            broker.publish_many(('tasks/assign', task) for task in tasks)
+        """
+        messages = list(messages)
+        results = [None] * len(messages)
+        for chunk in self._publish_chunks(messages, chunk_size):
+            pipe = self.redis_client.pipeline(transaction=False)
+            queued = [self._queue_publish(pipe, channel, json_message) for _, channel, json_message in chunk]
+            try:
+                replies = pipe.execute(raise_on_error=False)
+            except Exception as e:
+                # Connexion perdue: tout le paquet est en échec
+                logger.error(f"Erreur lors de la publication d'un paquet de {len(chunk)} messages: {e}")
+                continue
+            self._chunk_results(results, chunk, queued, replies)
+        logger.debug(f"{len(messages)} messages publiés par lots")
+        return results
+            
+    def request(self, channel: str, message: dict, timeout: Optional[float] = None,
+                reply_channel: Optional[str] = None, headers: Optional[dict] = None) -> Future:
+        """
+        Publie une requête et retourne un Future résolu par la réponse de
+        même request_id, publiée par un consommateur sur le canal de réponse.
+        
+        Args:
+            channel: Canal de la requête (ex: 'auth/login')
+            message: Requête (dict); request_id est ajouté s'il manque
+            timeout: Délai de réponse en secondes (défaut: settings.REDIS_REQUEST_TIMEOUT ou 10)
+            reply_channel: Canal des réponses (défaut: canal + '_response')
+            headers: En-tête d'enveloppe, comme pour publish()
+            
+        Returns:
+            Future: résultat = message de réponse (dict); TimeoutError sans
+                réponse dans le délai, ConnectionError si la publication échoue
+            
+        Example:
+            reply = broker.request('auth/login', login_message.to_dict()).result()
+        """
+        message = dict(message)
+        request_id = message.setdefault('request_id', str(uuid.uuid4()))
+        self._listen_for_replies(reply_channel or reply_channel_for(channel))
+        
+        # Enregistré avant la publication: la réponse peut arriver avant le retour de publish()
+        future = self.pending_requests.add(request_id, self.request_timeout if timeout is None else timeout)
+        if not self.publish(channel, message, headers):
+            self.pending_requests.fail(request_id, ConnectionError(f"Publication sur {channel} impossible"))
+        return future
+
+    def _listen_for_replies(self, reply_channel: str):
+        """Abonne une seule fois le callback commun des réponses à un canal de réponse"""
+        with self._reply_lock:
+            if reply_channel in self._reply_channels:
+                return
+            self.subscribe(reply_channel, self._resolve_reply)
+            if self._listener_thread is None:
+                self.start_listening()
+            # Une réponse publiée avant la confirmation de l'abonnement serait perdue
+            if is_wildcard(reply_channel):
+                confirmation = ('psubscribe', to_redis_pattern(reply_channel))
+            else:
+                confirmation = ('subscribe', reply_channel)
+            if not self.pubsub.wait_confirmed(*confirmation, timeout=self.request_timeout):
+                logger.warning(f"Abonnement à {reply_channel} non confirmé")
+            self._reply_channels.add(reply_channel)
+
+    def _resolve_reply(self, channel: str, data: Any):
+        """Callback commun des canaux de réponse: résout la requête en attente"""
+        if isinstance(data, dict) and data.get('request_id'):
+            self.pending_requests.resolve(data['request_id'], data)
+
+    def consume(self, channel: str, group: str, consumer: Optional[str] = None, **options) -> StreamConsumer:
+        """
+        Prépare la lecture d'un canal durable au sein d'un groupe de
+        consommateurs: chaque message est traité par un seul membre du
+        groupe, y compris ceux publiés pendant son absence.
+        
+        Args:
+            channel: Canal ou filtre durable du registre (ex: 'tasks/result/#')
+            group: Nom du groupe de consommateurs
+            consumer: Nom du consommateur dans le groupe (défaut: hôte:pid)
+            options: count, block, claim_idle, max_deliveries (voir StreamConsumer)
+            
+        Returns:
+            StreamConsumer: à lancer avec run(callback) ou start(callback)
+            
+        Example:
+            consumer = broker.consume('tasks/assign', 'schedulers')
+            consumer.start(on_task)
+        """
+        registered = self.get_channel(channel)
+        if registered is None or not registered.durable:
+            raise ValueError(f"Le canal {channel} n'est pas durable")
+        consumer = StreamConsumer(self.binary_client, registered.name, group, consumer, **options)
+        consumer.ensure_group()
+        return consumer
             
     def start_listening(self):
         """
@@ -247,9 +1061,25 @@ class MessageBroker:
         Utilise les callbacks définis avec subscribe().
         """
         logger.info("Démarrage de l'écoute des messages")
-        self.pubsub.run_in_thread(sleep_time=0.01)
+        self._listener_thread = self.pubsub.run_in_thread(sleep_time=0.01, daemon=True)
         
     def stop_listening(self):
         """Arrête l'écoute des messages."""
         logger.info("Arrêt de l'écoute des messages")
+        if self._listener_thread is not None:
+            # Le thread d'écoute lit le pubsub: l'arrêter avant de le fermer
+            self._listener_thread.stop()
+            self._listener_thread.join(timeout=2.0)
+            self._listener_thread = None
         self.pubsub.close()
+        if self._coalesce_thread is not None:
+            # Les messages encore retenus partent sans attendre leur fenêtre
+            self._coalesce_stop.set()
+            self._coalesce_thread.join(timeout=2.0)
+            self._coalesce_thread = None
+            self._flush_coalesced(math.inf)
+            logger.info(f"Fusion des messages: {self.coalescer.stats()}")
+        with self._reply_lock:
+            # Abonnements perdus avec le pubsub: réabonnés à la prochaine requête
+            self._reply_channels.clear()
+        self.local_dispatcher.stop()
@@ -0,0 +1,140 @@
+"""
+Fusion des messages de progression: seul le dernier message par clé est
+transmis dans une fenêtre.
+
+Sur un canal en mode fusion (tasks/status/#...), le premier message d'une
+clé (canal + champ task_id...) est retenu pendant la fenêtre; les suivants
+le remplacent, et seul le dernier est transmis à l'échéance. Les messages
+remplacés sont abandonnés avant tout envoi: un volunteer qui rapporte sa
+progression 100 fois par seconde produit 4 messages par seconde avec une
+fenêtre de 250 ms, quel que soit le nombre d'abonnés.
+
+Un message terminal (statut COMPLETED, FAILED...) n'est jamais retenu: il
+part immédiatement et le message en attente de sa clé, plus ancien, est
+abandonné.
+
+La fusion est faite une seule fois par message: par le proxy, ou par le
+broker quand il publie directement sur Redis (USE_REDIS_PROXY désactivé).
+
+Le Coalescer ne fait aucune entrée/sortie: le broker et les deux moteurs du
+proxy appellent pop_due() depuis leur propre thread ou tâche d'envoi.
+"""
+
+import heapq
+import threading
+import time
+
+# Statuts après lesquels une tâche ne change plus (comparés sans la casse)
+TERMINAL_STATES = frozenset({'COMPLETED', 'FAILED', 'CANCELLED', 'SUCCESS', 'ERROR'})
+
+# Attente maximale d'un envoyeur sans message en attente, en secondes
+IDLE_TICK = 0.05
+
+
+def is_terminal(message):
+    """Indique si un message (dict) porte un statut terminal"""
+    status = message.get('status') if isinstance(message, dict) else None
+    return isinstance(status, str) and status.upper() in TERMINAL_STATES
+
+
+def coalesce_key(channel, message, key_field=None):
+    """
+    Clé de fusion d'un message: le canal, et la valeur de key_field si le
+    message la porte.
+    """
+    if key_field and isinstance(message, dict):
+        return (channel, message.get(key_field))
+    return (channel, None)
+
+
+class Coalescer:
+    """
+    Dernière valeur en attente par clé, avec l'échéance de sa fenêtre.
+    """
+
+    def __init__(self):
+        self._pending = {}  # clé -> [échéance, élément]
+        self._deadlines = []  # tas de (échéance, compteur, clé)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+        # Métriques
+        self.offered = 0
+        self.superseded = 0
+        self.flushed = 0
+
+    def offer(self, key, item, window, now=None):
+        """
+        Retient un élément jusqu'à la fin de la fenêtre de sa clé, à la place
+        de celui qui y attendait.
+
+        Returns:
+            bool: True si un élément en attente a été remplacé
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.offered += 1
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = item
+                self.superseded += 1
+                return True
+            deadline = now + window
+            self._pending[key] = [deadline, item]
+            self._counter += 1
+            heapq.heappush(self._deadlines, (deadline, self._counter, key))
+            return False
+
+    def discard(self, key):
+        """
+        Abandonne l'élément en attente d'une clé (remplacé par un message
+        transmis immédiatement).
+
+        Returns:
+            bool: True si un élément attendait
+        """
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                return False
+            self.superseded += 1
+            return True
+
+    def pop_due(self, now=None):
+        """
+        Retire les éléments dont la fenêtre est écoulée.
+
+        Returns:
+            list: Éléments à transmettre, par ordre d'échéance
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, _, key = heapq.heappop(self._deadlines)
+                entry = self._pending.get(key)
+                # Absente ou réinsérée depuis: l'échéance ne la concerne plus
+                if entry is not None and entry[0] == deadline:
+                    del self._pending[key]
+                    due.append(entry[1])
+            self.flushed += len(due)
+        return due
+
+    def next_due(self, now=None):
+        """Secondes avant la prochaine échéance, ou IDLE_TICK sans élément en attente"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self._deadlines:
+                return IDLE_TICK
+            return max(0.0, self._deadlines[0][0] - now)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'offered': self.offered,
+            'superseded': self.superseded,
+            'flushed': self.flushed,
+        }
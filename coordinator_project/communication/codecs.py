@@ -0,0 +1,169 @@
+"""
+Codecs de sérialisation des messages pub/sub.
+
+Chaque canal du registre du broker choisit son codec (settings
+REDIS_CHANNEL_CODECS, ou create_channel(..., codec=...)):
+
+    json     json de la bibliothèque standard (défaut)
+    orjson   même format JSON, encodé et décodé par orjson (plus rapide)
+    msgpack  format binaire MessagePack (plus compact)
+
+Le format est porté par le message lui-même, pas par la configuration du
+récepteur: un message JSON reste un objet JSON classique (ou un corps JSON
+d'enveloppe), lisible par tous les clients, quel que soit le codec qui l'a
+produit. Un format binaire voyage toujours dans une enveloppe dont l'en-tête
+porte son nom (clé 'codec'); le token y est placé pour que le proxy
+authentifie la publication sans décoder le corps. Un récepteur décode donc
+chaque message selon son en-tête, et des clients de versions différentes
+cohabitent sur un canal tant qu'ils connaissent le format reçu.
+
+Les modules orjson et msgpack sont optionnels: un codec dont le module est
+absent est signalé par get_codec(), et le broker publie alors en JSON.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    msgpack = None
+
+# Clé de l'en-tête d'enveloppe qui nomme le format du corps (absente: JSON)
+CODEC_HEADER = 'codec'
+JSON = 'json'
+
+
+class Codec:
+    """
+    Codec de messages.
+
+    Attributes:
+        name: Nom du codec dans la configuration des canaux
+        wire: Nom du format sur le fil, porté par l'en-tête d'enveloppe
+        binary: Si le format n'est pas du texte JSON (message toujours enveloppé)
+    """
+    name = None
+    wire = JSON
+    binary = False
+
+    def available(self):
+        """Indique si le module du codec est installé"""
+        return True
+
+    def encode(self, message):
+        """Sérialise un message (bytes ou str)"""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """
+        Désérialise un message (bytes ou str).
+
+        Raises:
+            ValueError: si les données sont invalides
+        """
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = 'json'
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def available(self):
+        return orjson is not None
+
+    def encode(self, message):
+        return orjson.dumps(message)
+
+    def decode(self, data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN, entiers au-delà de 64 bits...: acceptés par json, pas par orjson
+            return json.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    wire = 'msgpack'
+    binary = True
+
+    def available(self):
+        return msgpack is not None
+
+    def encode(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data):
+        if isinstance(data, str):
+            raise ValueError("Un message msgpack doit être reçu en bytes")
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise ValueError(f"Message msgpack invalide: {e}") from e
+
+
+_codecs = {codec.name: codec for codec in (JsonCodec(), OrjsonCodec(), MsgpackCodec())}
+# Décodeur de chaque format sur le fil: le plus rapide disponible
+_decoders = {
+    JSON: _codecs['orjson'] if _codecs['orjson'].available() else _codecs['json'],
+    'msgpack': _codecs['msgpack'],
+}
+
+
+def register_codec(codec):
+    """Ajoute un codec (et son format, s'il est nouveau) au registre"""
+    _codecs[codec.name] = codec
+    _decoders.setdefault(codec.wire, codec)
+
+
+def available_codecs():
+    """Noms des codecs utilisables dans ce processus"""
+    return [name for name, codec in _codecs.items() if codec.available()]
+
+
+def get_codec(name=None):
+    """
+    Codec d'un nom de la configuration (défaut: json).
+
+    Raises:
+        ValueError: si le codec est inconnu ou son module absent
+    """
+    codec = _codecs.get(name or JSON)
+    if codec is None:
+        raise ValueError(f"Codec inconnu: {name}")
+    if not codec.available():
+        raise ValueError(f"Codec {name} indisponible: module {name} non installé")
+    return codec
+
+
+def decoder_for(wire):
+    """
+    Codec qui décode un format reçu (nom porté par l'en-tête d'enveloppe).
+
+    Raises:
+        ValueError: si le format est inconnu ou son module absent
+    """
+    codec = _decoders.get(wire or JSON)
+    if codec is None:
+        raise ValueError(f"Format de message inconnu: {wire}")
+    if not codec.available():
+        raise ValueError(f"Format {wire} reçu mais module {codec.name} non installé")
+    return codec
@@ -11,11 +11,13 @@ from datetime import datetime
 import jwt
 from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
+from django.utils.functional import SimpleLazyObject
 
 from manager.models import Manager
 from volunteer.models import Volunteer
 from manager.auth import generate_manager_token
-from .broker import MessageBroker
+from .broker import get_broker
+from .envelope import decode_message
 from .messages import (
     ManagerRegistrationResponseMessage,
     ManagerLoginResponseMessage,
@@ -35,13 +37,15 @@ class RedisConsumer:
         Initialise le consommateur Redis.
         
         Args:
-            broker: Instance du MessageBroker (si None, en crée une nouvelle)
+            broker: Instance du MessageBroker (si None, le broker partagé du processus)
         """
-        self.broker = broker or MessageBroker(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB
-        )
+        if broker is None:
+            broker = get_broker(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB
+            )
+        self.broker = broker
         self.running = False
         self.thread = None
     
@@ -88,7 +92,7 @@ class ManagerRegistrationConsumer(RedisConsumer):
     def _run(self):
         """Écoute le canal d'enregistrement et traite les messages."""
         # S'abonner au canal
-        pubsub = self.broker.redis_client.pubsub()
+        pubsub = self.broker.binary_client.pubsub()
         pubsub.subscribe(self.channel)
         
         logger.info(f"Écoute du canal {self.channel}")
@@ -99,7 +103,7 @@ class ManagerRegistrationConsumer(RedisConsumer):
                 if message and message['type'] == 'message':
                     try:
                         # Décoder le message
-                        data = json.loads(message['data'])
+                        data = decode_message(message['data'])
                         logger.info(f"Message reçu sur {self.channel}: {data}")
                         
                         # Traiter le message d'enregistrement
@@ -228,16 +232,18 @@ class ManagerRegistrationConsumer(RedisConsumer):
                 email=manager.email
             )
             
-            self.broker.publish('auth/register_response', response.to_dict())
-            
-            # Publier un message sur le canal des managers
-            self.broker.publish('manager/status', {
-                'id': str(manager.id),
-                'username': manager.username,
-                'email': manager.email,
-                'status': 'registered',
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            # Réponse et statut en un seul aller-retour
+            self.broker.publish_many([
+                ('auth/register_response', response.to_dict()),
+                # Publier un message sur le canal des managers
+                ('manager/status', {
+                    'id': str(manager.id),
+                    'username': manager.username,
+                    'email': manager.email,
+                    'status': 'registered',
+                    'timestamp': datetime.utcnow().isoformat()
+                }),
+            ])
             
         except Exception as e:
             logger.error(f"Erreur lors de l'enregistrement du manager: {e}")
@@ -265,7 +271,7 @@ class ManagerLoginConsumer(RedisConsumer):
     def _run(self):
         """Écoute le canal d'authentification et traite les messages."""
         # S'abonner au canal
-        pubsub = self.broker.redis_client.pubsub()
+        pubsub = self.broker.binary_client.pubsub()
         pubsub.subscribe(self.channel)
         
         logger.info(f"Écoute du canal {self.channel}")
@@ -276,7 +282,7 @@ class ManagerLoginConsumer(RedisConsumer):
                 if message and message['type'] == 'message':
                     try:
                         # Décoder le message
-                        data = json.loads(message['data'])
+                        data = decode_message(message['data'])
                         logger.info(f"Message reçu sur {self.channel}: {data}")
                         
                         # Traiter le message d'authentification
@@ -356,7 +362,7 @@ class ManagerLoginConsumer(RedisConsumer):
                 # Envoyer une réponse d'erreur
                 response = ManagerLoginResponseMessage(
                     request_id=request_id,
-                    status='error',
+                    status='inactive',
                     message='Ce compte n\'est pas actif'
                 )
                 
@@ -385,16 +391,18 @@ class ManagerLoginConsumer(RedisConsumer):
                 email=manager.email
             )
             
-            self.broker.publish('auth/login_response', response.to_dict())
-            
-            # Publier un message sur le canal des managers
-            self.broker.publish('manager/status', {
-                'id': str(manager.id),
-                'username': manager.username,
-                'status': 'online',
-                'timestamp': datetime.utcnow().isoformat(),
-                'token': token  # Le token sera retiré par le proxy
-            })
+            # Réponse et statut en un seul aller-retour
+            self.broker.publish_many([
+                ('auth/login_response', response.to_dict()),
+                # Publier un message sur le canal des managers
+                ('manager/status', {
+                    'id': str(manager.id),
+                    'username': manager.username,
+                    'status': 'online',
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'token': token  # Le token sera retiré par le proxy
+                }),
+            ])
             
         except Exception as e:
             logger.error(f"Erreur lors de l'authentification du manager: {e}")
@@ -422,7 +430,7 @@ class VolunteerRegistrationConsumer(RedisConsumer):
     def _run(self):
         """Écoute le canal d'enregistrement et traite les messages."""
         # S'abonner au canal
-        pubsub = self.broker.redis_client.pubsub()
+        pubsub = self.broker.binary_client.pubsub()
         pubsub.subscribe(self.channel)
         
         logger.info(f"Écoute du canal {self.channel}")
@@ -433,7 +441,7 @@ class VolunteerRegistrationConsumer(RedisConsumer):
                 if message and message['type'] == 'message':
                     try:
                         # Décoder le message
-                        data = json.loads(message['data'])
+                        data = decode_message(message['data'])
                         logger.info(f"Message reçu sur {self.channel}: {data}")
                         
                         # Traiter le message d'enregistrement
@@ -534,12 +542,13 @@ class CommunicationService:
     
     def __init__(self):
         """Initialise le service de communication."""
-        # Créer une instance du broker
-        self.broker = MessageBroker(
+        # Broker partagé du processus, créé au démarrage du service: l'instance
+        # globale ci-dessous ne doit rien initialiser à l'import
+        self.broker = SimpleLazyObject(lambda: get_broker(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             db=settings.REDIS_DB
-        )
+        ))
         
         # Créer les consommateurs
         self.consumers = [
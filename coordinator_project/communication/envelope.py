@@ -0,0 +1,143 @@
+"""
+Enveloppe des messages pub/sub: un en-tête JSON court suivi du corps, opaque.
+
+Format d'un message enveloppé:
+
+    \\x1eENV1 + en-tête JSON sur une ligne + \\n + corps
+
+L'en-tête transporte le token du publieur et, après le passage par le proxy,
+les métadonnées de l'expéditeur (_sender_id, _sender_role, _timestamp,
+_client_ip). Le proxy ne lit que l'en-tête: le corps (résultat de tâche,
+fichier...) traverse le proxy sans être décodé ni réencodé, sauf sur les
+canaux dont la politique demande l'inspection du corps (auth/register...).
+La clé 'codec' de l'en-tête nomme le format du corps (absente: JSON, voir
+codecs.py).
+
+Le champ '_origin' (en-tête, ou clé d'un message JSON classique) marque les
+messages déjà livrés aux abonnés locaux du broker émetteur. decode_message
+le retire: seul ce broker s'en sert, les autres abonnés ne le voient pas.
+
+Un message sans ce préfixe est un objet JSON classique, traité comme avant.
+"""
+
+import json
+
+from .codecs import CODEC_HEADER, decoder_for
+
+# Préfixe des messages enveloppés (séparateur d'enregistrement ASCII + version)
+MAGIC = b'\x1eENV1'
+_MAGIC_STR = MAGIC.decode('ascii')
+_HEADER_END = b'\n'
+
+# Marque d'origine posée par un broker en livraison locale (voir broker.py)
+ORIGIN_KEY = '_origin'
+
+
+def is_envelope(data):
+    """Indique si un message (bytes ou str) est enveloppé"""
+    if isinstance(data, str):
+        return data.startswith(_MAGIC_STR)
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode_header(header):
+    """Encode le préfixe et l'en-tête, fin de ligne comprise"""
+    return MAGIC + json.dumps(header, separators=(',', ':')).encode('utf-8') + _HEADER_END
+
+
+def encode_envelope(header, body):
+    """
+    Construit un message enveloppé.
+
+    Args:
+        header: dict de l'en-tête (token, métadonnées)
+        body: Corps en bytes ou str, transmis tel quel
+
+    Returns:
+        bytes: Message prêt à être publié
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return encode_header(header) + body
+
+
+def split_envelope(data):
+    """
+    Sépare l'en-tête du corps sans toucher au corps.
+
+    Args:
+        data: Message enveloppé (bytes)
+
+    Returns:
+        tuple: (header dict, memoryview du corps)
+
+    Raises:
+        ValueError: si l'en-tête est absent ou invalide
+    """
+    end = data.find(_HEADER_END, len(MAGIC))
+    if end < 0:
+        raise ValueError("En-tête d'enveloppe non terminé")
+    header = json.loads(data[len(MAGIC):end])
+    if not isinstance(header, dict):
+        raise ValueError("L'en-tête d'enveloppe doit être un objet JSON")
+    return header, memoryview(data)[end + 1:]
+
+
+def without_token(data):
+    """
+    Copie d'un message encodé sans le token du publieur (en-tête d'enveloppe
+    ou champ d'un objet JSON), pour les copies conservées (streams). Un
+    message sans token est rendu tel quel, sans réencodage.
+    """
+    if is_envelope(data):
+        raw = data.encode('utf-8') if isinstance(data, str) else data
+        header, body = split_envelope(raw)
+        if 'token' not in header:
+            return data
+        del header['token']
+        return encode_header(header) + bytes(body)
+    try:
+        message = decoder_for(None).decode(data)
+    except ValueError:
+        return data
+    if not isinstance(message, dict) or 'token' not in message:
+        return data
+    del message['token']
+    return json.dumps(message)
+
+
+def decode_message(data):
+    """
+    Décode un message reçu, enveloppé ou non, en dict.
+    Les métadonnées de l'en-tête sont recopiées dans le dict, comme celles
+    qu'ajoute le proxy aux messages JSON classiques; la marque d'origine est
+    retirée.
+
+    Args:
+        data: Message reçu (bytes ou str)
+
+    Raises:
+        ValueError: si le message est invalide ou son format inconnu
+    """
+    return decode_with_origin(data)[0]
+
+
+def decode_with_origin(data):
+    """
+    Comme decode_message, en rendant aussi la marque d'origine.
+
+    Returns:
+        tuple: (message, origin ou None)
+    """
+    if not is_envelope(data):
+        message = decoder_for(None).decode(data)
+    else:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        header, body = split_envelope(data)
+        message = decoder_for(header.get(CODEC_HEADER)).decode(body)
+        if isinstance(message, dict):
+            message.update((key, value) for key, value in header.items() if key.startswith('_'))
+    if isinstance(message, dict):
+        return message, message.pop(ORIGIN_KEY, None)
+    return message, None
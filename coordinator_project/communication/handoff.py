@@ -0,0 +1,266 @@
+"""
+Reprise à chaud du proxy Redis: passage des sockets d'un processus à l'autre.
+
+Un proxy lancé avec --handoff-socket écoute sur ce socket Unix. Un nouveau
+proxy lancé avec le même chemin s'y connecte et demande la reprise:
+
+    nouveau -> ancien   takeover
+    ancien              arrête de lire et d'accepter, termine les commandes
+                        en cours et vide les files d'envoi
+    ancien -> nouveau   listener   + descripteur du socket d'écoute
+    ancien -> nouveau   client     + descripteur du socket client, état de
+                        session (authentification, abonnements), octets reçus
+                        pas encore analysés et octets pas encore envoyés
+    ancien -> nouveau   done
+    nouveau -> ancien   ack
+    ancien              quitte sans fermer les connexions reprises
+
+Les descripteurs passent par SCM_RIGHTS (socket.send_fds): les connexions
+TCP ne sont jamais coupées et les clients n'ont pas à se reconnecter ni à se
+réauthentifier. Sans ack, l'ancien processus reprend le service.
+
+Limites: un client dont la connexion Redis est dédiée (MULTI, BLPOP...) ne
+peut pas être repris, son état vit dans Redis; il est déconnecté à la sortie
+de l'ancien processus. Les messages publiés entre l'instantané de l'ancien
+processus et l'abonnement du nouveau (quelques millisecondes) peuvent manquer.
+"""
+
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+
+logger = logging.getLogger('RedisProxy')
+
+TAKEOVER = 'takeover'
+LISTENER = 'listener'
+CLIENT = 'client'
+DONE = 'done'
+ACK = 'ack'
+
+# En-tête d'une trame: longueur du JSON, longueur des octets bruts, nombre de descripteurs
+_HEADER = struct.Struct('!III')
+# Un descripteur par trame: le socket d'écoute ou un socket client
+MAX_FDS = 1
+# Délai de confirmation par le nouveau processus, après l'envoi de la dernière trame
+ACK_TIMEOUT = 10.0
+
+
+class HandoffError(Exception):
+    """Échec de la reprise (pas d'ancien processus, protocole, délai dépassé)"""
+
+
+def supported():
+    """Le passage de descripteurs n'existe que sur les systèmes Unix"""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def worker_path(path, worker_id=None):
+    """Chemin du socket de reprise d'un worker (un par worker, comme le journal d'audit)"""
+    return path if worker_id is None else f"{path}.worker{worker_id}"
+
+
+def send_frame(sock, message, blob=b'', fds=()):
+    """
+    Envoie une trame: en-tête avec les descripteurs, puis JSON et octets bruts.
+
+    Args:
+        sock: Socket Unix de reprise
+        message: dict sérialisable en JSON
+        blob: Octets bruts qui suivent le JSON (tampons du client)
+        fds: Descripteurs à transmettre
+    """
+    payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    header = _HEADER.pack(len(payload), len(blob), len(fds))
+    if fds:
+        # Les descripteurs accompagnent l'en-tête seul: le récepteur les lit avec lui
+        socket.send_fds(sock, [header], list(fds))
+    else:
+        sock.sendall(header)
+    sock.sendall(payload)
+    if blob:
+        sock.sendall(blob)
+
+
+def _recv_exactly(sock, size):
+    """Lit exactement size octets, sans jamais entamer la trame suivante"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    position = 0
+    while position < size:
+        received = sock.recv_into(view[position:], size - position)
+        if not received:
+            raise HandoffError("Connexion de reprise fermée au milieu d'une trame")
+        position += received
+    return bytes(buffer)
+
+
+def recv_frame(sock):
+    """
+    Reçoit une trame.
+
+    Returns:
+        tuple: (message dict, octets bruts, liste de descripteurs)
+
+    Raises:
+        HandoffError: si la connexion est fermée ou la trame invalide
+    """
+    data, fds, _, _ = socket.recv_fds(sock, _HEADER.size, MAX_FDS)
+    if not data:
+        raise HandoffError("Connexion de reprise fermée")
+    if len(data) < _HEADER.size:
+        data += _recv_exactly(sock, _HEADER.size - len(data))
+    payload_size, blob_size, fd_count = _HEADER.unpack(data)
+    if len(fds) != fd_count:
+        for fd in fds:
+            os.close(fd)
+        raise HandoffError(f"Trame de reprise: {len(fds)} descripteurs reçus, {fd_count} attendus")
+    try:
+        message = json.loads(_recv_exactly(sock, payload_size))
+        blob = _recv_exactly(sock, blob_size) if blob_size else b''
+    except (ValueError, OSError, HandoffError):
+        for fd in fds:
+            os.close(fd)
+        raise
+    return message, blob, fds
+
+
+class Takeover:
+    """Sockets et états reçus de l'ancien processus"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.listener = None
+        self.clients = []  # (socket, état, octets bruts)
+
+    def ack(self):
+        """Confirme la reprise: l'ancien processus peut quitter"""
+        try:
+            send_frame(self.connection, {'type': ACK})
+        finally:
+            self.connection.close()
+
+    def close(self):
+        """Abandonne la reprise: ferme les descripteurs reçus, l'ancien processus reprend le service"""
+        for client_socket, _, _ in self.clients:
+            client_socket.close()
+        if self.listener is not None:
+            self.listener.close()
+        self.connection.close()
+
+
+def take_over(path, timeout=30.0):
+    """
+    Demande à l'ancien proxy qui écoute sur path de céder ses sockets.
+
+    Args:
+        path: Socket Unix de reprise
+        timeout: Délai maximal de la reprise (vidage des commandes en cours compris)
+
+    Returns:
+        Takeover, ou None si aucun proxy n'écoute sur path
+
+    Raises:
+        HandoffError: si la reprise échoue en cours de route
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        return None
+
+    takeover = Takeover(connection)
+    try:
+        send_frame(connection, {'type': TAKEOVER, 'pid': os.getpid()})
+        while True:
+            message, blob, fds = recv_frame(connection)
+            kind = message.get('type')
+            if kind == LISTENER:
+                takeover.listener = socket.socket(fileno=fds[0])
+            elif kind == CLIENT:
+                takeover.clients.append((socket.socket(fileno=fds[0]), message['state'], blob))
+            elif kind == DONE:
+                break
+            else:
+                for fd in fds:
+                    os.close(fd)
+                raise HandoffError(f"Trame de reprise inattendue: {kind}")
+        if takeover.listener is None:
+            raise HandoffError("L'ancien processus n'a pas transmis son socket d'écoute")
+    except (OSError, ValueError, HandoffError) as e:
+        takeover.close()
+        raise HandoffError(f"Reprise depuis {path} impossible: {e}") from e
+    return takeover
+
+
+class HandoffServer:
+    """
+    Écoute les demandes de reprise d'un nouveau processus, dans un thread dédié.
+    on_takeover(connection) cède les sockets et retourne True si l'ancien
+    processus doit s'arrêter.
+    """
+
+    def __init__(self, path, on_takeover):
+        self.path = path
+        self.on_takeover = on_takeover
+        self.server_socket = None
+        self._inode = None
+        self._thread = None
+
+    def start(self):
+        # Le chemin peut appartenir au processus repris: le nouveau le remplace
+        try:
+            if stat.S_ISSOCK(os.stat(self.path).st_mode):
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._inode = os.stat(self.path).st_ino
+        self.server_socket.listen(1)
+        self._thread = threading.Thread(target=self._serve, name='redis-proxy-handoff')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"Reprise à chaud possible via {self.path}")
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.server_socket.accept()
+            except OSError:
+                return  # Socket fermé par stop()
+            try:
+                message, _, fds = recv_frame(connection)
+                for fd in fds:
+                    os.close(fd)
+                if message.get('type') != TAKEOVER:
+                    raise HandoffError(f"Demande de reprise inattendue: {message.get('type')}")
+                logger.info(f"Reprise demandée par le processus {message.get('pid')}")
+                if self.on_takeover(connection):
+                    return
+            except (OSError, ValueError, HandoffError) as e:
+                logger.error(f"Reprise interrompue: {e}")
+            finally:
+                connection.close()
+
+    def stop(self):
+        if self.server_socket is None:
+            return
+        try:
+            # Réveille l'accept() du thread de reprise
+            self.server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server_socket.close()
+        try:
+            # Ne pas supprimer le socket du processus qui a repris le chemin
+            if os.stat(self.path).st_ino == self._inode:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,36 @@
+"""
+Commande Django pour exécuter les benchmarks du module de communication.
+"""
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import importlib
+from communication.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Exécute un benchmark du proxy ou du broker Redis'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='scenario', required=True)
+        for name, module_path in SCENARIOS.items():
+            module = importlib.import_module(module_path)
+            subparser = subparsers.add_parser(name, help=module.__doc__.strip().splitlines()[0])
+            subparser.add_argument(
+                '--redis-host',
+                default=getattr(settings, 'REDIS_HOST', 'localhost'),
+                help='Hôte Redis (défaut: settings.REDIS_HOST ou localhost)'
+            )
+            subparser.add_argument(
+                '--redis-port',
+                type=int,
+                default=getattr(settings, 'REDIS_PORT', 6379),
+                help='Port Redis (défaut: settings.REDIS_PORT ou 6379)'
+            )
+            module.add_arguments(subparser)
+
+    def handle(self, *args, **options):
+        module = importlib.import_module(SCENARIOS[options['scenario']])
+
+        self.stdout.write(self.style.SUCCESS(f"Benchmark {options['scenario']}"))
+        module.run(options, self.stdout)
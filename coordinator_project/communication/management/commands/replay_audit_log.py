@@ -0,0 +1,166 @@
+"""
+Commande Django pour relire le journal d'audit du proxy Redis.
+Affiche les enregistrements ou republie les messages sur Redis.
+"""
+
+from collections import Counter
+from datetime import datetime
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import redis
+
+from communication import audit
+from communication.envelope import encode_envelope
+from communication.topics import is_valid_filter, topic_matches
+
+
+class Command(BaseCommand):
+    help = "Relit le journal d'audit du proxy Redis (affichage ou republication des messages)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="Fichier du journal d'audit (les fichiers tournés path.1, path.2... sont lus aussi)"
+        )
+        parser.add_argument(
+            '--events',
+            default=None,
+            help="Événements à garder, séparés par des virgules (ex: publish,subscribe)"
+        )
+        parser.add_argument(
+            '--channel',
+            default=None,
+            help="Filtre de canal, jokers + et # acceptés (ex: tasks/result/#)"
+        )
+        parser.add_argument(
+            '--since',
+            type=float,
+            default=None,
+            help="Ignorer les enregistrements antérieurs à ce timestamp"
+        )
+        parser.add_argument(
+            '--until',
+            type=float,
+            default=None,
+            help="Ignorer les enregistrements postérieurs à ce timestamp"
+        )
+        parser.add_argument(
+            '--publish',
+            action='store_true',
+            help="Republier les messages publish dont le corps a été conservé (--audit-body full)"
+        )
+        parser.add_argument(
+            '--redis-host',
+            default=getattr(settings, 'REDIS_HOST', 'localhost'),
+            help='Hôte Redis pour --publish (défaut: settings.REDIS_HOST ou localhost)'
+        )
+        parser.add_argument(
+            '--redis-port',
+            type=int,
+            default=getattr(settings, 'REDIS_PORT', 6379),
+            help='Port Redis pour --publish (défaut: settings.REDIS_PORT ou 6379)'
+        )
+        parser.add_argument(
+            '--speed',
+            type=float,
+            default=1.0,
+            help="Vitesse de republication: 1 respecte les intervalles d'origine, 0 publie sans attendre (défaut: 1)"
+        )
+
+    def handle(self, *args, **options):
+        if not audit.audit_files(options['path']):
+            raise CommandError(f"Aucun journal d'audit trouvé: {options['path']}")
+        if options['channel'] and not is_valid_filter(options['channel']):
+            raise CommandError(f"Filtre de canal invalide: {options['channel']}")
+
+        records = self.select(audit.read_audit_records(options['path']), options)
+        if options['publish']:
+            self.replay(records, options)
+        else:
+            # Les trous de séquence ne signalent des pertes que sans filtre
+            filtered = any(options[name] is not None for name in ('events', 'channel', 'since', 'until'))
+            self.show(records, count_gaps=not filtered)
+
+    def select(self, records, options):
+        """Filtre les enregistrements selon les options"""
+        events = set(options['events'].split(',')) if options['events'] else None
+        for record in records:
+            if events and record.get('event') not in events:
+                continue
+            if options['since'] is not None and record.get('ts', 0) < options['since']:
+                continue
+            if options['until'] is not None and record.get('ts', 0) > options['until']:
+                continue
+            if options['channel']:
+                channel = record.get('channel')
+                channels = channel if isinstance(channel, list) else [channel]
+                if not any(isinstance(name, str) and topic_matches(options['channel'], name) for name in channels):
+                    continue
+            yield record
+
+    def show(self, records, count_gaps=True):
+        """Affiche les enregistrements, puis un résumé par événement"""
+        counts = Counter()
+        previous_seq = None
+        gaps = 0
+        for record in records:
+            counts[record.get('event')] += 1
+            seq = record.get('seq')
+            if count_gaps and previous_seq is not None and seq is not None and seq > previous_seq + 1:
+                gaps += seq - previous_seq - 1
+            previous_seq = seq
+            when = datetime.fromtimestamp(record.get('ts', 0)).isoformat(timespec='milliseconds')
+            channel = record.get('channel')
+            if isinstance(channel, list):
+                channel = ','.join(channel)
+            self.stdout.write(
+                f"{when} {record.get('event', '?'):<11} {record.get('client') or '-':<21} "
+                f"{channel or '-'} {record.get('size', 0)}o {record.get('outcome')}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(counts.values())} enregistrements: {dict(counts)}"
+        ))
+        if gaps:
+            # Échantillonnage exclu: seq n'est attribué qu'aux enregistrements gardés
+            self.stdout.write(self.style.WARNING(
+                f"{gaps} enregistrements perdus (tampon d'audit plein)"
+            ))
+
+    def replay(self, records, options):
+        """Republie les messages acceptés, en respectant les intervalles d'origine"""
+        redis_client = redis.Redis(host=options['redis_host'], port=options['redis_port'])
+        published = skipped = 0
+        first_ts = started = None
+
+        for record in records:
+            if record.get('event') != audit.PUBLISH or record.get('outcome') != 'ok':
+                continue
+            if 'body' not in record:
+                skipped += 1  # Corps non conservé ou tronqué
+                continue
+
+            if options['speed'] > 0:
+                if first_ts is None:
+                    first_ts, started = record['ts'], time.monotonic()
+                delay = (record['ts'] - first_ts) / options['speed'] - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            body = json.dumps(record['body'])
+            if 'envelope' in record:
+                body = encode_envelope(record['envelope'], body)
+            redis_client.publish(record['channel'], body)
+            published += 1
+
+        redis_client.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"{published} messages republiés sur {options['redis_host']}:{options['redis_port']}"
+        ))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"{skipped} messages ignorés: corps absent du journal (utiliser --audit-body full)"
+            ))
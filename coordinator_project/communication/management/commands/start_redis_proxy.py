@@ -2,14 +2,47 @@
 Commande Django pour démarrer le proxy Redis.
 """
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+import multiprocessing
+import signal
+import socket
+import sys
 import threading
 import logging
 from communication.proxy import RedisProxy
+from communication.async_proxy import AsyncRedisProxy
+from communication import handoff
+from communication.audit import BODY_MODES, AuditLog
+from communication.outbound import POLICIES
+from communication.sessions import RedisSessionStore
 
 logger = logging.getLogger(__name__)
 
+
+def run_worker(engine, proxy_kwargs, worker_id, audit_options, handoff_path=None):
+    """Point d'entrée d'un processus worker (--workers N)"""
+    proxy_class = AsyncRedisProxy if engine == 'asyncio' else RedisProxy
+    proxy = proxy_class(
+        # Un fichier d'audit par worker: le thread d'écriture démarre dans le processus fils
+        audit_log=AuditLog.from_settings(worker_id=worker_id, **audit_options),
+        # Chaque worker reprend les connexions du worker de même numéro
+        handoff_path=handoff.worker_path(handoff_path, worker_id) if handoff_path else None,
+        reuse_port=True,
+        session_store=RedisSessionStore(
+            host=proxy_kwargs['redis_host'],
+            port=proxy_kwargs['redis_port'],
+            worker_id=worker_id
+        ),
+        worker_id=worker_id,
+        **proxy_kwargs
+    )
+    try:
+        proxy.start()
+    except KeyboardInterrupt:
+        pass
+
+
 class Command(BaseCommand):
     help = 'Démarre le proxy Redis pour contrôler les messages et souscriptions'
 
@@ -31,6 +64,57 @@ class Command(BaseCommand):
             default=6380,
             help='Port sur lequel le proxy écoute (défaut: 6380)'
         )
+        parser.add_argument(
+            '--engine',
+            choices=['threaded', 'asyncio'],
+            default='threaded',
+            help="Moteur du proxy: un thread par client ou une boucle asyncio (défaut: threaded)"
+        )
+        parser.add_argument(
+            '--pool-size',
+            type=int,
+            default=4,
+            help='Nombre de connexions partagées vers Redis, quel que soit le nombre de clients (défaut: 4)'
+        )
+        parser.add_argument(
+            '--outbound-policy',
+            choices=POLICIES,
+            default=getattr(settings, 'REDIS_PROXY_OUTBOUND_POLICY', 'drop_oldest'),
+            help="Politique quand la file d'envoi d'un client lent est pleine (défaut: drop_oldest)"
+        )
+        parser.add_argument(
+            '--outbound-queue-size',
+            type=int,
+            default=1000,
+            help="Nombre maximal de messages pub/sub en attente par client (défaut: 1000)"
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Nombre de processus qui partagent le port d'écoute avec SO_REUSEPORT (défaut: 1)"
+        )
+        parser.add_argument(
+            '--audit-log',
+            default=None,
+            help="Fichier du journal d'audit du trafic (défaut: settings.REDIS_PROXY_AUDIT_LOG, désactivé si absent)"
+        )
+        parser.add_argument(
+            '--audit-body',
+            choices=BODY_MODES,
+            default=None,
+            help="Conservation des corps de messages dans le journal d'audit (défaut: settings.REDIS_PROXY_AUDIT_BODY ou none)"
+        )
+        parser.add_argument(
+            '--handoff-socket',
+            default=getattr(settings, 'REDIS_PROXY_HANDOFF_SOCKET', None),
+            help=(
+                "Socket Unix de reprise à chaud: le proxy reprend le socket d'écoute et les connexions "
+                "du proxy qui écoute sur ce chemin, puis y écoute à son tour pour le prochain "
+                "redémarrage. Avec --workers, garder le même nombre de workers "
+                "(défaut: settings.REDIS_PROXY_HANDOFF_SOCKET, désactivé si absent)"
+            )
+        )
         parser.add_argument(
             '--daemon',
             action='store_true',
@@ -42,15 +126,36 @@ class Command(BaseCommand):
         redis_port = options['redis_port']
         proxy_port = options['proxy_port']
         daemon = options['daemon']
+        engine = options['engine']
+        workers = options['workers']
+        
+        proxy_kwargs = {
+            'redis_host': redis_host,
+            'redis_port': redis_port,
+            'proxy_port': proxy_port,
+            'pool_size': options['pool_size'],
+            'outbound_policy': options['outbound_policy'],
+            'outbound_queue_size': options['outbound_queue_size'],
+        }
+        
+        audit_options = {'path': options['audit_log'], 'body_mode': options['audit_body']}
+        handoff_path = options['handoff_socket']
+        if handoff_path and not handoff.supported():
+            raise CommandError("Le passage de sockets n'est pas disponible sur ce système: --handoff-socket impossible")
+        
+        if workers > 1:
+            self.run_workers(engine, proxy_kwargs, workers, audit_options, handoff_path)
+            return
         
         self.stdout.write(self.style.SUCCESS(
-            f'Démarrage du proxy Redis sur {redis_host}:{proxy_port} -> {redis_host}:{redis_port}'
+            f'Démarrage du proxy Redis ({engine}) sur {redis_host}:{proxy_port} -> {redis_host}:{redis_port}'
         ))
         
-        proxy = RedisProxy(
-            redis_host=redis_host,
-            redis_port=redis_port,
-            proxy_port=proxy_port
+        proxy_class = AsyncRedisProxy if engine == 'asyncio' else RedisProxy
+        proxy = proxy_class(
+            audit_log=AuditLog.from_settings(**audit_options),
+            handoff_path=handoff_path,
+            **proxy_kwargs
         )
         
         if daemon:
@@ -76,3 +181,47 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING('Arrêt du proxy Redis...'))
             
         self.stdout.write(self.style.SUCCESS('Proxy Redis arrêté'))
+
+    def run_workers(self, engine, proxy_kwargs, workers, audit_options, handoff_path=None):
+        """
+        Lance plusieurs processus proxy sur le même port (SO_REUSEPORT).
+        Le noyau répartit les connexions entrantes entre les workers; les
+        sessions (identifiées par le nom que le client donne à toutes ses
+        connexions, voir communication/sessions.py) sont partagées dans Redis
+        et les messages publiés passent par Redis, donc un abonné reçoit les
+        messages publiés via n'importe quel worker.
+        """
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise CommandError("SO_REUSEPORT n'est pas disponible sur ce système: --workers impossible")
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Démarrage de {workers} workers du proxy Redis ({engine}) sur le port {proxy_kwargs['proxy_port']}"
+        ))
+        
+        # fork: les workers héritent de la configuration Django déjà chargée
+        context = multiprocessing.get_context('fork')
+        processes = []
+        for worker_id in range(workers):
+            process = context.Process(
+                target=run_worker,
+                args=(engine, proxy_kwargs, worker_id, audit_options, handoff_path),
+                name=f"redis-proxy-worker-{worker_id}"
+            )
+            process.start()
+            processes.append(process)
+        
+        # SIGTERM arrête aussi les workers
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            for process in processes:
+                process.join()
+        except (KeyboardInterrupt, SystemExit):
+            self.stdout.write(self.style.WARNING('Arrêt des workers du proxy Redis...'))
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join(timeout=5)
+        
+        self.stdout.write(self.style.SUCCESS('Proxy Redis arrêté'))
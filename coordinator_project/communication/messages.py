@@ -7,6 +7,8 @@ from typing import Optional, Dict, Any, List
 import uuid
 import json
 
+from .codecs import JSON, get_codec
+
 class BaseMessage:
     """Message de base pour la communication Redis."""
     
@@ -24,6 +26,10 @@ class BaseMessage:
     def to_json(self) -> str:
         """Convertit le message en JSON."""
         return json.dumps(self.to_dict())
+    
+    def encode(self, codec: str = JSON):
+        """Sérialise le message avec un codec (json, orjson, msgpack)."""
+        return get_codec(codec).encode(self.to_dict())
 
 
 class ManagerRegistrationMessage(BaseMessage):
@@ -3,7 +3,8 @@ Modèles pour le module de communication.
 Gère les canaux et les permissions.
 """
 
-from mongoengine import Document, StringField, ListField, BooleanField, DateTimeField
+from mongoengine import (Document, StringField, ListField, BooleanField, DateTimeField, DictField,
+                         IntField, FloatField)
 from datetime import datetime
 
 class Channel(Document):
@@ -18,6 +19,17 @@ class Channel(Document):
         require_auth: Si l'authentification est requise pour ce canal
         allowed_publishers: Liste des rôles autorisés à publier
         allowed_subscribers: Liste des rôles autorisés à s'abonner
+        inspect_body: Si le proxy doit décoder le corps des messages enveloppés
+        rate_limits: Limites de publication par portée (connection, user, role),
+            ex: {'user': {'messages': 100, 'bytes': 1048576}} (voir communication.ratelimit)
+        rate_limit_action: 'reject' (réponse -ERR) ou 'delay' pour les messages hors limite
+        durable, local_dispatch, maxlen, retention, codec: Configuration du
+            canal dans le registre du broker (voir communication.broker.Channel);
+            None tant que le broker ne l'a pas écrite (valeurs des settings)
+        coalesce_window: Fenêtre de fusion des messages en secondes, appliquée
+            par le proxy, ou par le broker s'il publie sans proxy (None ou 0: pas
+            de fusion, voir communication.coalesce)
+        coalesce_key: Champ des messages qui distingue les clés de fusion (ex: 'task_id')
     """
     name = StringField(required=True, primary_key=True)
     description = StringField(required=True)
@@ -26,6 +38,16 @@ class Channel(Document):
     require_auth = BooleanField(default=False)
     allowed_publishers = ListField(StringField(), default=list)
     allowed_subscribers = ListField(StringField(), default=list)
+    inspect_body = BooleanField(default=False)
+    rate_limits = DictField(default=dict)
+    rate_limit_action = StringField(choices=('reject', 'delay'), default='reject')
+    durable = BooleanField(null=True)
+    local_dispatch = BooleanField(null=True)
+    maxlen = IntField(null=True)
+    retention = FloatField(null=True)
+    codec = StringField(null=True)
+    coalesce_window = FloatField(null=True)
+    coalesce_key = StringField(null=True)
     
     meta = {
         'collection': 'channels',
@@ -0,0 +1,214 @@
+"""
+File d'envoi bornée par client du proxy Redis.
+
+L'abonné partagé ne fait plus d'envoi bloquant vers les clients: il dépose
+les messages dans la file du client, vidée par l'écrivain propre à ce client
+(thread ou tâche asyncio). Un client lent ne retarde donc plus les autres;
+quand sa file est pleine, la politique choisie s'applique:
+
+    drop_oldest: le plus ancien message pub/sub en attente est abandonné
+    coalesce:    un message remplace le dernier encore en attente sur le même
+                 canal (sinon le plus ancien est abandonné); tant que la file
+                 n'est pas pleine, tous les messages sont conservés
+    disconnect:  le client est déconnecté
+
+Les réponses aux commandes du client passent par la même file pour garder
+l'ordre, mais ne sont jamais abandonnées: le client qui ne les lit pas est
+ralenti par l'écrivain (contre-pression), comme avec un envoi bloquant.
+
+La file ne contient aucun verrou: le moteur à threads la protège avec la
+condition du client, le moteur asyncio n'y accède que depuis sa boucle.
+"""
+
+import os
+from collections import deque
+from itertools import islice
+
+# Nombre maximal de tampons par appel sendmsg (IOV_MAX)
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+
+class OutboundQueue:
+    """
+    File d'envoi d'un client.
+
+    Chaque entrée est une liste [clé de fusion, données, abandonnable].
+    """
+
+    def __init__(self, max_messages=1000, max_bytes=32 * 1024 * 1024, policy=DROP_OLDEST):
+        """
+        Args:
+            max_messages: Nombre maximal de messages pub/sub en attente (défaut: 1000)
+            max_bytes: Taille maximale des messages pub/sub en attente (défaut: 32 Mo)
+            policy: Politique de débordement (drop_oldest, coalesce ou disconnect)
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Politique de débordement inconnue: {policy}")
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+
+        self._entries = deque()
+        self._by_key = {}  # Clé de fusion -> dernière entrée en attente (politique coalesce)
+
+        # Messages pub/sub en attente (soumis aux limites)
+        self.message_count = 0
+        self.message_bytes = 0
+        # Réponses en attente (jamais abandonnées)
+        self.reply_bytes = 0
+
+        # Métriques
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak_depth = 0
+        self.overflowed = False
+
+    def put_message(self, data, key=None):
+        """
+        Ajoute un message pub/sub en appliquant la politique de débordement.
+
+        Args:
+            data: Message RESP déjà encodé
+            key: Clé de fusion (canal) pour la politique coalesce
+
+        Returns:
+            bool: False si le client doit être déconnecté
+        """
+        full = self.message_count >= self.max_messages or self.message_bytes + len(data) > self.max_bytes
+        if full and self.policy == COALESCE and key is not None:
+            pending = self._by_key.get(key)
+            if pending is not None:
+                # La valeur la plus récente remplace celle qui n'a pas encore été envoyée
+                self.message_bytes += len(data) - len(pending[1])
+                pending[1] = data
+                self.coalesced += 1
+                self.enqueued += 1
+                return True
+
+        while self.message_count and (self.message_count >= self.max_messages or
+                                      self.message_bytes + len(data) > self.max_bytes):
+            if self.policy == DISCONNECT:
+                self.overflowed = True
+                return False
+            self._drop_oldest()
+
+        entry = [key, data, True]
+        self._entries.append(entry)
+        if self.policy == COALESCE and key is not None:
+            self._by_key[key] = entry
+        self.message_count += 1
+        self.message_bytes += len(data)
+        self.enqueued += 1
+        if len(self._entries) > self.peak_depth:
+            self.peak_depth = len(self._entries)
+        return True
+
+    def put_reply(self, data):
+        """Ajoute une réponse à une commande du client (jamais abandonnée)"""
+        self._entries.append([None, data, False])
+        self.reply_bytes += len(data)
+        if len(self._entries) > self.peak_depth:
+            self.peak_depth = len(self._entries)
+
+    def _drop_oldest(self):
+        """Abandonne le plus ancien message pub/sub (les réponses sont conservées)"""
+        for index, entry in enumerate(self._entries):
+            if entry[2]:
+                del self._entries[index]
+                self._forget(entry)
+                self.dropped += 1
+                return
+
+    def _forget(self, entry):
+        key, data, droppable = entry
+        if droppable:
+            self.message_count -= 1
+            self.message_bytes -= len(data)
+            if key is not None and self._by_key.get(key) is entry:
+                del self._by_key[key]
+        else:
+            self.reply_bytes -= len(data)
+
+    def drain(self):
+        """
+        Retire toutes les entrées en attente.
+
+        Returns:
+            list: Données à envoyer, dans l'ordre
+        """
+        if not self._entries:
+            return []
+        batch = [entry[1] for entry in self._entries]
+        self._entries.clear()
+        self._by_key.clear()
+        self.message_count = 0
+        self.message_bytes = 0
+        self.reply_bytes = 0
+        return batch
+
+    def snapshot(self):
+        """
+        Copie des entrées en attente, sans les retirer (reprise à chaud).
+
+        Returns:
+            list: Données à envoyer, dans l'ordre
+        """
+        return [entry[1] for entry in self._entries]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Métriques de la file"""
+        return {
+            'depth': len(self._entries),
+            'pending_bytes': self.message_bytes + self.reply_bytes,
+            'peak_depth': self.peak_depth,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+        }
+
+
+def send_buffers(sock, buffers):
+    """
+    Envoie une liste de tampons sur un socket bloquant en écriture vectorisée:
+    plusieurs trames partent en un seul appel sendmsg, sans les concaténer.
+    Les tampons sont lus via memoryview, sans copie.
+
+    Args:
+        sock: Socket bloquant
+        buffers: Liste de bytes
+
+    Returns:
+        int: Nombre d'appels système d'envoi effectués
+    """
+    if not hasattr(sock, 'sendmsg'):
+        # Plateformes sans sendmsg (Windows)
+        sock.sendall(b''.join(buffers))
+        return 1
+
+    views = deque(memoryview(buffer) for buffer in buffers if buffer)
+    calls = 0
+    while views:
+        sent = sock.sendmsg(list(islice(views, IOV_MAX)))
+        calls += 1
+        # Retirer ce qui est parti; le premier tampon restant peut être entamé
+        while sent:
+            head = views[0]
+            if sent >= len(head):
+                sent -= len(head)
+                views.popleft()
+            else:
+                views[0] = head[sent:]
+                sent = 0
+    return calls
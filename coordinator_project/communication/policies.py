@@ -0,0 +1,353 @@
+"""
+Politiques d'accès aux canaux appliquées par le proxy Redis.
+
+Les règles viennent de la collection Mongo des canaux (communication.models.Channel):
+    require_auth=False      le canal est ouvert (publication et abonnement sans token)
+    allowed_publishers      rôles autorisés à publier si require_auth=True
+    allowed_subscribers     rôles autorisés à s'abonner si require_auth=True
+    inspect_body            le corps des messages enveloppés est décodé et filtré
+    rate_limits             limites de publication par connexion, user_id et rôle
+    rate_limit_action       refus (reject) ou retard (delay) hors limite
+    coalesce_window         fenêtre de fusion des messages de progression
+    coalesce_key            champ qui distingue les clés de fusion
+Le coordinateur a accès à tous les canaux. Les canaux par défaut ci-dessous
+s'appliquent tant qu'aucun document du même nom ne les remplace (un document
+inactif retire le canal par défaut).
+
+Les règles sont compilées dans une table de décision indexée par
+(rôle, verbe, canal): l'autorisation d'un message est une simple lecture de
+dictionnaire, sans accès à la base. Un canal absent de la table est résolu une
+seule fois par les tries des filtres avec jokers, puis mémorisé. Les règles
+d'une table ne changent jamais: un rechargement compile une nouvelle table et
+remplace la référence utilisée par le proxy.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import namedtuple
+
+from .ratelimit import REJECT, RateLimitRule, normalize_rate_limits
+from .topics import TopicTrie
+
+logger = logging.getLogger('RedisProxy')
+
+PUBLISH = 'publish'
+SUBSCRIBE = 'subscribe'
+VERBS = (PUBLISH, SUBSCRIBE)
+
+# Rôle qui a accès à tous les canaux
+SUPERUSER_ROLE = 'coordinator'
+# Rôles connus, pour lesquels la table est précompilée
+DEFAULT_ROLES = ('manager', 'volunteer', SUPERUSER_ROLE)
+
+# Canaux utilisés avant l'enregistrement des canaux dans Mongo
+DEFAULT_CHANNEL_POLICIES = [
+    # Canaux d'enregistrement et d'authentification (toujours autorisés)
+    {'name': 'auth/register', 'require_auth': False, 'inspect_body': True},
+    {'name': 'auth/register_response', 'require_auth': False},
+    {'name': 'auth/login', 'require_auth': False, 'inspect_body': True},
+    {'name': 'auth/login_response', 'require_auth': False},
+    {'name': 'coord/heartbeat/#', 'require_auth': False},
+    {'name': 'coord/emergency', 'require_auth': False},
+    # Invalidations du registre des canaux entre brokers (communication.registry)
+    {'name': 'coord/channels', 'require_auth': False},
+    # Canaux réservés aux managers
+    {'name': 'tasks/new', 'allowed_publishers': ['manager'], 'allowed_subscribers': ['manager']},
+    {'name': 'tasks/assign', 'allowed_publishers': ['manager'], 'allowed_subscribers': ['manager']},
+    {'name': 'tasks/status/#', 'allowed_publishers': ['manager'], 'allowed_subscribers': ['manager'],
+     'coalesce_window': 0.25, 'coalesce_key': 'task_id'},
+    {'name': 'manager/status', 'allowed_publishers': ['manager'], 'allowed_subscribers': ['manager']},
+    {'name': 'manager/requests', 'allowed_publishers': ['manager'], 'allowed_subscribers': ['manager']},
+    # Canaux réservés aux volunteers
+    {'name': 'volunteer/available', 'allowed_publishers': ['volunteer'], 'allowed_subscribers': ['volunteer']},
+    {'name': 'volunteer/resources', 'allowed_publishers': ['volunteer'], 'allowed_subscribers': ['volunteer']},
+    {'name': 'tasks/result/#', 'allowed_publishers': ['volunteer'], 'allowed_subscribers': ['volunteer']},
+]
+
+
+def normalize_policy(policy):
+    """Complète une définition de canal avec les valeurs par défaut du modèle"""
+    return {
+        'name': policy['name'],
+        'active': policy.get('active', True),
+        'require_auth': policy.get('require_auth', True),
+        'allowed_publishers': sorted(policy.get('allowed_publishers') or []),
+        'allowed_subscribers': sorted(policy.get('allowed_subscribers') or []),
+        'inspect_body': bool(policy.get('inspect_body', False)),
+        'rate_limits': normalize_rate_limits(policy.get('rate_limits')),
+        'rate_limit_action': policy.get('rate_limit_action') or REJECT,
+        'coalesce_window': float(policy.get('coalesce_window') or 0),
+        'coalesce_key': policy.get('coalesce_key') or None,
+    }
+
+
+def policy_documents_filter():
+    """
+    Filtre Mongo des documents de canaux qui portent une politique.
+
+    Le registre des brokers écrit un document fermé (authentification
+    requise, aucun rôle, ni limite ni fusion) pour chaque canal créé
+    automatiquement (tasks/status/<id>...): il n'accorde rien et n'a pas
+    besoin d'être relu. Les documents des canaux par défaut sont toujours
+    lus, car ils peuvent les restreindre ou les désactiver.
+    """
+    from mongoengine.queryset.visitor import Q
+
+    grants = (
+        Q(require_auth__ne=True) | Q(allowed_publishers__not__size=0) | Q(allowed_subscribers__not__size=0)
+        | Q(inspect_body=True) | Q(rate_limits__ne={}) | Q(coalesce_window__gt=0)
+    )
+    return Q(name__in=[policy['name'] for policy in DEFAULT_CHANNEL_POLICIES]) | (Q(active__ne=False) & grants)
+
+
+def load_channel_policies():
+    """
+    Lit les définitions de canaux dans Mongo et les fusionne avec les canaux par défaut.
+
+    Returns:
+        list: Définitions actives, triées par nom
+
+    Raises:
+        Exception: si la base n'est pas joignable (erreurs pymongo/mongoengine)
+    """
+    from .models import Channel
+
+    policies = {policy['name']: normalize_policy(policy) for policy in DEFAULT_CHANNEL_POLICIES}
+    for channel in Channel.objects(policy_documents_filter()).only(
+            'name', 'active', 'require_auth', 'allowed_publishers', 'allowed_subscribers',
+            'inspect_body', 'rate_limits', 'rate_limit_action', 'coalesce_window', 'coalesce_key'):
+        policies[channel.name] = normalize_policy({
+            'name': channel.name,
+            'active': channel.active,
+            'require_auth': channel.require_auth,
+            'allowed_publishers': channel.allowed_publishers,
+            'allowed_subscribers': channel.allowed_subscribers,
+            'inspect_body': channel.inspect_body,
+            'rate_limits': channel.rate_limits,
+            'rate_limit_action': channel.rate_limit_action,
+            'coalesce_window': channel.coalesce_window,
+            'coalesce_key': channel.coalesce_key,
+        })
+    return [policy for name, policy in sorted(policies.items()) if policy['active']]
+
+
+def policies_fingerprint(policies):
+    """Empreinte d'un ensemble de définitions, pour ne recompiler que si elles changent"""
+    ordered = sorted(policies, key=lambda policy: policy['name'])
+    encoded = json.dumps(ordered, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+# Fusion des messages d'un canal (voir communication.coalesce)
+CoalesceRule = namedtuple('CoalesceRule', ['name', 'window', 'key'])
+
+
+class ChannelPolicyTable:
+    """
+    Table de décision compilée: (rôle, verbe, canal) -> autorisé.
+
+    Le rôle None désigne un client non authentifié, qui n'a accès qu'aux
+    canaux ouverts.
+    """
+
+    def __init__(self, policies, max_decisions=100000):
+        """
+        Args:
+            policies: Définitions de canaux (voir normalize_policy)
+            max_decisions: Nombre maximal de décisions mémorisées (défaut: 100000)
+        """
+        self.policies = sorted(
+            (normalize_policy(policy) for policy in policies if policy.get('active', True)),
+            key=lambda policy: policy['name']
+        )
+        self.fingerprint = policies_fingerprint(self.policies)
+        self.max_decisions = max_decisions
+
+        roles = set(DEFAULT_ROLES)
+        for policy in self.policies:
+            roles.update(policy['allowed_publishers'])
+            roles.update(policy['allowed_subscribers'])
+
+        # Un trie par (rôle, verbe); le rôle None porte les canaux ouverts
+        self._rules = {}
+        self._inspect_rules = TopicTrie()
+        self._limit_rules = TopicTrie()
+        self._coalesce_rules = TopicTrie()
+        for policy in self.policies:
+            name = policy['name']
+            if policy['inspect_body']:
+                self._inspect_rules.add(name)
+            if policy['rate_limits']:
+                self._limit_rules.add(name, RateLimitRule(name, policy['rate_limits'], policy['rate_limit_action']))
+            if policy['coalesce_window'] > 0:
+                self._coalesce_rules.add(name, CoalesceRule(name, policy['coalesce_window'], policy['coalesce_key']))
+            for verb, allowed_roles in ((PUBLISH, policy['allowed_publishers']),
+                                        (SUBSCRIBE, policy['allowed_subscribers'])):
+                grantees = [None] if not policy['require_auth'] else allowed_roles
+                for role in grantees:
+                    self._rules.setdefault((role, verb), TopicTrie()).add(name)
+
+        # Décisions précompilées pour les canaux nommés et les rôles connus
+        self._decisions = {}
+        names = [policy['name'] for policy in self.policies]
+        for role in [None, *sorted(roles)]:
+            for verb in VERBS:
+                for name in names:
+                    self._decisions[(role, verb, name)] = self._decide(role, verb, name)
+        self._inspected = {name: bool(self._inspect_rules.match(name)) for name in names}
+        self._limits = {name: self._find_rate_limit(name) for name in names}
+        self._coalescing = {name: self._find_coalescing(name) for name in names}
+
+    def allows(self, role, verb, topic):
+        """
+        Indique si un rôle peut publier ou s'abonner sur un canal (ou un filtre:
+        un filtre n'est autorisé que si une règle le couvre entièrement).
+
+        Args:
+            role: Rôle du client authentifié, ou None
+            verb: PUBLISH ou SUBSCRIBE
+            topic: Canal concret ou filtre avec jokers
+        """
+        key = (role, verb, topic)
+        decision = self._decisions.get(key)
+        if decision is None:
+            decision = self._decide(role, verb, topic)
+            if len(self._decisions) >= self.max_decisions:
+                # Canaux dynamiques en grand nombre: repartir d'une table vide
+                self._decisions = {}
+            self._decisions[key] = decision
+        return decision
+
+    def inspects_body(self, channel):
+        """Indique si le corps des messages enveloppés de ce canal doit être décodé"""
+        inspected = self._inspected.get(channel)
+        if inspected is None:
+            inspected = bool(self._inspect_rules.match(channel))
+            if len(self._inspected) >= self.max_decisions:
+                self._inspected = {}
+            self._inspected[channel] = inspected
+        return inspected
+
+    def rate_limit(self, channel):
+        """Limites de publication applicables à un canal (RateLimitRule), ou None"""
+        try:
+            return self._limits[channel]
+        except KeyError:
+            rule = self._find_rate_limit(channel)
+            if len(self._limits) >= self.max_decisions:
+                self._limits = {}
+            self._limits[channel] = rule
+            return rule
+
+    def _find_rate_limit(self, channel):
+        matches = self._limit_rules.match_items(channel)
+        if not matches:
+            return None
+        # Le filtre le plus long est le plus précis
+        _, rules = max(matches, key=lambda item: len(item[0]))
+        return next(iter(rules))
+
+    def coalescing(self, channel):
+        """Fusion applicable aux messages d'un canal (CoalesceRule), ou None"""
+        try:
+            return self._coalescing[channel]
+        except KeyError:
+            rule = self._find_coalescing(channel)
+            if len(self._coalescing) >= self.max_decisions:
+                self._coalescing = {}
+            self._coalescing[channel] = rule
+            return rule
+
+    def _find_coalescing(self, channel):
+        matches = self._coalesce_rules.match_items(channel)
+        if not matches:
+            return None
+        _, rules = max(matches, key=lambda item: len(item[0]))
+        return next(iter(rules))
+
+    def is_open(self, verb, topic):
+        """Indique si un canal est accessible sans authentification"""
+        return self.allows(None, verb, topic)
+
+    def _decide(self, role, verb, topic):
+        if role == SUPERUSER_ROLE:
+            return True
+        rules = self._rules.get((None, verb))
+        if rules is not None and rules.covers(topic):
+            return True
+        if role is None:
+            return False
+        rules = self._rules.get((role, verb))
+        return rules is not None and rules.covers(topic)
+
+    def channel_names(self):
+        """Noms des canaux et filtres définis"""
+        return [policy['name'] for policy in self.policies]
+
+    def __len__(self):
+        return len(self.policies)
+
+
+class PolicyReloader:
+    """
+    Recharge périodiquement les politiques depuis Mongo dans un thread dédié
+    et publie une nouvelle table quand les définitions changent. Seuls les
+    documents qui portent une politique sont lus (policy_documents_filter):
+    le coût d'un tour ne croît pas avec les canaux créés automatiquement.
+    """
+
+    def __init__(self, on_change, interval=5.0, loader=load_channel_policies):
+        """
+        Args:
+            on_change: Fonction appelée avec la nouvelle ChannelPolicyTable
+            interval: Délai entre deux lectures, en secondes (défaut: 5)
+            loader: Fonction retournant les définitions de canaux
+        """
+        self.on_change = on_change
+        self.interval = interval
+        self.loader = loader
+        self.fingerprint = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, fingerprint=None):
+        """Démarre le thread; la première lecture est immédiate"""
+        self.fingerprint = fingerprint
+        self._thread = threading.Thread(target=self._run, name='channel-policy-reloader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def reload(self):
+        """
+        Relit les définitions et publie une nouvelle table si elles ont changé.
+
+        Returns:
+            bool: True si la table a été remplacée
+        """
+        try:
+            policies = self.loader()
+        except Exception as e:
+            # La table courante reste en place tant que la base est injoignable
+            logger.warning(f"Lecture des politiques de canaux impossible: {e}")
+            return False
+        # Même empreinte que celle de la table: définitions complétées, canaux actifs seulement
+        fingerprint = policies_fingerprint(
+            [normalize_policy(policy) for policy in policies if policy.get('active', True)]
+        )
+        if fingerprint == self.fingerprint:
+            return False
+        table = ChannelPolicyTable(policies)
+        self.fingerprint = table.fingerprint
+        self.on_change(table)
+        logger.info(f"Politiques de canaux rechargées: {len(table)} canaux")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.reload()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
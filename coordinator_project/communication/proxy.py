@@ -3,17 +3,34 @@ Proxy Redis pour le contrôle des messages et souscriptions.
 Intercepte toutes les commandes Redis pour appliquer des règles d'autorisation.
 """
 
+import os
+import select
 import socket
 import threading
 import logging
 import json
 import re
+import time
 import traceback
 from datetime import datetime
 import jwt
 from django.conf import settings
+from . import audit, handoff
 from .models import Channel
-from .broker import MessageBroker
+from .coalesce import Coalescer, coalesce_key, is_terminal
+from .codecs import CODEC_HEADER, decoder_for, get_codec
+from .envelope import decode_message, encode_header, is_envelope, split_envelope
+from .outbound import DROP_OLDEST, OutboundQueue, send_buffers
+from .policies import DEFAULT_CHANNEL_POLICIES, PUBLISH, SUBSCRIBE, ChannelPolicyTable, PolicyReloader
+from .ratelimit import RateLimiter
+from .reaper import ConnectionReaper, RedisMetricsSink, set_keepalive
+from .sessions import LocalSessionStore, session_id_for
+from .streams import DEAD_LETTER_SUFFIX, STREAM_PREFIX
+from .resp import RespParser, RespProtocolError, encode_array, encode_bulk, encode_command, encode_error
+from .subscriptions import SubscriptionIndex, UpstreamSubscriptions
+from .token_cache import VerifiedTokenCache
+from .topics import TopicTrie, glob_to_filter, is_wildcard, to_redis_pattern, topic_matches
+from .upstream import UpstreamConnection, UpstreamPool, needs_dedicated_connection
 import redis
 
 # Configuration du logging
@@ -23,44 +40,40 @@ logger = logging.getLogger('RedisProxy')
 class RedisCommand:
     """Classe pour analyser et représenter une commande Redis"""
     
-    def __init__(self, raw_data):
+    def __init__(self, raw_data, parts=None):
+        """
+        Args:
+            raw_data: Trame RESP brute de la commande
+            parts: Arguments déjà extraits par un RespParser (sinon raw_data est analysé)
+        """
         self.raw_data = raw_data
         self.command_type = None
-        self.args = []
-        self.parse()
+        self.raw_args = []
+        
+        if parts is None:
+            parts = self.parse()
+        if parts and all(isinstance(part, bytes) for part in parts):
+            self.command_type = parts[0].decode('utf-8', 'replace').upper()
+            self.raw_args = parts[1:]
     
     def parse(self):
-        """Parse le format RESP (Redis Serialization Protocol)"""
+        """Parse la première commande RESP (Redis Serialization Protocol) de raw_data"""
+        parser = RespParser()
         try:
-            # Format simplifié pour l'exemple
-            # Un parseur RESP complet serait plus complexe
-            text = self.raw_data.decode('utf-8')
-            
-            # Afficher les données brutes pour le débogage
-            logger.debug(f"Données brutes RESP: {text}")
-            
-            # Recherche des commandes pub/sub
-            if '*' in text:  # Format Array RESP
-                parts = text.split('\r\n')
-                cmd_parts = []
-                
-                i = 1  # Sauter le premier élément (*n)
-                while i < len(parts):
-                    if parts[i].startswith('$'):
-                        # Extraire la longueur
-                        length = int(parts[i][1:])
-                        i += 1  # Passer à la valeur
-                        if i < len(parts):
-                            cmd_parts.append(parts[i])
-                    i += 1
-                
-                if cmd_parts:
-                    self.command_type = cmd_parts[0].upper()
-                    self.args = cmd_parts[1:]
-                    logger.debug(f"Commande parsée: type={self.command_type}, args={self.args}")
-        except Exception as e:
+            parser.feed(self.raw_data)
+        except RespProtocolError as e:
             logger.error(f"Erreur lors du parsing de la commande: {e}")
-            traceback.print_exc()
+            return None
+        
+        frame = parser.gets()
+        if frame is None or not isinstance(frame[0], list):
+            return None
+        return frame[0]
+    
+    @property
+    def args(self):
+        """Arguments décodés en UTF-8 (à éviter pour les gros messages)"""
+        return [arg.decode('utf-8', 'replace') for arg in self.raw_args]
     
     def is_pubsub_command(self):
         """Vérifie si la commande est liée à pub/sub"""
@@ -70,20 +83,32 @@ class RedisCommand:
     
     def get_channel(self):
         """Récupère le canal pour les commandes pub/sub"""
-        if self.command_type == 'PUBLISH' and len(self.args) >= 1:
-            return self.args[0]
-        elif self.command_type in ['SUBSCRIBE', 'UNSUBSCRIBE'] and self.args:
+        if self.command_type == 'PUBLISH' and len(self.raw_args) >= 1:
+            return self.raw_args[0].decode('utf-8', 'replace')
+        elif self.command_type in ['SUBSCRIBE', 'UNSUBSCRIBE', 'PSUBSCRIBE', 'PUNSUBSCRIBE'] and self.raw_args:
             return self.args
         return None
     
     def get_message(self):
-        """Récupère le message pour la commande PUBLISH"""
-        if self.command_type == 'PUBLISH' and len(self.args) >= 2:
-            return self.args[1]
+        """Récupère le message (bytes, non décodé) pour la commande PUBLISH"""
+        if self.command_type == 'PUBLISH' and len(self.raw_args) >= 2:
+            return self.raw_args[1]
         return None
     
     def __str__(self):
-        return f"RedisCommand(type={self.command_type}, args={self.args})"
+        return f"RedisCommand(type={self.command_type}, args={len(self.raw_args)})"
+
+
+# Réponse à un PUBLISH au-delà des limites du canal
+RATE_LIMITED = b'-ERR RATELIMIT Publish rate limit exceeded\r\n'
+
+# Clés internes du proxy (sessions, métriques): réservées au proxy, jamais
+# lues ni écrites par une commande client
+INTERNAL_KEY_PREFIX = b'proxy:'
+INTERNAL_KEY_DENIED = b'-ERR NOPERM Reserved proxy key\r\n'
+
+# Clés des streams des canaux durables (politique du canal couvert)
+STREAM_KEY_PREFIX = STREAM_PREFIX.encode('ascii')
 
 
 class RedisProxy:
@@ -92,7 +117,9 @@ class RedisProxy:
     Gère l'authentification JWT et les permissions des canaux.
     """
     
-    def __init__(self, redis_host='localhost', redis_port=6379, proxy_port=6380):
+    def __init__(self, redis_host='localhost', redis_port=6379, proxy_port=6380, pool_size=4,
+                 outbound_policy=DROP_OLDEST, outbound_queue_size=1000,
+                 reuse_port=False, session_store=None, worker_id=None, audit_log=None, handoff_path=None):
         """
         Initialise le proxy Redis.
         
@@ -100,58 +127,171 @@ class RedisProxy:
             redis_host: Hôte Redis (défaut: localhost)
             port: Port Redis (défaut: 6379)
             proxy_port: Port sur lequel le proxy écoute (défaut: 6380)
+            pool_size: Nombre de connexions partagées vers Redis (défaut: 4)
+            outbound_policy: Politique pour les clients lents: drop_oldest, coalesce ou disconnect
+            outbound_queue_size: Nombre maximal de messages en attente par client (défaut: 1000)
+            reuse_port: Partager le port d'écoute avec d'autres workers (SO_REUSEPORT)
+            session_store: Stockage des sessions (défaut: LocalSessionStore, propre au processus)
+            worker_id: Numéro du worker quand plusieurs processus servent le même port
+            audit_log: Journal d'audit du trafic (défaut: selon settings.REDIS_PROXY_AUDIT_LOG)
+            handoff_path: Socket Unix de reprise à chaud: reprendre les connexions du proxy
+                qui y écoute, puis y écouter à son tour (défaut: pas de reprise)
         """
         self.redis_host = redis_host
         self.redis_port = redis_port
         self.proxy_port = proxy_port
+        self.pool_size = pool_size
+        self.outbound_policy = outbound_policy
+        self.outbound_queue_size = outbound_queue_size
+        self.outbound_max_bytes = getattr(settings, 'REDIS_PROXY_OUTBOUND_MAX_BYTES', 32 * 1024 * 1024)
+        self.reuse_port = reuse_port
+        self.worker_id = worker_id
+        
+        # Sessions partagées entre workers (authentification, abonnements)
+        self.session_store = session_store or LocalSessionStore()
+        
+        # Journal d'audit: les threads clients ne font qu'ajouter au tampon
+        self.audit_log = audit_log if audit_log is not None else audit.AuditLog.from_settings(worker_id=worker_id)
+        
+        # Reprise à chaud: un nouveau processus reprend le socket d'écoute et les connexions
+        self.handoff_path = handoff_path
+        self.handoff_server = None
+        self.handoff_drain_timeout = getattr(settings, 'REDIS_PROXY_HANDOFF_DRAIN_TIMEOUT', 5.0)
+        self.handing_off = False
+        self.handed_off = False
+        self._handoff_cond = threading.Condition()
+        self._handoff_wakeup = None  # Tube qui réveille les lectures bloquées quand une reprise commence
+        self._listener_info = {'parked': False}
         self.server_socket = None
         self.running = False
         self.client_connections = {}  # Pour suivre les connexions client
         
-        # Canaux d'enregistrement et d'authentification (toujours autorisés)
-        self.open_channels = {
-            'auth/register': True,
-            'auth/register_response': True,
-            'auth/login': True,
-            'auth/login_response': True,
-            'coord/heartbeat/#': True,
-            'coord/emergency': True
-        }
+        # Index canal (ou motif) -> clients abonnés, pour la diffusion des messages
+        self.channel_subscribers = SubscriptionIndex()
+        self.pattern_subscribers = SubscriptionIndex()
+        # Abonnements à des filtres avec jokers (tasks/status/#, coord/+/...)
+        self.filter_subscribers = TopicTrie()
         
-        # Canaux réservés aux managers
-        self.manager_channels = {
-            'tasks/new': True,
-            'tasks/assign': True,
-            'tasks/status/#': True,
-            'manager/status': True,
-            'manager/requests': True
-        }
+        # Connexions partagées vers Redis (commandes ordinaires et PUBLISH)
+        self.upstream_pool = None
         
-        # Canaux réservés aux volunteers
-        self.volunteer_channels = {
-            'volunteer/available': True,
-            'volunteer/resources': True,
-            'tasks/result/#': True
-        }
+        # Abonnements de l'abonné partagé, comptés par référence: Redis ne transmet
+        # au proxy que les canaux qu'au moins un client écoute
+        self.upstream_subscriptions = UpstreamSubscriptions()
+        # Attente maximale de la confirmation de Redis avant de confirmer un SUBSCRIBE au client
+        self.subscribe_timeout = getattr(settings, 'REDIS_PROXY_SUBSCRIBE_TIMEOUT', 2.0)
+        
+        # Politiques d'accès compilées; les canaux par défaut s'appliquent
+        # jusqu'à la première lecture de la collection Mongo des canaux
+        self.channel_policies = ChannelPolicyTable(DEFAULT_CHANNEL_POLICIES)
+        self.policy_reloader = PolicyReloader(
+            self._install_policies,
+            interval=getattr(settings, 'REDIS_PROXY_POLICY_RELOAD_INTERVAL', 5.0)
+        )
+        
+        # Connexions mortes ou inactives: keepalive TCP et parcours périodique
+        self.keepalive = None
+        if getattr(settings, 'REDIS_PROXY_TCP_KEEPALIVE', True):
+            self.keepalive = (
+                getattr(settings, 'REDIS_PROXY_KEEPALIVE_IDLE', 60),
+                getattr(settings, 'REDIS_PROXY_KEEPALIVE_INTERVAL', 10),
+                getattr(settings, 'REDIS_PROXY_KEEPALIVE_COUNT', 5),
+            )
+        reap_interval = getattr(settings, 'REDIS_PROXY_REAP_INTERVAL', 10.0)
+        self.reaper = ConnectionReaper(
+            self.client_connections,
+            self._reap_client,
+            idle_timeout=getattr(settings, 'REDIS_PROXY_IDLE_TIMEOUT', 600.0),
+            subscriber_idle_timeout=getattr(settings, 'REDIS_PROXY_SUBSCRIBER_IDLE_TIMEOUT', 0),
+            write_timeout=getattr(settings, 'REDIS_PROXY_WRITE_TIMEOUT', 60.0),
+            interval=reap_interval,
+            metrics_sink=RedisMetricsSink(
+                redis_host, redis_port, worker_id=worker_id, ttl=int(reap_interval * 3)
+            ) if getattr(settings, 'REDIS_PROXY_METRICS', True) else None
+        )
+        
+        # Limites de publication par connexion, user_id et rôle (configurées par canal)
+        self.rate_limiter = RateLimiter(
+            max_delay=getattr(settings, 'REDIS_PROXY_RATE_LIMIT_MAX_DELAY', 1.0)
+        )
+        
+        # Derniers messages par clé des canaux en mode fusion, publiés à la fin
+        # de leur fenêtre par un thread (ou une tâche) sur sa propre connexion du pool
+        self.coalescer = Coalescer()
+        self.coalesce_slot = None
         
-        # Broker pour la communication interne
-        self.message_broker = MessageBroker(host=redis_host, port=redis_port)
+        # Tokens JWT déjà vérifiés: évite de recalculer le HMAC à chaque PUBLISH
+        self.token_cache = VerifiedTokenCache(
+            max_size=getattr(settings, 'REDIS_PROXY_TOKEN_CACHE_SIZE', 10000)
+        )
         
         # Transformateurs de messages
         self.message_transformers = [
             self.add_metadata,
             self.filter_sensitive_data
         ]
+        
+        # Transformateurs du corps des messages enveloppés (canaux avec inspect_body):
+        # les métadonnées vont dans l'en-tête, pas dans le corps
+        self.body_transformers = [
+            self.filter_sensitive_data
+        ]
+    
+    def _install_policies(self, table):
+        """
+        Remplace la table des politiques (appelé par le thread de rechargement)
+        et retire les abonnements qu'elle n'autorise plus.
+        """
+        self.channel_policies = table
+        self._revoke_unauthorized_subscriptions()
+    
+    def _revoke_unauthorized_subscriptions(self):
+        """Désabonne les clients des canaux auxquels ils n'ont plus accès"""
+        for client_id, client_info in list(self.client_connections.items()):
+            for kind, subscriptions in (('unsubscribe', client_info['subscribed_channels']),
+                                        ('punsubscribe', client_info['subscribed_patterns'])):
+                if not subscriptions:
+                    continue
+                _, revoked = self.authorize_subscribe(
+                    client_id, sorted(subscriptions), patterns=(kind == 'punsubscribe')
+                )
+                if revoked:
+                    logger.warning(f"Abonnements retirés à {client_id} après rechargement des politiques: {revoked}")
+                    reply = self.prepare_unsubscribe(client_id, RedisCommand(encode_command(kind, *revoked)))
+                    self._send_to_client(client_info, reply)
     
     def start(self):
         """Démarre le proxy"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind(('0.0.0.0', self.proxy_port))
-        self.server_socket.listen(100)
+        takeover = self._take_over()
+        if takeover is not None:
+            # Socket d'écoute de l'ancien processus: sa file de connexions en attente est conservée
+            takeover.ack()
+            self.server_socket = takeover.listener
+            self.server_socket.setblocking(True)
+        else:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                # Le noyau répartit les connexions entre les workers qui écoutent ce port
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.server_socket.bind(('0.0.0.0', self.proxy_port))
+            self.server_socket.listen(100)
         
+        if self.handoff_path:
+            self._handoff_wakeup = os.pipe()
         self.running = True
-        logger.info(f"Proxy Redis démarré sur le port {self.proxy_port}")
+        self.upstream_pool = UpstreamPool(self.redis_host, self.redis_port, size=self.pool_size)
+        logger.info(f"Proxy Redis démarré sur le port {self.proxy_port}{self._worker_label()}")
+        
+        # Envoi des messages retenus par la fusion
+        self.coalesce_slot = self.upstream_pool.assign_slot()
+        coalesce_thread = threading.Thread(target=self._run_coalesce_flusher, name='proxy-coalesce-flush')
+        coalesce_thread.daemon = True
+        coalesce_thread.start()
+        
+        # Rechargement des politiques sans redémarrage (hors du chemin des messages)
+        self.policy_reloader.start(self.channel_policies.fingerprint)
+        self.reaper.start()
         
         # Démarrer un thread pour écouter les messages publiés sur Redis
         # et les transmettre aux clients abonnés
@@ -159,80 +299,443 @@ class RedisProxy:
         self.pubsub_thread.daemon = True
         self.pubsub_thread.start()
         
+        if takeover is not None:
+            for client_socket, state, blob in takeover.clients:
+                client_socket.setblocking(True)
+                self.audit_log.record(audit.CONNECT, state['client_id'], detail='handoff')
+                self._register_client(client_socket, state['client_id'], session=(state, blob))
+            logger.info(f"{len(takeover.clients)} connexions reprises de l'ancien processus")
+        if self.handoff_path:
+            self.handoff_server = handoff.HandoffServer(self.handoff_path, self._hand_off)
+            self.handoff_server.start()
+        
+        poller = self._new_poller(self.server_socket)
         try:
             while self.running:
+                if poller is not None:
+                    # Une reprise arrête les accept() avant de céder le socket d'écoute
+                    if not self._wait_readable(poller, self.server_socket):
+                        if self._park(self._listener_info):
+                            break
+                        continue
                 client_socket, client_address = self.server_socket.accept()
                 client_id = f"{client_address[0]}:{client_address[1]}"
-                logger.info(f"Nouvelle connexion: {client_id}")
-                
-                # Créer un thread pour gérer ce client
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket, client_id)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
-                # Suivre la connexion
-                self.client_connections[client_id] = {
-                    'socket': client_socket,
-                    'thread': client_thread,
-                    'authenticated': False,
-                    'user_id': None,
-                    'role': None,
-                    'token': None,
-                    'subscribed_channels': set()
-                }
+                logger.debug(f"Nouvelle connexion: {client_id}")
+                self.audit_log.record(audit.CONNECT, client_id)
+                self._register_client(client_socket, client_id)
         except KeyboardInterrupt:
             logger.info("Arrêt du proxy...")
         finally:
             self.stop()
     
+    def _run_coalesce_flusher(self):
+        """Thread d'envoi: transmet les PUBLISH retenus dont la fenêtre est écoulée"""
+        while self.running:
+            time.sleep(self.coalescer.next_due())
+            for upstream_command in self.coalescer.pop_due():
+                try:
+                    self.upstream_pool.submit(upstream_command, self.coalesce_slot)
+                except OSError as e:
+                    logger.error(f"Envoi d'un message fusionné impossible: {e}")
+    
+    def _worker_label(self):
+        return '' if self.worker_id is None else f" (worker {self.worker_id})"
+    
+    def _register_client(self, client_socket, client_id, session=None):
+        """
+        Suit une nouvelle connexion et démarre son thread de lecture et son écrivain.
+        
+        Args:
+            session: (état, octets en attente) d'une connexion reprise à l'ancien processus
+        """
+        # Suivre la connexion avant que ses threads ne démarrent
+        client_info = self._new_client_info(
+            socket=client_socket,
+            outbound_ready=threading.Condition(),
+            pool_slot=self.upstream_pool.assign_slot()
+        )
+        self.client_connections[client_id] = client_info
+        if session is not None:
+            self._adopt_session(client_id, client_info, *session)
+        self._set_keepalive(client_socket)
+        
+        # Créer un thread pour gérer ce client
+        client_info['thread'] = threading.Thread(
+            target=self.handle_client,
+            args=(client_socket, client_id)
+        )
+        client_info['thread'].daemon = True
+        
+        self._start_writer(client_id, client_info)
+        client_info['thread'].start()
+    
+    def _set_keepalive(self, client_socket):
+        """Keepalive TCP: le noyau détecte les pairs disparus sans attendre une écriture"""
+        if self.keepalive is None:
+            return
+        try:
+            set_keepalive(client_socket, *self.keepalive)
+        except OSError as e:
+            # Socket non TCP (socketpair des benchmarks...)
+            logger.debug(f"Keepalive TCP impossible: {e}")
+    
+    def _start_writer(self, client_id, client_info):
+        """L'écrivain vide la file d'envoi: l'abonné partagé n'attend jamais un client lent"""
+        client_info['writer_thread'] = threading.Thread(
+            target=self._write_loop,
+            args=(client_info['socket'], client_id, client_info)
+        )
+        client_info['writer_thread'].daemon = True
+        client_info['writer_thread'].start()
+    
+    def _new_outbound_queue(self):
+        """Crée la file d'envoi bornée d'un client"""
+        return OutboundQueue(
+            max_messages=self.outbound_queue_size,
+            max_bytes=self.outbound_max_bytes,
+            policy=self.outbound_policy
+        )
+    
+    def _new_client_info(self, **transport):
+        """
+        Crée l'état de session d'une connexion client.
+        
+        Args:
+            **transport: Objets de transport propres au moteur (socket, thread, writer...)
+        """
+        client_info = {
+            'authenticated': False,
+            'user_id': None,
+            'role': None,
+            'token': None,
+            'session_id': None,  # Nom de connexion partagé par les connexions d'un client (voir sessions.py)
+            'subscribed_channels': set(),
+            'subscribed_patterns': set(),
+            'parser': RespParser(),
+            'dedicated': False,  # Connexion Redis propre au client (MULTI, BLPOP...)
+            'outbound': self._new_outbound_queue(),
+            'closing': False,
+            # Suivi de l'activité pour le ConnectionReaper
+            'reading': False,  # Le lecteur attend des données: aucune commande en cours
+            'last_activity': time.monotonic(),
+            'write_started': None,
+            'close_reason': None
+        }
+        client_info.update(transport)
+        return client_info
+    
+    def _take_over(self):
+        """Reprend les sockets du proxy qui écoute sur handoff_path, s'il y en a un"""
+        if not self.handoff_path:
+            return None
+        try:
+            takeover = handoff.take_over(self.handoff_path)
+        except handoff.HandoffError as e:
+            logger.error(f"{e}: démarrage sans reprise")
+            return None
+        if takeover is None:
+            logger.info(f"Aucun proxy à reprendre sur {self.handoff_path}")
+        return takeover
+    
+    def _new_poller(self, sock):
+        """Attente de lecture sur sock et sur le tube de reprise (None sans reprise à chaud)"""
+        if self._handoff_wakeup is None:
+            return None
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        poller.register(self._handoff_wakeup[0], select.POLLIN)
+        return poller
+    
+    def _wait_readable(self, poller, sock):
+        """
+        Attend que sock soit lisible.
+        
+        Returns:
+            bool: False si une reprise a commencé
+        """
+        wakeup = self._handoff_wakeup[0]
+        while True:
+            events = poller.poll()
+            if self.handing_off:
+                return False
+            # Erreur ou fermeture comprises: recv()/accept() la signalera
+            if any(fd != wakeup for fd, _ in events):
+                return True
+    
+    def _park(self, info):
+        """
+        Suspend un thread de lecture (ou la boucle accept) pendant une reprise.
+        
+        Returns:
+            bool: True si les connexions ont été cédées et que le thread doit s'arrêter
+        """
+        with self._handoff_cond:
+            info['parked'] = True
+            self._handoff_cond.notify_all()
+            while self.handing_off and not self.handed_off:
+                self._handoff_cond.wait()
+            info['parked'] = False
+            return self.handed_off
+    
+    def _hand_off(self, connection):
+        """
+        Cède le socket d'écoute et les connexions au processus qui a demandé
+        la reprise (appelé par le thread de HandoffServer).
+        
+        Returns:
+            bool: True si la reprise a réussi et que le proxy s'arrête
+        """
+        deadline = time.monotonic() + self.handoff_drain_timeout
+        with self._handoff_cond:
+            self.handing_off = True
+        self.reaper.paused = True
+        os.write(self._handoff_wakeup[1], b'x')
+        
+        # Attendre que les lecteurs aient terminé leurs commandes en cours
+        with self._handoff_cond:
+            while not self._handoff_drained() and time.monotonic() < deadline:
+                self._handoff_cond.wait(deadline - time.monotonic())
+        candidates = [
+            (client_id, client_info) for client_id, client_info in list(self.client_connections.items())
+            if client_info.get('parked') and not client_info['dedicated']
+        ]
+        
+        # Les écrivains vident les files d'envoi puis s'arrêtent
+        for _, client_info in candidates:
+            with client_info['outbound_ready']:
+                client_info['closing'] = True
+                client_info['outbound_ready'].notify_all()
+        for _, client_info in candidates:
+            client_info['writer_thread'].join(timeout=max(0.0, deadline - time.monotonic()))
+        clients = [
+            (client_id, client_info) for client_id, client_info in candidates
+            if not client_info['writer_thread'].is_alive()
+        ]
+        
+        try:
+            self._send_handoff(connection, self.server_socket.fileno(), clients)
+        except (OSError, ValueError, handoff.HandoffError) as e:
+            logger.error(f"Reprise abandonnée, le proxy continue: {e}")
+            for client_id, client_info in candidates:
+                client_info['closing'] = False
+                if not client_info['writer_thread'].is_alive():
+                    self._start_writer(client_id, client_info)
+            with self._handoff_cond:
+                os.read(self._handoff_wakeup[0], 1)
+                self.handing_off = False
+                self._handoff_cond.notify_all()
+            self.reaper.paused = False
+            return False
+        
+        self._finish_handoff(clients)
+        with self._handoff_cond:
+            self.handed_off = True
+            self._handoff_cond.notify_all()
+        return True
+    
+    def _handoff_drained(self):
+        """Plus aucune commande en cours: boucle accept et lecteurs suspendus"""
+        return self._listener_info['parked'] and all(
+            client_info.get('parked') or client_info['dedicated']
+            for client_info in list(self.client_connections.values())
+        )
+    
+    def _send_handoff(self, connection, listener_fd, clients):
+        """
+        Transmet le socket d'écoute et les connexions, puis attend la confirmation.
+        
+        Args:
+            connection: Socket Unix du processus qui reprend
+            listener_fd: Descripteur du socket d'écoute
+            clients: Liste de (client_id, client_info) à céder
+        """
+        handoff.send_frame(connection, {'type': handoff.LISTENER, 'port': self.proxy_port}, fds=[listener_fd])
+        for client_id, client_info in clients:
+            state, blob = self._client_state(client_id, client_info)
+            handoff.send_frame(
+                connection, {'type': handoff.CLIENT, 'state': state}, blob,
+                fds=[self._client_fileno(client_info)]
+            )
+        handoff.send_frame(connection, {'type': handoff.DONE, 'clients': len(clients)})
+        
+        connection.settimeout(handoff.ACK_TIMEOUT)
+        message, _, _ = handoff.recv_frame(connection)
+        if message.get('type') != handoff.ACK:
+            raise handoff.HandoffError(f"Confirmation de reprise attendue, reçu: {message.get('type')}")
+    
+    def _finish_handoff(self, clients):
+        """Oublie les connexions cédées: leurs sessions appartiennent au nouveau processus"""
+        for client_id, _ in clients:
+            self.client_connections.pop(client_id, None)
+        self.running = False
+        remaining = len(self.client_connections)
+        logger.info(
+            f"{len(clients)} connexions cédées au nouveau processus"
+            + (f", {remaining} fermées (connexion Redis dédiée ou commande en cours)" if remaining else "")
+        )
+    
+    def _client_fileno(self, client_info):
+        return client_info['socket'].fileno()
+    
+    def _client_state(self, client_id, client_info):
+        """
+        État d'une connexion à céder: session, abonnements et octets en attente.
+        
+        Returns:
+            tuple: (état JSON, octets reçus non analysés suivis des octets à envoyer)
+        """
+        pending_input = client_info['parser'].pending()
+        pending_output = b''.join(client_info['outbound'].snapshot())
+        state = {
+            'client_id': client_id,
+            'authenticated': client_info['authenticated'],
+            'user_id': client_info['user_id'],
+            'role': client_info['role'],
+            'token': client_info['token'],
+            'name': client_info.get('name'),
+            'subscribed_channels': sorted(client_info['subscribed_channels']),
+            'subscribed_patterns': sorted(client_info['subscribed_patterns']),
+            'pending_input': len(pending_input),
+        }
+        return state, pending_input + pending_output
+    
+    def _adopt_session(self, client_id, client_info, state, blob):
+        """Rétablit l'état d'une connexion reprise à l'ancien processus"""
+        client_info['parser'].feed(blob[:state['pending_input']])
+        if len(blob) > state['pending_input']:
+            client_info['outbound'].put_reply(blob[state['pending_input']:])
+        client_info.update(
+            authenticated=state['authenticated'],
+            user_id=state['user_id'],
+            role=state['role'],
+            token=state['token']
+        )
+        if state.get('name'):
+            client_info['name'] = state['name']
+            client_info['session_id'] = session_id_for(state['name'])
+        
+        for kind, key, index in (('subscribe', 'subscribed_channels', self.channel_subscribers),
+                                 ('psubscribe', 'subscribed_patterns', self.pattern_subscribers)):
+            channels = state[key]
+            for channel in channels:
+                client_info[key].add(channel)
+                if kind == 'subscribe' and is_wildcard(channel):
+                    self.filter_subscribers.add(channel, client_id)
+                else:
+                    index.add(channel, client_id)
+                self.acquire_upstream_subscription(kind, channel)
+    
     def stop(self):
         """Arrête le proxy"""
         self.running = False
+        self.policy_reloader.stop()
+        self.reaper.stop()
+        if self.handoff_server:
+            self.handoff_server.stop()
+        self._close_sockets()
+        
+        if self.upstream_pool:
+            self.upstream_pool.close()
+        
+        logger.info(f"Cache des tokens JWT: {self.token_cache.stats()}")
+        logger.info(f"Files d'envoi: {self.outbound_stats()['total']}")
+        logger.info(f"Limites de publication: {self.rate_limiter.stats()}")
+        logger.info(f"Fusion des messages: {self.coalescer.stats()}")
+        logger.info(f"Connexions: {self.reaper.stats()}")
+        self.session_store.close()
+        if self.audit_log.enabled:
+            self.audit_log.close()
+            logger.info(f"Journal d'audit: {self.audit_log.stats()}")
+        logger.info("Proxy Redis arrêté")
+    
+    def _close_sockets(self):
+        """Ferme le socket d'écoute et les connexions client (sauf celles cédées au nouveau processus)"""
         if self.server_socket:
             self.server_socket.close()
-        
-        # Fermer toutes les connexions client
-        for client_id, client_info in self.client_connections.items():
+        for client_info in list(self.client_connections.values()):
             try:
                 client_info['socket'].close()
-            except:
+            except OSError:
                 pass
-        
-        logger.info("Proxy Redis arrêté")
     
     def handle_client(self, client_socket, client_id):
         """Gère une connexion client"""
-        # Connexion au serveur Redis réel
-        redis_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        redis_conn = None  # Connexion dédiée, ouverte seulement si nécessaire
+        client_info = self.client_connections[client_id]
+        parser = client_info['parser']
+        poller = self._new_poller(client_socket)
         try:
-            redis_socket.connect((self.redis_host, self.redis_port))
-            
             while self.running:
+                client_info['reading'] = True
+                if poller is not None and not self._wait_readable(poller, client_socket):
+                    # Reprise en cours: ne plus lire, les octets restent au nouveau processus
+                    if self._park(client_info):
+                        return
+                    continue
+                
                 # Recevoir des données du client
-                data = client_socket.recv(4096)
+                data = client_socket.recv(65536)
+                client_info['reading'] = False
+                client_info['last_activity'] = time.monotonic()
                 if not data:
                     logger.debug(f"Pas de donnees recues")
                     break
                 
-                # Analyser la commande Redis
-                command = RedisCommand(data)
-                logger.debug(f"Commande reçue: {command}")
+                # Une lecture peut contenir zéro, une ou plusieurs commandes complètes
+                try:
+                    parser.feed(data)
+                except RespProtocolError as e:
+                    self._send_replies(client_info, [encode_error(f"ERR Protocol error: {e}")])
+                    break
                 
-                # Traiter les commandes pub/sub
-                if command.is_pubsub_command():
-                    if self.handle_pubsub_command(client_id, command, client_socket, redis_socket, data):
-                        continue  # Commande déjà traitée
-                else:
-                    logger.info(f"Le message n'est pas pub/sub: {command.command_type},{client_id}")
+                # Les commandes du pool sont envoyées à la suite (pipelining),
+                # puis les réponses sont renvoyées au client dans l'ordre
+                replies = []
+                close = False
+                for parts, raw_data in parser:
+                    if not parts:
+                        continue  # Ligne inline vide, ignorée par Redis
+                    
+                    # Analyser la commande Redis
+                    command = RedisCommand(raw_data, parts)
+                    logger.debug(f"Commande reçue: {command}")
+                    
+                    session_id = self.session_to_restore(client_info, command)
+                    if session_id:
+                        self.restore_session(client_info, self.session_store.load(session_id))
+                    action, payload = self.process_command(client_id, command, raw_data)
+                    if command.command_type in ('SUBSCRIBE', 'PSUBSCRIBE'):
+                        # Confirmé au client une fois Redis abonné: rien n'est perdu entre les deux
+                        keys = self.upstream_keys(client_info, command)
+                        if not self.upstream_subscriptions.wait_confirmed(keys, self.subscribe_timeout):
+                            logger.warning(f"Abonnement Redis non confirmé pour {client_id}: {keys}")
+                    if action == 'delay':
+                        # Client au-delà de sa limite: seul son thread de lecture attend
+                        delay, payload = payload
+                        time.sleep(delay)
+                        action = 'dedicated' if client_info.get('dedicated') else 'forward'
+                    if action == 'forward':
+                        replies.append(self.upstream_pool.submit(payload, client_info['pool_slot']))
+                    elif action == 'dedicated':
+                        if redis_conn is None:
+                            redis_conn = UpstreamConnection(self.redis_host, self.redis_port)
+                        replies.append(redis_conn.request(payload))
+                    else:
+                        replies.append(payload)
+                        if action == 'close':
+                            close = True
+                            break
                 
-                # Pour les autres commandes, les transmettre directement
-                redis_socket.send(data)
-                response = redis_socket.recv(4096)
-                client_socket.send(response)
+                # Les réponses passent par la file d'envoi, dans l'ordre avec les messages pub/sub
+                self._send_replies(
+                    client_info,
+                    [reply if isinstance(reply, bytes) else reply.result() for reply in replies]
+                )
+                if close:
+                    break
         
+        except OSError as e:
+            logger.debug(f"Connexion interrompue pour {client_id}: {e}")
         except Exception as e:
             traceback.print_exc()
             logger.error(f"Erreur pour le client {client_id}: {e}")
@@ -240,102 +743,454 @@ class RedisProxy:
         finally:
             # Nettoyage
             try:
-                redis_socket.close()
+                if redis_conn is not None:
+                    redis_conn.close()
             except:
                 pass
             
+            # Laisser l'écrivain envoyer les dernières réponses (ex: +OK de QUIT)
+            with client_info['outbound_ready']:
+                client_info['closing'] = True
+                client_info['outbound_ready'].notify_all()
+            client_info['writer_thread'].join(timeout=1.0)
+            
             try:
                 client_socket.close()
             except:
                 pass
             
-            # Supprimer la connexion
-            if client_id in self.client_connections:
-                del self.client_connections[client_id]
+            # Supprimer la connexion et ses abonnements
+            self._remove_client(client_id)
+            
+            logger.debug(f"Client déconnecté: {client_id}")
+    
+    def _remove_client(self, client_id):
+        """Oublie une connexion client et la retire de l'index des abonnements"""
+        client_info = self.client_connections.pop(client_id, None)
+        if client_info is None:
+            return
+        self.audit_log.record(
+            audit.DISCONNECT, client_id, user_id=client_info['user_id'], role=client_info['role'],
+            detail=client_info.get('close_reason')
+        )
+        for channel in client_info['subscribed_channels']:
+            if is_wildcard(channel):
+                self.filter_subscribers.discard(channel, client_id)
+            self.release_upstream_subscription('subscribe', channel)
+        for pattern in client_info['subscribed_patterns']:
+            self.release_upstream_subscription('psubscribe', pattern)
+        self.channel_subscribers.remove_client(client_id, client_info['subscribed_channels'])
+        self.pattern_subscribers.remove_client(client_id, client_info['subscribed_patterns'])
+    
+    def process_command(self, client_id, command, raw_data):
+        """
+        Décide du traitement d'une commande client, sans entrée/sortie,
+        pour être partagé par tous les moteurs.
+        
+        Returns:
+            tuple: (action, data) avec action parmi:
+                'reply': data est la réponse à renvoyer directement au client
+                'forward': data est la commande à envoyer via le pool partagé
+                'delay': data est (délai, commande): envoyer après le délai, sur la
+                    connexion dédiée du client s'il en a une, sinon via le pool
+                'dedicated': data est la commande à envoyer sur la connexion dédiée du client
+                'close': data est la réponse à envoyer avant de fermer la connexion
+        """
+        client_info = self.client_connections.get(client_id, {})
+        
+        if command.is_pubsub_command():
+            if command.command_type == 'PUBLISH':
+                handled, upstream_command, error_response = self.prepare_publish(client_id, command)
+                delay = 0
+                if handled and error_response is None:
+                    delay = self.check_rate_limit(client_info, command)
+                    if delay is None:
+                        error_response = RATE_LIMITED
+                if self.audit_log.enabled:
+                    message = command.get_message()
+                    self.audit_log.record(
+                        audit.PUBLISH, client_id, command.get_channel(), len(message) if message else 0,
+                        error_response, message, client_info.get('user_id'), client_info.get('role')
+                    )
+                if handled:
+                    if error_response:
+                        return 'reply', error_response
+                    if delay:
+                        return 'delay', (delay, upstream_command)
+                    if client_info.get('dedicated'):
+                        # Transaction en cours (MULTI/WATCH): le PUBLISH réécrit suit les autres
+                        # commandes du client, jamais retenu par la fusion hors de la transaction
+                        return 'dedicated', upstream_command
+                    if self.coalesce_publish(command, upstream_command):
+                        return 'reply', b':%d\r\n' % self.local_receivers(command.get_channel())
+                    return 'forward', upstream_command
+            elif command.command_type in ['SUBSCRIBE', 'PSUBSCRIBE']:
+                return 'reply', self.prepare_subscribe(client_id, command)
+            else:
+                return 'reply', self.prepare_unsubscribe(client_id, command)
+        else:
+            self.audit_log.record(audit.COMMAND, client_id, detail=command.command_type)
+            if any(arg.startswith(INTERNAL_KEY_PREFIX) for arg in command.raw_args):
+                # Argument en position de clé ou motif (SCAN MATCH proxy:*): refusé dans tous les cas
+                logger.warning(f"{command.command_type} sur une clé interne refusé pour {client_id}")
+                return 'reply', INTERNAL_KEY_DENIED
+            if command.command_type == 'XADD':
+                raw_data, error_response = self.prepare_stream_append(client_id, command, raw_data)
+            else:
+                error_response = self.authorize_stream_access(client_id, command)
+            if error_response:
+                return 'reply', error_response
+        
+        if command.command_type == 'QUIT':
+            return 'close', b'+OK\r\n'
+        
+        if command.command_type == 'PING' and (client_info.get('subscribed_channels') or client_info.get('subscribed_patterns')):
+            # En mode abonnement, Redis répond à PING par un tableau
+            return 'reply', encode_array('pong', command.raw_args[0] if command.raw_args else b'')
+        
+        if command.command_type == 'CLIENT' and command.raw_args and command.raw_args[0].upper() in (b'SETNAME', b'SETINFO'):
+            # Propre à la connexion client: ne doit pas modifier une connexion partagée
+            if command.raw_args[0].upper() == b'SETNAME' and len(command.raw_args) > 1:
+                client_info['name'] = command.raw_args[1].decode('utf-8', 'replace')
+                client_info['session_id'] = session_id_for(client_info['name'])
+            return 'reply', b'+OK\r\n'
+        
+        if client_info.get('dedicated') or needs_dedicated_connection(command):
+            # Une fois la connexion dédiée utilisée, le client y reste pour conserver son état
+            client_info['dedicated'] = True
+            return 'dedicated', raw_data
+        
+        return 'forward', raw_data
+    
+    def check_rate_limit(self, client_info, command):
+        """
+        Applique les limites de publication du canal à un PUBLISH autorisé.
+        
+        Returns:
+            float: 0 si le message passe, le délai à respecter avant de le
+                transmettre, ou None s'il est refusé
+        """
+        rule = self.channel_policies.rate_limit(command.get_channel())
+        if rule is None:
+            return 0
+        authenticated = client_info.get('authenticated')
+        return self.rate_limiter.check(
+            rule,
+            client_info,
+            client_info.get('user_id') if authenticated else None,
+            client_info.get('role') if authenticated else None,
+            len(command.get_message())
+        )
+    
+    def coalesce_publish(self, command, upstream_command):
+        """
+        Retient un PUBLISH autorisé d'un canal en mode fusion jusqu'à la fin
+        de la fenêtre de sa clé (voir coalesce.py): un PUBLISH suivant de la
+        même clé le remplace avant tout envoi vers Redis.
+        
+        Returns:
+            bool: True si la commande est retenue, False si elle part tout de
+                suite (canal sans fusion, message terminal ou illisible)
+        """
+        channel = command.get_channel()
+        rule = self.channel_policies.coalescing(channel)
+        if rule is None:
+            return False
+        try:
+            message = decode_message(command.get_message())
+        except ValueError:
+            return False
+        key = coalesce_key(channel, message, rule.key)
+        if is_terminal(message):
+            # Le message en attente de la clé, plus ancien, ne doit pas le suivre
+            self.coalescer.discard(key)
+            return False
+        self.coalescer.offer(key, upstream_command, rule.window)
+        return True
+    
+    def local_receivers(self, channel):
+        """
+        Nombre de clients de ce proxy abonnés à un canal, directement ou par
+        un filtre: réponse à un PUBLISH retenu par la fusion, qui n'a pas
+        encore de compte de Redis. Comme le compte d'un nœud Redis Cluster, il
+        ignore les abonnés des autres workers et des autres connexions Redis,
+        ainsi que les motifs PSUBSCRIBE bruts.
+        """
+        count = len(self.channel_subscribers.subscribers(channel))
+        for _, client_ids in self.filter_subscribers.match_items(channel):
+            count += len(client_ids)
+        return count
+    
+    @staticmethod
+    def _stream_filter(key):
+        """Canal (ou filtre) couvert par une clé stream:<canal>[:dead], ou None"""
+        if not key.startswith(STREAM_KEY_PREFIX):
+            return None
+        channel_name = key[len(STREAM_KEY_PREFIX):].decode('utf-8', 'replace')
+        if channel_name.endswith(DEAD_LETTER_SUFFIX):
+            channel_name = channel_name[:-len(DEAD_LETTER_SUFFIX)]
+        # Motif SCAN/KEYS: le filtre qui couvre tous les streams qu'il désigne
+        return glob_to_filter(channel_name)
+    
+    def _stream_filters(self, command):
+        """Filtres des streams de canaux nommés par les arguments d'une commande"""
+        filters = []
+        for arg in command.raw_args:
+            topic_filter = self._stream_filter(arg)
+            if topic_filter is not None:
+                filters.append(topic_filter)
+        return filters
+    
+    def authorize_stream_access(self, client_id, command):
+        """
+        Applique la politique de SUBSCRIBE aux commandes qui lisent ou gèrent
+        le stream d'un canal durable (XRANGE, XREAD, XREADGROUP, XACK, XCLAIM,
+        DUMP...): les entrées conservées ne sont lisibles que par qui peut
+        s'abonner au canal. Tout argument stream:<canal> est traité comme une clé.
+        
+        Returns:
+            bytes: Réponse d'erreur, ou None si l'accès est autorisé
+        """
+        filters = self._stream_filters(command)
+        if not filters:
+            return None
+        client_info = self.client_connections.get(client_id, {})
+        role = client_info.get('role') if client_info.get('authenticated') else None
+        policies = self.channel_policies
+        for topic_filter in filters:
+            if not policies.allows(role, SUBSCRIBE, topic_filter):
+                logger.warning(f"{command.command_type} sur le stream de {topic_filter} refusé pour {client_id}")
+                return b'-ERR NOAUTH Permission denied\r\n'
+        return None
+    
+    def prepare_stream_append(self, client_id, command, raw_data):
+        """
+        Applique à un XADD sur le stream d'un canal durable le traitement du
+        PUBLISH qui l'accompagne (le broker écrit chaque message publié dans
+        les deux): même autorisation par le token du message, mêmes
+        transformateurs, et le token est retiré de l'entrée conservée. Le
+        canal concret est le champ 'channel' de l'entrée. Un XADD sur le dead
+        letter déplace une entrée déjà lue: il relève de la politique de
+        SUBSCRIBE.
+        
+        Returns:
+            tuple: (commande à transmettre, réponse d'erreur ou None)
+        """
+        args = command.raw_args
+        topic_filter = self._stream_filter(args[0]) if args else None
+        if topic_filter is None:
+            return raw_data, None
+        if args[0].endswith(DEAD_LETTER_SUFFIX.encode('ascii')):
+            return raw_data, self.authorize_stream_access(client_id, command)
+        
+        # XADD key [NOMKSTREAM] [MAXLEN|MINID [=|~] seuil [LIMIT n]] id champ valeur...
+        position = 1
+        while position < len(args):
+            option = args[position].upper()
+            if option == b'NOMKSTREAM':
+                position += 1
+            elif option in (b'MAXLEN', b'MINID'):
+                position += 1
+                if position < len(args) and args[position] in (b'=', b'~'):
+                    position += 1
+                position += 1
+            elif option == b'LIMIT':
+                position += 2
+            else:
+                break
+        pairs = list(args[position + 1:])
+        fields = dict(zip(pairs[0::2], pairs[1::2]))
+        
+        channel = fields.get(b'channel', b'').decode('utf-8', 'replace') or topic_filter
+        # Une entrée ne peut pas se réclamer d'un canal que le stream ne couvre pas
+        if not topic_matches(topic_filter, channel) or b'data' not in fields:
+            logger.warning(f"Entrée invalide pour {args[0]!r} de {client_id}")
+            return None, b'-ERR NOAUTH Permission denied\r\n'
+        
+        handled, upstream_command, error_response = self.prepare_publish(
+            client_id, RedisCommand(encode_command('PUBLISH', channel, fields[b'data']))
+        )
+        if not handled:
+            return None, b'-ERR NOAUTH Permission denied\r\n'
+        if error_response:
+            logger.warning(f"Écriture non autorisée dans {args[0]!r} pour {client_id}")
+            return None, error_response
+        
+        # Entrée réécrite avec le message tel que le reçoivent les abonnés (sans token)
+        data = RedisCommand(upstream_command).get_message()
+        for index in range(0, len(pairs) - 1, 2):
+            if pairs[index] == b'data':
+                pairs[index + 1] = data
+        return encode_command('XADD', *args[:position + 1], *pairs), None
+    
+    def authorize_publish(self, client_id, channel, token):
+        """
+        Vérifie qu'un client peut publier sur un canal.
+        
+        Args:
+            client_id: Identifiant de la connexion
+            channel: Canal visé
+            token: Token JWT présent dans le message (ou None)
+            
+        Returns:
+            tuple: (authorized, user_id, role)
+        """
+        # Un message est publié sur un canal concret, jamais sur un filtre
+        if is_wildcard(channel):
+            return False, None, None
+        
+        # Une seule référence pour toute la décision, même si la table est rechargée
+        policies = self.channel_policies
+        
+        # Canaux ouverts (pas besoin d'authentification)
+        if policies.is_open(PUBLISH, channel):
+            return True, None, None
+        
+        # Canaux nécessitant une authentification
+        if not token:
+            return False, None, None
+        
+        try:
+            # Vérifier le token JWT (signature vérifiée une seule fois par token)
+            user_id, role = self.verify_token(token)
+        except jwt.InvalidTokenError:
+            logger.warning(f"Token JWT invalide pour {client_id}")
+            return False, None, None
+        
+        # Mettre à jour les informations de connexion
+        client_info = self.client_connections.get(client_id)
+        if client_info is not None:
+            changed = (client_info['user_id'], client_info['role']) != (user_id, role) or not client_info['authenticated']
+            client_info['authenticated'] = True
+            client_info['user_id'] = user_id
+            client_info['role'] = role
+            client_info['token'] = token
+            if changed and client_info['session_id']:
+                # Visible par les autres connexions de la session (une écriture par changement, pas par PUBLISH)
+                self.session_store.save(client_info['session_id'], {
+                    'authenticated': True,
+                    'user_id': user_id,
+                    'role': role,
+                    'expires_at': self.token_cache.expires_at(token)
+                })
+        
+        return policies.allows(role, PUBLISH, channel), user_id, role
+    
+    def verify_token(self, token):
+        """
+        Vérifie un token JWT en passant par le cache des tokens vérifiés.
+        
+        Returns:
+            tuple: (user_id, role)
             
-            logger.info(f"Client déconnecté: {client_id}")
-    
-    def handle_pubsub_command(self, client_id, command, client_socket, redis_socket, raw_data):
-        """Gère les commandes pub/sub"""
-        
-        if command.command_type == 'PUBLISH':
-            return self.handle_publish(client_id, command, client_socket, redis_socket, raw_data)
-        elif command.command_type in ['SUBSCRIBE', 'PSUBSCRIBE']:
-            return self.handle_subscribe(client_id, command, client_socket, redis_socket, raw_data)
-        elif command.command_type in ['UNSUBSCRIBE', 'PUNSUBSCRIBE']:
-            # Gérer les désabonnements
-            channels = command.get_channel()
-            if channels and client_id in self.client_connections:
-                for channel in channels:
-                    if channel in self.client_connections[client_id]['subscribed_channels']:
-                        self.client_connections[client_id]['subscribed_channels'].remove(channel)
+        Raises:
+            jwt.InvalidTokenError: si le token est invalide ou expiré
+        """
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+        
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+        self.token_cache.put(token, payload)
+        return payload.get('user_id'), payload.get('role')
+    
+    def authorize_subscribe(self, client_id, channels, patterns=False):
+        """
+        Sépare les canaux demandés en canaux autorisés et non autorisés.
+        Un filtre avec jokers n'est autorisé que si une règle le couvre entièrement.
+        
+        Args:
+            client_id: Identifiant de la connexion
+            channels: Canaux (ou filtres) demandés
+            patterns: True pour des motifs PSUBSCRIBE de Redis
             
-            # Transmettre la commande telle quelle
-            redis_socket.send(raw_data)
-            response = redis_socket.recv(4096)
-            client_socket.send(response)
-            return True
+        Returns:
+            tuple: (authorized_channels, unauthorized_channels)
+        """
+        client_info = self.client_connections.get(client_id, {})
+        # Sans authentification, seuls les canaux ouverts sont accessibles
+        role = client_info.get('role') if client_info.get('authenticated') else None
+        policies = self.channel_policies
+        
+        authorized_channels = []
+        unauthorized_channels = []
         
-        return False
+        for channel in channels:
+            topic_filter = glob_to_filter(channel) if patterns else channel
+            if policies.allows(role, SUBSCRIBE, topic_filter):
+                authorized_channels.append(channel)
+            else:
+                unauthorized_channels.append(channel)
+        
+        return authorized_channels, unauthorized_channels
+    
+    def session_to_restore(self, client_info, command):
+        """
+        Identifiant de la session à relire avant de traiter une commande:
+        un (P)SUBSCRIBE d'un canal protégé, ou un accès à son stream, sur une
+        connexion non authentifiée qui présente une session partagée. La lecture elle-même est faite par
+        le moteur (session_store.load est bloquant), puis restore_session().
+        
+        Returns:
+            str ou None si rien n'est à relire
+        """
+        session_id = client_info.get('session_id')
+        if not session_id or client_info.get('authenticated'):
+            return None
+        if command.command_type in ('SUBSCRIBE', 'PSUBSCRIBE'):
+            patterns = command.command_type == 'PSUBSCRIBE'
+            filters = [glob_to_filter(channel) if patterns else channel for channel in command.get_channel() or []]
+        elif command.is_pubsub_command():
+            return None
+        else:
+            # Lecture du stream d'un canal durable (XREADGROUP d'un StreamConsumer...)
+            filters = self._stream_filters(command)
+        for topic_filter in filters:
+            if not self.channel_policies.is_open(SUBSCRIBE, topic_filter):
+                return session_id
+        return None
+    
+    def restore_session(self, client_info, session):
+        """Reprend l'authentification d'une session relue (dict de session_store.load ou None)"""
+        if session and session['authenticated'] and not client_info['authenticated']:
+            client_info.update(session)
     
-    def handle_publish(self, client_id, command, client_socket, redis_socket, raw_data):
-        """Gère la commande PUBLISH"""
+    def prepare_publish(self, client_id, command):
+        """
+        Applique l'autorisation et les transformateurs à une commande PUBLISH.
+        Ne fait aucune entrée/sortie, pour être partagé par tous les moteurs.
+        
+        Returns:
+            tuple: (handled, upstream_command, error_response)
+                handled est False si la commande doit être transmise telle quelle,
+                sinon exactement un de upstream_command/error_response est renseigné.
+        """
         channel = command.get_channel()
         message_str = command.get_message()
         
         if not channel or not message_str:
             logger.warning(f"Canal ou message manquant dans la commande PUBLISH: {command}")
-            return False
+            return False, None, None
+        
+        # Taille seulement: formater un corps de plusieurs Mo coûterait plus que son transfert
+        logger.debug(f"PUBLISH sur le canal {channel} ({len(message_str)} octets)")
         
-        logger.info(f"PUBLISH sur le canal {channel}: {message_str}")
+        if is_envelope(message_str):
+            return self._prepare_envelope_publish(client_id, channel, message_str)
         
         try:
-            # Tenter de parser le message JSON
-            message = json.loads(message_str)
-            
-            # Vérifier si un token est présent
-            token = message.get('token')
-            user_id = None
-            role = None
+            # Tenter de parser le message JSON (objet attendu), avec le décodeur le plus rapide
+            message = decoder_for(None).decode(message_str)
+            if not isinstance(message, dict):
+                raise ValueError("Le message doit être un objet JSON")
             
             # Vérifier l'autorisation pour ce canal
-            authorized = False
-            
-            # Canaux ouverts (pas besoin d'authentification)
-            if channel in self.open_channels:
-                authorized = True
-            # Canaux nécessitant une authentification
-            elif token:
-                try:
-                    # Vérifier le token JWT
-                    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                    user_id = payload.get('user_id')
-                    role = payload.get('role')
-                    
-                    # Vérifier les permissions selon le rôle
-                    if role == 'manager' and channel in self.manager_channels:
-                        authorized = True
-                    elif role == 'volunteer' and channel in self.volunteer_channels:
-                        authorized = True
-                    elif role == 'coordinator':  # Le coordinateur peut accéder à tous les canaux
-                        authorized = True
-                    
-                    # Mettre à jour les informations de connexion
-                    if client_id in self.client_connections:
-                        self.client_connections[client_id]['authenticated'] = True
-                        self.client_connections[client_id]['user_id'] = user_id
-                        self.client_connections[client_id]['role'] = role
-                        self.client_connections[client_id]['token'] = token
-                except jwt.InvalidTokenError:
-                    logger.warning(f"Token JWT invalide pour {client_id}")
-                    authorized = False
+            authorized, user_id, role = self.authorize_publish(client_id, channel, message.get('token'))
             
             # Si non autorisé, renvoyer une erreur
             if not authorized:
                 logger.warning(f"Accès non autorisé au canal {channel} pour {client_id}")
-                error_response = b'-ERR NOAUTH Permission denied\r\n'
-                client_socket.send(error_response)
-                return True
+                return True, None, b'-ERR NOAUTH Permission denied\r\n'
             
             # Appliquer les transformateurs de messages
             for transformer in self.message_transformers:
@@ -347,112 +1202,226 @@ class RedisProxy:
             
             # Reconstruire la commande PUBLISH avec le message transformé
             new_message_str = json.dumps(message)
-            new_command = f"*3\r\n$7\r\nPUBLISH\r\n${len(channel)}\r\n{channel}\r\n${len(new_message_str)}\r\n{new_message_str}\r\n"
-            
-            # Envoyer la commande modifiée à Redis
-            redis_socket.send(new_command.encode('utf-8'))
-            response = redis_socket.recv(4096)
-            client_socket.send(response)
-            
-            return True
-        except json.JSONDecodeError:
+            return True, encode_command('PUBLISH', channel, new_message_str), None
+        except ValueError:
+            # JSON invalide, UTF-8 invalide ou valeur qui n'est pas un objet
             logger.warning(f"Format JSON invalide dans le message: {message_str}")
-            error_response = b'-ERR WRONGTYPE Invalid JSON format\r\n'
-            client_socket.send(error_response)
-            return True
+            return True, None, b'-ERR WRONGTYPE Invalid JSON format\r\n'
         except Exception as e:
             logger.error(f"Erreur lors du traitement de PUBLISH: {e}")
             traceback.print_exc()
-            return False
+            return False, None, None
+    
+    def _prepare_envelope_publish(self, client_id, channel, message_bytes):
+        """
+        PUBLISH d'un message enveloppé: seul l'en-tête est décodé. Le token en
+        est retiré et les métadonnées de l'expéditeur y sont ajoutées; le corps
+        est recopié tel quel dans la commande transmise à Redis, sauf si la
+        politique du canal demande son inspection.
+        
+        Returns:
+            tuple: (handled, upstream_command, error_response), comme prepare_publish
+        """
+        try:
+            header, body = split_envelope(message_bytes)
+        except ValueError:
+            logger.warning(f"En-tête d'enveloppe invalide sur {channel} pour {client_id}")
+            return True, None, b'-ERR WRONGTYPE Invalid envelope header\r\n'
+        
+        authorized, user_id, role = self.authorize_publish(client_id, channel, header.pop('token', None))
+        if not authorized:
+            logger.warning(f"Accès non autorisé au canal {channel} pour {client_id}")
+            return True, None, b'-ERR NOAUTH Permission denied\r\n'
+        
+        header.update(self.sender_metadata(client_id, user_id, role))
+        
+        if self.channel_policies.inspects_body(channel):
+            try:
+                # Corps dans le format nommé par l'en-tête (JSON par défaut, msgpack...)
+                codec = decoder_for(header.get(CODEC_HEADER))
+                message = codec.decode(body)
+                if not isinstance(message, dict):
+                    raise ValueError("Le message doit être un objet")
+            except ValueError:
+                logger.warning(f"Format invalide dans le corps d'un message enveloppé sur {channel}")
+                return True, None, b'-ERR WRONGTYPE Invalid JSON format\r\n'
+            message.pop('token', None)
+            for transformer in self.body_transformers:
+                message = transformer(client_id, channel, message, user_id, role)
+            # Réencodé dans le même format; JSON par la bibliothèque standard, comme les messages non enveloppés
+            body = (codec if codec.binary else get_codec()).encode(message)
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+        
+        # Trame PUBLISH assemblée en une seule copie du corps
+        head = encode_header(header)
+        channel_bytes = channel.encode('utf-8')
+        upstream_command = b''.join([
+            b'*3\r\n$7\r\nPUBLISH\r\n$%d\r\n' % len(channel_bytes), channel_bytes,
+            b'\r\n$%d\r\n' % (len(head) + len(body)), head, body, b'\r\n'
+        ])
+        return True, upstream_command, None
     
-    def handle_subscribe(self, client_id, command, client_socket, redis_socket, raw_data):
-        """Gère la commande SUBSCRIBE"""
+    def prepare_subscribe(self, client_id, command):
+        """
+        Applique l'autorisation à une commande SUBSCRIBE/PSUBSCRIBE et
+        construit la réponse localement: les messages sont ensuite délivrés
+        par l'abonné partagé du proxy, pas par une connexion Redis par client.
+        Ne fait aucune entrée/sortie, pour être partagé par tous les moteurs:
+        le moteur retient la réponse jusqu'à ce que Redis ait confirmé les
+        abonnements de upstream_keys().
+        
+        Returns:
+            bytes: Réponse à renvoyer au client
+        """
         channels = command.get_channel()
+        kind = command.command_type.lower()
         
         if not channels:
             logger.warning(f"Canaux manquants dans la commande SUBSCRIBE: {command}")
-            return False
+            return encode_error(f"ERR wrong number of arguments for '{kind}' command")
         
-        logger.info(f"SUBSCRIBE aux canaux {channels}")
+        logger.debug(f"SUBSCRIBE aux canaux {channels}")
         
         # Vérifier l'autorisation pour chaque canal
-        client_info = self.client_connections.get(client_id, {})
-        role = client_info.get('role')
-        
-        authorized_channels = []
-        unauthorized_channels = []
-        
-        for channel in channels:
-            # Canaux ouverts (pas besoin d'authentification)
-            if channel in self.open_channels:
-                authorized_channels.append(channel)
-            # Canaux nécessitant une authentification
-            elif client_info.get('authenticated'):
-                if role == 'manager' and channel in self.manager_channels:
-                    authorized_channels.append(channel)
-                elif role == 'volunteer' and channel in self.volunteer_channels:
-                    authorized_channels.append(channel)
-                elif role == 'coordinator':  # Le coordinateur peut accéder à tous les canaux
-                    authorized_channels.append(channel)
-                else:
-                    unauthorized_channels.append(channel)
-            else:
-                unauthorized_channels.append(channel)
+        authorized_channels, unauthorized_channels = self.authorize_subscribe(
+            client_id, channels, patterns=(kind == 'psubscribe')
+        )
+        self.audit_log.record(
+            audit.SUBSCRIBE, client_id, channels,
+            outcome='denied' if unauthorized_channels else None,
+            detail={'command': kind, 'denied': unauthorized_channels} if unauthorized_channels else kind
+        )
         
         # Si aucun canal autorisé, renvoyer une erreur
         if not authorized_channels:
             logger.warning(f"Accès non autorisé aux canaux {channels} pour {client_id}")
-            error_response = b'-ERR NOAUTH Permission denied\r\n'
-            client_socket.send(error_response)
-            return True
-        
-        # Mettre à jour les canaux souscrits
-        if client_id in self.client_connections:
-            self.client_connections[client_id]['subscribed_channels'].update(authorized_channels)
-        
-        # S'abonner uniquement aux canaux autorisés
-        if len(authorized_channels) == len(channels):
-            # Tous les canaux sont autorisés, transmettre la commande telle quelle
-            redis_socket.send(raw_data)
+            return b'-ERR NOAUTH Permission denied\r\n'
+        
+        client_info = self.client_connections.get(client_id, self._new_client_info())
+        if kind == 'psubscribe':
+            subscriptions, index = client_info['subscribed_patterns'], self.pattern_subscribers
         else:
-            # Reconstruire la commande SUBSCRIBE avec seulement les canaux autorisés
-            parts = [f"*{len(authorized_channels) + 1}", "$9", "SUBSCRIBE"]
-            for channel in authorized_channels:
-                parts.append(f"${len(channel)}")
-                parts.append(channel)
-            
-            new_command = "\r\n".join(parts) + "\r\n"
-            redis_socket.send(new_command.encode('utf-8'))
+            subscriptions, index = client_info['subscribed_channels'], self.channel_subscribers
         
-        # Transmettre la réponse au client
-        response = redis_socket.recv(4096)
-        client_socket.send(response)
+        # Une confirmation par canal autorisé, comme le ferait Redis
+        registered = client_id in self.client_connections
+        replies = []
+        for channel in authorized_channels:
+            if registered and channel not in subscriptions:
+                # Une référence par abonnement client, rendue au désabonnement ou à la déconnexion
+                if kind == 'subscribe' and is_wildcard(channel):
+                    # Filtre MQTT: Redis est abonné au motif équivalent, le trie affine
+                    self.filter_subscribers.add(channel, client_id)
+                else:
+                    index.add(channel, client_id)
+                self.acquire_upstream_subscription(kind, channel)
+            subscriptions.add(channel)
+            count = len(client_info['subscribed_channels']) + len(client_info['subscribed_patterns'])
+            replies.append(encode_array(kind, channel, count))
         
         # Informer le client des canaux non autorisés
-        if unauthorized_channels:
-            for channel in unauthorized_channels:
-                error_msg = f"Accès non autorisé au canal {channel}"
-                error_response = f"$5\r\nerror\r\n${len(channel)}\r\n{channel}\r\n${len(error_msg)}\r\n{error_msg}\r\n"
-                client_socket.send(error_response.encode('utf-8'))
+        for channel in unauthorized_channels:
+            error_msg = f"Accès non autorisé au canal {channel}"
+            replies.append(encode_bulk('error') + encode_bulk(channel) + encode_bulk(error_msg))
         
-        return True
+        return b''.join(replies)
+    
+    def prepare_unsubscribe(self, client_id, command):
+        """
+        Met à jour les canaux souscrits suite à un UNSUBSCRIBE/PUNSUBSCRIBE
+        et construit la réponse localement.
+        
+        Returns:
+            bytes: Réponse à renvoyer au client
+        """
+        kind = command.command_type.lower()
+        client_info = self.client_connections.get(client_id, self._new_client_info())
+        if kind == 'punsubscribe':
+            subscriptions, index = client_info['subscribed_patterns'], self.pattern_subscribers
+        else:
+            subscriptions, index = client_info['subscribed_channels'], self.channel_subscribers
+        
+        # Sans argument, désabonne de tous les canaux (ou motifs)
+        channels = command.get_channel() or sorted(subscriptions)
+        self.audit_log.record(audit.UNSUBSCRIBE, client_id, channels, detail=kind)
+        
+        registered = client_id in self.client_connections
+        replies = []
+        for channel in channels:
+            if channel in subscriptions:
+                subscriptions.discard(channel)
+                if kind == 'unsubscribe' and is_wildcard(channel):
+                    self.filter_subscribers.discard(channel, client_id)
+                else:
+                    index.discard(channel, client_id)
+                if registered:
+                    self.release_upstream_subscription(kind.replace('un', '', 1), channel)
+            count = len(client_info['subscribed_channels']) + len(client_info['subscribed_patterns'])
+            replies.append(encode_array(kind, channel, count))
+        
+        if not replies:
+            count = len(client_info['subscribed_channels']) + len(client_info['subscribed_patterns'])
+            replies.append(encode_array(kind, None, count))
+        
+        return b''.join(replies)
+    
+    def _upstream_key(self, kind, channel):
+        """Abonnement Redis qui couvre un abonnement client (tasks/status/# -> motif tasks/status*)"""
+        if kind == 'subscribe' and is_wildcard(channel):
+            return 'psubscribe', to_redis_pattern(channel)
+        return kind, channel
+    
+    def upstream_keys(self, client_info, command):
+        """Abonnements Redis qui couvrent les canaux d'un SUBSCRIBE/PSUBSCRIBE auxquels le client est abonné"""
+        kind = command.command_type.lower()
+        subscriptions = client_info['subscribed_patterns'] if kind == 'psubscribe' else client_info['subscribed_channels']
+        return [self._upstream_key(kind, channel) for channel in command.get_channel() if channel in subscriptions]
+    
+    def acquire_upstream_subscription(self, kind, channel):
+        """Compte un abonnement client; l'abonné partagé s'abonne au premier"""
+        if self.upstream_subscriptions.acquire(*self._upstream_key(kind, channel)):
+            logger.debug(f"Premier abonné local: abonnement Redis à {channel}")
+    
+    def release_upstream_subscription(self, kind, channel):
+        """Rend la référence d'un abonnement client; l'abonné partagé se désabonne au dernier"""
+        if self.upstream_subscriptions.release(*self._upstream_key(kind, channel)):
+            logger.debug(f"Plus d'abonné local: désabonnement Redis de {channel}")
+    
+    def _drain_pending_subscriptions(self):
+        """
+        Retourne les changements à appliquer à l'abonné partagé depuis le dernier tour.
+        
+        Returns:
+            dict: commande (subscribe, psubscribe, unsubscribe, punsubscribe) -> canaux ou motifs
+        """
+        changes = self.upstream_subscriptions.changes()
+        if changes:
+            logger.debug(f"Abonné partagé: {', '.join(f'{kind} {len(names)}' for kind, names in changes.items())}")
+        return changes
     
     def add_metadata(self, client_id, channel, message, user_id=None, role=None):
         """Ajoute des métadonnées au message"""
+        message.update(self.sender_metadata(client_id, user_id, role))
+        return message
+    
+    def sender_metadata(self, client_id, user_id=None, role=None):
+        """Métadonnées de l'expéditeur, ajoutées au message ou à l'en-tête de l'enveloppe"""
+        metadata = {}
         # Ajouter des informations sur l'expéditeur
         if user_id:
-            message['_sender_id'] = user_id
+            metadata['_sender_id'] = user_id
         if role:
-            message['_sender_role'] = role
+            metadata['_sender_role'] = role
         
         # Ajouter un timestamp
-        message['_timestamp'] = datetime.utcnow().isoformat()
+        metadata['_timestamp'] = datetime.utcnow().isoformat()
         
         # Ajouter l'adresse IP du client
         if client_id:
-            message['_client_ip'] = client_id.split(':')[0]
+            metadata['_client_ip'] = client_id.split(':')[0]
         
-        return message
+        return metadata
     
     def filter_sensitive_data(self, client_id, channel, message, user_id=None, role=None):
         """Filtre les données sensibles des messages"""
@@ -462,6 +1431,10 @@ class RedisProxy:
             safe_keys = ['username', 'email', 'password', 'request_id', 'client_ip', 'client_info']
             return {k: v for k, v in message.items() if k in safe_keys or k.startswith('_')}
         
+        # La demande de connexion porte le mot de passe jusqu'au consommateur qui le vérifie
+        if channel == 'auth/login':
+            return message
+        
         # Pour les autres canaux, masquer les mots de passe
         if 'password' in message:
             message['password'] = '********'
@@ -469,74 +1442,222 @@ class RedisProxy:
         return message
 
     def _listen_for_published_messages(self):
-        """Écoute les messages publiés sur Redis et les transmet aux clients abonnés"""
+        """
+        Abonné partagé: écoute les messages publiés sur Redis et les transmet
+        aux clients abonnés. C'est la seule connexion Redis en mode abonnement.
+        """
         try:
             # Utiliser redis-py pour s'abonner aux canaux
-            redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, decode_responses=True)
+            # Messages reçus en bytes: ils sont retransmis sans décodage ni réencodage
+            redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, decode_responses=False)
             pubsub = redis_client.pubsub()
             
-            # S'abonner à tous les canaux connus
-            all_channels = list(self.open_channels.keys()) + list(self.manager_channels.keys()) + list(self.volunteer_channels.keys())
-            # Filtrer les canaux avec des jokers (#)
-            channels_to_subscribe = [channel for channel in all_channels if '#' not in channel]
-            
-            if channels_to_subscribe:
-                logger.info(f"Proxy s'abonne aux canaux: {', '.join(channels_to_subscribe)}")
-                pubsub.subscribe(*channels_to_subscribe)
-            
-            # Boucle d'écoute des messages
-            for message in pubsub.listen():
-                if message['type'] == 'message':
-                    channel = message['channel']
-                    data = message['data']
-                    
-                    logger.info(f"Message reçu sur {channel} à transmettre aux clients abonnés")
-                    
-                    # Convertir le message au format RESP pour le transmettre aux clients
-                    resp_message = self._format_pubsub_message(channel, data)
-                    
-                    # Transmettre le message aux clients abonnés
-                    for client_id, client_info in list(self.client_connections.items()):
-                        if channel in client_info.get('subscribed_channels', set()):
-                            try:
-                                client_socket = client_info['socket']
-                                client_socket.send(resp_message)
-                                logger.debug(f"Message transmis au client {client_id}")
-                            except Exception as e:
-                                logger.error(f"Erreur lors de la transmission au client {client_id}: {e}")
+            # Aucun abonnement au démarrage: seuls les canaux écoutés par un
+            # client sont demandés à Redis, au fil des SUBSCRIBE/UNSUBSCRIBE
+            while self.running:
+                # Appliquer les changements depuis le dernier tour, une commande par type
+                for kind, channels in self._drain_pending_subscriptions().items():
+                    getattr(pubsub, kind)(*channels)
+                
+                message = pubsub.get_message(timeout=0.05)
+                if message is not None:
+                    self._on_upstream_message(message)
         
         except Exception as e:
             logger.error(f"Erreur dans le thread d'écoute des messages publiés: {e}")
             import traceback
             traceback.print_exc()
     
-    def _format_pubsub_message(self, channel, data):
-        """Formate un message pub/sub au format RESP"""
-        # Format: *3\r\n$7\r\nmessage\r\n$<len(channel)>\r\n<channel>\r\n$<len(data)>\r\n<data>\r\n
-        channel_bytes = channel.encode('utf-8')
-        data_bytes = data.encode('utf-8') if isinstance(data, str) else data
+    def _on_upstream_message(self, message):
+        """Transmet un message de l'abonné partagé (redis-py, sans décodage) aux clients"""
+        if message['type'] in ('subscribe', 'psubscribe'):
+            # Confirmation de Redis: les SUBSCRIBE clients en attente peuvent être confirmés
+            self.upstream_subscriptions.confirm(message['type'], message['channel'].decode('utf-8', 'replace'))
+        elif message['type'] == 'message':
+            self.dispatch_published_message(message['channel'].decode('utf-8', 'replace'), message['data'])
+        elif message['type'] == 'pmessage':
+            self.dispatch_published_message(
+                message['channel'].decode('utf-8', 'replace'),
+                message['data'],
+                pattern=message['pattern'].decode('utf-8', 'replace')
+            )
+    
+    def dispatch_published_message(self, channel, data, pattern=None):
+        """
+        Transmet un message publié sur Redis aux clients abonnés au canal (ou au motif).
+        La trame RESP est encodée une seule fois: le même objet bytes est
+        déposé dans la file de chaque abonné, sans copie.
+        """
+        logger.debug(f"Message reçu sur {channel} à transmettre aux clients abonnés")
+        
+        # Convertir le message au format RESP pour le transmettre aux clients
+        if pattern is None:
+            delivered = self._deliver(self.channel_subscribers.subscribers(channel), self._format_pubsub_message(channel, data), channel)
+            self.audit_log.record(audit.DELIVER, channel=channel, size=len(data), detail=delivered)
+            return
+        
+        # Clients abonnés au motif Redis lui-même (PSUBSCRIBE)
+        delivered = 0
+        subscribers = self.pattern_subscribers.subscribers(pattern)
+        if subscribers:
+            delivered += self._deliver(subscribers, encode_array('pmessage', pattern, channel, data), (pattern, channel))
         
-        resp_message = (
-            f"*3\r\n$7\r\nmessage\r\n${len(channel_bytes)}\r\n{channel}\r\n"
-            f"${len(data_bytes)}\r\n{data}\r\n"
-        ).encode('utf-8')
+        # Clients abonnés à un filtre MQTT traduit en ce motif: le trie ne garde
+        # que les filtres qui correspondent vraiment au canal
+        filter_clients = set()
+        for topic_filter, client_ids in self.filter_subscribers.match_items(channel):
+            if to_redis_pattern(topic_filter) == pattern:
+                filter_clients |= client_ids
+        if filter_clients:
+            delivered += self._deliver(filter_clients, self._format_pubsub_message(channel, data), channel)
+        self.audit_log.record(audit.DELIVER, channel=channel, size=len(data), detail=delivered)
+    
+    def _deliver(self, subscribers, resp_message, key=None):
+        """
+        Dépose un message déjà encodé dans la file d'envoi des clients indiqués.
+        
+        Returns:
+            int: Nombre de clients destinataires
+        """
+        delivered = 0
+        for client_id in subscribers:
+            client_info = self.client_connections.get(client_id)
+            if client_info is None:
+                continue  # Client déconnecté entre-temps
+            try:
+                self._send_to_client(client_info, resp_message, key)
+                delivered += 1
+            except Exception as e:
+                logger.error(f"Erreur lors de la transmission au client {client_id}: {e}")
+        return delivered
+    
+    def _send_to_client(self, client_info, data, key=None):
+        """
+        Dépose un message pub/sub dans la file d'envoi du client, sans bloquer.
+        
+        Args:
+            client_info: État de la connexion
+            data: Message RESP encodé
+            key: Clé de fusion du message (politique coalesce)
+        """
+        ready = client_info['outbound_ready']
+        with ready:
+            accepted = client_info['outbound'].put_message(data, key)
+            ready.notify()
+        if not accepted:
+            self._disconnect_slow_client(client_info)
+    
+    def _send_replies(self, client_info, replies):
+        """
+        Dépose les réponses aux commandes du client dans sa file d'envoi.
+        Bloque tant que trop de réponses restent à envoyer, pour qu'un client
+        qui ne lit pas ses réponses soit ralenti au lieu de remplir la mémoire.
+        """
+        ready = client_info['outbound_ready']
+        outbound = client_info['outbound']
+        with ready:
+            for reply in replies:
+                outbound.put_reply(reply)
+            ready.notify_all()
+            while outbound.reply_bytes > self.outbound_max_bytes and not client_info['closing']:
+                ready.wait(1.0)
+    
+    def _write_loop(self, client_socket, client_id, client_info):
+        """Écrivain d'un client: envoie le contenu de sa file d'envoi"""
+        ready = client_info['outbound_ready']
+        outbound = client_info['outbound']
+        try:
+            while True:
+                with ready:
+                    while not outbound and not client_info['closing']:
+                        ready.wait()
+                    if not outbound:
+                        break
+                    batch = outbound.drain()
+                    # Réveiller _send_replies qui attend de la place
+                    ready.notify_all()
+                client_info['write_started'] = time.monotonic()
+                self._send_batch(client_socket, batch)
+                client_info['write_started'] = None
+        except OSError as e:
+            logger.debug(f"Envoi impossible vers {client_id}: {e}")
+            self._disconnect_slow_client(client_info)
+    
+    def _send_batch(self, client_socket, batch):
+        """Envoie les trames en attente d'un client en écriture vectorisée (sendmsg)"""
+        send_buffers(client_socket, batch)
+    
+    def _disconnect_slow_client(self, client_info):
+        """Coupe une connexion dont la file déborde (politique disconnect) ou en erreur"""
+        if client_info['outbound'].overflowed:
+            logger.warning("File d'envoi pleine: déconnexion d'un client trop lent")
+            client_info['close_reason'] = 'outbound_overflow'
+        self._close_connection(client_info)
+    
+    def _reap_client(self, client_id, client_info, reason):
+        """Ferme une connexion inactive ou bloquée (appelé par le ConnectionReaper)"""
+        client_info['close_reason'] = reason
+        self._close_connection(client_info)
+    
+    def _close_connection(self, client_info):
+        """
+        Coupe une connexion depuis un autre thread: le thread client fait le
+        nettoyage (connexion Redis dédiée, abonnements, session).
+        """
+        with client_info['outbound_ready']:
+            client_info['closing'] = True
+            client_info['outbound_ready'].notify_all()
+        try:
+            # Débloque le recv() du thread client, qui fera le nettoyage
+            client_info['socket'].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    
+    def outbound_stats(self):
+        """
+        Métriques des files d'envoi.
         
-        return resp_message
+        Returns:
+            dict: {'clients': {client_id: stats}, 'total': stats agrégées}
+        """
+        clients = {}
+        total = {'depth': 0, 'pending_bytes': 0, 'peak_depth': 0, 'enqueued': 0, 'dropped': 0, 'coalesced': 0}
+        for client_id, client_info in list(self.client_connections.items()):
+            stats = client_info['outbound'].stats()
+            clients[client_id] = stats
+            for name, value in stats.items():
+                total[name] = max(total[name], value) if name == 'peak_depth' else total[name] + value
+        return {'clients': clients, 'total': total}
+    
+    def _format_pubsub_message(self, channel, data):
+        """
+        Formate un message pub/sub au format RESP.
+        Les longueurs sont calculées sur les octets (canaux et messages non ASCII).
+        """
+        return encode_array('message', channel, data)
 
 
 # Fonction pour démarrer le proxy en tant que service
-def start_proxy_service(host='localhost', redis_port=6379, proxy_port=6380):
+def start_proxy_service(host='localhost', redis_port=6379, proxy_port=6380, engine='threaded', **options):
     """
-    Démarre le proxy Redis en tant que service.
+    Démarre le proxy Redis en tant que service, avec la même construction
+    que la commande start_redis_proxy (workers, sessions partagées, audit...).
     
     Args:
         host: Hôte Redis (défaut: localhost)
         redis_port: Port Redis (défaut: 6379)
         proxy_port: Port sur lequel le proxy écoute (défaut: 6380)
+        engine: 'threaded' (un thread par client) ou 'asyncio'
+        **options: Autres options de la commande (pool_size, outbound_policy,
+            outbound_queue_size, workers, audit_log, audit_body, handoff_socket...)
     """
-    proxy = RedisProxy(
+    from django.core.management import call_command
+    
+    call_command(
+        'start_redis_proxy',
         redis_host=host,
         redis_port=redis_port,
-        proxy_port=proxy_port
+        proxy_port=proxy_port,
+        engine=engine,
+        **options
     )
-    proxy.start()
@@ -0,0 +1,201 @@
+"""
+Limitation du débit des PUBLISH par seau à jetons (token bucket).
+
+Les limites se configurent par canal, avec la politique du canal
+(Channel.rate_limits), pour trois portées:
+    connection  chaque connexion au proxy
+    user        chaque user_id, toutes connexions confondues
+    role        chaque rôle (tous les volunteers ensemble...)
+et deux budgets indépendants par portée: nombre de messages et octets par
+seconde. Exemple:
+
+    {'connection': {'messages': 50, 'bytes': 1048576},
+     'user': {'messages': 100, 'burst': 2},
+     'role': {'messages': 2000}}
+
+'burst' est la réserve exprimée en secondes de débit (défaut: 1). Un filtre
+avec jokers (tasks/result/#) partage ses seaux entre tous ses canaux.
+
+Un message au-delà de la limite est refusé (-ERR) ou retardé selon
+Channel.rate_limit_action. Chaque vérification coûte un nombre constant
+d'opérations: un seau est rechargé paresseusement à partir de la date de sa
+dernière utilisation, sans minuterie.
+"""
+
+import threading
+import time
+
+CONNECTION = 'connection'
+USER = 'user'
+ROLE = 'role'
+SCOPES = (CONNECTION, USER, ROLE)
+
+REJECT = 'reject'
+DELAY = 'delay'
+ACTIONS = (REJECT, DELAY)
+
+
+class TokenBucket:
+    """Seau à jetons rechargé au débit rate, plafonné à capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount):
+        """
+        Délai avant que amount jetons soient disponibles (0 si tout de suite).
+        Un message plus gros que la réserve passe quand le seau est plein.
+        """
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, amount):
+        # Le solde peut devenir négatif: la dette retarde les messages suivants
+        self.tokens -= amount
+
+    def is_idle(self, now):
+        """Seau plein: l'oublier ne change aucune décision"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimitRule:
+    """Limites compilées d'un canal (ou d'un filtre)"""
+
+    __slots__ = ('name', 'action', 'limits')
+
+    def __init__(self, name, rate_limits, action=REJECT):
+        """
+        Args:
+            name: Canal ou filtre qui porte les limites (identifie les seaux)
+            rate_limits: dict portée -> {'messages', 'bytes', 'burst'}
+            action: reject ou delay
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Action de limitation inconnue: {action}")
+        self.name = name
+        self.action = action
+        # Portée -> ((débit messages, réserve), (débit octets, réserve)); None si pas de budget
+        self.limits = {}
+        for scope, config in rate_limits.items():
+            if scope not in SCOPES or not config:
+                continue
+            burst = config.get('burst') or 1
+            budgets = tuple(
+                (float(config[unit]), float(config[unit]) * burst) if config.get(unit) else None
+                for unit in ('messages', 'bytes')
+            )
+            if any(budgets):
+                self.limits[scope] = budgets
+
+
+def normalize_rate_limits(rate_limits):
+    """Forme canonique des limites d'un canal (pour l'empreinte des politiques)"""
+    result = {}
+    for scope in SCOPES:
+        config = (rate_limits or {}).get(scope)
+        if config:
+            result[scope] = {key: config[key] for key in ('messages', 'bytes', 'burst') if config.get(key)}
+    return result
+
+
+class RateLimiter:
+    """
+    Seaux de jetons par (règle, portée, identité). Les seaux de connexion
+    sont rangés dans l'état de la connexion et disparaissent avec elle; les
+    seaux user et role inactifs sont purgés quand leur nombre augmente.
+    """
+
+    def __init__(self, max_buckets=100000, max_delay=1.0):
+        """
+        Args:
+            max_buckets: Nombre de seaux user/role avant purge des seaux pleins (défaut: 100000)
+            max_delay: Retard maximal imposé en mode delay; au-delà, le message est refusé (défaut: 1s)
+        """
+        self.max_buckets = max_buckets
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        # Métriques
+        self.rejected = 0
+        self.delayed = 0
+
+    def check(self, rule, client_info, user_id, role, size):
+        """
+        Vérifie et débite les budgets d'un message.
+
+        Args:
+            rule: RateLimitRule du canal
+            client_info: État de la connexion (porte les seaux de connexion)
+            size: Taille du message en octets
+
+        Returns:
+            float: 0 si le message passe, un délai en secondes s'il doit être
+                retardé, ou None s'il est refusé
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for scope, budgets in rule.limits.items():
+                if scope == CONNECTION:
+                    store, identity = client_info.setdefault('rate_buckets', {}), None
+                elif scope == USER:
+                    if not user_id:
+                        continue
+                    store, identity = self._buckets, user_id
+                else:
+                    if not role:
+                        continue
+                    store, identity = self._buckets, role
+                for unit, budget in enumerate(budgets):
+                    if budget is None:
+                        continue
+                    key = (rule.name, scope, identity, unit)
+                    bucket = store.get(key)
+                    if bucket is None or bucket.rate != budget[0] or bucket.capacity != budget[1]:
+                        # Nouveau seau, ou limites modifiées par un rechargement des politiques
+                        if bucket is None and store is self._buckets and len(store) >= self.max_buckets:
+                            self._prune(now)
+                        bucket = store[key] = TokenBucket(budget[0], budget[1], now)
+                    else:
+                        bucket.refill(now)
+                    buckets.append((bucket, size if unit else 1))
+
+            wait = max((bucket.wait_time(amount) for bucket, amount in buckets), default=0.0)
+            if wait and (rule.action == REJECT or wait > self.max_delay):
+                self.rejected += 1
+                return None
+            for bucket, amount in buckets:
+                bucket.consume(amount)
+            if wait:
+                self.delayed += 1
+            return wait
+
+    def _prune(self, now):
+        """Oublie les seaux pleins (appelé sous verrou)"""
+        idle = [key for key, bucket in self._buckets.items() if bucket.is_idle(now)]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_buckets:
+            # Tous actifs: relever le seuil plutôt que de repurger à chaque nouveau seau
+            self.max_buckets *= 2
+
+    def stats(self):
+        return {
+            'buckets': len(self._buckets),
+            'rejected': self.rejected,
+            'delayed': self.delayed,
+        }
@@ -0,0 +1,189 @@
+"""
+Détection et fermeture des connexions client mortes ou inactives.
+
+Une connexion dont le pair a disparu (câble coupé, machine éteinte, NAT
+expiré) ne produit aucune erreur tant que le proxy ne lui écrit rien: elle
+garde son thread, sa file d'envoi et ses abonnements. Trois mécanismes:
+
+    keepalive TCP   le noyau sonde les connexions silencieuses et fait
+                    échouer recv() quand le pair ne répond plus
+    inactivité      un client qui n'envoie rien depuis idle_timeout est
+                    fermé; un client abonné (qui ne fait que recevoir) doit
+                    envoyer un PING avant subscriber_idle_timeout
+                    (health_check_interval de redis-py)
+    écriture        un envoi bloqué depuis write_timeout (pair qui ne lit
+                    plus) ferme la connexion
+
+Le ConnectionReaper parcourt les connexions à intervalle régulier, dans un
+thread dédié, et publie les compteurs de connexions et de fermetures.
+"""
+
+import logging
+import socket
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger('RedisProxy')
+
+# Motifs de fermeture
+IDLE = 'idle'
+PING_TIMEOUT = 'ping_timeout'
+WRITE_STALLED = 'write_stalled'
+REASONS = (IDLE, PING_TIMEOUT, WRITE_STALLED)
+
+
+def set_keepalive(sock, idle=60, interval=10, count=5):
+    """
+    Active le keepalive TCP sur un socket client.
+
+    Args:
+        idle: Silence avant la première sonde, en secondes
+        interval: Délai entre deux sondes
+        count: Sondes sans réponse avant de déclarer la connexion morte
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # TCP_KEEPIDLE sous Linux, TCP_KEEPALIVE sous macOS
+    idle_option = getattr(socket, 'TCP_KEEPIDLE', None) or getattr(socket, 'TCP_KEEPALIVE', None)
+    for option, value in ((idle_option, idle),
+                          (getattr(socket, 'TCP_KEEPINTVL', None), interval),
+                          (getattr(socket, 'TCP_KEEPCNT', None), count)):
+        if option is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
+    if hasattr(socket, 'TCP_USER_TIMEOUT'):
+        # Données envoyées jamais acquittées: même délai que les sondes (en millisecondes)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, (idle + interval * count) * 1000)
+
+
+class ConnectionReaper:
+    """
+    Ferme périodiquement les connexions inactives ou bloquées en écriture.
+
+    Champs lus dans l'état des connexions (client_info):
+        reading        le lecteur attend des données (aucune commande en cours)
+        last_activity  date (time.monotonic) de la dernière lecture
+        write_started  début de l'envoi en cours, None si l'écrivain attend
+    """
+
+    def __init__(self, connections, close, idle_timeout=300.0, subscriber_idle_timeout=0.0,
+                 write_timeout=60.0, interval=10.0, metrics_sink=None):
+        """
+        Args:
+            connections: dict client_id -> client_info du proxy
+            close: Fonction appelée avec (client_id, client_info, motif) pour fermer une connexion
+            idle_timeout: Inactivité maximale d'un client non abonné, en secondes (0: jamais)
+            subscriber_idle_timeout: Délai maximal entre deux PING d'un client abonné (0: jamais)
+            write_timeout: Durée maximale d'un envoi bloqué (0: jamais)
+            interval: Délai entre deux parcours (défaut: 10s)
+            metrics_sink: Fonction appelée avec stats() après chaque parcours
+        """
+        self.connections = connections
+        self.close = close
+        self.idle_timeout = idle_timeout
+        self.subscriber_idle_timeout = subscriber_idle_timeout
+        self.write_timeout = write_timeout
+        self.interval = interval
+        self.metrics_sink = metrics_sink
+        self.paused = False  # Pas de fermeture pendant une reprise à chaud
+        self.reaped = dict.fromkeys(REASONS, 0)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self, client_info, now):
+        """
+        Returns:
+            str: Motif de fermeture, ou None si la connexion est saine
+        """
+        started = client_info.get('write_started')
+        if self.write_timeout and started is not None and now - started > self.write_timeout:
+            return WRITE_STALLED
+        if not client_info.get('reading'):
+            return None  # Commande en cours (BLPOP...): pas inactive
+        subscribed = client_info['subscribed_channels'] or client_info['subscribed_patterns']
+        timeout = self.subscriber_idle_timeout if subscribed else self.idle_timeout
+        if timeout and now - client_info['last_activity'] > timeout:
+            return PING_TIMEOUT if subscribed else IDLE
+        return None
+
+    def reap(self, now=None):
+        """
+        Ferme les connexions mortes ou inactives.
+
+        Returns:
+            list: (client_id, motif) des connexions fermées
+        """
+        if self.paused:
+            return []
+        now = time.monotonic() if now is None else now
+        reaped = []
+        for client_id, client_info in list(self.connections.items()):
+            if client_info.get('closing'):
+                continue
+            reason = self.check(client_info, now)
+            if reason is None:
+                continue
+            self.reaped[reason] += 1
+            reaped.append((client_id, reason))
+            logger.info(f"Connexion {client_id} fermée: {reason}")
+            self.close(client_id, client_info, reason)
+        return reaped
+
+    def stats(self):
+        """Compteurs de connexions et de fermetures"""
+        connections = list(self.connections.values())
+        return {
+            'connections': len(connections),
+            'subscribers': sum(
+                1 for client_info in connections
+                if client_info['subscribed_channels'] or client_info['subscribed_patterns']
+            ),
+            'authenticated': sum(1 for client_info in connections if client_info['authenticated']),
+            'reaped': dict(self.reaped),
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='redis-proxy-reaper')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reap()
+                if self.metrics_sink is not None:
+                    self.metrics_sink(self.stats())
+            except Exception as e:
+                logger.error(f"Erreur du parcours des connexions: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+class RedisMetricsSink:
+    """
+    Publie les compteurs du proxy dans un hash Redis par worker, lisible par
+    la supervision sur Redis directement (HGETALL proxy:metrics:<worker>; le
+    proxy refuse les clés proxy:* à ses clients). La clé expire si le
+    proxy s'arrête de la rafraîchir.
+    """
+
+    KEY_PREFIX = 'proxy:metrics:'
+
+    def __init__(self, host='localhost', port=6379, worker_id=None, ttl=60):
+        self.redis_client = redis.Redis(host=host, port=port, decode_responses=True)
+        self.key = f"{self.KEY_PREFIX}{'main' if worker_id is None else worker_id}"
+        self.ttl = ttl
+
+    def __call__(self, stats):
+        mapping = {name: value for name, value in stats.items() if not isinstance(value, dict)}
+        for reason, count in stats.get('reaped', {}).items():
+            mapping[f"reaped_{reason}"] = count
+        mapping['updated_at'] = time.time()
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(self.key, mapping=mapping)
+            pipe.expire(self.key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Publication des métriques impossible: {e}")
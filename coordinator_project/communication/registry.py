@@ -0,0 +1,290 @@
+"""
+Registre des canaux du broker partagé entre processus.
+
+Le registre de chaque broker (dict des canaux et trie des filtres) reste la
+seule source consultée par publish(): aucune lecture de la base sur le chemin
+de publication. Il sert de cache à la collection Mongo des canaux
+(communication.models.Channel), la même que celle des politiques du proxy:
+
+    écriture    un canal créé ou modifié (create_channel, set_durable,
+                set_codec, canal créé automatiquement par publish...) est
+                mis à jour dans le cache, puis écrit dans Mongo par un thread
+                dédié, dans l'ordre des modifications; une suppression
+                désactive le document
+    invalidation après chaque écriture, le nom du canal est publié sur
+                coord/channels; les autres brokers relisent ce document et
+                mettent leur cache à jour
+    démarrage   le cache est complété par tous les documents actifs, et
+                entièrement relu après une coupure de la connexion Redis
+                (des invalidations ont pu être manquées)
+
+Les champs du broker (durable, codec...) d'un document sont facultatifs: un
+document créé pour les seules politiques du proxy ne remplace pas la
+configuration des settings. Un document créé par le broker reçoit la
+politique par défaut du canal s'il en a une, sinon une politique fermée
+(require_auth sans rôle autorisé), équivalente à l'absence de document.
+
+Le nombre d'abonnés d'un canal concret est celui de tout le cluster: PUBSUB
+NUMSUB, échantillonné à intervalle régulier par lots de noms. Derrière le
+proxy, Redis ne voit qu'un abonné par processus proxy et par canal. Les
+filtres avec jokers (abonnements par motif, que NUMSUB ne compte pas)
+gardent le compte des abonnements locaux.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+
+import redis
+
+from .envelope import decode_message
+from .policies import DEFAULT_CHANNEL_POLICIES, normalize_policy
+
+logger = logging.getLogger(__name__)
+
+# Canal des notifications d'invalidation du registre
+INVALIDATION_CHANNEL = 'coord/channels'
+
+# Champs du registre du broker conservés dans les documents (None: non défini)
+BROKER_FIELDS = ('durable', 'local_dispatch', 'maxlen', 'retention', 'codec', 'coalesce_window', 'coalesce_key')
+
+# Délai avant une nouvelle lecture complète quand la base n'est pas joignable
+RELOAD_RETRY = 30.0
+
+_SAVE = 'save'
+_DELETE = 'delete'
+
+
+def document_to_dict(document):
+    """Champs d'un document de canal utiles au registre du broker"""
+    data = {
+        'name': document.name,
+        'description': document.description,
+        'created_at': document.created_at,
+        'active': document.active,
+    }
+    data.update((field, getattr(document, field)) for field in BROKER_FIELDS)
+    return data
+
+
+def load_channels():
+    """
+    Lit tous les documents de canaux, actifs ou non.
+
+    Raises:
+        Exception: si la base n'est pas joignable (erreurs pymongo/mongoengine)
+    """
+    from .models import Channel
+
+    return [document_to_dict(document) for document in
+            Channel.objects.only('name', 'description', 'created_at', 'active', *BROKER_FIELDS)]
+
+
+def load_channel(name):
+    """Document d'un canal, ou None s'il n'existe pas"""
+    from .models import Channel
+
+    document = Channel.objects(name=name).only(
+        'name', 'description', 'created_at', 'active', *BROKER_FIELDS).first()
+    return None if document is None else document_to_dict(document)
+
+
+def save_channel(data):
+    """
+    Crée ou met à jour le document d'un canal: champs du broker, et politique
+    par défaut (ou fermée) à la création seulement.
+
+    Args:
+        data: Champs du canal (dataclasses.asdict d'un broker.Channel)
+    """
+    from .models import Channel
+
+    defaults = {policy['name']: policy for policy in DEFAULT_CHANNEL_POLICIES}
+    policy = normalize_policy(defaults.get(data['name'], {'name': data['name'], 'require_auth': True}))
+    updates = {f"set__{field}": data[field] for field in BROKER_FIELDS}
+    updates.update(
+        set__active=True,
+        set_on_insert__description=data['description'],
+        set_on_insert__created_at=data['created_at'],
+    )
+    updates.update((f"set_on_insert__{field}", policy[field]) for field in (
+        'require_auth', 'allowed_publishers', 'allowed_subscribers',
+        'inspect_body', 'rate_limits', 'rate_limit_action'))
+    Channel.objects(name=data['name']).update_one(upsert=True, **updates)
+
+
+def deactivate_channel(name):
+    """Désactive le document d'un canal (politiques comprises), sans le supprimer"""
+    from .models import Channel
+
+    Channel.objects(name=name).update_one(set__active=False)
+
+
+class ChannelStore:
+    """
+    Synchronise le registre d'un broker avec la collection des canaux et
+    les autres brokers, dans deux threads:
+
+        écriture    écritures Mongo dans l'ordre, puis invalidation
+        veille      chargement initial, invalidations reçues et
+                    échantillonnage de PUBSUB NUMSUB
+    """
+
+    def __init__(self, redis_client, origin, on_change, channel_names, on_counts,
+                 numsub_interval=10.0, numsub_batch=100):
+        """
+        Args:
+            redis_client: Client Redis synchrone (decode_responses=True)
+            origin: Identifiant du broker, pour ignorer ses propres invalidations
+            on_change: Fonction appelée avec les champs d'un document (dict) relu
+            channel_names: Fonction retournant les canaux concrets à compter
+            on_counts: Fonction appelée avec {canal: abonnés} après chaque lot
+            numsub_interval: Délai entre deux échantillonnages, en secondes (défaut: 10, 0: jamais)
+            numsub_batch: Canaux par commande PUBSUB NUMSUB (défaut: 100)
+        """
+        self.redis_client = redis_client
+        self.origin = origin
+        self.on_change = on_change
+        self.channel_names = channel_names
+        self.on_counts = on_counts
+        self.numsub_interval = numsub_interval
+        self.numsub_batch = numsub_batch
+        self._writes = queue.SimpleQueue()
+        self._writer = None
+        self._watcher = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def save(self, data):
+        """Écrit un canal dans la base (en arrière-plan)"""
+        self._submit((_SAVE, data))
+
+    def delete(self, name):
+        """Désactive un canal dans la base (en arrière-plan)"""
+        self._submit((_DELETE, name))
+
+    def _submit(self, item):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write, name='channel-store-writer')
+                self._writer.daemon = True
+                self._writer.start()
+            self._writes.put(item)
+
+    def _write(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            operation, payload = item
+            name = payload['name'] if operation == _SAVE else payload
+            try:
+                if operation == _SAVE:
+                    save_channel(payload)
+                else:
+                    deactivate_channel(payload)
+            except Exception as e:
+                # Le cache reste à jour; les autres brokers ne voient pas la modification
+                logger.warning(f"Écriture du canal {name} dans la base impossible: {e}")
+                continue
+            try:
+                self.redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'name': name, 'origin': self.origin}))
+            except redis.RedisError as e:
+                logger.warning(f"Invalidation du canal {name} impossible: {e}")
+
+    def start(self):
+        """Démarre le thread de veille; le chargement initial y est fait"""
+        self._watcher = threading.Thread(target=self._watch, name='channel-store-watcher')
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop(self):
+        """Arrête les deux threads, après les écritures déjà soumises"""
+        self._stop.set()
+        with self._lock:
+            if self._writer is not None:
+                self._writes.put(None)
+                self._writer = None
+
+    def reload(self):
+        """
+        Relit tous les documents et les applique au registre.
+
+        Returns:
+            bool: False si la base n'est pas joignable
+        """
+        try:
+            channels = load_channels()
+        except Exception as e:
+            logger.warning(f"Lecture du registre des canaux impossible: {e}")
+            return False
+        for data in channels:
+            self.on_change(data)
+        logger.info(f"Registre des canaux chargé: {len(channels)} documents")
+        return True
+
+    def invalidate(self, data):
+        """Relit le document nommé par une notification d'invalidation"""
+        try:
+            notification = decode_message(data)
+            name = notification['name']
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Notification d'invalidation invalide: {data!r}")
+            return
+        if notification.get('origin') == self.origin:
+            return  # Écrit par ce broker: déjà dans le cache
+        try:
+            document = load_channel(name)
+        except Exception as e:
+            logger.warning(f"Lecture du canal {name} impossible: {e}")
+            return
+        self.on_change(document or {'name': name, 'active': False})
+
+    def sample_subscribers(self):
+        """Compte les abonnés des canaux concrets par lots de PUBSUB NUMSUB"""
+        names = self.channel_names()
+        for start in range(0, len(names), self.numsub_batch):
+            batch = names[start:start + self.numsub_batch]
+            try:
+                counts = self.redis_client.pubsub_numsub(*batch)
+            except redis.RedisError as e:
+                logger.warning(f"PUBSUB NUMSUB impossible: {e}")
+                return
+            self.on_counts(dict(counts))
+
+    def _watch(self):
+        pubsub = None
+        loaded = False
+        next_reload = next_sample = 0.0
+        while not self._stop.is_set():
+            if pubsub is None:
+                try:
+                    pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(INVALIDATION_CHANNEL)
+                except redis.RedisError as e:
+                    logger.warning(f"Abonnement à {INVALIDATION_CHANNEL} impossible: {e}")
+                    pubsub = None
+                    self._stop.wait(1.0)
+                    continue
+                # Premier chargement, ou reprise après une coupure
+                loaded = False
+                next_reload = 0.0
+            if not loaded and time.monotonic() >= next_reload:
+                loaded = self.reload()
+                next_reload = time.monotonic() + RELOAD_RETRY
+            try:
+                message = pubsub.get_message(timeout=1.0)
+            except redis.RedisError as e:
+                logger.warning(f"Lecture des invalidations interrompue: {e}")
+                pubsub.close()
+                pubsub = None
+                continue
+            if message is not None and message['type'] == 'message':
+                self.invalidate(message['data'])
+            if self.numsub_interval and time.monotonic() >= next_sample:
+                next_sample = time.monotonic() + self.numsub_interval
+                self.sample_subscribers()
+        if pubsub is not None:
+            pubsub.close()
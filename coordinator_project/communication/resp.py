@@ -0,0 +1,300 @@
+"""
+Analyse et encodage du protocole RESP (Redis Serialization Protocol).
+Parseur incrémental RESP2/RESP3 qui accepte des lectures fragmentées ou
+contenant plusieurs commandes (pipelining) et lit les bulk strings par longueur.
+"""
+
+from collections import deque
+
+CRLF = b'\r\n'
+
+# Limites alignées sur celles de Redis (proto-max-bulk-len, client-query-buffer-limit)
+MAX_BULK_LENGTH = 512 * 1024 * 1024
+MAX_AGGREGATE_LENGTH = 1024 * 1024 * 1024
+MAX_INLINE_LENGTH = 64 * 1024
+# Profondeur d'imbrication maximale (tableaux, maps, attributs): le parseur
+# est récursif, une trame *1\r\n*1\r\n... épuiserait la pile Python
+MAX_NESTING_DEPTH = 64
+
+
+class RespProtocolError(Exception):
+    """Données qui ne respectent pas le protocole RESP"""
+
+
+class RespError:
+    """Réponse d'erreur RESP (-ERR ... ou !<len>)"""
+
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+    def __eq__(self, other):
+        return isinstance(other, RespError) and other.message == self.message
+
+    def __repr__(self):
+        return f"RespError({self.message!r})"
+
+
+class _Incomplete(Exception):
+    """La trame en cours n'est pas encore entièrement reçue"""
+
+    def __init__(self, needed=0):
+        # Position minimale que le tampon doit atteindre avant de réessayer
+        self.needed = needed
+
+
+class RespParser:
+    """
+    Parseur RESP incrémental avec tampon par connexion.
+
+    Les données reçues sont ajoutées avec feed(), puis chaque valeur complète
+    est récupérée avec gets() ou en itérant sur le parseur. Chaque valeur est
+    accompagnée des octets bruts de sa trame, pour pouvoir la retransmettre
+    sans la réencoder. Les bulk strings sont retournées en bytes, jamais décodées.
+
+    Example:
+        parser = RespParser()
+        parser.feed(data)
+        for value, raw in parser:
+            ...
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._frames = deque()
+        # Taille de tampon en dessous de laquelle la trame en cours reste incomplète
+        self._needed = 0
+
+    def feed(self, data):
+        """
+        Ajoute des données reçues et analyse toutes les trames complètes.
+
+        Args:
+            data: bytes, bytearray ou memoryview
+
+        Raises:
+            RespProtocolError: si les données sont invalides
+        """
+        buffer = self._buffer
+        buffer += data
+        end = len(buffer)
+        if end < self._needed:
+            # Une grosse bulk string arrive par morceaux: inutile de réanalyser
+            return
+        self._needed = 0
+        position = 0
+        try:
+            while position < end:
+                value, next_position = self._parse(buffer, position, inline=True)
+                self._frames.append((value, bytes(buffer[position:next_position])))
+                position = next_position
+        except _Incomplete as incomplete:
+            if end - position > MAX_BULK_LENGTH + MAX_INLINE_LENGTH:
+                raise RespProtocolError("Trame trop longue")
+            self._needed = incomplete.needed - position
+        finally:
+            if position:
+                del buffer[:position]
+
+    def gets(self):
+        """Retourne la prochaine trame complète (value, raw) ou None"""
+        if self._frames:
+            return self._frames.popleft()
+        return None
+
+    def has_frames(self):
+        """Indique si des trames complètes sont en attente"""
+        return bool(self._frames)
+
+    def buffered(self):
+        """Nombre d'octets reçus appartenant à une trame incomplète"""
+        return len(self._buffer)
+
+    def pending(self):
+        """Octets reçus appartenant à une trame incomplète (pour les confier à un autre parseur)"""
+        return bytes(self._buffer)
+
+    def __iter__(self):
+        while self._frames:
+            yield self._frames.popleft()
+
+    def _read_line(self, buffer, position):
+        """Retourne (ligne sans CRLF, position après CRLF)"""
+        line_end = buffer.find(CRLF, position)
+        if line_end < 0:
+            if len(buffer) - position > MAX_INLINE_LENGTH:
+                raise RespProtocolError("Ligne trop longue")
+            raise _Incomplete()
+        return buffer[position:line_end], line_end + 2
+
+    def _read_length(self, buffer, position, limit):
+        line, position = self._read_line(buffer, position)
+        try:
+            length = int(line)
+        except ValueError:
+            raise RespProtocolError(f"Longueur invalide: {bytes(line)!r}")
+        if length > limit or length < -1:
+            raise RespProtocolError(f"Longueur hors limites: {length}")
+        return length, position
+
+    def _read_blob(self, buffer, position, length):
+        end = position + length
+        if len(buffer) < end + 2:
+            raise _Incomplete(end + 2)
+        if buffer[end:end + 2] != CRLF:
+            raise RespProtocolError("Bulk string non terminée par CRLF")
+        return bytes(buffer[position:end]), end + 2
+
+    def _parse(self, buffer, position, inline=False, depth=0):
+        """
+        Analyse une valeur à partir de position et retourne (value, position suivante).
+        Les commandes inline ne sont acceptées qu'au premier niveau (inline=True).
+        """
+        if depth > MAX_NESTING_DEPTH:
+            raise RespProtocolError(f"Imbrication au-delà de {MAX_NESTING_DEPTH} niveaux")
+        if position >= len(buffer):
+            raise _Incomplete()
+        marker = buffer[position]
+        position += 1
+
+        if marker == 0x24:  # $ bulk string
+            length, position = self._read_length(buffer, position, MAX_BULK_LENGTH)
+            if length == -1:
+                return None, position
+            return self._read_blob(buffer, position, length)
+
+        if marker in (0x2a, 0x3e, 0x7e):  # * array, > push, ~ set
+            length, position = self._read_length(buffer, position, MAX_AGGREGATE_LENGTH)
+            if length == -1:
+                return None, position
+            items = []
+            for _ in range(length):
+                item, position = self._parse(buffer, position, depth=depth + 1)
+                items.append(item)
+            return items, position
+
+        if marker == 0x25:  # % map
+            length, position = self._read_length(buffer, position, MAX_AGGREGATE_LENGTH)
+            items = {}
+            for _ in range(length):
+                key, position = self._parse(buffer, position, depth=depth + 1)
+                item, position = self._parse(buffer, position, depth=depth + 1)
+                items[key if not isinstance(key, list) else tuple(key)] = item
+            return items, position
+
+        if marker == 0x7c:  # | attribut: ignoré, précède la vraie valeur
+            length, position = self._read_length(buffer, position, MAX_AGGREGATE_LENGTH)
+            for _ in range(length * 2):
+                _, position = self._parse(buffer, position, depth=depth + 1)
+            return self._parse(buffer, position, depth=depth + 1)
+
+        if marker == 0x2b:  # + simple string
+            line, position = self._read_line(buffer, position)
+            return bytes(line), position
+
+        if marker == 0x2d:  # - erreur
+            line, position = self._read_line(buffer, position)
+            return RespError(bytes(line)), position
+
+        if marker == 0x3a:  # : entier
+            line, position = self._read_line(buffer, position)
+            try:
+                return int(line), position
+            except ValueError:
+                raise RespProtocolError(f"Entier invalide: {bytes(line)!r}")
+
+        if marker == 0x21:  # ! bulk error
+            length, position = self._read_length(buffer, position, MAX_BULK_LENGTH)
+            blob, position = self._read_blob(buffer, position, length)
+            return RespError(blob), position
+
+        if marker == 0x3d:  # = verbatim string (préfixe "txt:")
+            length, position = self._read_length(buffer, position, MAX_BULK_LENGTH)
+            blob, position = self._read_blob(buffer, position, length)
+            return blob[4:], position
+
+        if marker == 0x5f:  # _ null
+            _, position = self._read_line(buffer, position)
+            return None, position
+
+        if marker == 0x23:  # # booléen
+            line, position = self._read_line(buffer, position)
+            return line == b't', position
+
+        if marker == 0x2c:  # , double
+            line, position = self._read_line(buffer, position)
+            try:
+                return float(line), position
+            except ValueError:
+                raise RespProtocolError(f"Double invalide: {bytes(line)!r}")
+
+        if marker == 0x28:  # ( big number
+            line, position = self._read_line(buffer, position)
+            try:
+                return int(line), position
+            except ValueError:
+                raise RespProtocolError(f"Big number invalide: {bytes(line)!r}")
+
+        if not inline:
+            raise RespProtocolError(f"Type RESP inconnu: {chr(marker)!r}")
+
+        # Commande inline (ex: "PING\r\n" envoyé par telnet/redis-cli)
+        line, position = self._read_line(buffer, position - 1)
+        return [bytes(part) for part in line.split()], position
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    if isinstance(value, int):
+        return b'%d' % value
+    return value
+
+
+def encode_bulk(value):
+    """Encode une bulk string RESP (longueur calculée en octets)"""
+    value = _to_bytes(value)
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def encode_command(*args):
+    """
+    Encode une commande RESP (tableau de bulk strings).
+
+    Args:
+        *args: Arguments en str, int ou bytes (les str sont encodées en UTF-8)
+
+    Returns:
+        bytes: Trame prête à être envoyée
+    """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        arg = _to_bytes(arg)
+        parts.append(b'$%d\r\n' % len(arg))
+        parts.append(arg)
+        parts.append(CRLF)
+    return b''.join(parts)
+
+
+def encode_error(message):
+    """Encode une réponse d'erreur RESP"""
+    return b'-' + message.encode('utf-8') + CRLF
+
+
+def encode_array(*items):
+    """
+    Encode une réponse tableau RESP2.
+
+    Args:
+        *items: str/bytes (bulk string), int (entier) ou None (bulk nulle)
+    """
+    parts = [b'*%d\r\n' % len(items)]
+    for item in items:
+        if item is None:
+            parts.append(b'$-1\r\n')
+        elif isinstance(item, int):
+            parts.append(b':%d\r\n' % item)
+        else:
+            parts.append(encode_bulk(item))
+    return b''.join(parts)
@@ -0,0 +1,113 @@
+"""
+Requête/réponse sur le pub/sub: corrélation des réponses par request_id.
+
+broker.request() publie une requête et retourne un Future. Les réponses
+arrivent sur le canal de réponse (auth/login -> auth/login_response), écouté
+une seule fois par broker: un seul callback reçoit toutes les réponses et
+résout le Future en attente du même request_id, par simple lecture de
+dictionnaire. Aucun abonnement par requête. Les réponses destinées aux autres
+processus (aucun Future en attente) sont ignorées.
+
+Un seul thread fait expirer les requêtes sans réponse: le Future échoue avec
+TimeoutError à l'échéance et sa place est libérée.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Suffixe du canal de réponse par défaut d'un canal de requête
+REPLY_SUFFIX = '_response'
+
+
+def reply_channel_for(channel):
+    """Canal de réponse par défaut d'un canal de requête"""
+    return f"{channel}{REPLY_SUFFIX}"
+
+
+class PendingRequests:
+    """
+    Futures des requêtes en attente de réponse, indexés par request_id, avec
+    leur échéance.
+    """
+
+    def __init__(self, name='broker-request-expiry'):
+        self.name = name
+        self._futures = {}
+        self._deadlines = []  # tas de (échéance, request_id)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def add(self, request_id, timeout):
+        """
+        Enregistre une requête avant sa publication.
+
+        Args:
+            request_id: Identifiant porté par la requête et sa réponse
+            timeout: Délai de réponse en secondes (None: jamais d'expiration)
+
+        Returns:
+            Future: résolu avec le message de réponse (dict)
+
+        Raises:
+            ValueError: si une requête du même identifiant est déjà en attente
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._condition:
+            if request_id in self._futures:
+                raise ValueError(f"Requête {request_id} déjà en attente")
+            self._futures[request_id] = future
+            if timeout is not None:
+                heapq.heappush(self._deadlines, (time.monotonic() + timeout, request_id))
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._expire, name=self.name)
+                    self._thread.daemon = True
+                    self._thread.start()
+                self._condition.notify()
+        return future
+
+    def resolve(self, request_id, reply):
+        """
+        Résout la requête en attente d'une réponse reçue.
+
+        Returns:
+            bool: False si aucune requête de ce processus n'attend cette réponse
+        """
+        with self._condition:
+            future = self._futures.pop(request_id, None)
+        if future is None:
+            return False
+        future.set_result(reply)
+        return True
+
+    def fail(self, request_id, error):
+        """Fait échouer une requête en attente (publication impossible...)"""
+        with self._condition:
+            future = self._futures.pop(request_id, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def __len__(self):
+        return len(self._futures)
+
+    def _expire(self):
+        with self._condition:
+            while True:
+                if not self._deadlines:
+                    self._condition.wait()
+                    continue
+                deadline, request_id = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+                # Déjà résolue si absente: l'échéance est simplement oubliée
+                future = self._futures.pop(request_id, None)
+                if future is not None:
+                    future.set_exception(TimeoutError(f"Aucune réponse à la requête {request_id}"))
@@ -0,0 +1,221 @@
+"""
+Sessions du proxy Redis partagées entre connexions et workers.
+
+Un client ouvre souvent plusieurs connexions: redis-py en ouvre une séparée
+pour le pub/sub, qui peut arriver sur un autre worker (--workers N,
+SO_REUSEPORT) et n'a jamais vu le token porté par les PUBLISH. Pour que
+cette connexion soit authentifiée, le client nomme toutes ses connexions
+avec le même identifiant de session aléatoire (CLIENT SETNAME, envoyé par
+redis-py sur chaque connexion avec Redis(client_name=...)):
+
+    session_id = uuid.uuid4().hex
+    client = redis.Redis(host=proxy_host, port=proxy_port, client_name=session_id)
+
+Le nom n'est jamais transmis à Redis: il reste un secret entre le client et
+le proxy. RedisSessionStore range une session sous l'empreinte SHA-256 de
+son identifiant: lister les clés ne révèle aucun identifiant utilisable.
+Un nom de moins de SESSION_ID_MIN_LENGTH caractères ne désigne aucune
+session, pour qu'un nom lisible (worker-1...) ne puisse pas être deviné
+par un autre client. MessageBroker et AsyncMessageBroker nomment ainsi
+leurs connexions quand ils passent par le proxy.
+
+Avec un seul processus, LocalSessionStore garde les sessions en mémoire.
+Avec plusieurs workers, RedisSessionStore enregistre l'authentification de
+chaque session dans Redis. Dans les deux cas, la session est relue quand une
+connexion de la même session demande un canal protégé. La session expire avec le token qui l'a ouverte.
+
+Les écritures sont faites par un thread dédié, en pipeline, pour ne jamais
+bloquer les threads clients ni la boucle asyncio. Les lectures sont
+bloquantes: le moteur asyncio les fait dans un thread de l'exécuteur.
+"""
+
+import hashlib
+import logging
+import queue
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger('RedisProxy')
+
+# Longueur minimale d'un nom de connexion utilisé comme identifiant de session
+SESSION_ID_MIN_LENGTH = 32
+
+
+def session_id_for(name):
+    """Identifiant de session porté par un nom de connexion (CLIENT SETNAME), ou None"""
+    if name and len(name) >= SESSION_ID_MIN_LENGTH:
+        return name
+    return None
+
+
+class LocalSessionStore:
+    """
+    Sessions gardées uniquement dans le processus (un seul worker): la
+    connexion pub/sub d'un client arrive toujours sur ce processus.
+    """
+
+    def __init__(self, ttl=24 * 3600, max_sessions=100000):
+        """
+        Args:
+            ttl: Durée de vie des sessions sans activité, en secondes (défaut: 24h)
+            max_sessions: Nombre de sessions avant purge des sessions expirées
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = {}  # session_id -> (échéance, état)
+        self._lock = threading.Lock()
+
+    def save(self, session_id, session):
+        """Enregistre l'état d'authentification d'une session (voir RedisSessionStore.save)"""
+        now = time.time()
+        expires_at = now + self.ttl
+        if session.get('expires_at'):
+            # La session ne survit pas au token qui l'a ouverte
+            expires_at = min(expires_at, session['expires_at'])
+        state = {
+            'authenticated': bool(session.get('authenticated')),
+            'user_id': session.get('user_id'),
+            'role': session.get('role'),
+        }
+        with self._lock:
+            if session_id not in self._sessions and len(self._sessions) >= self.max_sessions:
+                self._prune(now)
+            self._sessions[session_id] = (expires_at, state)
+
+    def load(self, session_id):
+        """
+        Returns:
+            dict ou None si aucune session valide n'existe
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._sessions[session_id]
+                return None
+            return dict(entry[1])
+
+    def _prune(self, now):
+        """Oublie les sessions expirées (appelé sous verrou)"""
+        for session_id in [key for key, (expires_at, _) in self._sessions.items() if expires_at <= now]:
+            del self._sessions[session_id]
+        if len(self._sessions) >= self.max_sessions:
+            # Toutes valides: relever le seuil plutôt que de repurger à chaque nouvelle session
+            self.max_sessions *= 2
+
+    def close(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+class RedisSessionStore:
+    """
+    Sessions partagées entre les workers du proxy, stockées dans Redis.
+
+    Clés utilisées:
+        proxy:session:<sha256(session_id)>  hash (authenticated, user_id, role, worker)
+    """
+
+    KEY_PREFIX = 'proxy:session:'
+
+    def __init__(self, host='localhost', port=6379, worker_id=None, ttl=24 * 3600):
+        """
+        Args:
+            host: Hôte Redis (le vrai serveur, pas le proxy)
+            port: Port Redis
+            worker_id: Numéro du worker, enregistré dans chaque session
+            ttl: Durée de vie des sessions sans activité, en secondes (défaut: 24h)
+        """
+        self.redis_client = redis.Redis(host=host, port=port, decode_responses=True)
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self._writes = queue.SimpleQueue()
+        self._closed = False
+
+        self._writer_thread = threading.Thread(target=self._write_loop)
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+
+    def _key(self, session_id):
+        # Empreinte et non identifiant: la clé seule ne permet pas de reprendre la session
+        return f"{self.KEY_PREFIX}{hashlib.sha256(session_id.encode('utf-8')).hexdigest()}"
+
+    def save(self, session_id, session):
+        """
+        Enregistre l'état d'authentification d'une session.
+
+        Args:
+            session_id: Identifiant de session présenté par le client
+            session: dict avec authenticated, user_id, role et éventuellement expires_at
+        """
+        key = self._key(session_id)
+        mapping = {
+            'authenticated': '1' if session.get('authenticated') else '0',
+            'user_id': session.get('user_id') or '',
+            'role': session.get('role') or '',
+            'worker': '' if self.worker_id is None else str(self.worker_id),
+        }
+        ttl = self.ttl
+        if session.get('expires_at'):
+            # La session ne survit pas au token qui l'a ouverte
+            ttl = max(1, min(ttl, int(session['expires_at'] - time.time())))
+
+        def write(pipe):
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, ttl)
+        self._writes.put(write)
+
+    def load(self, session_id):
+        """
+        Relit l'état d'une session enregistré par une connexion de ce worker
+        ou d'un autre. Bloquant: à appeler hors de la boucle asyncio.
+
+        Returns:
+            dict ou None si aucune session n'existe
+        """
+        try:
+            data = self.redis_client.hgetall(self._key(session_id))
+        except redis.RedisError as e:
+            logger.error(f"Lecture d'une session impossible: {e}")
+            return None
+        if not data:
+            return None
+        return {
+            'authenticated': data.get('authenticated') == '1',
+            'user_id': data.get('user_id') or None,
+            'role': data.get('role') or None,
+        }
+
+    def _write_loop(self):
+        """Applique les écritures en attente par lots, dans un pipeline"""
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for write in batch:
+                    if write is not None:
+                        write(pipe)
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Écriture des sessions dans Redis impossible: {e}")
+            if stop:
+                return
+
+    def close(self):
+        """Termine les écritures en attente"""
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(None)
+        self._writer_thread.join(timeout=2.0)
+        self.redis_client.close()
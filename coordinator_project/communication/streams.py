@@ -0,0 +1,288 @@
+"""
+Canaux durables: messages conservés dans un stream Redis et lus par groupes
+de consommateurs.
+
+Un PUBLISH n'est livré qu'aux abonnés connectés à l'instant de la
+publication: un consommateur (ou le proxy) qui redémarre perd tout ce qui est
+publié entre-temps. Pour un canal marqué durable dans le registre du broker,
+publish() ajoute aussi le message au stream du canal (XADD), dans le même
+aller-retour que le PUBLISH: les abonnés pub/sub ne voient aucune
+différence, et un StreamConsumer lit le stream au sein d'un groupe:
+
+    XREADGROUP  chaque entrée est livrée à un seul consommateur du groupe et
+                reste en attente (PEL) jusqu'à son acquittement
+    XACK        après traitement réussi du message
+    XCLAIM      une entrée en attente depuis claim_idle (consommateur mort)
+                est reprise par un autre consommateur
+    dead letter une entrée livrée max_deliveries fois sans succès, ou
+                illisible (message invalide), est déplacée vers
+                stream:<canal>:dead et acquittée
+
+L'entrée conservée ne porte pas le token du publieur: le proxy le retire de
+l'XADD qu'il transmet comme du PUBLISH, et un broker sans proxy le retire
+lui-même. À travers le proxy, lire ou gérer le stream d'un canal (XRANGE,
+XREADGROUP, XACK...) demande le droit de s'abonner à ce canal.
+
+Rétention: XADD MAXLEN ~ maxlen et XTRIM MINID ~ (maintenant - retention),
+approximatifs pour que Redis coupe par nœuds entiers.
+
+Un filtre durable (tasks/result/#) a un seul stream: chaque entrée porte le
+canal concret. Un consommateur durable ne doit pas aussi s'abonner en
+pub/sub au même canal, sous peine de recevoir chaque message deux fois.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+import redis
+from redis.utils import str_if_bytes
+
+from .envelope import decode_message
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = 'stream:'
+DEAD_LETTER_SUFFIX = ':dead'
+
+
+def stream_key(channel_name):
+    """Clé du stream d'un canal durable (nom du canal ou du filtre du registre)"""
+    return f"{STREAM_PREFIX}{channel_name}"
+
+
+def add_to_stream(pipe, channel_name, channel, json_message, maxlen=None, retention=None):
+    """
+    Ajoute un message au stream d'un canal durable, dans un pipeline.
+
+    Args:
+        pipe: Pipeline Redis (synchrone ou asyncio: les commandes sont seulement mises en file)
+        channel_name: Canal ou filtre durable du registre
+        channel: Canal concret du message
+        json_message: Message encodé
+        maxlen: Nombre maximal d'entrées conservées (approximatif)
+        retention: Âge maximal des entrées en secondes (approximatif)
+
+    Returns:
+        int: Nombre de commandes ajoutées au pipeline
+    """
+    key = stream_key(channel_name)
+    pipe.xadd(key, {'channel': channel, 'data': json_message}, maxlen=maxlen, approximate=True)
+    if not retention:
+        return 1
+    # Les identifiants d'entrée commencent par l'heure d'ajout en millisecondes
+    pipe.xtrim(key, minid=int((time.time() - retention) * 1000), approximate=True)
+    return 2
+
+
+class StreamConsumer:
+    """
+    Consommateur d'un canal durable au sein d'un groupe.
+
+    Example:
+        consumer = broker.consume('tasks/assign', 'schedulers')
+        consumer.run(on_task)  # bloquant; consumer.stop() depuis un autre thread
+    """
+
+    def __init__(self, redis_client, channel_name, group, consumer=None, count=100,
+                 block=5000, claim_idle=60000, max_deliveries=5):
+        """
+        Args:
+            redis_client: Client Redis synchrone (decode_responses=False pour
+                les canaux dont le codec est binaire)
+            channel_name: Canal ou filtre durable du registre
+            group: Nom du groupe de consommateurs
+            consumer: Nom du consommateur dans le groupe (défaut: hôte:pid)
+            count: Entrées lues par appel (défaut: 100)
+            block: Attente maximale d'une lecture en millisecondes (défaut: 5000)
+            claim_idle: Attente en PEL avant reprise par un autre consommateur, en millisecondes (défaut: 60000)
+            max_deliveries: Livraisons avant dead letter (défaut: 5, None pour jamais)
+        """
+        self.redis_client = redis_client
+        self.channel_name = channel_name
+        self.key = stream_key(channel_name)
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self.count = count
+        self.block = block
+        self.claim_idle = claim_idle
+        self.max_deliveries = max_deliveries
+        self._group_ready = False
+        self._stop = threading.Event()
+
+        # Métriques
+        self.processed = 0
+        self.failed = 0
+        self.claimed = 0
+        self.dead = 0
+
+    def ensure_group(self, start_id='0'):
+        """
+        Crée le groupe (et le stream) s'il n'existe pas.
+
+        Args:
+            start_id: Première entrée livrée au groupe: '0' pour tout l'historique
+                conservé, '$' pour les seuls nouveaux messages
+        """
+        if self._group_ready:
+            return
+        try:
+            self.redis_client.xgroup_create(self.key, self.group, id=start_id, mkstream=True)
+            logger.info(f"Groupe {self.group} créé sur {self.key}")
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def reclaim(self):
+        """
+        Reprend les entrées en attente depuis claim_idle chez un autre
+        consommateur; déplace vers le dead letter celles livrées trop souvent.
+
+        Returns:
+            list: Entrées reprises, (id, canal, données)
+        """
+        pending = self.redis_client.xpending_range(
+            self.key, self.group, min='-', max='+', count=self.count, idle=self.claim_idle
+        )
+        if not pending:
+            return []
+
+        dead = [entry['message_id'] for entry in pending
+                if self.max_deliveries and entry['times_delivered'] >= self.max_deliveries]
+        if dead:
+            self._dead_letter(dead)
+        retry = [entry['message_id'] for entry in pending if entry['message_id'] not in dead]
+        if not retry:
+            return []
+        entries = self.redis_client.xclaim(self.key, self.group, self.consumer, self.claim_idle, retry)
+        self.claimed += len(entries)
+        return self._decode(entries)
+
+    def read(self):
+        """
+        Lit les entrées à traiter: d'abord les entrées reprises, sinon les
+        nouvelles (attente d'au plus block millisecondes).
+
+        Returns:
+            list: (id, canal, données)
+        """
+        entries = self.reclaim()
+        if entries:
+            return entries
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer, {self.key: '>'}, count=self.count, block=self.block
+        )
+        if not response:
+            return []
+        return self._decode(response[0][1])
+
+    def ack(self, *entry_ids):
+        """Acquitte des entrées traitées"""
+        if entry_ids:
+            self.redis_client.xack(self.key, self.group, *entry_ids)
+
+    def run(self, callback):
+        """
+        Traite les messages jusqu'à stop(). Une entrée est acquittée si le
+        callback réussit; sinon elle reste en attente et sera relivrée après
+        claim_idle.
+
+        Args:
+            callback: Fonction appelée avec (canal, données)
+        """
+        self.ensure_group()
+        logger.info(f"Consommation de {self.key} (groupe {self.group}, consommateur {self.consumer})")
+        while not self._stop.is_set():
+            try:
+                entries = self.read()
+            except redis.RedisError as e:
+                logger.error(f"Erreur de lecture de {self.key}: {e}")
+                self._stop.wait(1.0)
+                continue
+
+            done = []
+            for entry_id, channel, data in entries:
+                try:
+                    callback(channel, data)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Erreur de traitement de {entry_id} sur {channel}: {e}")
+                    continue
+                done.append(entry_id)
+            try:
+                self.ack(*done)
+            except redis.RedisError as e:
+                # Relivrées après claim_idle: le callback doit tolérer les doublons
+                logger.error(f"Acquittement impossible sur {self.key}: {e}")
+                continue
+            self.processed += len(done)
+
+    def start(self, callback):
+        """Lance run() dans un thread dédié"""
+        thread = threading.Thread(target=self.run, args=(callback,), name=f"stream-consumer-{self.channel_name}")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Arrête run() après la lecture en cours (au plus block millisecondes)"""
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'processed': self.processed,
+            'failed': self.failed,
+            'claimed': self.claimed,
+            'dead': self.dead,
+        }
+
+    def _dead_letter(self, entry_ids):
+        """Copie des entrées en attente vers le stream dead letter, puis les acquitte"""
+        # Identifiants non contigus: chaque entrée est relue seule
+        pipe = self.redis_client.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipe.xrange(self.key, min=entry_id, max=entry_id, count=1)
+        entries = [found[0] for found in pipe.execute() if found]
+        self._move_to_dead_letter(entries, entry_ids)
+
+    def _move_to_dead_letter(self, entries, entry_ids):
+        """
+        Ajoute des entrées (id, champs) au stream dead letter et acquitte
+        entry_ids (y compris celles déjà supprimées par la rétention).
+        """
+        pipe = self.redis_client.pipeline(transaction=True)
+        for entry_id, fields in entries:
+            pipe.xadd(self.key + DEAD_LETTER_SUFFIX, dict(fields, id=entry_id, group=self.group))
+        pipe.xack(self.key, self.group, *entry_ids)
+        pipe.execute()
+        self.dead += len(entry_ids)
+        logger.warning(f"{len(entry_ids)} entrées de {self.key} déplacées vers le dead letter")
+
+    def _decode(self, entries):
+        """
+        Décode des entrées lues. Une entrée illisible ne serait jamais
+        traitée: elle part tout de suite au dead letter.
+        """
+        messages = []
+        poison = []
+        for entry_id, fields in entries:
+            if fields is None:
+                continue  # Entrée supprimée par la rétention alors qu'elle était en attente
+            # Clés en bytes si le client ne décode pas les réponses
+            channel = fields.get(b'channel', fields.get('channel'))
+            data = fields.get(b'data', fields.get('data'))
+            try:
+                if data is None:
+                    raise ValueError("champ data absent")
+                message = decode_message(data)
+            except ValueError as e:
+                logger.error(f"Entrée {str_if_bytes(entry_id)} de {self.key} illisible: {e}")
+                poison.append((entry_id, fields))
+                continue
+            messages.append((str_if_bytes(entry_id), str_if_bytes(channel), message))
+        if poison:
+            self._move_to_dead_letter(poison, [entry_id for entry_id, _ in poison])
+        return messages
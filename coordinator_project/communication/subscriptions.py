@@ -0,0 +1,219 @@
+"""
+Index des abonnements du proxy Redis.
+Associe chaque canal (ou motif) à l'ensemble des clients qui y sont abonnés,
+pour qu'un message publié ne parcoure que ses abonnés réels et non toutes
+les connexions ouvertes.
+"""
+
+import threading
+
+
+class SubscriptionIndex:
+    """
+    Index canal -> identifiants des clients abonnés.
+
+    Mis à jour par SUBSCRIBE/UNSUBSCRIBE et à la déconnexion d'un client,
+    lu par l'abonné partagé à chaque message. Un verrou protège l'index car,
+    avec le moteur à threads, l'abonné partagé et les threads clients
+    l'utilisent en parallèle.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def add(self, channel, client_id):
+        """
+        Abonne un client à un canal.
+
+        Returns:
+            bool: True si le canal n'avait encore aucun abonné
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is None:
+                self._subscribers[channel] = {client_id}
+                return True
+            subscribers.add(client_id)
+            return False
+
+    def discard(self, channel, client_id):
+        """
+        Désabonne un client d'un canal.
+
+        Returns:
+            bool: True si le canal n'a plus aucun abonné
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is None:
+                return False
+            subscribers.discard(client_id)
+            if not subscribers:
+                del self._subscribers[channel]
+                return True
+            return False
+
+    def remove_client(self, client_id, channels):
+        """
+        Retire un client déconnecté de tous ses canaux.
+
+        Returns:
+            list: Canaux qui n'ont plus aucun abonné
+        """
+        emptied = []
+        with self._lock:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(client_id)
+                if not subscribers:
+                    del self._subscribers[channel]
+                    emptied.append(channel)
+        return emptied
+
+    def subscribers(self, channel):
+        """Retourne une copie des clients abonnés à un canal"""
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            return tuple(subscribers) if subscribers else ()
+
+    def count(self, channel):
+        """Nombre de clients abonnés à un canal"""
+        subscribers = self._subscribers.get(channel)
+        return len(subscribers) if subscribers else 0
+
+    def channels(self):
+        """Liste des canaux qui ont au moins un abonné"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+class UpstreamSubscriptions:
+    """
+    Abonnements de l'abonné partagé auprès de Redis, comptés par référence.
+
+    Chaque abonnement client compte pour une référence sur le canal (ou le
+    motif) Redis qui lui correspond: l'abonné partagé s'abonne quand la
+    première référence arrive et se désabonne quand la dernière part. Les
+    changements sont accumulés puis appliqués par l'abonné partagé en une
+    commande par type (SUBSCRIBE a b c...), et un abonnement suivi d'un
+    désabonnement entre deux tours ne produit aucune commande.
+
+    Un abonnement n'est effectif qu'une fois confirmé par Redis: le proxy
+    retient la confirmation envoyée au client jusque-là, sans quoi un
+    message publié juste après le SUBSCRIBE serait perdu.
+    """
+
+    # Commande d'abonnement -> commande de désabonnement
+    UNSUBSCRIBE = {'subscribe': 'unsubscribe', 'psubscribe': 'punsubscribe'}
+
+    def __init__(self):
+        self._refs = {}  # (commande, canal ou motif) -> nombre d'abonnements clients
+        self._active = set()  # Abonnements demandés à Redis
+        self._changed = set()  # Clés modifiées depuis le dernier tour de l'abonné partagé
+        self._confirmed = set()  # Abonnements confirmés par Redis
+        self._lock = threading.Lock()
+        self._confirmation = threading.Condition(self._lock)
+
+    def acquire(self, kind, channel):
+        """
+        Ajoute une référence sur un canal (kind='subscribe') ou un motif (kind='psubscribe').
+
+        Returns:
+            bool: True si c'est la première référence
+        """
+        key = (kind, channel)
+        with self._lock:
+            count = self._refs.get(key, 0)
+            self._refs[key] = count + 1
+            if count == 0:
+                self._changed.add(key)
+            return count == 0
+
+    def release(self, kind, channel):
+        """
+        Retire une référence.
+
+        Returns:
+            bool: True si c'était la dernière référence
+        """
+        key = (kind, channel)
+        with self._lock:
+            count = self._refs.get(key, 0)
+            if count <= 1:
+                if count:
+                    del self._refs[key]
+                    self._changed.add(key)
+                return count == 1
+            self._refs[key] = count - 1
+            return False
+
+    def changes(self):
+        """
+        Retourne les commandes à envoyer à Redis pour suivre les références,
+        et les considère comme appliquées.
+
+        Returns:
+            dict: commande (subscribe, psubscribe, unsubscribe, punsubscribe) -> liste de canaux ou motifs
+        """
+        batches = {}
+        with self._lock:
+            if not self._changed:
+                return batches
+            changed, self._changed = self._changed, set()
+            for key in sorted(changed):
+                kind, channel = key
+                if key in self._refs and key not in self._active:
+                    self._active.add(key)
+                    batches.setdefault(kind, []).append(channel)
+                elif key not in self._refs and key in self._active:
+                    self._active.discard(key)
+                    self._confirmed.discard(key)
+                    batches.setdefault(self.UNSUBSCRIBE[kind], []).append(channel)
+        return batches
+
+    def confirm(self, kind, channel):
+        """Enregistre la confirmation d'un abonnement par Redis et réveille les clients qui l'attendent"""
+        key = (kind, channel)
+        with self._confirmation:
+            if key in self._active:
+                self._confirmed.add(key)
+                self._confirmation.notify_all()
+
+    def unconfirmed(self, keys):
+        """
+        Returns:
+            list: Clés (commande, canal ou motif) encore référencées mais pas encore confirmées par Redis
+        """
+        with self._lock:
+            return self._unconfirmed(keys)
+
+    def _unconfirmed(self, keys):
+        return [key for key in keys if key in self._refs and key not in self._confirmed]
+
+    def wait_confirmed(self, keys, timeout):
+        """
+        Attend que Redis ait confirmé les abonnements donnés (moteur à threads).
+
+        Returns:
+            bool: False si le délai a expiré avant
+        """
+        with self._confirmation:
+            return self._confirmation.wait_for(lambda: not self._unconfirmed(keys), timeout)
+
+    def count(self, kind, channel):
+        """Nombre de références sur un canal ou un motif"""
+        return self._refs.get((kind, channel), 0)
+
+    def active(self):
+        """Abonnements actuellement demandés à Redis: liste de (commande, canal ou motif)"""
+        with self._lock:
+            return sorted(self._active)
+
+    def __len__(self):
+        return len(self._refs)
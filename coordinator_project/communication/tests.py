@@ -1,3 +1,1376 @@
-from django.test import TestCase
+import json
+import os
+import asyncio
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import jwt
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from . import audit, handoff
+from . import broker as broker_module
+from .broker import MessageBroker, get_broker, get_connection_pool
+from .coalesce import Coalescer, coalesce_key, is_terminal
+from .codecs import CODEC_HEADER, available_codecs, decoder_for, get_codec
+from .envelope import (MAGIC, ORIGIN_KEY, decode_message, decode_with_origin, encode_envelope, is_envelope,
+                       split_envelope, without_token)
+from .messages import ManagerLoginMessage
+from .models import Channel as ChannelDocument
+from .outbound import COALESCE, DISCONNECT, OutboundQueue, send_buffers
+from .policies import (DEFAULT_CHANNEL_POLICIES, PUBLISH, SUBSCRIBE, ChannelPolicyTable, PolicyReloader,
+                       policy_documents_filter)
+from .async_broker import AsyncMessageBroker
+from .async_proxy import AsyncRedisProxy
+from .proxy import RedisCommand, RedisProxy
+from .ratelimit import DELAY, RateLimiter, RateLimitRule, TokenBucket
+from .reaper import IDLE, PING_TIMEOUT, WRITE_STALLED, ConnectionReaper
+from .registry import BROKER_FIELDS, save_channel
+from .resp import MAX_NESTING_DEPTH, RespParser, RespProtocolError, encode_array, encode_command
+from .rpc import PendingRequests
+from .sessions import LocalSessionStore, RedisSessionStore, session_id_for
+from .streams import DEAD_LETTER_SUFFIX, StreamConsumer, add_to_stream, stream_key
+from .subscriptions import SubscriptionIndex
+from .token_cache import VerifiedTokenCache
+from .topics import TopicTrie, glob_to_filter, is_wildcard, to_redis_pattern, topic_matches
+from .upstream import AsyncUpstreamPool, UpstreamPool
+
+
+def _parse_chunks(data, sizes):
+    """Analyse data lu par morceaux de tailles successives (cycliques)"""
+    parser = RespParser()
+    frames = []
+    view = memoryview(data)
+    offset = 0
+    index = 0
+    while offset < len(data):
+        size = sizes[index % len(sizes)]
+        parser.feed(view[offset:offset + size])
+        frames.extend(parser)
+        offset += size
+        index += 1
+    return frames, parser.buffered()
+
+
+class RespParserTests(SimpleTestCase):
+    """Parseur RESP incrémental: lectures fragmentées, pipelining, erreurs"""
+
+    def build_stream(self, count=200, seed=0):
+        rng = random.Random(seed)
+        frames = []
+        for i in range(count):
+            kind = i % 4
+            if kind == 0:
+                frames.append(encode_command('PUBLISH', f'tasks/result/{i}', 'é' * rng.randint(0, 300)))
+            elif kind == 1:
+                frames.append(encode_command('SUBSCRIBE', 'tasks/assign', f'tasks/status/{i}'))
+            elif kind == 2:
+                frames.append(encode_command('SET', f'key:{i}', os.urandom(rng.randint(0, 64))))
+            else:
+                frames.append(b'PING\r\n')
+        return b''.join(frames), frames
+
+    def test_pipelined_commands_in_one_read(self):
+        data, frames = self.build_stream()
+        parsed, leftover = _parse_chunks(data, [len(data)])
+        self.assertEqual([raw for _, raw in parsed], frames)
+        self.assertEqual(leftover, 0)
+        self.assertEqual(parsed[3][0], [b'PING'])
+
+    def test_split_reads_match_single_read(self):
+        data, _ = self.build_stream()
+        reference, _ = _parse_chunks(data, [len(data)])
+        for sizes in ([1], [2, 3], [7], [64, 1], [1500, 4096]):
+            with self.subTest(sizes=sizes):
+                parsed, leftover = _parse_chunks(data, sizes)
+                self.assertEqual(parsed, reference)
+                self.assertEqual(leftover, 0)
+
+    def test_random_split_reads(self):
+        data, _ = self.build_stream(seed=1)
+        reference, _ = _parse_chunks(data, [len(data)])
+        rng = random.Random(2)
+        for _ in range(50):
+            sizes = [rng.choice((1, 2, 3, 7, 64, 1500, rng.randint(1, 5000))) for _ in range(20)]
+            parsed, leftover = _parse_chunks(data, sizes)
+            self.assertEqual(parsed, reference)
+            self.assertEqual(leftover, 0)
+
+    def test_large_bulk_string(self):
+        body = os.urandom(3 * 1024 * 1024)
+        frame = encode_command('PUBLISH', 'tasks/result/1', body)
+        parsed, leftover = _parse_chunks(frame + b'PING\r\n', [65536])
+        self.assertEqual(parsed[0][0], [b'PUBLISH', b'tasks/result/1', body])
+        self.assertEqual(parsed[0][1], frame)
+        self.assertEqual(parsed[1][0], [b'PING'])
+        self.assertEqual(leftover, 0)
+
+    def test_incomplete_frame_stays_buffered(self):
+        parser = RespParser()
+        parser.feed(b'*2\r\n$3\r\nGET\r\n$1\r\n')
+        self.assertIsNone(parser.gets())
+        self.assertEqual(parser.buffered(), 17)
+        parser.feed(b'a\r\n')
+        self.assertEqual(parser.gets(), ([b'GET', b'a'], b'*2\r\n$3\r\nGET\r\n$1\r\na\r\n'))
+
+    def test_malformed_length(self):
+        with self.assertRaises(RespProtocolError):
+            RespParser().feed(b'*1\r\n$x\r\n')
+
+    def test_deep_nesting_is_a_protocol_error(self):
+        for data in (b'*1\r\n' * 5000, b'%1\r\n' * 5000, b'|0\r\n' * 5000):
+            with self.subTest(data=data[:4]), self.assertRaises(RespProtocolError):
+                RespParser().feed(data)
+        nested = b'*1\r\n' * MAX_NESTING_DEPTH + b':1\r\n'
+        parser = RespParser()
+        parser.feed(nested)
+        value, raw = parser.gets()
+        self.assertEqual(raw, nested)
+
+    def test_corrupted_input_never_raises_other_errors(self):
+        data, _ = self.build_stream(seed=3)
+        rng = random.Random(4)
+        for _ in range(300):
+            corrupted = bytearray(data[:rng.randint(1, 3000)])
+            for _ in range(rng.randint(1, 8)):
+                corrupted[rng.randrange(len(corrupted))] = rng.randrange(256)
+            parser = RespParser()
+            try:
+                parser.feed(bytes(corrupted))
+                list(parser)
+            except RespProtocolError:
+                pass
+
+
+class TopicTrieTests(SimpleTestCase):
+    """Filtres MQTT: trie et fonctions de correspondance"""
+
+    def test_matches_like_topic_matches(self):
+        filters = ['tasks/status/#', 'tasks/+/42', 'tasks/status/42', '#', 'coord/+', 'coord/+/x/#']
+        topics = ['tasks/status', 'tasks/status/42', 'tasks/result/42', 'coord/heartbeat',
+                  'coord/a/x', 'coord/a/x/y/z', 'manager/status', 'tasks']
+        trie = TopicTrie()
+        for topic_filter in filters:
+            trie.add(topic_filter, topic_filter)
+        for topic in topics:
+            with self.subTest(topic=topic):
+                expected = {f for f in filters if topic_matches(f, topic)}
+                self.assertEqual(trie.match(topic), expected)
+
+    def test_multi_level_matches_parent(self):
+        self.assertTrue(topic_matches('tasks/status/#', 'tasks/status'))
+        self.assertFalse(topic_matches('tasks/status/+', 'tasks/status'))
+        self.assertFalse(topic_matches('tasks/+', 'tasks/status/42'))
+
+    def test_discard_prunes_nodes(self):
+        trie = TopicTrie()
+        self.assertTrue(trie.add('a/b/c', 'x'))
+        self.assertFalse(trie.add('a/b/c', 'y'))
+        self.assertFalse(trie.discard('a/b/c', 'x'))
+        self.assertTrue(trie.discard('a/b/c', 'y'))
+        self.assertEqual(len(trie), 0)
+        self.assertEqual(trie._root.children, {})
+
+    def test_covers(self):
+        trie = TopicTrie()
+        trie.add('tasks/+/42')
+        trie.add('coord/#')
+        self.assertTrue(trie.covers('tasks/status/42'))
+        self.assertTrue(trie.covers('tasks/+/42'))
+        self.assertFalse(trie.covers('tasks/#'))
+        self.assertTrue(trie.covers('coord/heartbeat/+'))
+        self.assertFalse(trie.covers('manager/status'))
+
+    def test_wildcards_and_patterns(self):
+        self.assertTrue(is_wildcard('tasks/status/#'))
+        self.assertFalse(is_wildcard('tasks/#/x'))
+        self.assertFalse(is_wildcard('tasks/status'))
+        self.assertEqual(to_redis_pattern('tasks/+/42'), 'tasks/*/42')
+        self.assertEqual(to_redis_pattern('tasks/status/#'), 'tasks/status*')
+        self.assertEqual(glob_to_filter('tasks/sta*/x'), 'tasks/#')
+
+
+class OriginMarkTests(SimpleTestCase):
+    """La marque d'origine de la livraison locale n'atteint pas les abonnés"""
+
+    def test_json_message(self):
+        data = '{"x":1,"%s":"abc"}' % ORIGIN_KEY
+        self.assertEqual(decode_message(data), {'x': 1})
+        self.assertEqual(decode_with_origin(data), ({'x': 1}, 'abc'))
+
+    def test_envelope_header(self):
+        data = encode_envelope({'token': 't', '_sender_id': 'u1', ORIGIN_KEY: 'abc'}, b'{"x":1}')
+        self.assertEqual(decode_with_origin(data), ({'x': 1, '_sender_id': 'u1'}, 'abc'))
+        self.assertEqual(decode_with_origin(b'[1]'), ([1], None))
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Seaux à jetons et limiteur de publication"""
+
+    def test_bucket_refill_is_capped(self):
+        bucket = TokenBucket(rate=10, capacity=20, now=0.0)
+        bucket.consume(20)
+        self.assertAlmostEqual(bucket.wait_time(5), 0.5)
+        bucket.refill(1.0)
+        self.assertEqual(bucket.tokens, 10)
+        bucket.refill(100.0)
+        self.assertEqual(bucket.tokens, 20)
+        self.assertTrue(bucket.is_idle(100.0))
+
+    def test_oversized_message_passes_when_full(self):
+        bucket = TokenBucket(rate=100, capacity=100, now=0.0)
+        self.assertEqual(bucket.wait_time(1000), 0.0)
+        bucket.consume(1000)
+        # La dette retarde les messages suivants
+        self.assertAlmostEqual(bucket.wait_time(1), 9.01)
+
+    def check(self, limiter, rule, client_info, now, user_id='u1', role='volunteer', size=10):
+        with mock.patch('communication.ratelimit.time.monotonic', return_value=now):
+            return limiter.check(rule, client_info, user_id, role, size)
+
+    def test_reject_beyond_connection_budget(self):
+        limiter = RateLimiter()
+        rule = RateLimitRule('tasks/result/#', {'connection': {'messages': 2}})
+        client_info = {}
+        self.assertEqual(self.check(limiter, rule, client_info, 0.0), 0)
+        self.assertEqual(self.check(limiter, rule, client_info, 0.0), 0)
+        self.assertIsNone(self.check(limiter, rule, client_info, 0.0))
+        # Une autre connexion a son propre seau
+        self.assertEqual(self.check(limiter, rule, {}, 0.0), 0)
+        self.assertEqual(self.check(limiter, rule, client_info, 0.5), 0)
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    def test_user_budget_spans_connections(self):
+        limiter = RateLimiter()
+        rule = RateLimitRule('tasks/result/#', {'user': {'messages': 1}})
+        self.assertEqual(self.check(limiter, rule, {}, 0.0), 0)
+        self.assertIsNone(self.check(limiter, rule, {}, 0.0))
+        self.assertEqual(self.check(limiter, rule, {}, 0.0, user_id='u2'), 0)
+
+    def test_delay_action(self):
+        limiter = RateLimiter(max_delay=1.0)
+        rule = RateLimitRule('tasks/result/#', {'connection': {'bytes': 100}}, DELAY)
+        client_info = {}
+        self.assertEqual(self.check(limiter, rule, client_info, 0.0, size=100), 0)
+        self.assertAlmostEqual(self.check(limiter, rule, client_info, 0.0, size=50), 0.5)
+        # Au-delà du retard maximal, le message est refusé
+        self.assertIsNone(self.check(limiter, rule, client_info, 0.0, size=100))
+
+
+class PendingRequestsTests(SimpleTestCase):
+    """Corrélation des réponses et expiration des requêtes"""
+
+    def test_reply_resolves_future(self):
+        pending = PendingRequests()
+        future = pending.add('r1', timeout=5)
+        self.assertFalse(pending.resolve('autre', {}))
+        self.assertTrue(pending.resolve('r1', {'status': 'success'}))
+        self.assertEqual(future.result(0), {'status': 'success'})
+        self.assertEqual(len(pending), 0)
+        with self.assertRaises(ValueError):
+            pending.add('r2', timeout=None)
+            pending.add('r2', timeout=None)
+
+    def test_timeout(self):
+        pending = PendingRequests()
+        started = time.monotonic()
+        future = pending.add('r1', timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            future.result(2)
+        self.assertLess(time.monotonic() - started, 1)
+        # Une réponse tardive n'a plus de requête à résoudre
+        self.assertFalse(pending.resolve('r1', {}))
+        self.assertEqual(len(pending), 0)
+
+
+class LoginThroughProxyTests(SimpleTestCase):
+    """Une demande de connexion traverse le proxy avec son mot de passe"""
+
+    def publish(self, channel, message):
+        handled, upstream, error = RedisProxy().prepare_publish(
+            '10.0.0.1:5000', RedisCommand(encode_command('PUBLISH', channel, json.dumps(message)))
+        )
+        self.assertTrue(handled)
+        self.assertIsNone(error)
+        return json.loads(RedisCommand(upstream).get_message())
+
+    def test_login_keeps_password(self):
+        message = ManagerLoginMessage('alice', 's3cret', client_ip='10.0.0.1').to_dict()
+        forwarded = self.publish('auth/login', message)
+        self.assertEqual(forwarded['password'], 's3cret')
+        self.assertEqual(forwarded['_client_ip'], '10.0.0.1')
+
+    def test_other_channels_mask_password(self):
+        forwarded = self.publish('coord/emergency', {'password': 's3cret'})
+        self.assertEqual(forwarded['password'], '********')
+
+
+class CoalescerTests(SimpleTestCase):
+    """Fusion des messages de progression par clé"""
+
+    def test_last_item_per_key_is_flushed_at_deadline(self):
+        coalescer = Coalescer()
+        self.assertFalse(coalescer.offer('a', 1, 0.25, now=0.0))
+        self.assertTrue(coalescer.offer('a', 2, 0.25, now=0.1))
+        coalescer.offer('b', 3, 0.25, now=0.2)
+        self.assertAlmostEqual(coalescer.next_due(now=0.1), 0.15)
+        self.assertEqual(coalescer.pop_due(now=0.24), [])
+        # La fenêtre part du premier message de la clé, pas du dernier
+        self.assertEqual(coalescer.pop_due(now=0.25), [2])
+        self.assertEqual(coalescer.pop_due(now=0.45), [3])
+        self.assertEqual(coalescer.stats(), {'pending': 0, 'offered': 3, 'superseded': 1, 'flushed': 2})
+
+    def test_discarded_key_restarts_its_window(self):
+        coalescer = Coalescer()
+        coalescer.offer('a', 1, 0.25, now=0.0)
+        self.assertTrue(coalescer.discard('a'))
+        self.assertFalse(coalescer.discard('a'))
+        coalescer.offer('a', 2, 0.25, now=0.2)
+        # L'ancienne échéance ne publie pas le nouvel élément trop tôt
+        self.assertEqual(coalescer.pop_due(now=0.3), [])
+        self.assertEqual(coalescer.pop_due(now=0.45), [2])
+
+    def test_keys_and_terminal_states(self):
+        self.assertEqual(coalesce_key('tasks/status/1', {'task_id': '1'}, 'task_id'), ('tasks/status/1', '1'))
+        self.assertEqual(coalesce_key('tasks/status/1', {}, None), ('tasks/status/1', None))
+        self.assertTrue(is_terminal({'status': 'completed'}))
+        self.assertFalse(is_terminal({'status': 'RUNNING'}))
+        self.assertFalse(is_terminal('COMPLETED'))
+
+    def test_broker_leaves_coalescing_to_the_proxy(self):
+        broker = MessageBroker.__new__(MessageBroker)
+        broker.get_channel = lambda channel: mock.Mock(coalesce_window=0.25, coalesce_key='task_id')
+        message = {'task_id': '1', 'status': 'RUNNING'}
+        broker.use_proxy = False
+        self.assertEqual(broker._coalesce_key('tasks/status/1', message), ('tasks/status/1', '1'))
+        broker.use_proxy = True
+        self.assertIsNone(broker._coalesce_key('tasks/status/1', message))
+
+    def test_held_publish_reports_proxy_subscribers(self):
+        proxy = RedisProxy()
+        proxy.channel_subscribers.add('tasks/status/1', 'c1')
+        proxy.filter_subscribers.add('tasks/status/#', 'c2')
+        proxy.filter_subscribers.add('tasks/+/1', 'c3')
+        token = jwt.encode({'user_id': 'm1', 'role': 'manager',
+                            'exp': datetime.now(timezone.utc) + timedelta(minutes=5)},
+                           settings.SECRET_KEY, algorithm='HS256')
+        raw = encode_command('PUBLISH', 'tasks/status/1',
+                             json.dumps({'task_id': '1', 'status': 'RUNNING', 'token': token}))
+        self.assertEqual(proxy.process_command('10.0.0.1:5000', RedisCommand(raw), raw), ('reply', b':3\r\n'))
+        self.assertEqual(len(proxy.coalescer), 1)
+
+
+class LocalSessionStoreTests(SimpleTestCase):
+    """Sessions d'un proxy à un seul worker, partagées entre les connexions d'un client"""
+
+    def test_session_expires_with_its_token(self):
+        store = LocalSessionStore()
+        with mock.patch('communication.sessions.time.time', return_value=1000.0):
+            store.save('s' * 32, {'authenticated': True, 'user_id': 'm1', 'role': 'manager', 'expires_at': 1060.0})
+            self.assertEqual(store.load('s' * 32), {'authenticated': True, 'user_id': 'm1', 'role': 'manager'})
+            self.assertIsNone(store.load('autre'))
+        with mock.patch('communication.sessions.time.time', return_value=1060.0):
+            self.assertIsNone(store.load('s' * 32))
+
+    def test_expired_sessions_are_pruned(self):
+        store = LocalSessionStore(ttl=10, max_sessions=2)
+        with mock.patch('communication.sessions.time.time', return_value=0.0):
+            store.save('a', {'authenticated': True})
+            store.save('b', {'authenticated': True})
+        with mock.patch('communication.sessions.time.time', return_value=20.0):
+            store.save('c', {'authenticated': True})
+        self.assertEqual(list(store._sessions), ['c'])
+
+    def test_redis_key_does_not_reveal_the_session_id(self):
+        store = RedisSessionStore.__new__(RedisSessionStore)
+        key = store._key('s' * 32)
+        self.assertTrue(key.startswith(RedisSessionStore.KEY_PREFIX))
+        self.assertNotIn('s' * 32, key)
+        self.assertEqual(key, store._key('s' * 32))
+
+    def test_clients_cannot_reach_proxy_keys(self):
+        proxy = RedisProxy()
+        for args in (('SCAN', '0', 'MATCH', 'proxy:session:*'), ('HGETALL', 'proxy:metrics:0'),
+                     ('DEL', 'a', 'proxy:session:x')):
+            with self.subTest(args=args):
+                raw = encode_command(*args)
+                action, reply = proxy.process_command('10.0.0.1:5000', RedisCommand(raw), raw)
+                self.assertEqual(action, 'reply')
+                self.assertTrue(reply.startswith(b'-ERR NOPERM'))
+        raw = encode_command('GET', 'tasks:proxy:1')
+        self.assertEqual(proxy.process_command('10.0.0.1:5000', RedisCommand(raw), raw), ('forward', raw))
+
+    def test_broker_names_its_connections_behind_the_proxy(self):
+        with self.settings(USE_REDIS_PROXY=True, REDIS_PROXY_HOST='127.0.0.1', REDIS_PROXY_PORT=16391):
+            proxied = MessageBroker(host='127.0.0.1', port=16391, persistent=False)
+            direct = MessageBroker(host='127.0.0.1', port=16392, persistent=False)
+        self.assertEqual(session_id_for(proxied.session_id), proxied.session_id)
+        self.assertNotEqual(proxied.session_id, proxied.origin)  # L'origine circule dans les messages
+        for pool in (proxied.redis_client.connection_pool, proxied.pubsub.connection_pool):
+            self.assertEqual(pool.connection_kwargs['client_name'], proxied.session_id)
+        self.assertIsNone(direct.session_id)
+        self.assertIsNone(direct.redis_client.connection_pool.connection_kwargs['client_name'])
+
+    def test_short_names_are_not_sessions(self):
+        self.assertIsNone(session_id_for('worker-1'))
+        self.assertIsNone(session_id_for(None))
+        self.assertEqual(session_id_for('s' * 32), 's' * 32)
+
+
+def _token(role, user_id='u1'):
+    return jwt.encode({'user_id': user_id, 'role': role,
+                       'exp': datetime.now(timezone.utc) + timedelta(minutes=5)},
+                      settings.SECRET_KEY, algorithm='HS256')
+
+
+class DurableStreamAccessTests(SimpleTestCase):
+    """Entrées des streams durables: sans token, lues selon la politique de SUBSCRIBE"""
+
+    def process(self, proxy, *args):
+        raw = encode_command(*args)
+        return proxy.process_command('10.0.0.1:5000', RedisCommand(raw), raw)
+
+    def test_without_token(self):
+        self.assertEqual(json.loads(without_token('{"a": 1, "token": "t"}')), {'a': 1})
+        self.assertEqual(without_token('{"a": 1}'), '{"a": 1}')
+        enveloped = without_token(encode_envelope({'token': 't', 'codec': 'msgpack'}, b'\x81'))
+        self.assertEqual(enveloped, encode_envelope({'codec': 'msgpack'}, b'\x81'))
+
+    def test_xadd_is_rewritten_like_the_publish(self):
+        proxy = RedisProxy()
+        data = json.dumps({'task': 1, 'token': _token('manager')})
+        action, command = self.process(proxy, 'XADD', 'stream:tasks/assign', 'MAXLEN', '~', '10', '*',
+                                       'channel', 'tasks/assign', 'data', data)
+        self.assertEqual(action, 'forward')
+        args = RedisCommand(command).raw_args
+        self.assertEqual(args[:6], [b'stream:tasks/assign', b'MAXLEN', b'~', b'10', b'*', b'channel'])
+        stored = json.loads(args[-1])
+        self.assertNotIn('token', stored)
+        self.assertEqual((stored['task'], stored['_sender_role']), (1, 'manager'))
+
+    def test_xadd_refused_without_publish_rights(self):
+        proxy = RedisProxy()
+        for data in ({'task': 1}, {'task': 1, 'token': _token('volunteer')}):
+            with self.subTest(data=data):
+                action, reply = self.process(proxy, 'XADD', 'stream:tasks/assign', '*',
+                                             'channel', 'tasks/assign', 'data', json.dumps(data))
+                self.assertEqual((action, reply), ('reply', b'-ERR NOAUTH Permission denied\r\n'))
+        action, reply = self.process(proxy, 'XADD', 'stream:tasks/result/#', '*', 'channel', 'tasks/assign',
+                                     'data', json.dumps({'token': _token('volunteer')}))
+        self.assertEqual(action, 'reply')
+
+    def test_reads_follow_the_subscribe_policy(self):
+        proxy = RedisProxy()
+        proxy.client_connections['10.0.0.1:5000'] = {'authenticated': True, 'role': 'manager', 'user_id': 'm1'}
+        self.assertEqual(self.process(proxy, 'XRANGE', 'stream:tasks/assign', '-', '+')[0], 'forward')
+        for args in (('XRANGE', 'stream:tasks/result/#', '-', '+'),
+                     ('XREADGROUP', 'GROUP', 'g', 'c', 'STREAMS', 'stream:tasks/assign', 'stream:tasks/result/#', '>', '>'),
+                     ('DUMP', 'stream:tasks/result/#:dead')):
+            with self.subTest(args=args):
+                self.assertEqual(self.process(proxy, *args)[0], 'reply')
+        proxy.client_connections.clear()
+        self.assertEqual(self.process(proxy, 'XLEN', 'stream:tasks/assign')[0], 'reply')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeRedisTestCase(SimpleTestCase):
+    """Serveur Redis simulé (fakeredis) sur un port libre, partagé par les tests de la classe"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from fakeredis import TcpFakeServer
+        cls.redis_port = _free_port()
+        cls.redis_server = TcpFakeServer(('127.0.0.1', cls.redis_port), server_type='redis')
+        threading.Thread(target=cls.redis_server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.redis_server.shutdown()
+        cls.redis_server.server_close()
+        super().tearDownClass()
+
+    def new_proxy(self, proxy_class=RedisProxy):
+        """Proxy vers le serveur simulé, sans base Mongo ni métriques"""
+        with self.settings(REDIS_PROXY_METRICS=False):
+            proxy = proxy_class('127.0.0.1', self.redis_port, _free_port())
+        proxy.policy_reloader.start = lambda fingerprint: None
+        return proxy
+
+    def stop_proxy(self, proxy):
+        """Arrête un proxy à threads et attend son abonné partagé, avant l'arrêt du serveur simulé"""
+        proxy.stop()
+        proxy.pubsub_thread.join(timeout=1.0)
+
+
+class SubscribeConfirmationTests(FakeRedisTestCase):
+    """Un SUBSCRIBE n'est confirmé au client qu'une fois l'abonné partagé abonné sur Redis"""
+
+    def test_publish_right_after_subscribe_is_delivered(self):
+        proxy = self.new_proxy()
+        proxy_port = proxy.proxy_port
+        threading.Thread(target=proxy.start, daemon=True).start()
+        self.addCleanup(self.stop_proxy, proxy)
+        direct = redis.Redis(port=self.redis_port)
+        for _ in range(50):
+            if proxy.running:
+                break
+            time.sleep(0.02)
+        for channel in ('auth/login_response', 'coord/heartbeat/w1', 'coord/heartbeat/w2'):
+            with self.subTest(channel=channel):
+                pubsub = redis.Redis(port=proxy_port).pubsub()
+                self.addCleanup(pubsub.close)
+                pubsub.subscribe(channel)
+                self.assertEqual(pubsub.get_message(timeout=2)['type'], 'subscribe')
+                direct.publish(channel, b'{"n": 1}')
+                message = pubsub.get_message(timeout=2)
+                self.assertEqual((message['type'], message['data']), ('message', b'{"n": 1}'))
+
+    def test_async_engine_waits_for_the_confirmation(self):
+        async def scenario():
+            proxy = AsyncRedisProxy()
+            proxy.loop = asyncio.get_running_loop()
+            proxy.subscriptions_confirmed = asyncio.Event()
+            client_id = '10.0.0.1:5000'
+            client_info = proxy.client_connections[client_id] = proxy._new_client_info()
+            command = RedisCommand(encode_command('SUBSCRIBE', 'coord/heartbeat/#'))
+            proxy.prepare_subscribe(client_id, command)
+            self.assertEqual(proxy._drain_pending_subscriptions(), {'psubscribe': ['coord/heartbeat*']})
+            waiter = asyncio.create_task(proxy._wait_upstream_subscriptions(client_id, client_info, command))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            proxy._on_upstream_message({'type': 'psubscribe', 'pattern': None,
+                                        'channel': b'coord/heartbeat*', 'data': 1})
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(scenario())
+
+
+class OutboundQueueTests(SimpleTestCase):
+    """Politiques de débordement de la file d'envoi d'un client"""
+
+    def test_coalesce_keeps_every_message_until_full(self):
+        queue = OutboundQueue(max_messages=3, policy=COALESCE)
+        for data in (b'a1', b'a2', b'b1'):
+            self.assertTrue(queue.put_message(data, key='a' if data.startswith(b'a') else 'b'))
+        self.assertEqual((queue.coalesced, queue.dropped), (0, 0))
+        # File pleine: le dernier message en attente du canal est remplacé
+        queue.put_message(b'a3', key='a')
+        self.assertEqual(queue.drain(), [b'a1', b'a3', b'b1'])
+        self.assertEqual(queue.coalesced, 1)
+
+    def test_coalesce_without_pending_message_drops_the_oldest(self):
+        queue = OutboundQueue(max_messages=2, policy=COALESCE)
+        queue.put_reply(b'+OK')
+        for data, key in ((b'a1', 'a'), (b'b1', 'b'), (b'c1', 'c')):
+            queue.put_message(data, key=key)
+        self.assertEqual(queue.drain(), [b'+OK', b'b1', b'c1'])
+        self.assertEqual(queue.dropped, 1)
+
+    def test_disconnect_when_full(self):
+        queue = OutboundQueue(max_messages=1, policy=DISCONNECT)
+        self.assertTrue(queue.put_message(b'a1', key='a'))
+        self.assertFalse(queue.put_message(b'a2', key='a'))
+        self.assertTrue(queue.overflowed)
+
+
+class DedicatedConnectionTests(SimpleTestCase):
+    """Un client en transaction (MULTI/WATCH) garde tous ses PUBLISH sur sa connexion dédiée"""
+
+    def process(self, proxy, *args):
+        raw = encode_command(*args)
+        return proxy.process_command('10.0.0.1:5000', RedisCommand(raw), raw)
+
+    def test_rewritten_publish_follows_the_transaction(self):
+        proxy = RedisProxy()
+        proxy.client_connections['10.0.0.1:5000'] = proxy._new_client_info()
+        self.assertEqual(self.process(proxy, 'MULTI')[0], 'dedicated')
+        # Canal en mode fusion: hors transaction, le message serait retenu
+        message = json.dumps({'task_id': '1', 'status': 'RUNNING', 'token': _token('manager')})
+        action, command = self.process(proxy, 'PUBLISH', 'tasks/status/1', message)
+        self.assertEqual(action, 'dedicated')
+        published = json.loads(RedisCommand(command).get_message())
+        self.assertNotIn('token', published)
+        self.assertEqual(published['_sender_role'], 'manager')
+        self.assertEqual(proxy.coalescer.stats()['offered'], 0)
+
+
+class ChannelPolicyTableTests(SimpleTestCase):
+    """Décisions de la table compilée et rechargement des politiques"""
+
+    def test_decisions(self):
+        table = ChannelPolicyTable(DEFAULT_CHANNEL_POLICIES + [
+            {'name': 'jobs/#', 'active': False, 'require_auth': False},
+        ])
+        self.assertTrue(table.is_open(PUBLISH, 'auth/login'))
+        self.assertTrue(table.is_open(SUBSCRIBE, 'coord/heartbeat/w1'))
+        self.assertFalse(table.is_open(SUBSCRIBE, 'tasks/status/42'))
+        self.assertTrue(table.allows('manager', SUBSCRIBE, 'tasks/status/42'))
+        self.assertTrue(table.allows('manager', SUBSCRIBE, 'tasks/status/+'))
+        # Un filtre n'est autorisé que si une règle le couvre entièrement
+        self.assertFalse(table.allows('manager', SUBSCRIBE, 'tasks/#'))
+        self.assertFalse(table.allows('volunteer', PUBLISH, 'tasks/assign'))
+        self.assertTrue(table.allows('coordinator', PUBLISH, 'tasks/result/7'))
+        self.assertFalse(table.is_open(PUBLISH, 'jobs/1'))  # Canal inactif
+        self.assertEqual(table.coalescing('tasks/status/42').key, 'task_id')
+        self.assertTrue(table.inspects_body('auth/login'))
+
+    def test_reload_only_when_definitions_change(self):
+        definitions = [{'name': 'coord/emergency', 'require_auth': False}]
+        installed = []
+        reloader = PolicyReloader(installed.append, loader=lambda: list(definitions))
+        self.assertTrue(reloader.reload())
+        self.assertFalse(reloader.reload())
+        definitions.append({'name': 'jobs/#', 'allowed_publishers': ['manager'], 'require_auth': True})
+        self.assertTrue(reloader.reload())
+        self.assertEqual(len(installed), 2)
+        self.assertTrue(installed[-1].allows('manager', PUBLISH, 'jobs/1'))
+
+    def test_unreachable_database_keeps_the_table(self):
+        def loader():
+            raise ConnectionError('Mongo injoignable')
+        installed = []
+        reloader = PolicyReloader(installed.append, loader=loader)
+        with self.assertLogs('RedisProxy', 'WARNING'):
+            self.assertFalse(reloader.reload())
+        self.assertEqual(installed, [])
+
+    def test_closed_auto_created_documents_are_not_read(self):
+        from .models import Channel
+        query = policy_documents_filter().to_query(Channel)
+        defaults, policy_bearing = query['$or']
+        self.assertIn('tasks/status/#', defaults['_id']['$in'])
+        grants = policy_bearing['$and'][1]['$or']
+        # Document fermé écrit par save_channel: aucune clause ne le retient
+        self.assertIn({'require_auth': {'$ne': True}}, grants)
+        self.assertIn({'rate_limits': {'$ne': {}}}, grants)
+        self.assertIn({'coalesce_window': {'$gt': 0.0}}, grants)
+
+
+class AsyncProxyFanOutTests(FakeRedisTestCase):
+    """Moteur asyncio: diffusion d'un message publié à tous les abonnés du proxy"""
+
+    def test_each_subscriber_receives_the_message_once(self):
+        proxy = self.new_proxy(AsyncRedisProxy)
+
+        async def receive(pubsub):
+            messages = []
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.3)
+                if message is None:
+                    return messages
+                messages.append((message['channel'], message['data']))
+
+        async def scenario():
+            serving = asyncio.create_task(proxy.serve())
+            while not proxy.running:
+                await asyncio.sleep(0.01)
+            clients = [aioredis.Redis(port=proxy.proxy_port) for _ in range(4)]
+            pubsubs = [client.pubsub() for client in clients]
+            try:
+                for pubsub, channel in zip(pubsubs, ('coord/emergency', 'coord/emergency', 'coord/heartbeat/#')):
+                    await pubsub.subscribe(channel)
+                    self.assertEqual((await pubsub.get_message(timeout=2))['type'], 'subscribe')
+                await clients[3].ping()  # Connecté, sans abonnement
+                direct = aioredis.Redis(port=self.redis_port)
+                await direct.publish('coord/emergency', b'alert')
+                await direct.publish('coord/heartbeat/w1', b'beat')
+                await direct.aclose()
+                received = await asyncio.gather(*(receive(pubsub) for pubsub in pubsubs[:3]))
+            finally:
+                for pubsub, client in zip(pubsubs, clients):
+                    await pubsub.aclose()
+                    await client.aclose()
+                serving.cancel()
+                try:
+                    await serving
+                except asyncio.CancelledError:
+                    pass
+            return received
+
+        received = asyncio.run(scenario())
+        proxy.stop()
+        self.assertEqual(received, [
+            [(b'coord/emergency', b'alert')],
+            [(b'coord/emergency', b'alert')],
+            [(b'coord/heartbeat/w1', b'beat')],
+        ])
+
+
+class UpstreamPoolTests(FakeRedisTestCase):
+    """Connexions pipelinées partagées: chaque commande reçoit sa propre réponse"""
+
+    def test_pipelined_replies_follow_submission_order(self):
+        pool = UpstreamPool('127.0.0.1', self.redis_port, size=2)
+        self.addCleanup(pool.close)
+        results = {}
+
+        def client(name):
+            slot = pool.assign_slot()
+            # Toutes les commandes partent avant la lecture de la première réponse:
+            # la n-ième réponse doit être celle du n-ième INCR de ce client
+            futures = [pool.submit(encode_command('INCR', f'pool:{name}'), slot) for _ in range(300)]
+            results[name] = [future.result(timeout=5) for future in futures]
+
+        threads = [threading.Thread(target=client, args=(f'c{n}',)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expected = [b':%d\r\n' % (i + 1) for i in range(300)]
+        self.assertEqual(results, {f'c{n}': expected for n in range(6)})
+
+    def test_commands_of_a_client_run_in_order(self):
+        pool = UpstreamPool('127.0.0.1', self.redis_port, size=3)
+        self.addCleanup(pool.close)
+        slot = pool.assign_slot()
+        pool.submit(encode_command('DEL', 'pool:order'), slot).result(timeout=5)
+        replies = [pool.submit(encode_command('RPUSH', 'pool:order', str(i)), slot) for i in range(50)]
+        self.assertEqual([reply.result(timeout=5) for reply in replies], [b':%d\r\n' % (i + 1) for i in range(50)])
+
+    def test_async_pool(self):
+        async def scenario():
+            pool = AsyncUpstreamPool('127.0.0.1', self.redis_port, size=2)
+            try:
+                futures = [await pool.submit(encode_command('INCR', f'pool:async:{i % 2}'), i % 2)
+                           for i in range(200)]
+                return [await future for future in futures]
+            finally:
+                pool.close()
+                await asyncio.sleep(0)
+
+        replies = asyncio.run(scenario())
+        self.assertEqual(replies[0::2], replies[1::2])
+        self.assertEqual(replies[0::2], [b':%d\r\n' % (i + 1) for i in range(100)])
+
+    def test_lost_connection_fails_pending_commands(self):
+        # Serveur qui ne répond jamais: la commande reste en attente
+        listener = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(listener.close)
+        pool = UpstreamPool('127.0.0.1', listener.getsockname()[1], size=1)
+        future = pool.submit(encode_command('PING'), 0)
+        self.assertFalse(future.done())
+        pool.close()
+        with self.assertRaises(ConnectionError):
+            future.result(timeout=5)
+
+
+def _subscriber(proxy, client_id, *channels, kind='SUBSCRIBE'):
+    """Enregistre un client du moteur à threads (sans socket) abonné à des canaux"""
+    client_info = proxy.client_connections[client_id] = proxy._new_client_info(outbound_ready=threading.Condition())
+    if channels:
+        proxy.prepare_subscribe(client_id, RedisCommand(encode_command(kind, *channels)))
+    return client_info
+
+
+class SubscriptionIndexTests(SimpleTestCase):
+    """Un message publié ne parcourt que les abonnés de son canal"""
+
+    def test_index(self):
+        index = SubscriptionIndex()
+        self.assertTrue(index.add('a', 'c1'))
+        self.assertFalse(index.add('a', 'c2'))
+        index.add('b', 'c1')
+        self.assertEqual(sorted(index.subscribers('a')), ['c1', 'c2'])
+        self.assertFalse(index.discard('a', 'c2'))
+        self.assertEqual(index.remove_client('c1', ['a', 'b']), ['a', 'b'])
+        self.assertEqual((len(index), index.subscribers('a')), (0, ()))
+
+    def test_dispatch_reaches_only_the_subscribers(self):
+        proxy = RedisProxy()
+        direct = _subscriber(proxy, '10.0.0.1:1', 'coord/emergency')
+        by_filter = _subscriber(proxy, '10.0.0.1:2', 'coord/heartbeat/#')
+        by_pattern = _subscriber(proxy, '10.0.0.1:3', 'coord/heartbeat/*', kind='PSUBSCRIBE')
+        idle = _subscriber(proxy, '10.0.0.1:4')
+
+        proxy.dispatch_published_message('coord/emergency', b'alert')
+        proxy.dispatch_published_message('coord/heartbeat/w1', b'beat', pattern='coord/heartbeat*')
+        proxy.dispatch_published_message('coord/heartbeat/w1', b'beat', pattern='coord/heartbeat/*')
+        self.assertEqual(direct['outbound'].drain(), [encode_array('message', 'coord/emergency', b'alert')])
+        self.assertEqual(by_filter['outbound'].drain(), [encode_array('message', 'coord/heartbeat/w1', b'beat')])
+        self.assertEqual(by_pattern['outbound'].drain(),
+                         [encode_array('pmessage', 'coord/heartbeat/*', 'coord/heartbeat/w1', b'beat')])
+        self.assertEqual(len(idle['outbound']), 0)
+
+    def test_unsubscribe_and_disconnect_leave_the_index(self):
+        proxy = RedisProxy()
+        client_info = _subscriber(proxy, '10.0.0.1:1', 'coord/emergency', 'coord/heartbeat/#')
+        self.assertEqual(proxy._drain_pending_subscriptions(),
+                         {'subscribe': ['coord/emergency'], 'psubscribe': ['coord/heartbeat*']})
+        proxy.prepare_unsubscribe('10.0.0.1:1', RedisCommand(encode_command('UNSUBSCRIBE', 'coord/emergency')))
+        proxy.dispatch_published_message('coord/emergency', b'alert')
+        self.assertEqual(len(client_info['outbound']), 0)
+        proxy._remove_client('10.0.0.1:1')
+        self.assertEqual(len(proxy.channel_subscribers), 0)
+        self.assertEqual(proxy.filter_subscribers.match('coord/heartbeat/w1'), set())
+        # Plus aucune référence: l'abonné partagé se désabonne de Redis
+        self.assertEqual(proxy._drain_pending_subscriptions(),
+                         {'unsubscribe': ['coord/emergency'], 'punsubscribe': ['coord/heartbeat*']})
+        self.assertEqual(len(proxy.upstream_subscriptions), 0)
+
+
+class VerifiedTokenCacheTests(SimpleTestCase):
+    """Tokens vérifiés une fois, jamais servis après leur expiration"""
+
+    def test_entry_expires_with_the_token(self):
+        cache = VerifiedTokenCache()
+        with mock.patch('communication.token_cache.time.time', return_value=1000.0):
+            cache.put('t', {'user_id': 'v1', 'role': 'volunteer', 'exp': 1060})
+            self.assertEqual(cache.get('t'), ('v1', 'volunteer'))
+        with mock.patch('communication.token_cache.time.time', return_value=1060.0):
+            self.assertIsNone(cache.get('t'))
+        self.assertEqual((len(cache), cache.expired, cache.hits), (0, 1, 1))
+
+    def test_token_without_exp_uses_the_default_ttl(self):
+        cache = VerifiedTokenCache(default_ttl=30)
+        with mock.patch('communication.token_cache.time.time', return_value=1000.0):
+            cache.put('t', {'user_id': 'v1', 'role': 'volunteer'})
+        self.assertEqual(cache.expires_at('t'), 1030.0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = VerifiedTokenCache(max_size=2)
+        for token in ('a', 'b'):
+            cache.put(token, {'user_id': token, 'exp': time.time() + 60})
+        cache.get('a')
+        cache.put('c', {'user_id': 'c', 'exp': time.time() + 60})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a')[0], cache.get('c')[0], cache.evicted), ('a', 'c', 1))
+
+    def test_proxy_verifies_the_signature_once_and_rejects_expired_tokens(self):
+        proxy = RedisProxy()
+        token = _token('manager', 'm1')
+        with mock.patch('communication.proxy.jwt.decode', wraps=jwt.decode) as decode:
+            self.assertEqual(proxy.verify_token(token), ('m1', 'manager'))
+            self.assertEqual(proxy.verify_token(token), ('m1', 'manager'))
+        self.assertEqual(decode.call_count, 1)
+        expired = jwt.encode({'user_id': 'm1', 'role': 'manager', 'exp': int(time.time()) - 1},
+                             settings.SECRET_KEY, algorithm='HS256')
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            proxy.verify_token(expired)
+
+
+class EncodeOnceFanOutTests(SimpleTestCase):
+    """Trame encodée une fois et partagée par tous les abonnés, envoyée sans concaténation"""
+
+    def test_subscribers_share_the_same_frame(self):
+        proxy = RedisProxy()
+        clients = [_subscriber(proxy, f'10.0.0.1:{port}', 'coord/emergency') for port in range(3)]
+        data = bytes(range(256))  # Message binaire: transmis tel quel
+        proxy.dispatch_published_message('coord/emergency', data)
+        frames = [client_info['outbound'].drain() for client_info in clients]
+        self.assertEqual(frames[0], [encode_array('message', 'coord/emergency', data)])
+        self.assertTrue(all(batch[0] is frames[0][0] for batch in frames))
+
+    def test_send_buffers_survives_partial_writes(self):
+        sender, receiver = socket.socketpair()
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        buffers = [os.urandom(size) for size in (1, 70000, 0, 3, 150000)]
+        received = bytearray()
+
+        def read():
+            while len(received) < sum(map(len, buffers)):
+                received.extend(receiver.recv(65536))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        send_buffers(sender, buffers)
+        reader.join(timeout=5)
+        self.assertEqual(bytes(received), b''.join(buffers))
+
+
+class EnvelopePassThroughTests(SimpleTestCase):
+    """Messages enveloppés: seul l'en-tête est décodé et réécrit"""
+
+    def publish(self, channel, data):
+        return RedisProxy().prepare_publish('10.0.0.1:5000', RedisCommand(encode_command('PUBLISH', channel, data)))
+
+    def test_body_is_forwarded_untouched(self):
+        body = b'\x82\xa4task\x01\xff\x00 pas du JSON'
+        handled, upstream, error = self.publish('tasks/new', encode_envelope({'token': _token('manager')}, body))
+        self.assertTrue(handled)
+        self.assertIsNone(error)
+        header, forwarded = split_envelope(RedisCommand(upstream).get_message())
+        self.assertEqual(bytes(forwarded), body)
+        self.assertNotIn('token', header)
+        self.assertEqual((header['_sender_id'], header['_sender_role']), ('u1', 'manager'))
+
+    def test_inspected_channel_decodes_the_body(self):
+        data = encode_envelope({}, json.dumps({'username': 'alice', 'password': 's3cret', 'token': 't'}))
+        handled, upstream, error = self.publish('auth/login', data)
+        self.assertIsNone(error)
+        header, forwarded = split_envelope(RedisCommand(upstream).get_message())
+        self.assertEqual(json.loads(bytes(forwarded)), {'username': 'alice', 'password': 's3cret'})
+        self.assertEqual(header['_client_ip'], '10.0.0.1')
+
+    def test_refusals(self):
+        self.assertEqual(self.publish('tasks/new', encode_envelope({}, b'x')),
+                         (True, None, b'-ERR NOAUTH Permission denied\r\n'))
+        self.assertEqual(self.publish('tasks/new', encode_envelope({'token': _token('volunteer')}, b'x'))[2],
+                         b'-ERR NOAUTH Permission denied\r\n')
+        self.assertEqual(self.publish('tasks/new', MAGIC + b'{"token": "t"}')[2],
+                         b'-ERR WRONGTYPE Invalid envelope header\r\n')
+
+
+class AuditLogTests(FakeRedisTestCase):
+    """Écriture du journal d'audit et relecture par replay_audit_log"""
+
+    def new_log(self, body_mode=audit.BODY_FULL, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        log = audit.AuditLog(os.path.join(directory.name, 'audit.log'), body_mode=body_mode, **kwargs)
+        self.addCleanup(log.close)
+        return log
+
+    def test_records_are_written_without_token(self):
+        log = self.new_log()
+        body = encode_envelope({'token': 't', '_sender_id': 'm1'}, b'{"task":1,"token":"t"}')
+        log.record(audit.PUBLISH, '10.0.0.1:5000', 'tasks/new', len(body), body=body, user_id='m1', role='manager')
+        log.record(audit.PUBLISH, '10.0.0.1:5000', 'tasks/new', 3, b'-ERR NOAUTH Permission denied\r\n', body=b'{}')
+        log.record(audit.SUBSCRIBE, '10.0.0.1:5000', ['coord/emergency'], detail={'command': 'SUBSCRIBE'})
+        log.close()
+        records = list(audit.read_audit_records(log.path))
+        self.assertEqual([record['seq'] for record in records], [0, 1, 2])
+        self.assertEqual((records[0]['body'], records[0]['envelope']), ({'task': 1}, {'_sender_id': 'm1'}))
+        self.assertEqual(records[1]['outcome'], 'ERR NOAUTH Permission denied')
+        self.assertEqual(records[2]['channel'], ['coord/emergency'])
+        self.assertEqual(log.stats()['lost'], 0)
+
+    def test_redacted_body_and_sampling(self):
+        log = self.new_log(audit.BODY_REDACTED, sample_rates={'coord/heartbeat/#': 0.0})
+        log.record(audit.PUBLISH, channel='auth/login', body=b'{"username":"alice","password":"s3cret"}')
+        log.record(audit.PUBLISH, channel='coord/heartbeat/v1', body=b'{}')
+        log.close()
+        records = list(audit.read_audit_records(log.path))
+        self.assertEqual([record['body'] for record in records], [{'username': 'alice', 'password': '********'}])
+        self.assertEqual(log.sampled_out, 1)
+
+    def test_rotated_files_are_read_in_order(self):
+        log = self.new_log(audit.BODY_NONE, max_bytes=200, backup_count=2, flush_interval=60)
+        for index in range(10):
+            log.record(audit.PUBLISH, channel=f'tasks/status/{index}', size=10)
+            log.flush()  # Une écriture par enregistrement: rotation à chaque dépassement
+        log.close()
+        self.assertEqual(len(audit.audit_files(log.path)), 3)
+        # Les fichiers au-delà de backup_count sont supprimés: il reste les derniers enregistrements, dans l'ordre
+        seqs = [record['seq'] for record in audit.read_audit_records(log.path)]
+        self.assertEqual(seqs, list(range(10 - len(seqs), 10)))
+        self.assertGreater(len(seqs), 2)
+
+    def test_replay_republishes_accepted_messages(self):
+        log = self.new_log()
+        log.record(audit.PUBLISH, channel='tasks/new', body=encode_envelope({'token': 't'}, b'{"task":1}'))
+        log.record(audit.PUBLISH, channel='tasks/new', outcome=b'-ERR NOAUTH Permission denied\r\n', body=b'{}')
+        log.record(audit.PUBLISH, channel='coord/emergency', body=b'{"level":2}')
+        log.close()
+        pubsub = redis.Redis(port=self.redis_port).pubsub(ignore_subscribe_messages=True)
+        self.addCleanup(pubsub.close)
+        pubsub.subscribe('tasks/new', 'coord/emergency')
+        out = StringIO()
+        call_command('replay_audit_log', log.path, '--publish', '--speed', '0',
+                     '--redis-host', '127.0.0.1', '--redis-port', str(self.redis_port), stdout=out)
+        self.assertIn('2 messages republiés', out.getvalue())
+        received = []
+        deadline = time.monotonic() + 2.0
+        while len(received) < 2 and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=0.1)
+            if message:
+                received.append((message['channel'], decode_message(message['data'])))
+        self.assertEqual(received, [(b'tasks/new', {'task': 1}), (b'coord/emergency', {'level': 2})])
+
+
+class HandoffStateTests(SimpleTestCase):
+    """Trames de reprise à chaud et état de session cédé au nouveau processus"""
+
+    def test_frames_carry_json_bytes_and_descriptors(self):
+        old, new = socket.socketpair()
+        self.addCleanup(old.close)
+        self.addCleanup(new.close)
+        read_end, write_end = os.pipe()
+        self.addCleanup(os.close, write_end)
+        handoff.send_frame(old, {'type': handoff.CLIENT, 'state': {'client_id': 'c1'}}, b'\x00\r\n', [read_end])
+        os.close(read_end)  # Le descripteur transmis reste ouvert chez le récepteur
+        handoff.send_frame(old, {'type': handoff.DONE})
+        message, blob, fds = handoff.recv_frame(new)
+        self.assertEqual((message, blob, len(fds)), ({'type': 'client', 'state': {'client_id': 'c1'}}, b'\x00\r\n', 1))
+        os.write(write_end, b'ok')
+        self.assertEqual(os.read(fds[0], 2), b'ok')
+        os.close(fds[0])
+        self.assertEqual(handoff.recv_frame(new), ({'type': 'done'}, b'', []))
+        old.close()
+        with self.assertRaises(handoff.HandoffError):
+            handoff.recv_frame(new)
+
+    def test_session_survives_the_handoff(self):
+        old = RedisProxy()
+        client_info = _subscriber(old, '10.0.0.1:5000', 'coord/emergency', 'coord/heartbeat/#')
+        client_info.update(authenticated=True, user_id='m1', role='manager', token='t', name='s' * 32)
+        client_info['parser'].feed(b'*1\r\n$4\r\nPI')  # Commande à moitié reçue
+        client_info['outbound'].put_reply(b'+OK\r\n')  # Réponse pas encore envoyée
+        state, blob = old._client_state('10.0.0.1:5000', client_info)
+        state = json.loads(json.dumps(state))  # Passe par la trame JSON
+
+        new = RedisProxy()
+        adopted = new.client_connections['10.0.0.1:5000'] = new._new_client_info(outbound_ready=threading.Condition())
+        new._adopt_session('10.0.0.1:5000', adopted, state, blob)
+        self.assertEqual((adopted['authenticated'], adopted['user_id'], adopted['role'], adopted['token']),
+                         (True, 'm1', 'manager', 't'))
+        self.assertEqual(adopted['session_id'], session_id_for('s' * 32))
+        self.assertEqual(adopted['subscribed_channels'], {'coord/emergency', 'coord/heartbeat/#'})
+        self.assertEqual(adopted['outbound'].drain(), [b'+OK\r\n'])
+        adopted['parser'].feed(b'NG\r\n')
+        self.assertEqual(adopted['parser'].gets()[1], b'*1\r\n$4\r\nPING\r\n')
+        # Le nouveau processus s'abonne sur Redis aux mêmes canaux que l'ancien
+        changes = new.upstream_subscriptions.changes()
+        self.assertTrue(changes)
+        self.assertEqual(changes, old.upstream_subscriptions.changes())
+        new.dispatch_published_message('coord/emergency', b'{}')
+        self.assertEqual(len(adopted['outbound']), 1)
+
+
+class ConnectionReaperTests(SimpleTestCase):
+    """Fermeture des connexions inactives, muettes ou bloquées en écriture"""
+
+    def connection(self, last_activity=0.0, reading=True, write_started=None, channels=()):
+        return {'reading': reading, 'last_activity': last_activity, 'write_started': write_started,
+                'subscribed_channels': set(channels), 'subscribed_patterns': set(), 'authenticated': False}
+
+    def test_check_per_reason(self):
+        reaper = ConnectionReaper({}, close=None, idle_timeout=300, subscriber_idle_timeout=60, write_timeout=30)
+        cases = [
+            (self.connection(), 100, None),
+            (self.connection(), 301, IDLE),
+            (self.connection(reading=False), 1000, None),  # Commande bloquante en cours
+            (self.connection(channels=['coord/emergency']), 61, PING_TIMEOUT),
+            (self.connection(last_activity=990, write_started=969), 1000, WRITE_STALLED),
+            (self.connection(reading=False, write_started=990), 1000, None),
+        ]
+        for client_info, now, reason in cases:
+            with self.subTest(client_info=client_info, now=now):
+                self.assertEqual(reaper.check(client_info, now), reason)
+
+    def test_zero_timeouts_never_close(self):
+        reaper = ConnectionReaper({}, close=None, idle_timeout=0, subscriber_idle_timeout=0, write_timeout=0)
+        self.assertIsNone(reaper.check(self.connection(write_started=0.0), 10 ** 6))
+        self.assertIsNone(reaper.check(self.connection(channels=['a']), 10 ** 6))
+
+    def test_reap_closes_and_counts(self):
+        connections = {'idle': self.connection(), 'busy': self.connection(last_activity=200),
+                       'closing': dict(self.connection(), closing=True)}
+        closed = []
+        reaper = ConnectionReaper(connections, lambda *args: closed.append(args), idle_timeout=300)
+        reaper.paused = True
+        self.assertEqual(reaper.reap(now=400), [])
+        reaper.paused = False
+        self.assertEqual(reaper.reap(now=400), [('idle', IDLE)])
+        self.assertEqual(closed, [('idle', connections['idle'], IDLE)])
+        self.assertEqual(reaper.stats()['reaped'], {IDLE: 1, PING_TIMEOUT: 0, WRITE_STALLED: 0})
+
+
+class AsyncMessageBrokerTests(FakeRedisTestCase):
+    """Publication et abonnements du broker asyncio sur un Redis simulé"""
+
+    async def wait_subscribed(self, broker, channel=None, patterns=0):
+        """Attend que Redis ait enregistré l'abonnement (subscribe n'attend pas sa confirmation)"""
+        for _ in range(100):
+            if channel is not None:
+                [(_, count)] = await broker.redis_client.pubsub_numsub(channel)
+            else:
+                count = await broker.redis_client.pubsub_numpat() - patterns
+            if count > 0:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"Abonnement à {channel or 'un motif'} non enregistré")
+
+    def test_publish_and_subscribe(self):
+        async def scenario():
+            broker = AsyncMessageBroker('127.0.0.1', self.redis_port)
+            received = []
+
+            async def on_emergency(channel, data):
+                received.append((channel, data))
+
+            await broker.subscribe('coord/emergency', on_emergency)
+            await self.wait_subscribed(broker, 'coord/emergency')
+            async with broker.subscription('coord/heartbeat/+') as heartbeats:
+                await self.wait_subscribed(broker)
+                self.assertTrue(await broker.publish('coord/heartbeat/v1', {'alive': True}))
+                self.assertTrue(await broker.publish('coord/heartbeat/v1/extra', {'alive': False}))
+                self.assertTrue(await broker.publish('coord/emergency', {'level': 2}))
+                self.assertEqual(await heartbeats.get(timeout=2), ('coord/heartbeat/v1', {'alive': True}))
+                # Couvert par le motif Redis coord/heartbeat/*, pas par le filtre '+'
+                self.assertIsNone(await heartbeats.get(timeout=0.2))
+            self.assertEqual(received, [('coord/emergency', {'level': 2})])
+            self.assertTrue(await broker.unsubscribe('coord/emergency', on_emergency))
+            self.assertFalse(await broker.unsubscribe('coord/emergency', on_emergency))
+            self.assertEqual(broker.get_channel('coord/emergency').subscribers, 0)
+
+            # Canal durable: le message est aussi conservé dans le stream, sans token
+            await broker.publish('tasks/assign', {'task_id': '1', 'token': 't'})
+            [(_, fields)] = await broker.redis_client.xrange('stream:tasks/assign')
+            self.assertNotIn('token', json.loads(fields['data']))
+            await broker.stop_listening()
+
+        asyncio.run(scenario())
+
+    def test_progress_messages_are_coalesced(self):
+        async def scenario():
+            broker = AsyncMessageBroker('127.0.0.1', self.redis_port)
+            async with broker.subscription('tasks/status/#') as statuses:
+                await self.wait_subscribed(broker)
+                for progress in range(5):
+                    await broker.publish('tasks/status/1', {'task_id': '1', 'status': 'RUNNING', 'progress': progress})
+                self.assertEqual(await statuses.get(timeout=2),
+                                 ('tasks/status/1', {'task_id': '1', 'status': 'RUNNING', 'progress': 4}))
+                await broker.publish('tasks/status/1', {'task_id': '1', 'status': 'RUNNING', 'progress': 5})
+                await broker.publish('tasks/status/1', {'task_id': '1', 'status': 'COMPLETED'})
+                # Le statut terminal part aussitôt et remplace la progression retenue
+                self.assertEqual(await statuses.get(timeout=2),
+                                 ('tasks/status/1', {'task_id': '1', 'status': 'COMPLETED'}))
+                self.assertIsNone(await statuses.get(timeout=0.4))
+            await broker.stop_listening()
+
+        asyncio.run(scenario())
+
+
+class PublishManyTests(FakeRedisTestCase):
+    """Publication par lots: un message en échec n'empêche pas les autres"""
+
+    def new_broker(self, port=None):
+        broker = MessageBroker('127.0.0.1', port or self.redis_port, persistent=False)
+        self.addCleanup(broker.redis_client.close)
+        return broker
+
+    def test_failures_are_reported_per_message(self):
+        broker = self.new_broker()
+        direct = redis.Redis(port=self.redis_port)
+        self.addCleanup(direct.close)
+        direct.delete(stream_key('tasks/assign'))
+        pubsub = direct.pubsub(ignore_subscribe_messages=True)
+        self.addCleanup(pubsub.close)
+        pubsub.subscribe('coord/emergency')
+        messages = [
+            ('coord/emergency', {'level': 1}),
+            ('coord/emergency', {'level': object()}),  # Impossible à encoder
+            ('tasks/assign', {'task_id': '1'}),
+            ('coord/emergency', {'level': 3}),
+        ]
+        self.assertEqual(broker.publish_many(messages, chunk_size=2), [1, None, 0, 1])
+        self.assertEqual(direct.xlen(stream_key('tasks/assign')), 1)
+
+        self.assertEqual(broker.publish_many([('coord/emergency', {'level': 4})]), [1])
+        levels = []
+        deadline = time.monotonic() + 2.0
+        while len(levels) < 3 and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=0.1)
+            if message:
+                levels.append(json.loads(message['data'])['level'])
+        self.assertEqual(levels, [1, 3, 4])
+
+    def test_command_error_fails_only_its_message(self):
+        # fakeredis ferme la connexion sur une erreur: réponses d'un pipeline Redis réel
+        chunk = [(0, 'tasks/assign', '{}'), (1, 'coord/emergency', '{}'), (2, 'tasks/assign', '{}')]
+        replies = [redis.ResponseError('WRONGTYPE'), 0, 2, 2, b'1-0', 1]
+        results = [None] * 3
+        MessageBroker._chunk_results(results, chunk, [3, 1, 2], replies)
+        self.assertEqual(results, [None, 2, 1])
+
+    def test_unreachable_redis_fails_every_message(self):
+        broker = self.new_broker(_free_port())
+        self.assertEqual(broker.publish_many([('coord/emergency', {}), ('coord/status', {})]), [None, None])
+
+
+class StreamConsumerTests(FakeRedisTestCase):
+    """Lecture d'un canal durable en groupe: reprise des entrées en attente et dead letter"""
+
+    def test_reclaim_and_dead_letter(self):
+        direct = redis.Redis(port=self.redis_port)
+        self.addCleanup(direct.close)
+        key = stream_key('tasks/assign')
+        direct.delete(key, key + DEAD_LETTER_SUFFIX)
+        pipe = direct.pipeline(transaction=False)
+        for task in (1, 2):
+            add_to_stream(pipe, 'tasks/assign', 'tasks/assign', json.dumps({'task': task}))
+        pipe.execute()
+        poison_id = direct.xadd(key, {'channel': 'tasks/assign', 'data': 'pas du JSON'})
+
+        first = StreamConsumer(direct, 'tasks/assign', 'schedulers', 'first', block=10, claim_idle=50, max_deliveries=2)
+        second = StreamConsumer(direct, 'tasks/assign', 'schedulers', 'second', block=10, claim_idle=50,
+                                max_deliveries=2)
+        first.ensure_group()
+        entries = first.read()
+        self.assertEqual([data for _, _, data in entries], [{'task': 1}, {'task': 2}])
+        # Entrée illisible: dead letter dès la première lecture
+        self.assertEqual(first.dead, 1)
+        first.ack(entries[0][0])  # Le premier consommateur meurt avant d'acquitter la tâche 2
+
+        time.sleep(0.1)
+        self.assertEqual(second.reclaim(), [(entries[1][0], 'tasks/assign', {'task': 2})])
+        self.assertEqual(second.claimed, 1)
+        time.sleep(0.1)
+        # Deuxième livraison sans acquittement: max_deliveries atteint
+        self.assertEqual(second.reclaim(), [])
+        self.assertEqual(second.dead, 1)
+
+        dead = direct.xrange(key + DEAD_LETTER_SUFFIX)
+        self.assertEqual([fields[b'id'] for _, fields in dead], [poison_id, entries[1][0].encode()])
+        self.assertEqual({fields[b'group'] for _, fields in dead}, {b'schedulers'})
+        self.assertEqual(direct.xpending(key, 'schedulers')['pending'], 0)
+
+
+class SharedPoolRegistryTests(FakeRedisTestCase):
+    """Un pool de connexions et un broker par serveur et par processus"""
+
+    def setUp(self):
+        # Registres du module vidés pour le test, puis restaurés
+        patcher = mock.patch.dict(broker_module._pools, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(broker_module._brokers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pool_per_endpoint(self):
+        with self.settings(USE_REDIS_PROXY=False, REDIS_HOST='127.0.0.1', REDIS_PORT=self.redis_port, REDIS_DB=0):
+            pool = get_connection_pool()
+            self.assertIs(get_connection_pool('127.0.0.1', self.redis_port, 0), pool)
+            self.assertIsNot(get_connection_pool(decode_responses=False), pool)
+            self.assertIsNot(get_connection_pool(client_name='s' * 32), pool)
+            self.assertIsNot(get_connection_pool(db=1), pool)
+        self.assertEqual(len(broker_module._pools), 4)
+
+    def test_idle_connections_beyond_max_idle_are_closed(self):
+        with self.settings(REDIS_POOL_MAX_IDLE=2):
+            pool = get_connection_pool('127.0.0.1', self.redis_port)
+        self.addCleanup(pool.disconnect)
+        connections = [pool.get_connection('PING') for _ in range(5)]
+        for connection in connections:
+            pool.release(connection)
+        self.assertEqual((len(pool._available_connections), pool._created_connections), (2, 2))
+        self.assertTrue(all(connection._sock is None for connection in connections[2:]))
+
+    def test_one_broker_per_endpoint_across_threads(self):
+        factory = mock.Mock(side_effect=lambda *endpoint: mock.Mock(endpoint=endpoint))
+        barrier = threading.Barrier(8)
+        brokers = []
+
+        def worker():
+            barrier.wait()
+            brokers.append(get_broker('127.0.0.1', self.redis_port, 0))
+
+        with mock.patch.object(broker_module, 'MessageBroker', factory):
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            other = get_broker('127.0.0.1', self.redis_port, 1)
+        self.assertEqual(len(brokers), 8)
+        self.assertTrue(all(broker is brokers[0] for broker in brokers))
+        self.assertIsNot(other, brokers[0])
+        self.assertEqual(factory.call_args_list, [mock.call('127.0.0.1', self.redis_port, 0),
+                                                  mock.call('127.0.0.1', self.redis_port, 1)])
+
+
+class CodecTests(SimpleTestCase):
+    """Formats des messages: aller-retour par codec, enveloppe des formats binaires"""
+
+    MESSAGE = {'task_id': 'é-42', 'progress': 0.5, 'count': 2 ** 40, 'done': False, 'result': None,
+               'items': [1, 'deux', {'trois': [3.0]}]}
+
+    def test_round_trip_per_codec(self):
+        for name in available_codecs():
+            with self.subTest(codec=name):
+                codec = get_codec(name)
+                encoded = codec.encode(self.MESSAGE)
+                self.assertEqual(codec.decode(encoded), self.MESSAGE)
+                self.assertEqual(decoder_for(codec.wire).decode(encoded), self.MESSAGE)
+                # Message publié par le broker, tel que le lit un abonné
+                published = MessageBroker._encode_message(dict(self.MESSAGE, token='t'), codec=name)
+                self.assertEqual(is_envelope(published), codec.binary)
+                self.assertEqual(decode_message(published), dict(self.MESSAGE, token='t') if not codec.binary
+                                 else self.MESSAGE)
+
+    @skipUnless('msgpack' in available_codecs(), "module msgpack non installé")
+    def test_binary_format_carries_token_in_header(self):
+        published = MessageBroker._encode_message({'task_id': '1', 'token': 't'}, codec='msgpack')
+        header, body = split_envelope(published)
+        self.assertEqual(header, {CODEC_HEADER: 'msgpack', 'token': 't'})
+        self.assertEqual(get_codec('msgpack').decode(bytes(body)), {'task_id': '1'})
+
+    @skipUnless('orjson' in available_codecs(), "module orjson non installé")
+    def test_json_is_readable_by_every_json_decoder(self):
+        # orjson refuse les entiers au-delà de 64 bits, json les accepte
+        self.assertEqual(get_codec('orjson').decode('{"n": 18446744073709551616}'), {'n': 2 ** 64})
+        self.assertEqual(get_codec('json').decode(get_codec('orjson').encode(self.MESSAGE)), self.MESSAGE)
+
+    @skipUnless('msgpack' in available_codecs(), "module msgpack non installé")
+    def test_invalid_data_and_unknown_formats(self):
+        msgpack_codec = get_codec('msgpack')
+        for data in ('{"a": 1}', b'\xc1'):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                msgpack_codec.decode(data)
+        with self.assertRaises(ValueError):
+            get_codec('xml')
+        with self.assertRaises(ValueError):
+            decoder_for('xml')
+        with self.assertRaises(ValueError):
+            decode_message(encode_envelope({CODEC_HEADER: 'xml'}, b'<a/>'))
+
+    @skipUnless('msgpack' in available_codecs(), "module msgpack non installé")
+    def test_proxy_inspects_binary_body_in_its_format(self):
+        body = get_codec('msgpack').encode({'username': 'alice', 'password': 's3cret', 'token': 't'})
+        data = encode_envelope({CODEC_HEADER: 'msgpack'}, body)
+        handled, upstream, error = RedisProxy().prepare_publish(
+            '10.0.0.1:5000', RedisCommand(encode_command('PUBLISH', 'auth/login', data))
+        )
+        self.assertIsNone(error)
+        header, forwarded = split_envelope(RedisCommand(upstream).get_message())
+        self.assertEqual(header[CODEC_HEADER], 'msgpack')
+        self.assertEqual(get_codec('msgpack').decode(bytes(forwarded)), {'username': 'alice', 'password': 's3cret'})
+
+
+class SaveChannelTests(SimpleTestCase):
+    """Écriture d'un canal par le broker: la politique du proxy n'est posée qu'à la création"""
+
+    POLICY_FIELDS = ('require_auth', 'allowed_publishers', 'allowed_subscribers', 'inspect_body',
+                     'rate_limits', 'rate_limit_action')
+
+    def save(self, name, **fields):
+        data = {'name': name, 'description': 'test', 'created_at': datetime(2024, 1, 1),
+                **dict.fromkeys(BROKER_FIELDS), **fields}
+        with mock.patch.object(ChannelDocument, 'objects') as objects:
+            save_channel(data)
+        objects.assert_called_once_with(name=name)
+        (_, kwargs), = objects.return_value.update_one.call_args_list
+        self.assertIs(kwargs.pop('upsert'), True)
+        return kwargs
+
+    def test_existing_policy_is_never_overwritten(self):
+        updates = self.save('tasks/new', durable=True, codec='msgpack')
+        for field in self.POLICY_FIELDS:
+            self.assertNotIn(f'set__{field}', updates)
+        self.assertEqual(updates['set_on_insert__allowed_publishers'], ['manager'])
+        self.assertEqual((updates['set__durable'], updates['set__codec']), (True, 'msgpack'))
+
+    def test_new_channel_without_default_policy_is_closed(self):
+        updates = self.save('custom/reports')
+        self.assertIs(updates['set_on_insert__require_auth'], True)
+        self.assertEqual(updates['set_on_insert__allowed_publishers'], [])
+        self.assertEqual(updates['set_on_insert__allowed_subscribers'], [])
+        self.assertEqual(updates['set_on_insert__rate_limits'], {})
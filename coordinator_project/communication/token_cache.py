@@ -0,0 +1,116 @@
+"""
+Cache des tokens JWT déjà vérifiés par le proxy Redis.
+
+Un volunteer envoie des centaines de PUBLISH avec le même token: la signature
+HMAC n'est vérifiée qu'à la première utilisation, puis les informations
+décodées sont réutilisées jusqu'à l'expiration du token (claim 'exp').
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class VerifiedTokenCache:
+    """
+    Cache LRU borné de tokens vérifiés.
+
+    Les entrées sont indexées par l'empreinte SHA-256 du token (le token
+    lui-même n'est pas conservé) et contiennent user_id, role et la date
+    d'expiration. Une entrée expirée n'est jamais servie: elle est retirée
+    au moment de la lecture et le token doit être vérifié à nouveau, ce qui
+    fera échouer jwt.decode.
+    """
+
+    def __init__(self, max_size=10000, default_ttl=300):
+        """
+        Args:
+            max_size: Nombre maximal de tokens conservés (défaut: 10000)
+            default_ttl: Durée de conservation en secondes des tokens sans 'exp' (défaut: 300)
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Compteurs exposés par stats()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _digest(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        """
+        Retourne les informations d'un token déjà vérifié et non expiré.
+
+        Returns:
+            tuple: (user_id, role) ou None s'il faut vérifier le token
+        """
+        key = self._digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, role, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id, role
+
+    def put(self, token, payload):
+        """
+        Enregistre un token dont la signature vient d'être vérifiée.
+
+        Args:
+            token: Token JWT
+            payload: Claims décodés par jwt.decode
+        """
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            expires_at = time.time() + self.default_ttl
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (payload.get('user_id'), payload.get('role'), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def expires_at(self, token):
+        """Date d'expiration (timestamp) d'un token en cache, ou None"""
+        with self._lock:
+            entry = self._entries.get(self._digest(token))
+        return entry[2] if entry is not None else None
+
+    def clear(self):
+        """Vide le cache (ex: après un changement de SECRET_KEY)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Compteurs du cache"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,272 @@
+"""
+Canaux hiérarchiques avec jokers de style MQTT.
+
+Les noms de canaux sont découpés en niveaux séparés par '/'. Dans un filtre,
+'+' remplace exactement un niveau et '#', en dernier niveau seulement, le
+niveau parent et tous ses sous-niveaux ('tasks/status/#' correspond à
+'tasks/status' et à 'tasks/status/42'). Les filtres sont rangés dans un trie
+par niveau, pour qu'une recherche coûte un nombre d'étapes borné par la
+profondeur du canal et non par le nombre de filtres enregistrés.
+"""
+
+import re
+import threading
+
+SEPARATOR = '/'
+SINGLE_LEVEL = '+'
+MULTI_LEVEL = '#'
+
+# Caractères spéciaux des motifs PSUBSCRIBE de Redis
+_GLOB_SPECIAL = re.compile(r'([*?\[\]\\])')
+
+
+def is_wildcard(topic_filter):
+    """Indique si un nom de canal est un filtre valide contenant un joker"""
+    levels = topic_filter.split(SEPARATOR)
+    if not any(level in (SINGLE_LEVEL, MULTI_LEVEL) for level in levels):
+        return False
+    return is_valid_filter(topic_filter)
+
+
+def is_valid_filter(topic_filter):
+    """Vérifie qu'un filtre respecte les règles MQTT ('#' en dernier, jokers sur un niveau entier)"""
+    levels = topic_filter.split(SEPARATOR)
+    for i, level in enumerate(levels):
+        if level == MULTI_LEVEL:
+            if i != len(levels) - 1:
+                return False
+        elif level != SINGLE_LEVEL and (SINGLE_LEVEL in level or MULTI_LEVEL in level):
+            return False
+    return True
+
+
+def topic_matches(topic_filter, topic):
+    """Indique si un canal correspond à un filtre"""
+    filter_levels = topic_filter.split(SEPARATOR)
+    topic_levels = topic.split(SEPARATOR)
+    for i, level in enumerate(filter_levels):
+        if level == MULTI_LEVEL:
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != SINGLE_LEVEL and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def to_redis_pattern(topic_filter):
+    """
+    Traduit un filtre en motif PSUBSCRIBE de Redis.
+    Le motif est plus large que le filtre ('*' traverse les '/'): les messages
+    reçus doivent encore être filtrés avec le trie.
+    """
+    levels = topic_filter.split(SEPARATOR)
+    if levels[-1] == MULTI_LEVEL:
+        # 'a/#' correspond aussi à 'a': le motif ne peut pas exiger le '/'
+        prefix = SEPARATOR.join(levels[:-1])
+        return _escape_glob(prefix) + '*'
+    return SEPARATOR.join('*' if level == SINGLE_LEVEL else _escape_glob(level) for level in levels)
+
+
+def glob_to_filter(pattern):
+    """
+    Convertit un motif PSUBSCRIBE en filtre qui le couvre, pour l'autorisation.
+    Un niveau contenant un caractère de motif peut s'étendre sur plusieurs
+    niveaux: il est remplacé par '#' et la suite est ignorée.
+    """
+    levels = []
+    for level in pattern.split(SEPARATOR):
+        if any(char in level for char in '*?['):
+            levels.append(MULTI_LEVEL)
+            break
+        levels.append(level.replace('\\', ''))
+    return SEPARATOR.join(levels)
+
+
+def _escape_glob(text):
+    return _GLOB_SPECIAL.sub(r'\\\1', text)
+
+
+class _Node:
+    __slots__ = ('children', 'values', 'topic_filter')
+
+    def __init__(self):
+        self.children = {}
+        self.values = set()
+        self.topic_filter = None
+
+
+class TopicTrie:
+    """
+    Trie de filtres de canaux, chaque filtre portant un ensemble de valeurs
+    (identifiants de clients, règles, définitions de canaux...).
+
+    Les écritures et les lectures sont protégées par un verrou: avec le
+    moteur à threads, le trie est modifié par les threads clients pendant
+    que l'abonné partagé l'interroge.
+
+    Example:
+        trie = TopicTrie()
+        trie.add('tasks/status/#', 'client-1')
+        trie.match('tasks/status/42')  # {'client-1'}
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def add(self, topic_filter, value=True):
+        """
+        Ajoute une valeur à un filtre.
+
+        Returns:
+            bool: True si le filtre n'avait encore aucune valeur
+        """
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split(SEPARATOR):
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _Node()
+                node = child
+            created = not node.values
+            if created:
+                node.topic_filter = topic_filter
+                self._size += 1
+            node.values.add(value)
+            return created
+
+    def discard(self, topic_filter, value=True):
+        """
+        Retire une valeur d'un filtre et élague les nœuds devenus vides.
+
+        Returns:
+            bool: True si le filtre n'a plus aucune valeur
+        """
+        with self._lock:
+            path = [self._root]
+            levels = topic_filter.split(SEPARATOR)
+            for level in levels:
+                child = path[-1].children.get(level)
+                if child is None:
+                    return False
+                path.append(child)
+            node = path[-1]
+            if value not in node.values:
+                return False
+            node.values.discard(value)
+            if node.values:
+                return False
+            node.topic_filter = None
+            self._size -= 1
+            # Supprimer les nœuds sans valeur ni enfant, du bas vers le haut
+            for depth in range(len(levels), 0, -1):
+                child = path[depth]
+                if child.values or child.children:
+                    break
+                del path[depth - 1].children[levels[depth - 1]]
+            return True
+
+    def values(self, topic_filter):
+        """Valeurs enregistrées pour un filtre exact"""
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split(SEPARATOR):
+                node = node.children.get(level)
+                if node is None:
+                    return set()
+            return set(node.values)
+
+    def match_items(self, topic):
+        """
+        Filtres qui correspondent à un canal concret.
+
+        Returns:
+            list: Paires (filtre, copie de ses valeurs)
+        """
+        levels = topic.split(SEPARATOR)
+        found = []
+        with self._lock:
+            frontier = [self._root]
+            for level in levels:
+                next_frontier = []
+                for node in frontier:
+                    multi = node.children.get(MULTI_LEVEL)
+                    if multi is not None and multi.values:
+                        found.append((multi.topic_filter, set(multi.values)))
+                    child = node.children.get(level)
+                    if child is not None:
+                        next_frontier.append(child)
+                    if level != SINGLE_LEVEL:
+                        single = node.children.get(SINGLE_LEVEL)
+                        if single is not None:
+                            next_frontier.append(single)
+                if not next_frontier:
+                    return found
+                frontier = next_frontier
+            for node in frontier:
+                if node.values:
+                    found.append((node.topic_filter, set(node.values)))
+                # 'a/#' correspond aussi au niveau parent 'a'
+                multi = node.children.get(MULTI_LEVEL)
+                if multi is not None and multi.values:
+                    found.append((multi.topic_filter, set(multi.values)))
+        return found
+
+    def match(self, topic):
+        """Union des valeurs de tous les filtres qui correspondent à un canal"""
+        result = set()
+        for _, values in self.match_items(topic):
+            result |= values
+        return result
+
+    def covers(self, topic_filter):
+        """
+        Indique si un filtre enregistré couvre tous les canaux d'un autre
+        filtre (ou d'un canal concret). Un '+' demandé n'est couvert que par
+        '+' ou '#', et un '#' demandé que par '#'.
+        """
+        levels = topic_filter.split(SEPARATOR)
+        with self._lock:
+            frontier = [self._root]
+            for level in levels:
+                next_frontier = []
+                for node in frontier:
+                    multi = node.children.get(MULTI_LEVEL)
+                    if multi is not None and multi.values:
+                        return True
+                    if level == MULTI_LEVEL:
+                        continue
+                    single = node.children.get(SINGLE_LEVEL)
+                    if single is not None:
+                        next_frontier.append(single)
+                    if level != SINGLE_LEVEL:
+                        child = node.children.get(level)
+                        if child is not None:
+                            next_frontier.append(child)
+                if not next_frontier:
+                    return False
+                frontier = next_frontier
+            for node in frontier:
+                if node.values:
+                    return True
+                multi = node.children.get(MULTI_LEVEL)
+                if multi is not None and multi.values:
+                    return True
+        return False
+
+    def filters(self):
+        """Liste des filtres enregistrés"""
+        result = []
+        with self._lock:
+            stack = [self._root]
+            while stack:
+                node = stack.pop()
+                if node.values:
+                    result.append(node.topic_filter)
+                stack.extend(node.children.values())
+        return result
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,325 @@
+"""
+Connexions du proxy vers le serveur Redis réel.
+
+Les commandes des clients sont multiplexées sur un petit pool de connexions
+pipelinées partagées: chaque commande est écrite à la suite des autres et
+sa réponse lui est rendue dans l'ordre d'envoi (Redis répond toujours dans
+l'ordre sur une connexion). Seules les commandes liées à l'état d'une
+connexion (MULTI, commandes bloquantes, ...) utilisent une connexion dédiée.
+"""
+
+import asyncio
+import itertools
+import logging
+import socket
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from .resp import RespParser
+
+logger = logging.getLogger('RedisProxy')
+
+# Commandes qui dépendent de l'état de la connexion ou qui bloquent Redis:
+# elles ne peuvent pas partager une connexion pipelinée
+SESSION_COMMANDS = {
+    'MULTI', 'EXEC', 'DISCARD', 'WATCH', 'UNWATCH',
+    'SELECT', 'AUTH', 'HELLO', 'RESET', 'MONITOR', 'SYNC', 'PSYNC',
+    'READONLY', 'READWRITE', 'ASKING', 'WAIT', 'WAITAOF',
+    'BLPOP', 'BRPOP', 'BRPOPLPUSH', 'BLMOVE', 'BLMPOP',
+    'BZPOPMIN', 'BZPOPMAX', 'BZMPOP',
+    'SSUBSCRIBE', 'SUNSUBSCRIBE',
+}
+
+# Commandes qui ne bloquent que si l'option BLOCK est présente
+BLOCKING_OPTION_COMMANDS = {'XREAD', 'XREADGROUP'}
+
+
+def needs_dedicated_connection(command):
+    """Indique si une commande doit utiliser une connexion Redis dédiée au client"""
+    if command.command_type in SESSION_COMMANDS:
+        return True
+    if command.command_type in BLOCKING_OPTION_COMMANDS:
+        return any(arg.upper() == b'BLOCK' for arg in command.raw_args)
+    if command.command_type == 'CLIENT' and command.raw_args:
+        # CLIENT REPLY/TRACKING modifient le comportement de la connexion
+        return command.raw_args[0].upper() in (b'REPLY', b'TRACKING', b'CACHING')
+    return False
+
+
+class UpstreamConnection:
+    """
+    Connexion bloquante vers le serveur Redis réel, dédiée à un client.
+    Les réponses sont lues trame par trame avec un RespParser, quelle que
+    soit leur taille ou leur découpage en paquets TCP.
+    """
+
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.parser = RespParser()
+
+    def request(self, data, replies=1):
+        """Envoie une commande brute et retourne les octets de ses réponses"""
+        self.sock.sendall(data)
+        frames = []
+        while len(frames) < replies:
+            frame = self.parser.gets()
+            if frame is None:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("Connexion Redis fermée")
+                self.parser.feed(chunk)
+                continue
+            frames.append(frame[1])
+        return b''.join(frames)
+
+    def close(self):
+        self.sock.close()
+
+
+class PipelinedConnection:
+    """
+    Connexion Redis partagée par plusieurs clients.
+    Les commandes sont écrites sous verrou; un thread lecteur associe
+    chaque réponse à la plus ancienne commande en attente.
+    """
+
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.parser = RespParser()
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.reader_thread = threading.Thread(target=self._read_loop)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+    def submit(self, data):
+        """
+        Envoie une commande brute.
+
+        Returns:
+            Future: résolu avec les octets de la réponse
+        """
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Connexion Redis fermée")
+            self.pending.append(future)
+            try:
+                self.sock.sendall(data)
+            except OSError as e:
+                self._fail(e)
+                raise ConnectionError(f"Envoi vers Redis impossible: {e}")
+        return future
+
+    def _read_loop(self):
+        try:
+            while True:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("Connexion Redis fermée")
+                self.parser.feed(chunk)
+                for _, raw in self.parser:
+                    self.pending.popleft().set_result(raw)
+        except Exception as e:
+            if not self.closed:
+                logger.error(f"Connexion partagée vers Redis perdue: {e}")
+            self._fail(e)
+
+    def _fail(self, error):
+        """Ferme la connexion et fait échouer toutes les commandes en attente"""
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(f"Connexion Redis perdue: {error}"))
+
+    def close(self):
+        self._fail(ConnectionError("Fermeture demandée"))
+
+
+class UpstreamPool:
+    """
+    Pool fixe de connexions pipelinées vers Redis.
+    Le nombre de connexions ne dépend pas du nombre de clients du proxy.
+    """
+
+    def __init__(self, host, port, size=4):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connections = [None] * size
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _connection(self, index):
+        connection = self.connections[index]
+        if connection is None or connection.closed:
+            with self._lock:
+                connection = self.connections[index]
+                if connection is None or connection.closed:
+                    connection = PipelinedConnection(self.host, self.port)
+                    self.connections[index] = connection
+        return connection
+
+    def assign_slot(self):
+        """
+        Attribue une connexion du pool à un nouveau client (round-robin).
+        Toutes les commandes d'un client passent par la même connexion pour
+        que Redis les exécute dans l'ordre où le client les a envoyées.
+        """
+        return next(self._counter) % self.size
+
+    def submit(self, data, slot):
+        """Envoie une commande sur la connexion du pool attribuée au client"""
+        return self._connection(slot).submit(data)
+
+    def close(self):
+        for connection in self.connections:
+            if connection is not None:
+                connection.close()
+
+
+class AsyncUpstreamConnection:
+    """Connexion non bloquante vers le serveur Redis réel, dédiée à un client"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.parser = RespParser()
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, data, replies=1):
+        """Envoie une commande brute et retourne les octets de ses réponses"""
+        self.writer.write(data)
+        await self.writer.drain()
+        frames = []
+        while len(frames) < replies:
+            frame = self.parser.gets()
+            if frame is None:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    raise ConnectionError("Connexion Redis fermée")
+                self.parser.feed(chunk)
+                continue
+            frames.append(frame[1])
+        return b''.join(frames)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncPipelinedConnection:
+    """Connexion Redis partagée et pipelinée pour le moteur asyncio"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.parser = RespParser()
+        self.pending = deque()
+        self.closed = False
+        self.reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def submit(self, data):
+        """
+        Envoie une commande brute sans attendre.
+
+        Returns:
+            asyncio.Future: résolu avec les octets de la réponse
+        """
+        if self.closed:
+            raise ConnectionError("Connexion Redis fermée")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(data)
+        return future
+
+    async def _read_loop(self):
+        try:
+            while True:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    raise ConnectionError("Connexion Redis fermée")
+                self.parser.feed(chunk)
+                for _, raw in self.parser:
+                    future = self.pending.popleft()
+                    if not future.done():
+                        future.set_result(raw)
+        except asyncio.CancelledError:
+            self._fail(ConnectionError("Fermeture demandée"))
+        except Exception as e:
+            logger.error(f"Connexion partagée vers Redis perdue: {e}")
+            self._fail(e)
+
+    def _fail(self, error):
+        self.closed = True
+        self.writer.close()
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(f"Connexion Redis perdue: {error}"))
+
+    def close(self):
+        self.reader_task.cancel()
+
+
+class AsyncUpstreamPool:
+    """Pool fixe de connexions pipelinées vers Redis pour le moteur asyncio"""
+
+    def __init__(self, host, port, size=4):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connections = [None] * size
+        self._counter = itertools.count()
+        self._connecting = {}
+
+    async def _connection(self, index):
+        connection = self.connections[index]
+        if connection is None or connection.closed:
+            # Un seul établissement de connexion par emplacement à la fois
+            opening = self._connecting.get(index)
+            if opening is None:
+                opening = asyncio.ensure_future(AsyncPipelinedConnection.open(self.host, self.port))
+                self._connecting[index] = opening
+                try:
+                    self.connections[index] = await opening
+                finally:
+                    self._connecting.pop(index, None)
+            else:
+                await opening
+            connection = self.connections[index]
+        return connection
+
+    def assign_slot(self):
+        """Attribue une connexion du pool à un nouveau client (voir UpstreamPool)"""
+        return next(self._counter) % self.size
+
+    async def submit(self, data, slot):
+        """Envoie une commande et retourne le futur de sa réponse"""
+        connection = await self._connection(slot)
+        future = connection.submit(data)
+        await connection.writer.drain()
+        return future
+
+    def close(self):
+        for connection in self.connections:
+            if connection is not None:
+                connection.close()
@@ -165,6 +165,12 @@ REDIS_HOST = '127.0.0.1'
 REDIS_PORT = 6379
 REDIS_DB = 0
 
+# Canaux durables: chaque PUBLISH est aussi ajouté au stream du canal (XADD),
+# lu par groupes de consommateurs (voir communication/streams.py)
+REDIS_DURABLE_CHANNELS = ['tasks/assign', 'tasks/result/#']
+REDIS_STREAM_MAXLEN = 100000  # Entrées conservées par stream (approximatif)
+REDIS_STREAM_RETENTION = 7 * 24 * 3600  # Âge maximal des entrées, en secondes
+
 # Redis proxy settings
 REDIS_PROXY_HOST = '127.0.0.1'
 REDIS_PROXY_PORT = 6380
@@ -1,3 +1,52 @@
-from django.test import TestCase
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from . import views
+
+
+def _reply(result=None, error=None):
+    """Future déjà résolu, comme celui de broker.request()"""
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+class ManagerRedisAuthViewTests(SimpleTestCase):
+    """Connexion des managers par requête/réponse sur auth/login"""
+
+    def login(self, future):
+        request = APIRequestFactory().post('/api/auth/manager/login/',
+                                           {'username': 'alice', 'password': 's3cret'}, format='json')
+        broker = mock.Mock()
+        broker.request.return_value = future
+        # new explicite: mock n'inspecte pas le broker paresseux (qui se connecterait)
+        with mock.patch.object(views, 'message_broker', broker):
+            response = views.ManagerRedisAuthView.as_view()(request)
+        return response, broker.request.call_args
+
+    def test_password_is_sent_to_the_consumer(self):
+        response, call = self.login(_reply({'status': 'success', 'token': 't', 'manager_id': 'm1'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['token'], 't')
+        channel, message = call.args
+        self.assertEqual((channel, message['password']), ('auth/login', 's3cret'))
+
+    def test_invalid_credentials(self):
+        response, _ = self.login(_reply({'status': 'error', 'message': 'Identifiants invalides'}))
+        self.assertEqual(response.status_code, 401)
+
+    def test_inactive_account(self):
+        response, _ = self.login(_reply({'status': 'inactive', 'message': "Ce compte n'est pas actif"}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_no_consumer(self):
+        response, _ = self.login(_reply(error=TimeoutError()))
+        self.assertEqual(response.status_code, 504)
+        response, _ = self.login(_reply(error=ConnectionError('Publication sur auth/login impossible')))
+        self.assertEqual(response.status_code, 503)
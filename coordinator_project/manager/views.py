@@ -5,6 +5,7 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status as drf_status
 from mongoengine.connection import get_db
+from django.utils.functional import SimpleLazyObject
 from volunteer.models import Volunteer
 from .models import Manager, Workflow, Task
 from .serializers import (
@@ -16,12 +17,10 @@ from .serializers import (
 )
 
 # Importer le broker pour la communication Redis
-from communication.broker import MessageBroker
+from communication.broker import get_broker
 from communication.messages import (
     ManagerRegistrationMessage, 
-    ManagerRegistrationResponseMessage,
-    ManagerLoginMessage, 
-    ManagerLoginResponseMessage
+    ManagerLoginMessage
 )
 
 # Importer les utilitaires d'authentification
@@ -29,8 +28,8 @@ from .auth import generate_manager_token, verify_manager_token
 import uuid
 import json
 
-# Créer une instance du broker
-message_broker = MessageBroker()
+# Broker partagé du processus, créé à la première publication (aucune connexion à l'import)
+message_broker = SimpleLazyObject(get_broker)
 
 # ViewSet personnalisé pour MongoEngine
 class ManagerViewSet(viewsets.ViewSet):
@@ -202,21 +201,26 @@ class TaskViewSet(viewsets.ViewSet):
         serializer = TaskSerializer(tasks, many=True)
         return Response(serializer.data)
 
-    # Crée une nouvelle tâche
+    # Crée une nouvelle tâche, ou plusieurs si le corps est une liste
     def create(self, request):
-        serializer = TaskSerializer(data=request.data)
+        many = isinstance(request.data, list)
+        serializer = TaskSerializer(data=request.data, many=many)
         if serializer.is_valid():
-            task = serializer.save()
+            saved = serializer.save()
+            tasks = saved if many else [saved]
             
-            # Publier sur Redis pour informer les volunteers
-            message_broker.publish('tasks/assign', {
-                'task_id': str(task.id),
-                'name': task.name,
-                'workflow_id': str(task.workflow.id),
-                'required_resources': task.required_resources
-            })
+            # Publier sur Redis pour informer les volunteers (un aller-retour par paquet)
+            message_broker.publish_many(
+                ('tasks/assign', {
+                    'task_id': str(task.id),
+                    'name': task.name,
+                    'workflow_id': str(task.workflow.id),
+                    'required_resources': task.required_resources
+                })
+                for task in tasks
+            )
             
-            return Response(TaskSerializer(task).data, status=201)
+            return Response(TaskSerializer(saved, many=many).data, status=201)
         return Response(serializer.errors, status=400)
 
     # Détail d'une tâche
@@ -570,7 +574,8 @@ class ManagerRedisRegistrationView(APIView):
         """
         Enregistre un nouveau manager via Redis.
         Publie une demande d'enregistrement sur le canal auth/register
-        et attend la réponse sur auth/register_response.
+        et attend la réponse sur auth/register_response: l'enregistrement
+        est fait par les consommateurs (ManagerRegistrationConsumer).
         
         POST /api/auth/manager/register/
         {
@@ -591,51 +596,28 @@ class ManagerRedisRegistrationView(APIView):
             client_ip=request.META.get('REMOTE_ADDR', 'unknown')
         )
         
-        # Publier sur le canal d'enregistrement
-        message_broker.publish('auth/register', registration_message.to_dict())
-        
-        # Dans un cas réel, vous utiliseriez un système d'attente asynchrone
-        # comme asyncio ou Celery pour attendre la réponse
-        # Ici, nous simulons une réponse immédiate pour simplifier
-        
+        # Publier la demande et attendre la réponse du consommateur
         try:
-            # Enregistrer dans MongoDB
-            manager = serializer.save()
-            
-            # Créer la réponse
-            response_message = ManagerRegistrationResponseMessage(
-                request_id=registration_message.request_id,
-                status='success',
-                message='Manager registered successfully',
-                manager_id=str(manager.id),
-                username=manager.username,
-                email=manager.email
-            )
-            
-            # Publier la réponse
-            message_broker.publish('auth/register_response', response_message.to_dict())
-            
-            return Response({
-                'message': 'Manager registered successfully',
-                'manager_id': str(manager.id),
-                'username': manager.username,
-                'email': manager.email
-            }, status=201)
-            
-        except Exception as e:
-            # Créer la réponse d'erreur
-            response_message = ManagerRegistrationResponseMessage(
-                request_id=registration_message.request_id,
-                status='error',
-                message=str(e)
+            reply = message_broker.request('auth/register', registration_message.to_dict()).result()
+        except TimeoutError:
+            return Response(
+                {'error': 'Registration service did not respond'},
+                status=status.HTTP_504_GATEWAY_TIMEOUT
             )
-            
-            # Publier la réponse d'erreur
-            message_broker.publish('auth/register_response', response_message.to_dict())
-            
+        except ConnectionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        if reply.get('status') != 'success':
             return Response({
-                'error': str(e)
+                'error': reply.get('message')
             }, status=400)
+        
+        return Response({
+            'message': 'Manager registered successfully',
+            'manager_id': reply.get('manager_id'),
+            'username': reply.get('username'),
+            'email': reply.get('email')
+        }, status=201)
 
 
 # Vue pour l'authentification Redis des managers
@@ -646,7 +628,8 @@ class ManagerRedisAuthView(APIView):
         """
         Authentifie un manager via Redis.
         Publie une demande d'authentification sur le canal auth/login
-        et attend la réponse sur auth/login_response.
+        et attend la réponse sur auth/login_response: la vérification et
+        les tokens sont faits par les consommateurs (ManagerLoginConsumer).
         
         POST /api/auth/manager/login/
         {
@@ -670,105 +653,36 @@ class ManagerRedisAuthView(APIView):
             client_ip=request.META.get('REMOTE_ADDR', 'unknown')
         )
         
-        # Publier sur le canal d'authentification
-        message_broker.publish('auth/login', login_message.to_dict())
-        
-        # Dans un cas réel, vous utiliseriez un système d'attente asynchrone
-        # comme asyncio ou Celery pour attendre la réponse
-        # Ici, nous simulons une réponse immédiate pour simplifier
-        
+        # Publier la demande et attendre la réponse du consommateur
         try:
-            # Vérifier les identifiants
-            manager = Manager.objects.get(username=username)
-            
-            # Vérifier le mot de passe
-            if manager.password != password:
-                # Créer la réponse d'erreur
-                response_message = ManagerLoginResponseMessage(
-                    request_id=login_message.request_id,
-                    status='error',
-                    message='Invalid credentials'
-                )
-                
-                # Publier la réponse d'erreur
-                message_broker.publish('auth/login_response', response_message.to_dict())
-                
-                return Response(
-                    {'error': 'Invalid credentials'}, 
-                    status=status.HTTP_401_UNAUTHORIZED
-                )
-            
-            # Vérifier que le compte est actif
-            if manager.status != 'active':
-                # Créer la réponse d'erreur
-                response_message = ManagerLoginResponseMessage(
-                    request_id=login_message.request_id,
-                    status='error',
-                    message='Account is not active'
-                )
-                
-                # Publier la réponse d'erreur
-                message_broker.publish('auth/login_response', response_message.to_dict())
-                
-                return Response(
-                    {'error': 'Account is not active'}, 
-                    status=status.HTTP_403_FORBIDDEN
-                )
-            
-            # Générer un token JWT et un refresh token
-            token = generate_manager_token(str(manager.id))
-            refresh_token = generate_manager_token(str(manager.id), expiration_hours=168)  # 7 jours
-            
-            # Mettre à jour la date de dernière connexion
-            manager.last_login = datetime.utcnow()
-            manager.save()
-            
-            # Créer la réponse de succès
-            response_message = ManagerLoginResponseMessage(
-                request_id=login_message.request_id,
-                status='success',
-                message='Login successful',
-                token=token,
-                refresh_token=refresh_token,
-                manager_id=str(manager.id),
-                username=manager.username,
-                email=manager.email
+            reply = message_broker.request('auth/login', login_message.to_dict()).result()
+        except TimeoutError:
+            return Response(
+                {'error': 'Authentication service did not respond'},
+                status=status.HTTP_504_GATEWAY_TIMEOUT
             )
-            
-            # Publier la réponse de succès
-            message_broker.publish('auth/login_response', response_message.to_dict())
-            
-            # Publier un message sur le canal de statut
-            message_broker.publish('manager/status', {
-                'id': str(manager.id),
-                'username': manager.username,
-                'status': 'online',
-                'timestamp': datetime.utcnow().isoformat(),
-                'token': token  # Le token sera retiré par le proxy
-            })
-            
-            return Response({
-                'token': token,
-                'refresh_token': refresh_token,
-                'user_id': str(manager.id),
-                'username': manager.username,
-                'email': manager.email,
-                'status': manager.status,
-                'role': 'manager'
-            })
-            
-        except Manager.DoesNotExist:
-            # Créer la réponse d'erreur
-            response_message = ManagerLoginResponseMessage(
-                request_id=login_message.request_id,
-                status='error',
-                message='Invalid credentials'
+        except ConnectionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        # Compte existant mais désactivé: refusé, pas une erreur d'identifiants
+        if reply.get('status') == 'inactive':
+            return Response(
+                {'error': 'Account is not active'}, 
+                status=status.HTTP_403_FORBIDDEN
             )
-            
-            # Publier la réponse d'erreur
-            message_broker.publish('auth/login_response', response_message.to_dict())
-            
+        
+        if reply.get('status') != 'success':
             return Response(
-                {'error': 'Invalid credentials'}, 
+                {'error': reply.get('message') or 'Invalid credentials'}, 
                 status=status.HTTP_401_UNAUTHORIZED
-            )
\ No newline at end of file
+            )
+        
+        return Response({
+            'token': reply.get('token'),
+            'refresh_token': reply.get('refresh_token'),
+            'user_id': reply.get('manager_id'),
+            'username': reply.get('username'),
+            'email': reply.get('email'),
+            'status': 'active',
+            'role': reply.get('role', 'manager')
+        })
\ No newline at end of file